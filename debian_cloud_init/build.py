@@ -0,0 +1,205 @@
+"""Inkrementeller Zusammenbau der cloud-init.yml.
+
+Ein Build wird über einen Hash aller Eingaben (Template-Dateien + Parameter)
+identifiziert. Stimmen Eingabe-Hash und Hash der vorhandenen Ausgabedatei mit
+dem letzten Build überein, werden Parsen, Rendern, Schreiben und Validieren
+komplett übersprungen.
+"""
+
+import copy
+import hashlib
+import json
+import pathlib
+
+import yaml
+
+from .cloud_init import LiteralString, YamlDumper, YamlLoader, ensure_file_exists
+from .metrics import count_cache
+from .packages import apply_additions, diff_report, optimize_runcmd
+from .stages import apply_deferred_stage
+from .tools import load_manifest, render_tools_script
+from .ui import fail, progress, success
+from .workspace import write_atomic
+
+BUILD_CACHE_FILE = pathlib.Path(".build-cache.json")
+
+# Erhöhen, wenn sich die Render-Logik ändert – invalidiert alle Cache-Einträge
+BUILD_VERSION = 2
+
+
+def template_files(templates_dir: pathlib.Path) -> dict[str, pathlib.Path]:
+    return {
+        "template": templates_dir / "cloud-init-template.yml",
+        "package_config": templates_dir / "package-config.txt",
+        "system_config": templates_dir / "system-config.txt",
+        "tools": templates_dir / "tools.yml",
+    }
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def input_hash(files: dict[str, pathlib.Path], params: dict) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps({"version": BUILD_VERSION, "params": params}, sort_keys=True).encode())
+    for key in sorted(files):
+        h.update(key.encode())
+        h.update(files[key].read_bytes())
+    return h.hexdigest()
+
+
+def _load_cache() -> dict:
+    if not BUILD_CACHE_FILE.exists():
+        return {}
+    try:
+        return json.loads(BUILD_CACHE_FILE.read_text())
+    except json.JSONDecodeError:
+        return {}
+
+
+def _save_cache(cache: dict):
+    write_atomic(BUILD_CACHE_FILE, json.dumps(cache, indent=4))
+
+
+# Geparste Templates pro Prozess – im Daemon (`serve`) wird das YAML nur neu
+# gelesen, wenn sich die Datei geändert hat
+_TEMPLATE_CACHE: dict[tuple[str, int, int], dict] = {}
+
+
+def _load_template(path: pathlib.Path) -> dict:
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    count_cache("template", key in _TEMPLATE_CACHE)
+    if key not in _TEMPLATE_CACHE:
+        _TEMPLATE_CACHE[key] = yaml.load(path.read_text(), Loader=YamlLoader) or {}
+    return copy.deepcopy(_TEMPLATE_CACHE[key])
+
+
+def render_cloud_config(files: dict[str, pathlib.Path], username: str, hashed_password: str,
+                        ssh_key_content: str, backend: str = "libvirt",
+                        optimize_packages: bool = False, arch: str = "amd64",
+                        deferred: bool = False) -> dict:
+    tools_content = render_tools_script(load_manifest(files["tools"]), arch)
+    system_config_content = files["system_config"].read_text()
+    package_runcmd = [
+        line.strip()
+        for line in files["package_config"].read_text().splitlines()
+        if line.strip()
+    ]
+
+    try:
+        cloud_config = _load_template(files["template"])
+    except (OSError, yaml.YAMLError) as e:
+        fail(f"Fehler beim Laden des Templates: {e}")
+
+    if backend == "proxmox":
+        # Proxmox-spezifisch: qemu-guest-agent für IP-Erkennung via pvesh
+        cloud_config["packages"] = cloud_config.get("packages", [])
+        cloud_config.setdefault("package_update", True)
+
+    cloud_config["users"] = [
+        {
+            "name": username,
+            "passwd": hashed_password,
+            "lock_passwd": False,
+            "groups": ["sudo"],
+            "shell": "/bin/bash",
+            "sudo": ["ALL=(ALL) NOPASSWD:ALL"],
+            "ssh_authorized_keys": [ssh_key_content],
+        }
+    ]
+
+    if optimize_packages:
+        additions, package_runcmd, system_config_content = optimize_runcmd(package_runcmd, system_config_content)
+        apply_additions(cloud_config, additions)
+
+    if deferred:
+        steps = [("tools", tools_content), ("system", system_config_content)]
+        if package_runcmd:
+            steps.insert(0, ("packages", "\n".join(package_runcmd)))
+        apply_deferred_stage(cloud_config, steps)
+        return cloud_config
+
+    cloud_config["runcmd"] = package_runcmd + [
+        LiteralString(tools_content),
+        LiteralString(system_config_content),
+    ]
+    return cloud_config
+
+
+def dump_cloud_config(cloud_config: dict) -> str:
+    return "#cloud-config\n" + yaml.dump(cloud_config, sort_keys=False, Dumper=YamlDumper)
+
+
+def build_cloud_config(templates_dir: pathlib.Path, output_file: pathlib.Path, *,
+                       username: str, hashed_password: str, ssh_key_content: str,
+                       arch: str = "amd64", backend: str = "libvirt",
+                       optimize_packages: bool = False, deferred: bool = False,
+                       force: bool = False) -> bool:
+    """Erzeugt cloud-init.yml nur, wenn sich Eingaben oder Ausgabe geändert haben.
+
+    Gibt True zurück, wenn die Datei neu geschrieben wurde.
+    """
+    files = template_files(templates_dir)
+    for key in ("tools", "system_config", "package_config"):
+        if not ensure_file_exists(files[key]):
+            fail(f"Pflichtdatei fehlt: {files[key]}")
+
+    params = {
+        "username": username,
+        "hashed_password": hashed_password,
+        "ssh_key": ssh_key_content,
+        "arch": arch,
+        "backend": backend,
+        "optimize_packages": optimize_packages,
+        "deferred": deferred,
+    }
+    try:
+        digest = input_hash(files, params)
+    except OSError as e:
+        fail(f"Fehler beim Lesen der Templates: {e}")
+
+    cache = _load_cache()
+    cache_key = str(output_file.resolve())
+    entry = cache.get(cache_key, {})
+    fresh = (
+        not force
+        and entry.get("inputs") == digest
+        and output_file.exists()
+        and _sha256(output_file.read_bytes()) == entry.get("output")
+    )
+    count_cache("cloud_config", fresh)
+    if fresh:
+        success(f"{output_file} ist aktuell (Templates unverändert).")
+        return False
+
+    progress(f"Schreibe {output_file}…")
+    cloud_config = render_cloud_config(
+        files, username, hashed_password, ssh_key_content, backend, optimize_packages, arch, deferred
+    )
+    try:
+        content = dump_cloud_config(cloud_config)
+        # Validierung direkt auf dem erzeugten Text – kein erneutes Einlesen der Datei
+        yaml.load(content, Loader=YamlLoader)
+        write_atomic(output_file, content)
+    except yaml.YAMLError as e:
+        fail(f"Ungültige YAML-Datei:\n{e}")
+    except OSError as e:
+        fail(f"Fehler beim Schreiben der {output_file}: {e}")
+    success("YAML-Validierung erfolgreich.")
+
+    cache[cache_key] = {"inputs": digest, "output": _sha256(content.encode())}
+    _save_cache(cache)
+    return True
+
+
+def preview_package_optimization(templates_dir: pathlib.Path, *, username: str, hashed_password: str,
+                                 ssh_key_content: str, arch: str = "amd64", backend: str = "libvirt") -> str:
+    """Dry-Run: Diff zwischen unverändertem und optimiertem cloud-config."""
+    files = template_files(templates_dir)
+    before = render_cloud_config(files, username, hashed_password, ssh_key_content, backend, arch=arch)
+    after = render_cloud_config(
+        files, username, hashed_password, ssh_key_content, backend, optimize_packages=True, arch=arch
+    )
+    return diff_report(dump_cloud_config(before), dump_cloud_config(after))
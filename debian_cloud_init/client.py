@@ -0,0 +1,182 @@
+"""Thin Client für `debian_cloud_init.daemon` – nur Standardbibliothek, startet in Millisekunden.
+
+    python -m debian_cloud_init.client provision build-42 --ssh-key ci.pub --wait --json
+    python -m debian_cloud_init.client status [build-42]
+    python -m debian_cloud_init.client job 7
+    python -m debian_cloud_init.client teardown build-42 --wait
+
+Exit-Code 0 bei Erfolg, 1 bei Fehlern des Auftrags oder der API, 2, wenn
+kein Daemon läuft.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import pathlib
+import socket
+import sys
+import time
+
+POLL_INTERVAL = 2
+
+
+def default_socket_path() -> pathlib.Path:
+    """`DEBIAN_CLOUD_INIT_SOCKET`, sonst `$XDG_RUNTIME_DIR` bzw. /tmp (pro Benutzer)."""
+    if os.environ.get("DEBIAN_CLOUD_INIT_SOCKET"):
+        return pathlib.Path(os.environ["DEBIAN_CLOUD_INIT_SOCKET"])
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return pathlib.Path(os.environ["XDG_RUNTIME_DIR"]) / "debian-cloud-init.sock"
+    return pathlib.Path(f"/tmp/debian-cloud-init-{os.getuid()}.sock")
+
+
+class DaemonError(Exception):
+    """Fehlerantwort der API (`status` ist der HTTP-Status)."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class DaemonUnavailable(ConnectionError):
+    """Auf dem Socket lauscht kein Daemon."""
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: pathlib.Path, timeout: float = 30):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        try:
+            self.sock.connect(str(self.socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise DaemonUnavailable(f"Kein Daemon auf {self.socket_path}") from e
+
+
+def request(method: str, path: str, body: dict | None = None, socket_path: pathlib.Path | None = None) -> dict:
+    """Ein API-Aufruf; wirft DaemonError bei Status >= 400 und DaemonUnavailable ohne Daemon."""
+    conn = _UnixConnection(socket_path or default_socket_path())
+    try:
+        data = json.dumps(body).encode() if body is not None else None
+        conn.request(method, path, body=data, headers={"Content-Type": "application/json"} if data else {})
+        response = conn.getresponse()
+        payload = json.loads(response.read() or b"{}")
+    finally:
+        conn.close()
+    if response.status >= 400:
+        raise DaemonError(response.status, payload.get("error", response.reason))
+    return payload
+
+
+def wait_for_job(job_id: str, socket_path: pathlib.Path | None = None, interval: float = POLL_INTERVAL,
+                 echo=None) -> dict:
+    """Pollt den Auftrag bis "done"/"failed"; neue Log-Zeilen gehen an `echo`."""
+    shown = 0
+    while True:
+        job = request("GET", f"/jobs/{job_id}", socket_path=socket_path)
+        if echo is not None:
+            for line in job["log"][shown:]:
+                echo(line)
+            shown = len(job["log"])
+        if job["state"] in ("done", "failed"):
+            return job
+        time.sleep(interval)
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def _print_job(job: dict, as_json: bool):
+    if as_json:
+        print(json.dumps({key: value for key, value in job.items() if key != "log"}))
+    elif job["state"] == "failed":
+        print(f"❌ Auftrag {job['id']} ({job['kind']} {job['target']}) fehlgeschlagen: {job['error']}")
+    elif job["state"] == "done":
+        print(f"✔ Auftrag {job['id']} ({job['kind']} {job['target']}) erledigt: {json.dumps(job['result'])}")
+    else:
+        print(f"Auftrag {job['id']} ({job['kind']} {job['target']}): {job['state']}")
+
+
+def _submitted(args, response: dict, socket_path: pathlib.Path) -> int:
+    if not args.wait:
+        print(json.dumps(response) if args.json else f"Auftrag {response['job']} angenommen.")
+        return 0
+    job = wait_for_job(response["job"], socket_path, echo=None if args.json else print)
+    _print_job(job, args.json)
+    return 0 if job["state"] == "done" else 1
+
+
+def run(args) -> int:
+    socket_path = args.socket
+    if args.command == "provision":
+        body = {
+            "name": args.name, "distro": args.distro, "arch": args.arch, "profile": args.profile,
+            "username": args.username, "hashed_password": args.hashed_password, "templates": args.templates,
+            "ssh_key": pathlib.Path(args.ssh_key).expanduser().read_text(),
+        }
+        return _submitted(args, request("POST", "/vms", body, socket_path), socket_path)
+    if args.command == "teardown":
+        return _submitted(args, request("DELETE", f"/vms/{args.name}", socket_path=socket_path), socket_path)
+    if args.command == "job":
+        _print_job(request("GET", f"/jobs/{args.id}", socket_path=socket_path), args.json)
+        return 0
+
+    payload = request("GET", f"/vms/{args.name}" if args.name else "/vms", socket_path=socket_path)
+    if args.json:
+        print(json.dumps(payload))
+    elif args.name:
+        addresses = ", ".join(payload["addresses"]) or "-"
+        print(f"{payload['name']}: {payload['state']} ({addresses})")
+        for job in payload["jobs"]:
+            _print_job(job, False)
+    else:
+        for vm in payload["vms"]:
+            print(f"  {vm['name']:<30} {vm['state']}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client für den Provisionierungs-Daemon")
+    parser.add_argument("--socket", type=pathlib.Path, default=default_socket_path(), help="Socket-Pfad")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_prov = sub.add_parser("provision", parents=[common], help="VM provisionieren")
+    p_prov.add_argument("name")
+    p_prov.add_argument("--ssh-key", dest="ssh_key", default="~/.ssh/id_ed25519.pub", help="Öffentlicher SSH-Key")
+    p_prov.add_argument("--distro", help="Distro und Version (Standard: debian/13)")
+    p_prov.add_argument("--arch", choices=["amd64", "arm64"])
+    p_prov.add_argument("--profile")
+    p_prov.add_argument("--username", help="Benutzer (Standard: Vorgabe des Daemons)")
+    p_prov.add_argument("--hashed-password", dest="hashed_password")
+    p_prov.add_argument("--templates", help="Template-Verzeichnis auf dem Daemon-Host")
+    p_prov.add_argument("--wait", action="store_true", help="Bis zum Ende des Auftrags warten")
+
+    p_down = sub.add_parser("teardown", parents=[common], help="VM löschen")
+    p_down.add_argument("name")
+    p_down.add_argument("--wait", action="store_true", help="Bis zum Ende des Auftrags warten")
+
+    p_status = sub.add_parser("status", parents=[common], help="Alle VMs oder eine VM mit ihren Aufträgen")
+    p_status.add_argument("name", nargs="?")
+
+    p_job = sub.add_parser("job", parents=[common], help="Status eines Auftrags")
+    p_job.add_argument("id")
+    args = parser.parse_args()
+
+    try:
+        sys.exit(run(args))
+    except DaemonError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    except DaemonUnavailable as e:
+        print(f"❌ {e} – starten mit: python -m debian_cloud_init.daemon", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import urllib.request
 import yaml
 
 from .ui import ask_yes_no, fail, progress, success
+from .workspace import META_DATA, NETWORK_CONFIG, write_atomic
 
 # =============================================================================
 # YAML Literal Block Support
@@ -13,15 +14,24 @@ from .ui import ask_yes_no, fail, progress, success
 ISOS_PATH = None  # set via config.py import; accessed as cloud_init.ISOS_PATH
 
 
+# C-beschleunigter Loader/Dumper (libyaml), falls PyYAML damit gebaut wurde.
+# Die Ausgabe ist identisch zum reinen Python-Dumper.
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
 class LiteralString(str):
     pass
 
 
 def _literal_representer(dumper, data):
-    return dumper.represent_scalar("tag:yaml.org,2002:str", data, style="|")
+    # libyaml akzeptiert nur exakte str-Instanzen, keine Subklassen
+    return dumper.represent_scalar("tag:yaml.org,2002:str", str(data), style="|")
 
 
 yaml.SafeDumper.add_representer(LiteralString, _literal_representer)
+if YamlDumper is not yaml.SafeDumper:
+    YamlDumper.add_representer(LiteralString, _literal_representer)
 
 
 # =============================================================================
@@ -57,7 +67,7 @@ def ensure_file_exists(path: pathlib.Path, download_url: str | None = None) -> b
 
 def validate_yaml(path: pathlib.Path):
     try:
-        yaml.safe_load(path.read_text())
+        yaml.load(path.read_text(), Loader=YamlLoader)
         success("YAML-Validierung erfolgreich.")
     except yaml.YAMLError as e:
         fail(f"Ungültige YAML-Datei:\n{e}")
@@ -67,27 +77,31 @@ def validate_yaml(path: pathlib.Path):
 # Cloud-Init Metadaten
 # =============================================================================
 
-def create_meta_data(vmname: str, isos_path: pathlib.Path):
-    meta_path = isos_path / "meta-data.yml"
+def create_meta_data(vmname: str, workspace: pathlib.Path) -> pathlib.Path:
+    meta_path = workspace / META_DATA
     content = (
         f"instance-id: {vmname}-{int(time.time())}\n"
         f"local-hostname: {vmname}\n"
     )
     try:
-        meta_path.write_text(content)
+        write_atomic(meta_path, content)
         success(f"meta-data.yml erstellt (Hostname: {vmname}).")
     except OSError as e:
         fail(f"Fehler beim Erstellen der meta-data.yml: {e}")
+    return meta_path
 
 
-def create_network_config(distro: str, isos_path: pathlib.Path) -> pathlib.Path | None:
+def create_network_config(distro: str, workspace: pathlib.Path) -> pathlib.Path | None:
     """Erstellt network-config für Ubuntu (NoCloud-Datasource).
 
     Wird in der Local-Stage verarbeitet – BEVOR apt-get läuft. Ubuntu-Cloud-Images
     kommen mit einer Netplan-Konfiguration für 'ens3' (i440fx), aber mit q35+virtio
     heißt das Interface 'enp1s0'. Der Wildcard-Match löst das zuverlässig.
     """
+    path = workspace / NETWORK_CONFIG
     if not distro.startswith("ubuntu"):
+        # Übrig aus einem früheren Ubuntu-Aufbau unter demselben Namen
+        path.unlink(missing_ok=True)
         return None
 
     net_cfg = {
@@ -101,7 +115,6 @@ def create_network_config(distro: str, isos_path: pathlib.Path) -> pathlib.Path
         },
     }
 
-    path = isos_path / "network-config.yml"
-    path.write_text(yaml.dump(net_cfg, sort_keys=False, Dumper=yaml.SafeDumper))
+    write_atomic(path, yaml.dump(net_cfg, sort_keys=False, Dumper=YamlDumper))
     success(f"network-config.yml für Ubuntu erstellt ({path}).")
     return path
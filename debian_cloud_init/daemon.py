@@ -0,0 +1,488 @@
+"""Langlebiger Provisionierungs-Daemon mit lokaler HTTP-API über einen Unix-Socket.
+
+Jeder CLI-Aufruf zahlt Python-Start, Imports, YAML-Parsen der Templates und
+den Aufbau der libvirt-Verbindung erneut. `serve` hält all das in einem
+Prozess warm: geparste Templates (`build._load_template`), die native
+libvirt-Verbindung (`virt.connection`) und die Images in ISOS_PATH. Aufträge
+kommen über HTTP/JSON auf einem Unix-Socket (nur für den Besitzer lesbar),
+landen in einer Warteschlange und werden von `--workers` Threads
+abgearbeitet. `debian_cloud_init.client` ist der passende Thin Client.
+
+    POST   /vms           VM provisionieren   → 202 {"job": …}
+    GET    /vms           Domains mit Zustand
+    GET    /vms/<name>    Zustand, IPs und Aufträge einer VM
+    DELETE /vms/<name>    VM löschen          → 202 {"job": …}
+    GET    /jobs          alle Aufträge
+    GET    /jobs/<id>     Auftrag mit Status, Ergebnis und Log
+    GET    /health        Warteschlange und laufende Aufträge
+    GET    /metrics       Metriken im Prometheus-Textformat (siehe `metrics`)
+
+Die Ausgabe (`progress`, `success`, `fail`) eines Auftrags landet in dessen
+Log; `fail` beendet nur den Auftrag, nicht den Daemon. Jede VM baut ihre
+cloud-init-Dateien in einem eigenen Workspace; nur der Download eines
+Basis-Images läuft serialisiert. Mit `--seed-listen` läuft der Seed-Server
+(`seed_server`) im selben Prozess mit.
+
+    python -m debian_cloud_init.daemon --workers 4 \\
+        --username ci --hashed-password '$6$…' --templates ./templates
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import pathlib
+import queue
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+from . import seed_server, ui, virt
+from .client import default_socket_path
+from .domain import ARCHES
+from .metrics import fleet, flush, inc, phase, register_collector, render, scoped_labels
+from .pool import provision_vm
+from .profiles import DEFAULT_PROFILE, PROFILES
+from .session import all_sessions, delete_session
+from .teardown import destroy_domain, teardown_all
+from .vm import ISOS_PATH
+
+DEFAULT_WORKERS = 2
+HOST = socket.gethostname()
+LOG_TAIL = 200
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,62}$")
+
+
+def work_dir() -> pathlib.Path:
+    return ISOS_PATH / ".daemon"
+
+
+class RequestError(Exception):
+    """Ungültige Anfrage; wird als JSON-Fehler mit `status` beantwortet."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# =============================================================================
+# Ausgabe pro Auftrag
+# =============================================================================
+
+class _ThreadOutput(io.TextIOBase):
+    """stdout-Ersatz: Worker-Threads schreiben ins Log ihres Auftrags, alle anderen durch."""
+
+    def __init__(self, target):
+        self.target = target
+        self.local = threading.local()
+
+    def write(self, text: str) -> int:
+        log = getattr(self.local, "log", None)
+        if log is None:
+            return self.target.write(text)
+        log.append(text)
+        return len(text)
+
+    def flush(self):
+        self.target.flush()
+
+
+def _log_lines(chunks: list[str]) -> list[str]:
+    return "".join(chunks).strip("\n").splitlines()[-LOG_TAIL:]
+
+
+# =============================================================================
+# Warteschlange
+# =============================================================================
+
+class JobQueue:
+    """Aufträge als dicts, abgearbeitet von `workers` Threads in Eingangsreihenfolge."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.jobs: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.pending: queue.Queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._logs: dict[str, list[str]] = {}
+        self.output = None
+        self.threads = [threading.Thread(target=self._work, daemon=True, name=f"worker-{i}")
+                        for i in range(workers)]
+
+    def start(self):
+        ui.NON_INTERACTIVE = True
+        if not isinstance(sys.stdout, _ThreadOutput):
+            sys.stdout = _ThreadOutput(sys.stdout)
+        self.output = sys.stdout
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, kind: str, target: str, params: dict, func: Callable[[dict], dict]) -> dict:
+        with self.lock:
+            job_id = str(next(self._ids))
+            self.jobs[job_id] = {
+                "id": job_id, "kind": kind, "target": target, "params": params, "state": "queued",
+                "submitted": time.time(), "started": None, "finished": None, "result": None, "error": None,
+            }
+            self._logs[job_id] = []
+            job = self._view(job_id)
+        self.pending.put((job_id, func))
+        return job
+
+    def active(self, target: str) -> dict | None:
+        """Wartender oder laufender Auftrag für diese VM."""
+        with self.lock:
+            for job_id, job in self.jobs.items():
+                if job["target"] == target and job["state"] in ("queued", "running"):
+                    return self._view(job_id)
+        return None
+
+    def get(self, job_id: str) -> dict | None:
+        with self.lock:
+            return self._view(job_id, log=True) if job_id in self.jobs else None
+
+    def list(self, target: str | None = None) -> list[dict]:
+        with self.lock:
+            return [self._view(job_id) for job_id, job in self.jobs.items()
+                    if target is None or job["target"] == target]
+
+    def counts(self) -> dict[str, int]:
+        with self.lock:
+            states = [job["state"] for job in self.jobs.values()]
+        return {state: states.count(state) for state in ("queued", "running", "done", "failed")}
+
+    def _view(self, job_id: str, log: bool = False) -> dict:
+        job = {key: value for key, value in self.jobs[job_id].items() if key != "params"}
+        if log:
+            job["log"] = _log_lines(self._logs[job_id])
+        return job
+
+    def _work(self):
+        while True:
+            job_id, func = self.pending.get()
+            with self.lock:
+                job = self.jobs[job_id]
+                job.update(state="running", started=time.time())
+                params = job["params"]
+                log = self._logs[job_id]
+            if self.output is not None:
+                self.output.local.log = log
+            try:
+                result, error = func(params), None
+            except SystemExit:
+                # fail() hat die Meldung bereits ins Log geschrieben
+                failed = [line for line in _log_lines(log) if line.startswith("❌")]
+                result, error = None, failed[-1].removeprefix("❌").strip() if failed else "Abgebrochen"
+            except Exception as e:  # noqa: BLE001 - ein Auftrag darf den Worker nicht beenden
+                result, error = None, str(e) or type(e).__name__
+            finally:
+                if self.output is not None:
+                    self.output.local.log = None
+            with self.lock:
+                job.update(state="failed" if error else "done", finished=time.time(), result=result, error=error)
+            try:
+                flush()
+            except OSError as e:
+                print(f"⚠ Metriken konnten nicht geschrieben werden: {e}", file=sys.__stdout__)
+            self.pending.task_done()
+
+
+# =============================================================================
+# Aufträge
+# =============================================================================
+
+def provision_params(body: dict, defaults: dict) -> dict:
+    """Prüft eine Provisionierungs-Anfrage und ergänzt die Daemon-Vorgaben."""
+    params = {**defaults, **{key: value for key, value in body.items() if value is not None}}
+    params.setdefault("distro", "debian/13")
+    params.setdefault("arch", "amd64")
+    params.setdefault("profile", DEFAULT_PROFILE)
+    wrong = [key for key in ("name", "distro", "arch", "profile", "ssh_key")
+             if key in params and not isinstance(params[key], str)]
+    if wrong:
+        raise RequestError(400, f"Text erwartet für: {', '.join(wrong)}")
+    name = params.get("name") or ""
+    if not _NAME_RE.match(name):
+        raise RequestError(400, f"Ungültiger VM-Name: '{name}'")
+    if "/" not in params["distro"]:
+        raise RequestError(400, f"Ungültige Distro: '{params['distro']}' (z.B. debian/13)")
+    if params["arch"] not in ARCHES:
+        raise RequestError(400, f"Ungültige Architektur: '{params['arch']}'")
+    if params["profile"] not in PROFILES:
+        raise RequestError(400, f"Unbekanntes Profil: '{params['profile']}'")
+    missing = [key for key in ("username", "hashed_password", "ssh_key", "templates") if not params.get(key)]
+    if missing:
+        raise RequestError(400, f"Fehlende Angaben: {', '.join(missing)}")
+    return params
+
+
+def provision_job(params: dict, staging_lock: threading.Lock) -> dict:
+    name = params["name"]
+    workdir = work_dir()
+    workdir.mkdir(parents=True, exist_ok=True)
+    key_file = workdir / f"{name}.pub"
+    key_file.write_text(params["ssh_key"].strip() + "\n")
+    settings = {**params, "ssh_key": str(key_file)}
+    outcome = "error"
+    with scoped_labels(backend="kvm", host=HOST, distro=params["distro"], arch=params["arch"]):
+        try:
+            with phase("total"):
+                ip = provision_vm(name, params["distro"], params["arch"], params["profile"], settings,
+                                  staging_lock=staging_lock)
+            if ip:
+                outcome = "ok"
+        finally:
+            inc("runs_total", result=outcome)
+    if not ip:
+        raise RuntimeError(f"VM '{name}' konnte nicht provisioniert werden")
+    ui.success(f"VM '{name}' bereit ({ip}).")
+    return {"name": name, "ip": ip, "username": params["username"]}
+
+
+def teardown_job(params: dict) -> dict:
+    name = params["name"]
+    with scoped_labels(backend="kvm", host=HOST), phase("teardown"):
+        result = asyncio.run(teardown_all([{"name": name, "host": "local"}], destroy_domain))[0]
+    if result["error"]:
+        raise RuntimeError(result["error"])
+    delete_session(name)
+    (work_dir() / f"{name}.pub").unlink(missing_ok=True)
+    ui.success(f"VM '{name}' gelöscht.")
+    return {"name": name, "freed": result["freed"], "seconds": result["seconds"]}
+
+
+def vm_status(name: str) -> dict:
+    state = virt.domain_state(name)
+    return {
+        "name": name,
+        "state": state or "undefined",
+        "addresses": virt.agent_ipv4_addresses(name) if state == "running" else [],
+        "session": name in all_sessions(),
+    }
+
+
+# =============================================================================
+# HTTP
+# =============================================================================
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: pathlib.Path, jobs: JobQueue, defaults: dict):
+        self.socket_path = socket_path
+        self.jobs = jobs
+        self.defaults = defaults
+        self.staging_lock = threading.Lock()
+        self.submit_lock = threading.Lock()
+        super().__init__(str(socket_path), _Handler)
+
+    def server_bind(self):
+        _remove_stale_socket(self.socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        self.socket_path.unlink(missing_ok=True)
+
+    # ---- Routen ----
+
+    def provision(self, body: dict) -> tuple[int, dict]:
+        params = provision_params(body, self.defaults)
+        name = params["name"]
+        with self.submit_lock:
+            if self.jobs.active(name):
+                raise RequestError(409, f"Für '{name}' läuft bereits ein Auftrag")
+            if virt.domain_exists(name):
+                raise RequestError(409, f"VM '{name}' existiert bereits")
+            job = self.jobs.submit("provision", name, params, lambda p: provision_job(p, self.staging_lock))
+        return 202, {"job": job["id"], "state": job["state"]}
+
+    def teardown(self, name: str) -> tuple[int, dict]:
+        with self.submit_lock:
+            if self.jobs.active(name):
+                raise RequestError(409, f"Für '{name}' läuft bereits ein Auftrag")
+            if not virt.domain_exists(name):
+                raise RequestError(404, f"VM '{name}' nicht gefunden")
+            job = self.jobs.submit("teardown", name, {"name": name}, teardown_job)
+        return 202, {"job": job["id"], "state": job["state"]}
+
+    def vm(self, name: str) -> tuple[int, dict]:
+        status = vm_status(name)
+        status["jobs"] = self.jobs.list(name)
+        if status["state"] == "undefined" and not status["jobs"]:
+            raise RequestError(404, f"VM '{name}' nicht gefunden")
+        return 200, status
+
+    def vms(self) -> tuple[int, dict]:
+        domains = virt.list_domains()
+        if domains is None:
+            raise RequestError(503, "libvirt nicht erreichbar")
+        return 200, {"vms": [{"name": name, "state": virt.domain_state(name)} for name in sorted(domains)]}
+
+    def job(self, job_id: str) -> tuple[int, dict]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise RequestError(404, f"Auftrag {job_id} nicht gefunden")
+        return 200, job
+
+    def health(self) -> tuple[int, dict]:
+        return 200, {"ok": True, "pid": os.getpid(), "workers": len(self.jobs.threads), **self.jobs.counts()}
+
+
+def _remove_stale_socket(path: pathlib.Path):
+    """Entfernt einen verwaisten Socket; bricht ab, wenn dort schon ein Daemon lauscht."""
+    if not path.exists():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(path))
+        except OSError:
+            path.unlink()
+            return
+    raise OSError(f"Auf {path} läuft bereits ein Daemon")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: DaemonServer  # pyright: ignore[reportIncompatibleVariableOverride]
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self) -> str:
+        # Unix-Sockets haben keine Client-Adresse
+        return "unix"
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.log_date_time_string()} {format % args}\n")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method: str):
+        parts = [part for part in urlsplit(self.path).path.split("/") if part]
+        try:
+            body = self._body()
+            match method, parts:
+                case "GET", ["health"]:
+                    status, payload = self.server.health()
+                case "GET", ["metrics"]:
+                    self._send_text(200, render())
+                    return
+                case "GET", ["vms"]:
+                    status, payload = self.server.vms()
+                case "POST", ["vms"]:
+                    status, payload = self.server.provision(body)
+                case "GET", ["vms", name]:
+                    status, payload = self.server.vm(name)
+                case "DELETE", ["vms", name]:
+                    status, payload = self.server.teardown(name)
+                case "GET", ["jobs"]:
+                    status, payload = 200, {"jobs": self.server.jobs.list()}
+                case "GET", ["jobs", job_id]:
+                    status, payload = self.server.job(job_id)
+                case _:
+                    raise RequestError(404, f"Unbekannter Pfad: {method} {self.path}")
+        except RequestError as e:
+            status, payload = e.status, {"error": str(e)}
+        self._send(status, payload)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise RequestError(400, f"Ungültiges JSON: {e}") from None
+        if not isinstance(body, dict):
+            raise RequestError(400, "JSON-Objekt erwartet")
+        return body
+
+    def _send_text(self, status: int, text: str):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def serve(socket_path: pathlib.Path, workers: int = DEFAULT_WORKERS, defaults: dict | None = None,
+          seed_listen: tuple[str, int] | None = None):
+    jobs = JobQueue(workers)
+    server = DaemonServer(socket_path, jobs, defaults or {})
+    jobs.start()
+    virt.connection()
+    register_collector(lambda: fleet(virt.domain_states() or [], backend="kvm", host=HOST))
+    seed = None
+    if seed_listen:
+        seed = seed_server.start(seed_listen)
+        ui.success(f"Seed-Server lauscht auf {seed_listen[0]}:{seed_listen[1]}.")
+    ui.success(f"Daemon lauscht auf {socket_path} ({workers} Worker).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if seed:
+            seed.shutdown()
+            seed.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provisionierungs-Daemon mit API auf einem Unix-Socket")
+    parser.add_argument("--socket", type=pathlib.Path, default=default_socket_path(),
+                        help=f"Socket-Pfad (Standard: {default_socket_path()})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Höchstens N Aufträge gleichzeitig (Standard: {DEFAULT_WORKERS})")
+    parser.add_argument("--username", help="Standard-Benutzer für neue VMs")
+    parser.add_argument("--hashed-password", dest="hashed_password", help="Standard-Passwort-Hash (SHA-512)")
+    parser.add_argument("--templates", help="Template-Verzeichnis (Standard: ./templates)")
+    parser.add_argument("--net-type", dest="net_type", choices=["default", "bridge"])
+    parser.add_argument("--bridge-interface", dest="bridge_interface")
+    parser.add_argument("--seed-listen", dest="seed_listen", type=seed_server.parse_listen,
+                        help="Seed-Server im selben Prozess starten (HOST[:PORT], siehe seed_server)")
+    args = parser.parse_args()
+
+    templates = args.templates or ("templates" if pathlib.Path("templates").is_dir() else None)
+    defaults = {
+        "username": args.username,
+        "hashed_password": args.hashed_password,
+        "templates": str(pathlib.Path(templates).resolve()) if templates else None,
+        "net_type": args.net_type,
+        "bridge_interface": args.bridge_interface,
+    }
+    serve(args.socket, args.workers, {key: value for key, value in defaults.items() if value}, args.seed_listen)
+
+
+if __name__ == "__main__":
+    main()
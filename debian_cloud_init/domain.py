@@ -0,0 +1,238 @@
+"""Domain-XML ohne virt-install.
+
+virt-install fragt bei jedem Aufruf osinfo-db und den Host ab und braucht
+dafür pro VM mehrere Sekunden – bei parallel angelegten VMs serialisiert das
+zusätzlich. Hier wird das Domain-XML direkt erzeugt und über `virt.py`
+definiert und gestartet.
+
+Das Gerätelayout ist an die bisherigen virt-install-Parameter angelehnt
+(q35/UEFI für amd64, `virt` für arm64, Seed-ISO als SCSI-CDROM, Bridge- oder
+NAT-NIC), aber nicht gegen dessen Ausgabe abgeglichen. Die statischen Teile werden pro
+(Architektur, Maschine, Profil) einmal aufgebaut und danach nur noch kopiert
+und um Name, Pfade, NIC, NUMA-Pinning und L2-Cache ergänzt.
+
+Mit `DEBIAN_CLOUD_INIT_VIRT_INSTALL=1` wird wie bisher virt-install
+verwendet.
+"""
+
+import copy
+import functools
+import pathlib
+import xml.etree.ElementTree as ET
+
+from .numa import HUGEPAGE_KB, format_cpulist
+from .overlay import is_tuned, l2_cache_bytes
+from .profiles import get_profile
+
+LIBOSINFO_NS = "http://libosinfo.org/xmlns/libvirt/domain/1.0"
+ET.register_namespace("libosinfo", LIBOSINFO_NS)
+
+ARCHES = {
+    "amd64": {"virt_type": "kvm", "arch": "x86_64", "machine": "q35", "cpu": "host-passthrough"},
+    "arm64": {"virt_type": "qemu", "arch": "aarch64", "machine": "virt", "cpu": "max"},
+}
+
+_OS_IDS = {
+    "debian": "http://debian.org/debian/{version}",
+    "ubuntu": "http://ubuntu.com/ubuntu/{version}",
+}
+
+
+def arch_settings(arch: str) -> dict:
+    return ARCHES["arm64" if arch == "arm64" else "amd64"]
+
+
+def os_id(distro: str) -> str:
+    """libosinfo-ID wie bei `--os-variant` (debian13 → http://debian.org/debian/13)."""
+    name, version = distro.split("/", 1)
+    return _OS_IDS.get(name, _OS_IDS["debian"]).format(version=version)
+
+
+def _sub(parent: ET.Element, tag: str, text: str | int | None = None, **attrib) -> ET.Element:
+    element = ET.SubElement(parent, tag, {k: str(v) for k, v in attrib.items()})
+    if text is not None:
+        element.text = str(text)
+    return element
+
+
+def _find(parent: ET.Element, path: str) -> ET.Element:
+    """`find` für Elemente, die die Vorlage immer enthält."""
+    element = parent.find(path)
+    if element is None:
+        raise KeyError(path)
+    return element
+
+
+# =============================================================================
+# Vorlagen pro (Architektur, Maschine, Profil)
+# =============================================================================
+
+def _disk_driver(profile: dict) -> dict:
+    driver: dict[str, str | int] = {"name": "qemu", "type": "qcow2"}
+    for key in ("cache", "io", "discard"):
+        if profile.get(key):
+            driver[key] = profile[key]
+    if profile["bus"] == "virtio-blk":
+        if profile.get("iothreads"):
+            driver["iothread"] = 1
+        if profile.get("queues"):
+            driver["queues"] = profile["queues"]
+    return driver
+
+
+@functools.cache
+def _template(arch: str, machine: str, profile_name: str) -> ET.Element:
+    """Statisches Domain-XML; Name, Pfade, NIC und NUMA setzt `domain_xml`."""
+    settings = arch_settings(arch)
+    profile = get_profile(profile_name)
+    memory_kib = profile["memory"] * 1024
+
+    domain = ET.Element("domain", {"type": settings["virt_type"]})
+    _sub(domain, "name")
+    metadata = _sub(domain, "metadata")
+    libosinfo = _sub(metadata, f"{{{LIBOSINFO_NS}}}libosinfo")
+    _sub(libosinfo, f"{{{LIBOSINFO_NS}}}os")
+    _sub(domain, "memory", memory_kib, unit="KiB")
+    _sub(domain, "currentMemory", memory_kib, unit="KiB")
+    _sub(domain, "vcpu", profile["vcpus"])
+    if profile.get("iothreads"):
+        _sub(domain, "iothreads", profile["iothreads"])
+
+    os_element = _sub(domain, "os", firmware="efi")
+    _sub(os_element, "type", "hvm", arch=settings["arch"], machine=machine)
+    _sub(os_element, "boot", dev="hd")
+
+    features = _sub(domain, "features")
+    _sub(features, "acpi")
+    if arch != "arm64":
+        _sub(features, "apic")
+        _sub(features, "vmport", state="off")
+
+    if settings["cpu"] == "host-passthrough":
+        _sub(domain, "cpu", mode="host-passthrough")
+    else:
+        cpu = _sub(domain, "cpu", mode="custom", match="exact")
+        _sub(cpu, "model", settings["cpu"])
+
+    clock = _sub(domain, "clock", offset="utc")
+    if arch != "arm64":
+        _sub(clock, "timer", name="rtc", tickpolicy="catchup")
+        _sub(clock, "timer", name="pit", tickpolicy="delay")
+        _sub(clock, "timer", name="hpet", present="no")
+        pm = _sub(domain, "pm")
+        _sub(pm, "suspend-to-mem", enabled="no")
+        _sub(pm, "suspend-to-disk", enabled="no")
+
+    devices = _sub(domain, "devices")
+    scsi_disk = profile["bus"] == "virtio-scsi"
+
+    disk = _sub(devices, "disk", type="file", device="disk")
+    _sub(disk, "driver", **_disk_driver(profile))
+    _sub(disk, "source")
+    _sub(disk, "target", dev="sda" if scsi_disk else "vda", bus="scsi" if scsi_disk else "virtio")
+
+    seed = _sub(devices, "disk", type="file", device="cdrom")
+    _sub(seed, "driver", name="qemu", type="raw")
+    _sub(seed, "source")
+    _sub(seed, "target", dev="sdb" if scsi_disk else "sda", bus="scsi")
+    _sub(seed, "readonly")
+
+    _sub(devices, "controller", type="usb", model="qemu-xhci", ports=15)
+    controller = _sub(devices, "controller", type="scsi", model="virtio-scsi")
+    if scsi_disk and (profile.get("iothreads") or profile.get("queues")):
+        driver = {}
+        if profile.get("iothreads"):
+            driver["iothread"] = 1
+        if profile.get("queues"):
+            driver["queues"] = profile["queues"]
+        _sub(controller, "driver", **driver)
+
+    console = _sub(devices, "console", type="pty")
+    _sub(console, "target", type="serial")
+    channel = _sub(devices, "channel", type="unix")
+    _sub(channel, "source", mode="bind")
+    _sub(channel, "target", type="virtio", name="org.qemu.guest_agent.0")
+    rng = _sub(devices, "rng", model="virtio")
+    _sub(rng, "backend", "/dev/urandom", model="random")
+    return domain
+
+
+# =============================================================================
+# Variable Teile
+# =============================================================================
+
+def _interface(net_type: str, bridge_interface: str | None) -> ET.Element:
+    if net_type == "bridge" and bridge_interface:
+        iface = ET.Element("interface", {"type": "direct"})
+        _sub(iface, "source", dev=bridge_interface, mode="bridge")
+    else:
+        iface = ET.Element("interface", {"type": "network"})
+        _sub(iface, "source", network="default")
+    _sub(iface, "model", type="virtio")
+    return iface
+
+
+def _apply_pinning(domain: ET.Element, plan: dict):
+    """cputune, numatune, Hugepages und NUMA-Zelle – wie `numa.virt_install_numa_options`."""
+    node = plan["node"]
+    vcpus = len(plan["cpus"])
+
+    backing = ET.Element("memoryBacking")
+    hugepages = _sub(backing, "hugepages")
+    _sub(hugepages, "page", size=HUGEPAGE_KB, unit="KiB", nodeset=0)
+    domain.insert(list(domain).index(_find(domain, "vcpu")), backing)
+
+    cputune = ET.Element("cputune")
+    for i, cpu in enumerate(plan["cpus"]):
+        _sub(cputune, "vcpupin", vcpu=i, cpuset=cpu)
+    _sub(cputune, "emulatorpin", cpuset=format_cpulist(plan["emulator"]))
+    numatune = ET.Element("numatune")
+    _sub(numatune, "memory", mode="strict", nodeset=node)
+    _sub(numatune, "memnode", cellid=0, mode="strict", nodeset=node)
+    position = list(domain).index(_find(domain, "os"))
+    domain.insert(position, numatune)
+    domain.insert(position, cputune)
+
+    numa = _sub(_find(domain, "cpu"), "numa")
+    _sub(numa, "cell", id=0, cpus=f"0-{vcpus - 1}", memory=plan["memory_mb"] * 1024, unit="KiB")
+
+
+def _apply_smbios_serial(domain: ET.Element, serial: str):
+    """SMBIOS-Seriennummer, z.B. `ds=nocloud;s=…` für den Seed-Server."""
+    sysinfo = ET.Element("sysinfo", {"type": "smbios"})
+    _sub(_sub(sysinfo, "system"), "entry", serial, name="serial")
+    os_element = _find(domain, "os")
+    domain.insert(list(domain).index(os_element), sysinfo)
+    _sub(os_element, "smbios", mode="sysinfo")
+
+
+def domain_xml(vmname: str, arch: str, distro: str, profile_name: str, disk: pathlib.Path,
+               seed_iso: pathlib.Path | None, net_type: str = "default", bridge_interface: str | None = None,
+               overlay: dict | None = None, pinning: dict | None = None, smbios_serial: str | None = None) -> str:
+    """Ohne `seed_iso` entfällt das CDROM; die Daten kommen dann über `smbios_serial` (NoCloud-net)."""
+    settings = arch_settings(arch)
+    domain = copy.deepcopy(_template(arch, settings["machine"], profile_name))
+
+    _find(domain, "name").text = vmname
+    _find(domain, f"metadata/{{{LIBOSINFO_NS}}}libosinfo/{{{LIBOSINFO_NS}}}os").set("id", os_id(distro))
+
+    devices = _find(domain, "devices")
+    system_disk, seed = domain.findall("devices/disk")
+    _find(system_disk, "source").set("file", str(disk))
+    if seed_iso:
+        _find(seed, "source").set("file", str(seed_iso))
+    else:
+        devices.remove(seed)
+    if overlay and is_tuned(overlay):
+        cache = _sub(_find(system_disk, "driver"), "metadata_cache")
+        _sub(cache, "max_size", l2_cache_bytes(overlay), unit="bytes")
+
+    devices.insert(list(devices).index(_find(devices, "console")), _interface(net_type, bridge_interface))
+
+    if pinning:
+        _apply_pinning(domain, pinning)
+    if smbios_serial:
+        _apply_smbios_serial(domain, smbios_serial)
+
+    ET.indent(domain)
+    return ET.tostring(domain, encoding="unicode") + "\n"
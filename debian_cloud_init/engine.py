@@ -0,0 +1,168 @@
+"""Asynchrone Befehlsausführung ohne Shell.
+
+Für nebenläufige Abläufe (Pool, Flotten, Daemon) gibt es hier:
+
+- `run_async(argv, timeout=…)`  – ein Befehl als argv-Liste, ohne Shell,
+  mit Timeout; stdout/stderr werden zeilenweise an `on_line` (Standard:
+  Logger `debian_cloud_init.engine`) gereicht
+- `run_all([argv, …], limit=…)` – viele Befehle parallel, höchstens `limit`
+  gleichzeitig
+- `run_sync(argv, …)`           – dasselbe für synchronen Code
+
+`run_cmd` (ui) und `ssh_run` (proxmox) sind synchrone Hüllen um `run_sync`
+für die interaktiven Abläufe: ohne Timeout, Ausgabe per `echo_line` im
+Terminal, und bei Fehlern wird das Programm beendet.
+
+Fehler werden nicht mit `sys.exit` quittiert, sondern als `CommandError`
+(bzw. `CommandTimeout`) geworfen. Bei Timeout, Abbruch (`CancelledError`)
+oder einer Zeile über `LINE_LIMIT` wird der Prozess beendet.
+"""
+
+import asyncio
+import logging
+import os
+import shlex
+import subprocess
+import sys
+from collections.abc import Callable
+
+from .metrics import count_timeout, timed_command
+from .ui import clean_env
+
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_LIMIT = 8
+# Längste Zeile, die gelesen wird – pvesh liefert JSON in einer einzigen Zeile
+LINE_LIMIT = 16 * 1024 * 1024
+
+log = logging.getLogger(__name__)
+
+LineHandler = Callable[[list[str], str, str], None]
+
+
+class CommandError(Exception):
+    """Befehl mit Exit-Code != 0 (oder nicht startbar: Exit-Code 127)."""
+
+    def __init__(self, argv: list[str], returncode: int | None, stdout: str = "", stderr: str = ""):
+        self.argv = argv
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        super().__init__(str(self))
+
+    def __str__(self) -> str:
+        detail = self.stderr.strip().splitlines()[-1] if self.stderr.strip() else ""
+        return f"{shlex.join(self.argv)} endete mit Exit-Code {self.returncode}" + (f": {detail}" if detail else "")
+
+
+class CommandTimeout(CommandError):
+    def __init__(self, argv: list[str], timeout: float, stdout: str = "", stderr: str = ""):
+        self.timeout = timeout
+        super().__init__(argv, None, stdout, stderr)
+
+    def __str__(self) -> str:
+        return f"{shlex.join(self.argv)} nach {self.timeout:g} s abgebrochen (Timeout)"
+
+
+def log_line(argv: list[str], stream: str, line: str):
+    log.debug("%s [%s] %s", argv[0], stream, line)
+
+
+def echo_line(argv: list[str], stream: str, line: str):
+    print(line, file=sys.stderr if stream == "stderr" else sys.stdout, flush=True)
+
+
+async def _pump(reader: asyncio.StreamReader, argv: list[str], stream: str, sink: list[str], on_line: LineHandler):
+    while True:
+        raw = await reader.readline()
+        if not raw:
+            return
+        line = raw.decode(errors="replace").rstrip("\n")
+        sink.append(line)
+        on_line(argv, stream, line)
+
+
+async def _stop(proc: asyncio.subprocess.Process):
+    if proc.returncode is None:
+        proc.kill()
+        await proc.wait()
+
+
+async def run_async(argv: list[str], *, timeout: float | None = DEFAULT_TIMEOUT, check: bool = True,
+                    input: str | None = None, on_line: LineHandler = log_line, env: dict | None = None,
+                    cwd: str | None = None, label: str | None = None) -> subprocess.CompletedProcess[str]:
+    """Führt argv ohne Shell aus; wirft CommandError/CommandTimeout statt das Programm zu beenden.
+
+    `label` ersetzt den Programmnamen in den Metriken (z.B. "ssh qm").
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            env=env if env is not None else clean_env(), cwd=cwd, limit=LINE_LIMIT,
+        )
+    except OSError as e:
+        raise CommandError(argv, 127, "", str(e)) from e
+    assert proc.stdout is not None and proc.stderr is not None
+    stdout_reader, stderr_reader = proc.stdout, proc.stderr
+
+    out: list[str] = []
+    err: list[str] = []
+
+    async def communicate():
+        if input is not None:
+            assert proc.stdin is not None
+            proc.stdin.write(input.encode())
+            await proc.stdin.drain()
+            proc.stdin.close()
+        await asyncio.gather(
+            _pump(stdout_reader, argv, "stdout", out, on_line),
+            _pump(stderr_reader, argv, "stderr", err, on_line),
+        )
+        return await proc.wait()
+
+    try:
+        with timed_command(label or os.path.basename(argv[0])):
+            returncode = await asyncio.wait_for(communicate(), timeout)
+    except TimeoutError:
+        await _stop(proc)
+        count_timeout("command")
+        raise CommandTimeout(argv, timeout or 0.0, "\n".join(out), "\n".join(err)) from None
+    except ValueError:
+        # StreamReader.readline: Zeile länger als LINE_LIMIT
+        await _stop(proc)
+        raise CommandError(argv, proc.returncode, "\n".join(out),
+                           f"Ausgabezeile länger als {LINE_LIMIT} Byte") from None
+    except asyncio.CancelledError:
+        await _stop(proc)
+        raise
+
+    stdout = "\n".join(out) + ("\n" if out else "")
+    stderr = "\n".join(err) + ("\n" if err else "")
+    if check and returncode != 0:
+        raise CommandError(argv, returncode, stdout, stderr)
+    return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
+
+
+async def run_all(commands: list[list[str]], *, limit: int = DEFAULT_LIMIT,
+                  **kwargs) -> list[subprocess.CompletedProcess[str] | CommandError]:
+    """Führt alle Befehle nebenläufig aus (höchstens `limit` gleichzeitig).
+
+    Das Ergebnis steht an derselben Position wie der Befehl; fehlgeschlagene
+    Befehle liefern ihren CommandError statt die anderen abzubrechen.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def one(argv):
+        async with semaphore:
+            try:
+                return await run_async(argv, **kwargs)
+            except CommandError as e:
+                return e
+
+    return await asyncio.gather(*(one(argv) for argv in commands))
+
+
+def run_sync(argv: list[str], **kwargs) -> subprocess.CompletedProcess[str]:
+    """Synchroner Einstieg für Code ohne Event-Loop."""
+    return asyncio.run(run_async(argv, **kwargs))
@@ -0,0 +1,229 @@
+"""Zwischengespeicherte Fakten über Hosts, die sich fast nie ändern.
+
+Jeder Lauf fragte bisher dieselben Dinge neu ab: `kvm`-Gruppe und Besitzer
+von ISOS_PATH, Netzwerk-Interfaces (`ip -o link show`), vorhandene Tools –
+auf Proxmox Nodes, Storages, Bridges und welche Images im Storage liegen.
+Diese Fakten werden pro Backend und Host in einem Durchlauf ermittelt und in
+`.host-facts` abgelegt. Jeder Fakt hat eine eigene Gültigkeitsdauer (TTL);
+ist einer der angefragten Fakten abgelaufen, wird der ganze Host neu geprüft.
+
+Nach Änderungen außerhalb dieses Tools (neue Bridge, Image gelöscht, Rechte
+geändert) den Cache gezielt verwerfen:
+
+    python -m debian_cloud_init.facts show
+    python -m debian_cloud_init.facts invalidate --backend proxmox --host 192.168.1.10 --key images
+    python -m debian_cloud_init.facts refresh
+"""
+
+import argparse
+import grp
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import time
+from collections.abc import Callable, Iterable
+
+from .metrics import count_cache
+from .pool import format_duration
+from .ui import fail, success
+
+FACTS_FILE = pathlib.Path(".host-facts")
+
+LOCAL_TTLS = {
+    "uid": 86400,
+    "kvm_gid": 86400,
+    "isos": 3600,
+    "interfaces": 600,
+    "tools": 86400,
+}
+
+# Tools, die die lokalen Schritte aufrufen (virsh nur ohne libvirt-python bzw. mit DEBIAN_CLOUD_INIT_VIRSH)
+LOCAL_TOOLS = ("qemu-img", "genisoimage", "virsh", "virt-install", "wget", "zstd")
+
+# Interfaces, die als Bridge-Ziel nicht in Frage kommen
+_VIRTUAL_PREFIXES = ("virbr", "docker", "br-", "veth")
+
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+def cache_key(backend: str, host: str | None = None) -> str:
+    return f"{backend}/{host}" if host else backend
+
+
+def _load() -> dict:
+    if not FACTS_FILE.exists():
+        return {}
+    try:
+        return json.loads(FACTS_FILE.read_text())
+    except json.JSONDecodeError:
+        return {}
+
+
+def _save(cache: dict):
+    FACTS_FILE.write_text(json.dumps(cache, indent=4))
+
+
+def _fresh(entry: dict, keys: Iterable[str], ttls: dict[str, int]) -> bool:
+    age = time.time() - entry.get("probed", 0)
+    return all(key in entry["facts"] and age <= ttls.get(key, 0) for key in keys)
+
+
+def cached_facts(backend: str, host: str | None, probe: Callable[[], dict], ttls: dict[str, int],
+                 keys: Iterable[str] | None = None, refresh: bool = False) -> dict:
+    """Liefert die Fakten aus dem Cache oder ruft `probe` auf, sobald einer der `keys` abgelaufen ist."""
+    keys = list(keys or ttls)
+    cache = _load()
+    key = cache_key(backend, host)
+    entry = cache.get(key)
+    hit = bool(entry) and not refresh and _fresh(entry, keys, ttls)
+    count_cache("host_facts", hit)
+    if hit and entry:
+        return entry["facts"]
+    facts = probe()
+    cache[key] = {"probed": time.time(), "facts": facts}
+    _save(cache)
+    return facts
+
+
+def facts_entry(backend: str, host: str | None = None) -> dict | None:
+    return _load().get(cache_key(backend, host))
+
+
+def peek_facts(backend: str, host: str | None, ttls: dict[str, int], keys: Iterable[str]) -> dict | None:
+    """Fakten nur aus dem Cache (ohne Prüfung des Hosts); None wenn nicht vorhanden oder abgelaufen."""
+    entry = _load().get(cache_key(backend, host))
+    return entry["facts"] if entry and _fresh(entry, keys, ttls) else None
+
+
+def update_facts(backend: str, host: str | None, **facts):
+    """Ergänzt Fakten eines bereits geprüften Hosts (z.B. nach einem Image-Download)."""
+    cache = _load()
+    entry = cache.get(cache_key(backend, host))
+    if not entry:
+        return
+    entry["facts"].update(facts)
+    _save(cache)
+
+
+def invalidate(backend: str | None = None, host: str | None = None, keys: Iterable[str] | None = None) -> int:
+    """Verwirft Fakten – alle, die eines Backends/Hosts oder nur einzelne Schlüssel. Gibt die Anzahl Hosts zurück."""
+    cache = _load()
+    matched = [
+        k for k in cache
+        if (backend is None or k.partition("/")[0] == backend) and (host is None or k.partition("/")[2] == host)
+    ]
+    for k in matched:
+        if keys:
+            for fact in keys:
+                cache[k]["facts"].pop(fact, None)
+        else:
+            del cache[k]
+    _save(cache)
+    return len(matched)
+
+
+# =============================================================================
+# Lokaler Host
+# =============================================================================
+
+def parse_interfaces(output: str) -> list[str]:
+    """Physische Interfaces aus `ip -o link show` (ohne lo, libvirt-, Docker- und veth-Interfaces)."""
+    interfaces = []
+    for line in output.splitlines():
+        parts = line.split(": ")
+        if len(parts) >= 2:
+            iface = parts[1].split("@")[0]
+            if iface != "lo" and not iface.startswith(_VIRTUAL_PREFIXES):
+                interfaces.append(iface)
+    return interfaces
+
+
+def probe_local() -> dict:
+    from .vm import ISOS_PATH  # lokaler Import um zirkuläre Imports zu vermeiden
+
+    try:
+        kvm_gid = grp.getgrnam("kvm").gr_gid
+    except KeyError:
+        kvm_gid = None
+    try:
+        stat_info = ISOS_PATH.stat()
+        isos = {"path": str(ISOS_PATH), "exists": True, "uid": stat_info.st_uid, "gid": stat_info.st_gid}
+    except FileNotFoundError:
+        isos = {"path": str(ISOS_PATH), "exists": False, "uid": None, "gid": None}
+    try:
+        result = subprocess.run(["ip", "-o", "link", "show"], capture_output=True, text=True, check=False)
+        interfaces = parse_interfaces(result.stdout)
+    except FileNotFoundError:
+        interfaces = []
+    return {
+        "uid": os.getuid(),
+        "kvm_gid": kvm_gid,
+        "isos": isos,
+        "interfaces": interfaces,
+        "tools": {tool: shutil.which(tool) for tool in LOCAL_TOOLS},
+    }
+
+
+def local_facts(keys: Iterable[str] | None = None, refresh: bool = False) -> dict:
+    return cached_facts("local", None, probe_local, LOCAL_TTLS, keys, refresh)
+
+
+def missing_tools(tools: Iterable[str]) -> list[str]:
+    """Tools, die laut Cache fehlen – ein fehlendes Tool wird vor der Meldung noch einmal gesucht."""
+    known = local_facts(["tools"])["tools"]
+    missing = [tool for tool in tools if not known.get(tool)]
+    if missing:
+        # Vielleicht inzwischen installiert – dann nicht auf den Ablauf der TTL warten
+        known = local_facts(["tools"], refresh=True)["tools"]
+        missing = [tool for tool in tools if not known.get(tool)]
+    return missing
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def format_facts(cache: dict) -> str:
+    if not cache:
+        return "Keine Fakten im Cache."
+    lines = []
+    for key in sorted(cache):
+        entry = cache[key]
+        lines.append(f"{key} (vor {format_duration(time.time() - entry.get('probed', 0))} geprüft)")
+        lines += [f"    {name}: {json.dumps(value)}" for name, value in entry["facts"].items()]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m debian_cloud_init.facts",
+        description="Zwischengespeicherte Host-Fakten anzeigen, neu ermitteln oder verwerfen",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("show", help="Cache anzeigen")
+    sub.add_parser("refresh", help="Lokalen Host neu prüfen")
+    p_invalidate = sub.add_parser("invalidate", help="Fakten verwerfen")
+    p_invalidate.add_argument("--backend", choices=["local", "proxmox"], help="Nur dieses Backend")
+    p_invalidate.add_argument("--host", help="Nur dieser Host (mit --backend proxmox)")
+    p_invalidate.add_argument("--key", action="append", help="Nur diesen Fakt (mehrfach möglich)")
+    args = parser.parse_args()
+
+    match args.command:
+        case "show":
+            print(format_facts(_load()))
+        case "refresh":
+            local_facts(refresh=True)
+            print(format_facts({"local": facts_entry("local")}))
+        case "invalidate":
+            if args.host and args.backend != "proxmox":
+                fail("--host nur zusammen mit --backend proxmox.")
+            count = invalidate(args.backend, args.host, args.key)
+            success(f"Fakten von {count} Host(s) verworfen.")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,30 +4,33 @@ import argparse
 import getpass
 import pathlib
 import shlex
+import socket
 import subprocess
 import sys
 
-import yaml
-
-from .cloud_init import (
-    LiteralString,
-    create_meta_data,
-    create_network_config,
-    ensure_file_exists,
-    validate_yaml,
-)
-from .session import delete_session, get_or_create_session
-from .ui import ask_yes_no, fail, progress, success
+from . import virt
+from .build import build_cloud_config, preview_package_optimization
+from .cloud_init import create_meta_data, create_network_config
+from .facts import local_facts
+from .metrics import fleet, phase, record_run, register_collector, set_labels
+from .overlay import overlay_settings, parse_overrides
+from .profiles import DEFAULT_PROFILE, PROFILES, describe_profiles, fio_check
+from .rebuild import capture_golden, config_hash, golden_matches, revert_to_golden
+from .session import delete_session, get_or_create_session, update_session
+from .stages import UNIT_NAME, format_status, wait_for_provisioning
+from .teardown import tombstone_vm
+from .ui import ask_yes_no, success
 from .vm import (
-    ISOS_PATH,
     create_vm,
-    delete_vm,
     ensure_base_image,
     ensure_isos_folder,
     ensure_overlay_image,
+    ensure_tools,
     get_vm_ip,
     print_ssh_command,
+    read_provision_status,
 )
+from .workspace import USER_DATA, ensure_workspace, session_workspace, workspace_dir
 
 
 def _oneline_wizard():
@@ -98,14 +101,7 @@ def _oneline_wizard():
 
     ans = input("\nBridge-Netzwerk verwenden? (Nein = Default NAT) [j/N]: ").strip().lower()
     if ans in ("j", "y", "ja", "yes"):
-        result = subprocess.run(["ip", "-o", "link", "show"], capture_output=True, text=True, check=False)
-        interfaces = []
-        for line in result.stdout.splitlines():
-            parts = line.split(": ")
-            if len(parts) >= 2:
-                iface = parts[1].split("@")[0]
-                if iface not in ("lo",) and not iface.startswith(("virbr", "docker", "br-", "veth")):
-                    interfaces.append(iface)
+        interfaces = local_facts(["interfaces"])["interfaces"]
 
         if not interfaces:
             print("⚠ Keine physischen Interfaces gefunden. Verwende NAT.")
@@ -120,6 +116,13 @@ def _oneline_wizard():
             except (ValueError, IndexError):
                 print("⚠ Ungültige Auswahl. Verwende NAT.")
 
+    print("\nPerformance-Profil wählen:")
+    print(describe_profiles())
+    profile = input(f"Profil [{DEFAULT_PROFILE}]: ").strip() or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        print(f"⚠ Unbekanntes Profil. Verwende {DEFAULT_PROFILE}.")
+        profile = DEFAULT_PROFILE
+
     cmd_parts = [
         "uv", "run", "python", "-m", "debian_cloud_init.generator",
         f"--vmname={vmname}",
@@ -132,6 +135,8 @@ def _oneline_wizard():
     ]
     if bridge_interface:
         cmd_parts.append(f"--bridge-interface={bridge_interface}")
+    if profile != DEFAULT_PROFILE:
+        cmd_parts.append(f"--profile={profile}")
 
     print("\n=== Einzeiler-Befehl ===")
     print(shlex.join(cmd_parts))
@@ -149,6 +154,10 @@ def _session_from_args(args) -> dict:
         "hashed_password": args.hashed_password,
         "net_type": args.net_type,
         "bridge_interface": args.bridge_interface,
+        "profile": args.profile or DEFAULT_PROFILE,
+        "numa": args.numa,
+        "overlay": parse_overrides(args.overlay),
+        "workspace": str(workspace_dir(args.vmname)),
     }
 
 
@@ -173,19 +182,42 @@ def main():
                         help="Netzwerktyp: default (NAT) oder bridge")
     parser.add_argument("--bridge-interface", dest="bridge_interface",
                         help="Bridge-Interface-Name (nur bei --net-type=bridge)")
+    parser.add_argument("--profile", choices=list(PROFILES),
+                        help="Performance-Profil (vCPU/RAM, Disk-Cache/AIO, IOThreads); wird in der Session gespeichert")
+    parser.add_argument("--numa", action="store_true",
+                        help="vCPUs + Emulator auf einen NUMA-Knoten pinnen, RAM aus dessen Hugepages; wird in der Session gespeichert")
+    parser.add_argument("--overlay", action="append", default=[], metavar="KEY=WERT",
+                        help="qcow2-Overlay-Option überschreiben (size, cluster_size, extended_l2, preallocation, "
+                             "lazy_refcounts, compression_type); wird in der Session gespeichert")
+    parser.add_argument("--fio", action="store_true",
+                        help="fio-Check in der VM ausführen und mit anderen Profilen vergleichen")
+    parser.add_argument("--force-build", dest="force_build", action="store_true",
+                        help="cloud-init.yml auch bei unveränderten Templates neu erzeugen")
+    parser.add_argument("--optimize-packages", dest="optimize_packages", action="store_true",
+                        help="apt-Aufrufe zu packages: + einer Installations-Transaktion zusammenfassen")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true",
+                        help="Nur den Diff der Paket-Optimierung anzeigen, nichts schreiben")
+    parser.add_argument("--deferred", action="store_true",
+                        help="Pakete, Tools und System-Konfiguration erst nach dem Boot als systemd-Unit ausführen")
+    parser.add_argument("--wait", action="store_true",
+                        help="Mit --deferred: auf die vollständige Provisionierung warten und Zeiten ausgeben")
+    parser.add_argument("--fast-rebuild", dest="fast_rebuild", action="store_true",
+                        help="Nach der Provisionierung ein Golden-Overlay sichern; 'löschen und neu erstellen' "
+                             "setzt bei unveränderter Konfiguration nur darauf zurück")
     args = parser.parse_args()
 
     if args.oneline:
         _oneline_wizard()
         return
 
-    templates_dir = pathlib.Path("templates")
+    host = socket.gethostname()
+    register_collector(lambda: fleet(virt.domain_states() or [], backend="kvm", host=host))
+    with record_run("kvm", host=host):
+        _setup(args)
 
-    template_file = templates_dir / "cloud-init-template.yml"
-    package_config_file = templates_dir / "package-config.txt"
-    system_config_file = templates_dir / "system-config.txt"
-    tools_file = templates_dir / "amd64-tools.sh"
-    output_file = pathlib.Path("cloud-init.yml")
+
+def _setup(args):
+    templates_dir = pathlib.Path("templates")
 
     # -------------------------------------------------------------------------
     # SESSION LADEN ODER NEUE PARAMETER ABFRAGEN
@@ -205,74 +237,75 @@ def main():
     hashed_password = session["hashed_password"]
     net_type = session["net_type"]
     bridge_interface = session.get("bridge_interface")
+    profile = args.profile or session.get("profile", DEFAULT_PROFILE)
+    numa = args.numa or session.get("numa", False)
+    overlay_overrides = {**session.get("overlay", {}), **parse_overrides(args.overlay)}
+    if (profile != session.get("profile", DEFAULT_PROFILE) or numa != session.get("numa", False)
+            or overlay_overrides != session.get("overlay", {})):
+        update_session(vmname, profile=profile, numa=numa, overlay=overlay_overrides)
+    overlay = overlay_settings(profile, overlay_overrides)
+    set_labels(distro=distro, arch=arch)
+    if is_persistent and "workspace" not in session:
+        update_session(vmname, workspace=str(workspace_dir(vmname)))
+    workspace = ensure_workspace(session_workspace(session))
+    output_file = workspace / USER_DATA
 
     # -------------------------------------------------------------------------
     # CLOUD-INIT GENERIEREN (immer, unabhängig vom VM-Zustand)
     # -------------------------------------------------------------------------
 
-    if not ensure_file_exists(tools_file):
-        fail(f"Pflichtdatei fehlt: {tools_file}")
-    if not ensure_file_exists(system_config_file):
-        fail(f"Pflichtdatei fehlt: {system_config_file}")
-    if not ensure_file_exists(package_config_file):
-        fail(f"Pflichtdatei fehlt: {package_config_file}")
-
-    tools_content = tools_file.read_text()
-    system_config_content = system_config_file.read_text()
-    package_runcmd = [
-        line.strip()
-        for line in package_config_file.read_text().splitlines()
-        if line.strip()
-    ]
-
-    try:
-        cloud_config = yaml.safe_load(template_file.read_text()) or {}
-    except (OSError, yaml.YAMLError) as e:
-        fail(f"Fehler beim Laden des Templates: {e}")
-
-    cloud_config["users"] = [
-        {
-            "name": username,
-            "passwd": hashed_password,
-            "lock_passwd": False,
-            "groups": ["sudo"],
-            "shell": "/bin/bash",
-            "sudo": ["ALL=(ALL) NOPASSWD:ALL"],
-            "ssh_authorized_keys": [ssh_key_content],
-        }
-    ]
-
-    cloud_config["runcmd"] = package_runcmd + [
-        LiteralString(tools_content),
-        LiteralString(system_config_content),
-    ]
-
-    progress("Schreibe cloud-init.yml…")
-    try:
-        yaml_body = yaml.dump(cloud_config, sort_keys=False, Dumper=yaml.SafeDumper)
-        output_file.write_text("#cloud-config\n" + yaml_body)
-    except (OSError, yaml.YAMLError) as e:
-        fail(f"Fehler beim Schreiben der cloud-init.yml: {e}")
+    if args.dry_run:
+        print(preview_package_optimization(
+            templates_dir,
+            username=username,
+            hashed_password=hashed_password,
+            ssh_key_content=ssh_key_content,
+            arch=arch,
+        ) or "Keine apt-Aufrufe zum Zusammenfassen gefunden.")
+        return
 
-    progress("Validiere YAML…")
-    validate_yaml(output_file)
-    create_meta_data(vmname, ISOS_PATH)
-    success("cloud-init.yml erfolgreich erstellt.")
+    with phase("build"):
+        build_cloud_config(
+            templates_dir, output_file,
+            username=username,
+            hashed_password=hashed_password,
+            ssh_key_content=ssh_key_content,
+            arch=arch,
+            optimize_packages=args.optimize_packages,
+            deferred=args.deferred,
+            force=args.force_build,
+        )
+        create_meta_data(vmname, workspace)
+    success(f"{output_file} erfolgreich erstellt.")
+
+    digest = config_hash(output_file, {
+        "distro": distro, "arch": arch, "username": username, "net_type": net_type,
+        "bridge_interface": bridge_interface, "profile": profile, "numa": numa,
+        "overlay": overlay, "deferred": args.deferred,
+    })
 
     if is_persistent:
         print(f"Session geladen: {vmname} ({distro}, {arch})")
         try:
-            state = subprocess.run(
-                ["virsh", "domstate", vmname], capture_output=True, text=True, check=False
-            ).stdout.strip()
-            if state == "running" and ask_yes_no(f"VM '{vmname}' läuft. IP anzeigen?"):
-                ip = get_vm_ip(vmname)
+            if virt.domain_state(vmname) == "running" and ask_yes_no(f"VM '{vmname}' läuft. IP anzeigen?"):
+                with phase("ip"):
+                    ip = get_vm_ip(vmname)
                 if ip:
                     print_ssh_command(username, ip)
+                    if args.fio:
+                        fio_check(vmname, profile, username, ip)
+                    status = read_provision_status(vmname)
+                    if status:
+                        print(f"Provisionierung: {format_status(status)}")
                     return
 
             if ask_yes_no(f"Soll die VM '{vmname}' gelöscht und neu erstellt werden?"):
-                delete_vm(vmname, skip_confirm=True)
+                if args.fast_rebuild:
+                    if golden_matches(vmname, digest):
+                        revert_to_golden(vmname)
+                        return
+                    print("Konfiguration geändert oder kein Golden-Overlay – vollständiger Neuaufbau.")
+                tombstone_vm(vmname)
                 delete_session(vmname)
             else:
                 return
@@ -282,10 +315,32 @@ def main():
     print("\n=== VM-Setup ===")
 
     ensure_isos_folder()
-    ensure_base_image(arch, distro)
-    ensure_overlay_image(vmname, arch, distro)
-    network_config_file = create_network_config(distro, ISOS_PATH)
-    create_vm(vmname, username, arch, net_type, bridge_interface, distro, network_config_file)
+    ensure_tools()
+    with phase("base_image"):
+        ensure_base_image(arch, distro)
+    with phase("overlay"):
+        ensure_overlay_image(vmname, arch, distro, overlay)
+    create_network_config(distro, workspace)
+    with phase("create"):
+        created = create_vm(vmname, username, arch, net_type, bridge_interface, distro, profile, numa, overlay,
+                            workspace)
+
+    if created and args.fast_rebuild:
+        capture_golden(vmname, digest, deferred=args.deferred)
+
+    if created and args.deferred:
+        if args.wait:
+            with phase("provisioning"):
+                status = wait_for_provisioning(lambda: read_provision_status(vmname))
+            print(f"Provisionierung: {format_status(status) if status else 'Status nicht lesbar'}")
+        else:
+            print(f"Verzögerte Provisionierung läuft nach dem Boot weiter: journalctl -u {UNIT_NAME}")
+
+    if created and args.fio:
+        with phase("ip"):
+            ip = get_vm_ip(vmname)
+        if ip:
+            fio_check(vmname, profile, username, ip)
 
     success("Alle Schritte abgeschlossen.")
 
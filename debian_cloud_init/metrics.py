@@ -0,0 +1,299 @@
+"""Provisionierungs-Metriken im Prometheus-Textformat.
+
+Gemessen werden Phasendauern (Histogramm), die Laufzeit externer Befehle,
+Cache-Treffer (Basis-Images, cloud-init.yml, Templates, Golden-Overlays,
+Host-Fakten, Warm-Pool), Wiederholungen und Timeouts sowie die Größe der
+Flotte – jeweils mit den Labels backend, distro, arch und host.
+
+Kurzlebige Läufe (Cron, CI) schreiben beim Beenden eine Textdatei für den
+textfile-Collector des node_exporter, wenn `DEBIAN_CLOUD_INIT_METRICS`
+gesetzt ist (Datei oder Verzeichnis). Zähler und Histogramme werden dabei
+mit den Werten früherer Läufe zusammengeführt (Zustand in `<datei>.json`,
+unter fcntl-Lock), so dass `rate()` und `histogram_quantile()` wie bei einem
+Dienst funktionieren. Der Daemon liefert dieselben Metriken live unter
+`GET /metrics`.
+
+    DEBIAN_CLOUD_INIT_METRICS=/var/lib/node_exporter/textfile debian-cloud-init
+"""
+
+import contextlib
+import contextvars
+import copy
+import fcntl
+import json
+import logging
+import os
+import pathlib
+import re
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+ENV = "DEBIAN_CLOUD_INIT_METRICS"
+PREFIX = "debian_cloud_init_"
+TEXTFILE_NAME = "debian-cloud-init.prom"
+
+PHASE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+COMMAND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+METRICS = {
+    "phase_duration_seconds": ("histogram", "Dauer der Provisionierungs-Phasen", PHASE_BUCKETS),
+    "command_duration_seconds": ("histogram", "Laufzeit externer Befehle", COMMAND_BUCKETS),
+    "cache_requests_total": ("counter", "Cache-Zugriffe nach Ergebnis (hit/miss)", None),
+    "retries_total": ("counter", "Wiederholte Versuche (z.B. IP-Ermittlung)", None),
+    "timeouts_total": ("counter", "Abgelaufene Wartezeiten und Befehls-Timeouts", None),
+    "runs_total": ("counter", "Läufe nach Ergebnis (ok/error)", None),
+    "seed_requests_total": ("counter", "Abrufe am Seed-Server nach Datei und Ergebnis (ok/miss)", None),
+    "fleet_vms": ("gauge", "VMs nach Zustand", None),
+}
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_labels: contextvars.ContextVar[dict[str, str] | None] = contextvars.ContextVar("metric_labels", default=None)
+# Seit Prozessstart (für /metrics) bzw. seit dem letzten flush() (für die Textdatei)
+_live: dict[str, dict[str, object]] = {}
+_pending: dict[str, dict[str, object]] = {}
+_collectors: list[Callable[[], None]] = []
+
+
+# =============================================================================
+# Erfassen
+# =============================================================================
+
+def _current() -> dict[str, str]:
+    return _labels.get() or {}
+
+
+def set_labels(**labels: str):
+    """Labels für alle folgenden Messungen im aktuellen Kontext (Thread bzw. Lauf)."""
+    _labels.set({**_current(), **{key: str(value) for key, value in labels.items() if value is not None}})
+
+
+@contextlib.contextmanager
+def scoped_labels(**labels: str) -> Iterator[None]:
+    """Labels nur innerhalb des Blocks, z.B. für einen Daemon-Auftrag."""
+    token = _labels.set({**_current(), **{key: str(value) for key, value in labels.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def _key(labels: dict[str, str]) -> str:
+    return json.dumps(sorted(labels.items()))
+
+
+def _record(name: str, labels: dict[str, str], update: Callable[[Any], object]):
+    key = _key(labels)
+    with _lock:
+        for registry in (_live, _pending):
+            series = registry.setdefault(name, {})
+            series[key] = update(series.get(key))
+
+
+def inc(name: str, amount: float = 1.0, **labels: str):
+    _record(name, {**_current(), **labels}, lambda value: (value or 0.0) + amount)
+
+
+def observe(name: str, value: float, **labels: str):
+    buckets = METRICS[name][2]
+
+    def update(hist):
+        hist = dict(hist) if hist else {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+        hist["buckets"] = [n + (value <= bound) for n, bound in zip(hist["buckets"], buckets, strict=True)]
+        hist["sum"] += value
+        hist["count"] += 1
+        return hist
+
+    _record(name, {**_current(), **labels}, update)
+
+
+def set_gauge(name: str, value: float, **labels: str):
+    """Gauges tragen nur die übergebenen Labels (z.B. backend und host, nicht distro)."""
+    _record(name, labels, lambda _: float(value))
+
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[None]:
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe("phase_duration_seconds", time.monotonic() - started, phase=name)
+
+
+_COMMAND_RE = re.compile(r"[A-Za-z/][\w./-]*")
+
+
+def command_label(cmd: str) -> str:
+    """Erstes Wort eines Shell-Befehls als Label ("qm", "pvesh", …); "sh" für alles andere."""
+    match = _COMMAND_RE.match(cmd.strip())
+    return os.path.basename(match.group()) if match else "sh"
+
+
+@contextlib.contextmanager
+def timed_command(command: str) -> Iterator[None]:
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe("command_duration_seconds", time.monotonic() - started, command=command)
+
+
+def count_cache(cache: str, hit: bool):
+    inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def count_retry(operation: str):
+    inc("retries_total", operation=operation)
+
+
+def count_timeout(operation: str):
+    inc("timeouts_total", operation=operation)
+
+
+# Immer alle Zustände ausgeben, damit kein Gauge auf einem alten Wert stehen bleibt
+FLEET_STATES = ("running", "paused", "stopped", "other")
+_FLEET_ALIASES = {"shut off": "stopped", "shutoff": "stopped"}
+
+
+def fleet(states: Iterable[str], **labels: str):
+    """Setzt `fleet_vms` pro Zustand (libvirt- und Proxmox-Zustände zusammengefasst)."""
+    counts = dict.fromkeys(FLEET_STATES, 0)
+    for state in states:
+        state = _FLEET_ALIASES.get(state, state)
+        counts[state if state in counts else "other"] += 1
+    for state, count in counts.items():
+        set_gauge("fleet_vms", count, state=state, **labels)
+
+
+def register_collector(func: Callable[[], None]):
+    """`func` setzt Gauges (z.B. Flottengröße) und wird vor jeder Ausgabe aufgerufen."""
+    if func not in _collectors:
+        _collectors.append(func)
+
+
+def _collect():
+    for func in _collectors:
+        try:
+            func()
+        except Exception:  # fehlende Gauges dürfen die Ausgabe nicht verhindern
+            log.debug("Metrik-Collector %s fehlgeschlagen", func, exc_info=True)
+
+
+# =============================================================================
+# Ausgabe
+# =============================================================================
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: str, extra: dict[str, str] | None = None) -> str:
+    pairs = [*json.loads(key), *(extra or {}).items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(registry: dict | None = None) -> str:
+    if registry is None:
+        _collect()
+        with _lock:
+            registry = copy.deepcopy(_live)
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = registry.get(name)
+        if not series:
+            continue
+        full = PREFIX + name
+        lines += [f"# HELP {full} {help_text}", f"# TYPE {full} {kind}"]
+        for key in sorted(series):
+            value = series[key]
+            if kind != "histogram":
+                lines.append(f"{full}{_format_labels(key)} {_number(value)}")
+                continue
+            for bound, count in zip(buckets, value["buckets"], strict=True):
+                lines.append(f"{full}_bucket{_format_labels(key, {'le': _number(bound)})} {count}")
+            lines.append(f"{full}_bucket{_format_labels(key, {'le': '+Inf'})} {value['count']}")
+            lines.append(f"{full}_sum{_format_labels(key)} {_number(round(value['sum'], 6))}")
+            lines.append(f"{full}_count{_format_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def textfile_path() -> pathlib.Path | None:
+    if not os.environ.get(ENV):
+        return None
+    path = pathlib.Path(os.environ[ENV])
+    return path / TEXTFILE_NAME if path.is_dir() else path
+
+
+def merge(state: dict, delta: dict) -> dict:
+    """Addiert Zähler und Histogramme aus `delta` auf `state`; Gauges werden ersetzt."""
+    for name, series in delta.items():
+        kind = METRICS[name][0]
+        target = state.setdefault(name, {})
+        for key, value in series.items():
+            old = target.get(key)
+            if kind == "gauge" or old is None:
+                target[key] = value
+            elif kind == "counter":
+                target[key] = old + value
+            else:
+                target[key] = {
+                    "buckets": [a + b for a, b in zip(old["buckets"], value["buckets"], strict=True)],
+                    "sum": old["sum"] + value["sum"],
+                    "count": old["count"] + value["count"],
+                }
+    return state
+
+
+def flush():
+    """Schreibt die seit dem letzten Aufruf erfassten Werte in die Textdatei (nur mit DEBIAN_CLOUD_INIT_METRICS)."""
+    path = textfile_path()
+    if path is None:
+        return
+    _collect()
+    with _lock:
+        delta = json.loads(json.dumps(_pending))
+        _pending.clear()
+    if not delta:
+        return
+    state_file = path.with_name(path.name + ".json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            state = json.loads(state_file.read_text()) if state_file.exists() else {}
+        except json.JSONDecodeError:
+            state = {}
+        state = merge(state, delta)
+        for target, content in ((state_file, json.dumps(state)), (path, render(state))):
+            # node_exporter darf nie eine halb geschriebene Datei sehen
+            tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+            tmp.write_text(content)
+            tmp.replace(target)
+
+
+@contextlib.contextmanager
+def record_run(backend: str, **labels: str) -> Iterator[None]:
+    """Ein CLI-Lauf: Gesamtdauer, Ergebnis und Ausgabe der Textdatei beim Beenden (auch nach `fail`)."""
+    set_labels(backend=backend, **labels)
+    started = time.monotonic()
+    result = "error"
+    try:
+        yield
+        result = "ok"
+    finally:
+        observe("phase_duration_seconds", time.monotonic() - started, phase="total")
+        inc("runs_total", result=result)
+        try:
+            flush()
+        except OSError as e:
+            print(f"⚠ Metriken konnten nicht geschrieben werden: {e}")
@@ -0,0 +1,290 @@
+"""NUMA-Pinning, Hugepages und Allokations-Ledger für latenzkritische VMs.
+
+Die Host-Topologie wird aus sysfs gelesen (Fallback: `virsh capabilities`).
+Eine VM bekommt genau einen NUMA-Knoten: alle vCPUs und der Emulator-Thread
+werden auf Kerne dieses Knotens gepinnt, der Gast-RAM kommt strikt aus dessen
+Hugepages, und der Gast sieht eine passende NUMA-Zelle.
+
+Welche Kerne bereits vergeben sind, steht im Ledger neben den VM-Images. Jede
+Reservierung hält dabei einen exklusiven `flock`, damit zwei parallel
+angelegte VMs nie dieselben Kerne bekommen. Einträge von Domains, die libvirt
+nicht kennt, werden beim nächsten Zugriff entfernt – aber erst nach
+`RESERVATION_GRACE`, denn zwischen Reservierung und Definition der Domain
+kennt libvirt eine gerade entstehende VM noch nicht.
+
+`free_hugepages` in sysfs sieht nur laufende Gäste. Hugepages von VMs, die im
+Ledger stehen, aber noch nicht gestartet sind, werden daher zusätzlich
+abgezogen – sonst scheitern parallel angelegte VMs erst beim Start.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import pathlib
+import subprocess
+import time
+import xml.etree.ElementTree as ET
+
+from . import virt
+from .ui import fail, success
+
+SYSFS_NODES = pathlib.Path("/sys/devices/system/node")
+LEDGER_FILE = pathlib.Path(os.environ.get("ISOS_PATH", "/isos")) / ".numa-ledger.json"
+
+HUGEPAGE_KB = 2048
+# So lange bleibt eine Reservierung ohne definierte Domain erhalten (Image-Kopie, Overlay, Definition)
+RESERVATION_GRACE = 15 * 60
+
+
+# =============================================================================
+# Host-Topologie
+# =============================================================================
+
+def parse_cpulist(text: str) -> list[int]:
+    """'0-3,8,10-11' → [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def format_cpulist(cpus: list[int]) -> str:
+    """[0, 1, 2, 3, 8] → '0-3,8'"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def _read_int(path: pathlib.Path) -> int:
+    try:
+        return int(path.read_text().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def read_sysfs_topology(root: pathlib.Path = SYSFS_NODES) -> dict[int, dict]:
+    topology = {}
+    for node_dir in sorted(root.glob("node[0-9]*")):
+        node = int(node_dir.name[4:])
+        cpus = parse_cpulist((node_dir / "cpulist").read_text())
+        if not cpus:
+            continue  # reine Speicher-Knoten (z.B. CXL) haben keine CPUs
+        memory_mb = 0
+        with contextlib.suppress(OSError):
+            for line in (node_dir / "meminfo").read_text().splitlines():
+                if "MemTotal:" in line:
+                    memory_mb = int(line.split()[-2]) // 1024
+        hugepages = node_dir / "hugepages" / f"hugepages-{HUGEPAGE_KB}kB"
+        topology[node] = {
+            "cpus": cpus,
+            "memory_mb": memory_mb,
+            "hugepages_total": _read_int(hugepages / "nr_hugepages"),
+            "hugepages_free": _read_int(hugepages / "free_hugepages"),
+        }
+    return topology
+
+
+def parse_capabilities(xml_text: str) -> dict[int, dict]:
+    """Topologie aus `virsh capabilities` (kennt nur die Gesamtzahl der Hugepages)."""
+    topology = {}
+    for cell in ET.fromstring(xml_text).iter("cell"):
+        pages = 0
+        for page in cell.findall("pages"):
+            if page.get("size") == str(HUGEPAGE_KB):
+                pages = int(page.text or 0)
+        memory = cell.find("memory")
+        topology[int(cell.get("id", 0))] = {
+            "cpus": sorted(int(cpu.get("id", 0)) for cpu in cell.iter("cpu")),
+            "memory_mb": int(memory.text or 0) // 1024 if memory is not None else 0,
+            "hugepages_total": pages,
+            "hugepages_free": pages,
+        }
+    return topology
+
+
+def read_host_topology() -> dict[int, dict]:
+    if SYSFS_NODES.exists():
+        topology = read_sysfs_topology()
+        if topology:
+            return topology
+    result = subprocess.run(["virsh", "capabilities"], capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        fail("Host-Topologie konnte weder aus sysfs noch via 'virsh capabilities' gelesen werden.")
+    return parse_capabilities(result.stdout)
+
+
+# =============================================================================
+# Ledger
+# =============================================================================
+
+@contextlib.contextmanager
+def locked_ledger():
+    """Liest das Ledger unter exklusivem Lock; Änderungen am dict werden beim Verlassen geschrieben."""
+    LEDGER_FILE.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = LEDGER_FILE.with_suffix(".lock")
+    with open(lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            ledger = json.loads(LEDGER_FILE.read_text()) if LEDGER_FILE.exists() else {}
+        except json.JSONDecodeError:
+            ledger = {}
+        yield ledger
+        tmp = LEDGER_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(ledger, indent=4))
+        tmp.replace(LEDGER_FILE)
+
+
+def _domain_states() -> dict[str, str] | None:
+    """Zustand aller definierten Domains; None, wenn libvirt nicht erreichbar ist."""
+    return virt.domain_state_map()
+
+
+def prune_ledger(ledger: dict, domains: set[str] | None, now: float | None = None):
+    """Entfernt Einträge ohne Domain, deren Reservierung älter als `RESERVATION_GRACE` ist."""
+    if domains is None:
+        return  # libvirt nicht erreichbar – lieber nichts freigeben
+    cutoff = (now if now is not None else time.time()) - RESERVATION_GRACE
+    for vmname in [name for name, entry in ledger.items()
+                   if name not in domains and entry.get("reserved_at", 0) < cutoff]:
+        del ledger[vmname]
+
+
+# =============================================================================
+# Planung
+# =============================================================================
+
+def hugepages_needed(memory_mb: int) -> int:
+    return -(-memory_mb * 1024 // HUGEPAGE_KB)
+
+
+def reserved_hugepages(ledger: dict, active: set[str] | None = None) -> dict[int, int]:
+    """Hugepages pro Knoten, die Ledger-Einträge ohne laufende Domain noch belegen werden.
+
+    Ohne `active` (libvirt nicht erreichbar) zählen alle Einträge.
+    """
+    reserved: dict[int, int] = {}
+    for vmname, entry in ledger.items():
+        if active is None or vmname not in active:
+            reserved[entry["node"]] = reserved.get(entry["node"], 0) + hugepages_needed(entry.get("memory_mb", 0))
+    return reserved
+
+
+def active_domains(states: dict[str, str] | None) -> set[str] | None:
+    """Domains, deren Hugepages bereits in `free_hugepages` fehlen."""
+    if states is None:
+        return None
+    return {name for name, state in states.items() if state not in ("shut off", "crashed")}
+
+
+def plan_pinning(topology: dict[int, dict], ledger: dict, vcpus: int, memory_mb: int,
+                 active: set[str] | None = None) -> dict:
+    """Wählt den Knoten mit den meisten freien Kernen, der vCPUs + Emulator und den RAM aufnehmen kann.
+
+    `active` sind die laufenden Domains; die Hugepages aller übrigen Ledger-Einträge gelten als vergeben.
+    """
+    used = {cpu for entry in ledger.values() for cpu in entry["cpus"] + entry["emulator"]}
+    reserved = reserved_hugepages(ledger, active)
+    free_pages = {node: info["hugepages_free"] - reserved.get(node, 0) for node, info in topology.items()}
+    pages = hugepages_needed(memory_mb)
+
+    candidates = []
+    for node, info in topology.items():
+        free = [cpu for cpu in info["cpus"] if cpu not in used]
+        if len(free) >= vcpus + 1 and free_pages[node] >= pages:
+            candidates.append((len(free), -node, node, free))
+    if not candidates:
+        details = ", ".join(
+            f"Node {n}: {len([c for c in i['cpus'] if c not in used])} freie CPUs, "
+            f"{max(free_pages[n], 0)} freie {HUGEPAGE_KB} kB-Hugepages"
+            for n, i in sorted(topology.items())
+        )
+        fail(
+            f"Kein NUMA-Knoten hat {vcpus + 1} freie CPUs und {pages} Hugepages ({details}).\n"
+            f"  Hugepages reservieren, z.B.: echo {pages} | sudo tee "
+            f"{SYSFS_NODES}/node0/hugepages/hugepages-{HUGEPAGE_KB}kB/nr_hugepages"
+        )
+
+    _, _, node, free = max(candidates)
+    return {"node": node, "cpus": free[:vcpus], "emulator": [free[vcpus]], "memory_mb": memory_mb}
+
+
+def reserve_pinning(vmname: str, vcpus: int, memory_mb: int) -> dict:
+    topology = read_host_topology()
+    with locked_ledger() as ledger:
+        states = _domain_states()
+        prune_ledger(ledger, set(states) if states is not None else None)
+        ledger.pop(vmname, None)
+        plan = plan_pinning(topology, ledger, vcpus, memory_mb, active_domains(states))
+        ledger[vmname] = {**plan, "reserved_at": time.time()}
+    success(
+        f"NUMA-Knoten {plan['node']}: vCPUs → {format_cpulist(plan['cpus'])}, "
+        f"Emulator → {format_cpulist(plan['emulator'])}, {hugepages_needed(memory_mb)} Hugepages"
+    )
+    return plan
+
+
+def release_pinning(vmname: str):
+    if not LEDGER_FILE.exists():
+        return
+    with locked_ledger() as ledger:
+        ledger.pop(vmname, None)
+
+
+# =============================================================================
+# virt-install-Parameter
+# =============================================================================
+
+def virt_install_numa_options(plan: dict) -> tuple[str, str]:
+    """Gibt (Zusatz für --cpu, weitere virt-install-Parameter) zurück."""
+    vcpus = len(plan["cpus"])
+    node = plan["node"]
+    cputune = ",".join(
+        f"vcpupin{i}.vcpu={i},vcpupin{i}.cpuset={cpu}" for i, cpu in enumerate(plan["cpus"])
+    )
+    cputune += f",emulatorpin.cpuset={format_cpulist(plan['emulator'])}"
+
+    cpu_cell = f",cell0.id=0,cell0.cpus=0-{vcpus - 1},cell0.memory={plan['memory_mb'] * 1024},cell0.unit=KiB"
+    options = (
+        f"--cputune {cputune} "
+        f"--numatune memory.mode=strict,memory.nodeset={node},"
+        f"memnode0.cellid=0,memnode0.mode=strict,memnode0.nodeset={node} "
+        f"--memorybacking hugepages.page0.size={HUGEPAGE_KB},hugepages.page0.unit=KiB,"
+        f"hugepages.page0.nodeset=0 "
+    )
+    return cpu_cell, options
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="NUMA-Topologie und Pinning-Ledger anzeigen")
+    parser.parse_args()
+
+    topology = read_host_topology()
+    with locked_ledger() as ledger:
+        states = _domain_states()
+        prune_ledger(ledger, set(states) if states is not None else None)
+        snapshot = dict(ledger)
+
+    for node, info in sorted(topology.items()):
+        print(f"Node {node}: CPUs {format_cpulist(info['cpus'])}, {info['memory_mb']} MB, "
+              f"Hugepages {info['hugepages_free']}/{info['hugepages_total']} frei")
+        for vmname, entry in sorted(snapshot.items()):
+            if entry["node"] == node:
+                print(f"  {vmname}: vCPUs {format_cpulist(entry['cpus'])}, "
+                      f"Emulator {format_cpulist(entry['emulator'])}, {entry['memory_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""qcow2-Overlay-Optionen, passender L2-Cache und Schreib-Benchmark.
+
+Die Overlay-Parameter kommen aus dem Performance-Profil (`profiles.py`) und
+können pro Session mit `--overlay KEY=WERT` überschrieben werden:
+
+- `size`              virtuelle Größe (z.B. 30G)
+- `cluster_size`      qcow2-Clustergröße (512 … 2M, Zweierpotenz)
+- `extended_l2`       Subcluster (32 pro Cluster) – COW vom Backing-File nur
+                      noch in Subcluster-Größe statt ganzer Cluster
+- `preallocation`     `metadata` – L2-Tabellen vorab anlegen (mit Backing-File
+                      nur zusammen mit extended_l2 möglich)
+- `lazy_refcounts`    Refcount-Updates verzögern (weniger Sync-Writes)
+- `compression_type`  `zlib` oder `zstd`
+
+Damit alle L2-Einträge im Speicher bleiben, wird der `l2-cache-size` des
+Overlays passend zur Größe gesetzt (libvirt `metadata_cache.max_size`).
+"""
+
+import argparse
+import pathlib
+import re
+import subprocess
+import tempfile
+
+from .profiles import DEFAULT_PROFILE, PROFILES, get_profile
+from .ui import fail, progress
+
+OVERLAY_KEYS = ("size", "cluster_size", "extended_l2", "preallocation", "lazy_refcounts", "compression_type")
+
+_SIZE_RE = re.compile(r"^(\d+)([kKmMgGtT]?)$")
+_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+DEFAULT_CLUSTER_SIZE = 64 * 1024
+
+BENCH_COUNT = 20000
+BENCH_IMAGE_SIZE = "4G"
+
+
+def parse_size(value: str | int) -> int:
+    match = _SIZE_RE.match(str(value).strip())
+    if not match:
+        fail(f"Ungültige Größe: {value!r}")
+    return int(match.group(1)) * _UNITS[match.group(2).lower()]
+
+
+def _as_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "on", "true", "yes", "ja")
+
+
+def parse_overrides(items: list[str]) -> dict:
+    """`["cluster_size=128k", "extended_l2=on"]` → dict (für die Session)."""
+    overrides = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        key = key.strip().replace("-", "_")
+        if not sep or key not in OVERLAY_KEYS:
+            fail(f"Ungültige Overlay-Option {item!r}. Erlaubt: {', '.join(OVERLAY_KEYS)}")
+        overrides[key] = value.strip()
+    return overrides
+
+
+def overlay_settings(profile_name: str | None, overrides: dict | None = None) -> dict:
+    settings = dict(get_profile(profile_name)["overlay"])
+    settings.update(overrides or {})
+    settings["extended_l2"] = _as_bool(settings.get("extended_l2", False))
+    settings["lazy_refcounts"] = _as_bool(settings.get("lazy_refcounts", False))
+    validate_settings(settings)
+    return settings
+
+
+def validate_settings(settings: dict):
+    parse_size(settings["size"])
+    cluster = settings.get("cluster_size")
+    if cluster:
+        size = parse_size(cluster)
+        if size < 512 or size > 2 * 1024 ** 2 or size & (size - 1):
+            fail(f"cluster_size muss eine Zweierpotenz zwischen 512 und 2M sein, nicht {cluster}.")
+    if settings["extended_l2"] and parse_size(cluster or DEFAULT_CLUSTER_SIZE) < 16 * 1024:
+        fail("extended_l2 benötigt cluster_size >= 16k.")
+    if settings.get("preallocation") not in (None, "", "off", "metadata"):
+        fail("preallocation: mit Backing-File ist nur 'metadata' möglich.")
+    if settings.get("preallocation") == "metadata" and not settings["extended_l2"]:
+        fail("preallocation=metadata mit Backing-File erfordert extended_l2=on.")
+    if settings.get("compression_type") not in (None, "", "zlib", "zstd"):
+        fail("compression_type muss 'zlib' oder 'zstd' sein.")
+
+
+def is_tuned(settings: dict) -> bool:
+    """True, sobald eine Option vom qemu-img-Standard abweicht."""
+    return any(settings.get(key) for key in OVERLAY_KEYS if key != "size")
+
+
+# =============================================================================
+# qemu-img / virt-install
+# =============================================================================
+
+def create_options(settings: dict) -> str:
+    """Zusätzliche `-o`-Optionen für qemu-img create (mit führendem Komma)."""
+    options = []
+    if settings.get("cluster_size"):
+        options.append(f"cluster_size={settings['cluster_size']}")
+    if settings["extended_l2"]:
+        options.append("extended_l2=on")
+    if settings.get("preallocation") and settings["preallocation"] != "off":
+        options.append(f"preallocation={settings['preallocation']}")
+    if settings["lazy_refcounts"]:
+        options.append("lazy_refcounts=on")
+    if settings.get("compression_type"):
+        options.append(f"compression_type={settings['compression_type']}")
+    return "".join(f",{o}" for o in options)
+
+
+def l2_cache_bytes(settings: dict) -> int:
+    """L2-Cache, der die komplette Disk abdeckt: ein Eintrag (8 B, mit Subclustern 16 B) pro Cluster."""
+    cluster = parse_size(settings.get("cluster_size") or DEFAULT_CLUSTER_SIZE)
+    entry = 16 if settings["extended_l2"] else 8
+    clusters = -(-parse_size(settings["size"]) // cluster)
+    # auf volle Cluster aufrunden – qemu cached L2-Tabellen clusterweise
+    return -(-clusters * entry // cluster) * cluster
+
+
+def virt_install_cache_options(settings: dict) -> str:
+    """`--xml`-Edits für metadata_cache der ersten Disk (leer ohne Tuning)."""
+    if not is_tuned(settings):
+        return ""
+    path = "./devices/disk[1]/driver/metadata_cache/max_size"
+    return f"--xml {path}={l2_cache_bytes(settings)} --xml {path}/@unit=bytes "
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+def _bench_one(base: pathlib.Path, workdir: pathlib.Path, name: str, settings: dict, count: int) -> float:
+    overlay = workdir / f"bench-{name}.qcow2"
+    subprocess.run(
+        ["qemu-img", "create", "-q", "-f", "qcow2", "-F", "qcow2",
+         "-o", f"backing_file={base}{create_options(settings)}", str(overlay), BENCH_IMAGE_SIZE],
+        check=True, capture_output=True, text=True,
+    )
+    # 4k-Writes mit 1M Schrittweite: jeder Write trifft einen neuen Cluster → allozierender COW-Pfad
+    result = subprocess.run(
+        ["qemu-img", "bench", "-w", "-t", "none", "-f", "qcow2", "-c", str(count), "-d", "32",
+         "-s", "4k", "-S", "1M", str(overlay)],
+        check=True, capture_output=True, text=True,
+    )
+    overlay.unlink()
+    match = re.search(r"Run completed in ([\d.]+) seconds", result.stdout)
+    if not match:
+        fail(f"Unerwartete Ausgabe von qemu-img bench:\n{result.stdout}")
+    return count / float(match.group(1))
+
+
+def benchmark(profile_names: list[str], base: pathlib.Path | None = None, count: int = BENCH_COUNT,
+              workdir: pathlib.Path | None = None) -> dict[str, float]:
+    """Misst zufällige 4k-Schreib-IOPS (allozierend) für die Overlay-Einstellungen jedes Profils."""
+    results = {}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        tmp_path = pathlib.Path(tmp)
+        if base is None:
+            base = tmp_path / "bench-base.qcow2"
+            subprocess.run(["qemu-img", "create", "-q", "-f", "qcow2", str(base), BENCH_IMAGE_SIZE],
+                           check=True, capture_output=True, text=True)
+        for name in profile_names:
+            progress(f"Benchmark Overlay-Profil '{name}'…")
+            try:
+                results[name] = _bench_one(base, tmp_path, name, overlay_settings(name), count)
+            except subprocess.CalledProcessError as e:
+                fail(f"qemu-img fehlgeschlagen ({name}): {e.stderr.strip()}")
+    return results
+
+
+def format_benchmark(results: dict[str, float]) -> str:
+    baseline = results.get(DEFAULT_PROFILE)
+    lines = [f"{'Profil':<10} {'IOPS':>10} {'vs. default':>12}"]
+    for name, iops in results.items():
+        ratio = f"{iops / baseline:.2f}x" if baseline else "-"
+        lines.append(f"{name:<10} {iops:>10.0f} {ratio:>12}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qcow2-Overlay-Einstellungen der Profile vergleichen")
+    parser.add_argument("--profiles", default=",".join(PROFILES),
+                        help="Kommagetrennte Profilnamen (Standard: alle)")
+    parser.add_argument("--base", type=pathlib.Path,
+                        help="Backing-Image (Standard: leeres temporäres qcow2)")
+    parser.add_argument("--count", type=int, default=BENCH_COUNT, help="Anzahl Writes pro Lauf")
+    parser.add_argument("--dir", type=pathlib.Path, help="Arbeitsverzeichnis (Dateisystem der VM-Images)")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    for name in names:
+        get_profile(name)
+    print(format_benchmark(benchmark(names, args.base, args.count, args.dir)))
+
+
+if __name__ == "__main__":
+    main()
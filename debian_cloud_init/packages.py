@@ -0,0 +1,124 @@
+"""Optimiert apt-Aufrufe im generierten runcmd.
+
+`package-config.txt` und `system-config.txt` enthalten mehrere `apt-get update`
+und einzelne `apt-get install`-Transaktionen, jede mit eigener dpkg-Trigger-
+Verarbeitung. Diese Stufe fasst sie zusammen:
+
+- Pakete, die vor dem ersten Fremd-Repository installiert werden, wandern in
+  die native cloud-init-Liste `packages:` (+ `package_update: true`). cloud-init
+  installiert sie in einer Transaktion noch vor `runcmd`.
+- Die Repository-Einrichtung (Keyring, GPG-Key, sources.list.d) bleibt als
+  zusammenhängender Block erhalten; direkt danach folgt genau ein
+  `apt-get update` und eine einzige Installations-Transaktion für alle
+  übrigen Pakete.
+- Alle anderen Shell-Zeilen bleiben in ihrer Reihenfolge erhalten.
+
+Zeilen mit Shell-Logik (`&&`, `;`, `|`, `$(…)`, …) und Installationen mit
+Optionen außer `-y`/`-q` (`-t`, `-o`, `--no-install-recommends`, …) werden nie
+umgeschrieben – diese Optionen gälten sonst für die ganze Transaktion oder
+gingen verloren.
+"""
+
+import difflib
+import re
+
+_APT = r"^(?:sudo\s+)?(?:DEBIAN_FRONTEND=\S+\s+)?apt(?:-get)?"
+_UPDATE_RE = re.compile(_APT + r"\s+(?:-\S+\s+)*update(?:\s+-\S+)*\s*$")
+_INSTALL_RE = re.compile(_APT + r"\s+(?P<options>(?:-\S+\s+)*)install\s+(?P<args>.+)$")
+_REPO_RE = re.compile(r"/etc/apt/sources\.list\.d/|^(?:sudo\s+)?add-apt-repository\s")
+_SHELL_META = re.compile(r"[;&|`$<>(){}]")
+# Optionen, die beim Zusammenfassen nichts ändern (INSTALL_CMD setzt -y ohnehin)
+_MERGEABLE_OPTIONS = {"-y", "--yes", "--assume-yes", "-q", "-qq", "--quiet"}
+
+INSTALL_CMD = "DEBIAN_FRONTEND=noninteractive apt-get install -y"
+
+
+def is_apt_update(line: str) -> bool:
+    return bool(_UPDATE_RE.match(line.strip()))
+
+
+def install_packages(line: str) -> list[str] | None:
+    """Paketliste einer einfachen `apt-get install`-Zeile, sonst None."""
+    match = _INSTALL_RE.match(line.strip())
+    if not match or _SHELL_META.search(match.group("args")):
+        return None
+    args = match.group("options").split() + match.group("args").split()
+    if any(arg.startswith("-") and arg not in _MERGEABLE_OPTIONS for arg in args):
+        return None
+    packages = [arg for arg in args if not arg.startswith("-")]
+    return packages or None
+
+
+def is_repo_setup(line: str) -> bool:
+    return bool(_REPO_RE.search(line.strip()))
+
+
+def _unique(items: list[str]) -> list[str]:
+    return list(dict.fromkeys(items))
+
+
+def optimize_runcmd(package_lines: list[str], system_script: str) -> tuple[dict, list[str], str]:
+    """Fasst apt-Aufrufe aus runcmd-Zeilen und dem System-Skript zusammen.
+
+    Gibt (cloud-config-Ergänzungen, neue runcmd-Zeilen, neues System-Skript) zurück.
+    """
+    script_lines = system_script.splitlines()
+    stream = [("runcmd", i, line) for i, line in enumerate(package_lines)]
+    stream += [("script", i, line) for i, line in enumerate(script_lines)]
+
+    repo_positions = [pos for pos, (_, _, line) in enumerate(stream) if is_repo_setup(line)]
+    first_repo = repo_positions[0] if repo_positions else len(stream)
+
+    early: list[str] = []
+    late: list[str] = []
+    drop: set[tuple[str, int]] = set()
+    for pos, (source, idx, line) in enumerate(stream):
+        if is_apt_update(line):
+            drop.add((source, idx))
+            continue
+        packages = install_packages(line)
+        if packages is None:
+            continue
+        drop.add((source, idx))
+        (early if pos < first_repo else late).extend(packages)
+
+    merged = ""
+    if late:
+        merged = f"apt-get update && {INSTALL_CMD} {' '.join(_unique(late))}"
+
+    new_runcmd: list[str] = []
+    new_script: list[str] = []
+    last_repo = stream[repo_positions[-1]][:2] if repo_positions else None
+    for source, idx, line in stream:
+        target = new_runcmd if source == "runcmd" else new_script
+        if (source, idx) not in drop:
+            target.append(line)
+        if (source, idx) == last_repo and merged:
+            target.append(merged)
+
+    additions: dict = {}
+    if early:
+        additions["package_update"] = True
+        additions["packages"] = _unique(early)
+
+    script = "\n".join(new_script)
+    if system_script.endswith("\n"):
+        script += "\n"
+    return additions, new_runcmd, script
+
+
+def apply_additions(cloud_config: dict, additions: dict):
+    """Übernimmt `packages`/`package_update` in die cloud-config (ohne Duplikate)."""
+    if "packages" in additions:
+        cloud_config["packages"] = _unique(list(cloud_config.get("packages") or []) + additions["packages"])
+    if additions.get("package_update"):
+        cloud_config["package_update"] = True
+
+
+def diff_report(before: str, after: str, name: str = "cloud-init.yml") -> str:
+    return "".join(difflib.unified_diff(
+        before.splitlines(keepends=True),
+        after.splitlines(keepends=True),
+        fromfile=f"{name} (original)",
+        tofile=f"{name} (optimiert)",
+    ))
@@ -0,0 +1,607 @@
+"""Warm-Pool fertig provisionierter VMs.
+
+Pro Pool-Schlüssel (Distro, Architektur, Profil) werden N VMs vollständig
+provisioniert und im Leerlauf gehalten. Ein `claim` nimmt die älteste bereite
+VM, trägt SSH-Key und Hostname des Anfragenden über den Guest-Agent (Fallback:
+SSH) ein und gibt sofort die IP zurück; danach füllt ein Hintergrundprozess
+den Pool wieder auf. Bereite VMs, die älter als `max_age` sind, werden beim
+Auffüllen verworfen und neu gebaut.
+
+Konfiguration, VM-Zustände und Treffer/Fehlgriff-Metriken stehen im
+Pool-Ledger neben den VM-Images (Zugriff unter exklusivem `flock`):
+
+    {"pools":   {"debian/13|amd64|default": {"size": 2, "max_age": 86400, …}},
+     "vms":     {"pool-debian-13-amd64-default-1a2b3c": {"key": …, "state": "ready", "ip": …}},
+     "metrics": {"debian/13|amd64|default": {"hits": 10, "misses": 1, …}}}
+
+Die Funktionen ohne Backend-Bezug (Ledger, Auswahl, Metriken) nutzt auch
+`proxmox_cloud_init.pool`.
+
+Beispiel:
+
+    python -m debian_cloud_init.pool configure --distro debian/13 --arch amd64 --size 3 \\
+        --username ci --hashed-password '$6$…' --ssh-key ~/.ssh/id_ed25519.pub
+    python -m debian_cloud_init.pool fill
+    python -m debian_cloud_init.pool claim --name build-42 --ssh-key ci.pub --json
+    python -m debian_cloud_init.pool status
+    python -m debian_cloud_init.pool release build-42
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import pathlib
+import re
+import secrets
+import shlex
+import subprocess
+import time
+
+from . import ui, virt
+from .metrics import count_cache, phase
+from .profiles import DEFAULT_PROFILE, PROFILES
+from .ui import fail, progress, success
+from .workspace import USER_DATA, ensure_workspace, workspace_dir
+
+POOL_FILE = pathlib.Path(os.environ.get("ISOS_PATH", "/isos")) / ".pool.json"
+
+DEFAULT_SIZE = 2
+DEFAULT_MAX_AGE = 24 * 3600
+CLAIM_POLL_INTERVAL = 2
+
+REQUIRED_SETTINGS = ("username", "hashed_password", "ssh_key", "templates")
+
+_SSH_OPTS = ["-o", "StrictHostKeyChecking=accept-new", "-o", "BatchMode=yes", "-o", "ConnectTimeout=5"]
+_DURATION_RE = re.compile(r"^(\d+)([smhd]?)$")
+# RFC 1123: Labels aus Buchstaben, Ziffern und '-', nicht mit '-' am Rand, höchstens 63 Zeichen
+_HOSTNAME_RE = re.compile(r"^(?=.{1,253}$)[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?"
+                          r"(\.[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?)*$")
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+# =============================================================================
+# Schlüssel / Dauer
+# =============================================================================
+
+def pool_key(distro: str, arch: str, profile: str | None) -> str:
+    return f"{distro}|{arch}|{profile or DEFAULT_PROFILE}"
+
+
+def key_slug(key: str) -> str:
+    """`debian/13|amd64|default` → `debian-13-amd64-default` (für VM-Namen)."""
+    return re.sub(r"[^a-z0-9.]+", "-", key.lower()).strip("-")
+
+
+def parse_duration(value: str) -> int:
+    match = _DURATION_RE.match(str(value).strip().lower())
+    if not match:
+        fail(f"Ungültige Dauer: {value!r} (z.B. 3600, 30m, 12h, 2d)")
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 86400 and seconds % 86400 == 0:
+        return f"{seconds // 86400}d"
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f}h".replace(".0h", "h")
+    if seconds >= 60:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+# =============================================================================
+# Ledger
+# =============================================================================
+
+@contextlib.contextmanager
+def locked_pool(pool_file: pathlib.Path):
+    """Liest das Pool-Ledger unter exklusivem Lock; Änderungen werden beim Verlassen geschrieben."""
+    pool_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(pool_file.with_suffix(".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            ledger = json.loads(pool_file.read_text()) if pool_file.exists() else {}
+        except json.JSONDecodeError:
+            ledger = {}
+        for section in ("pools", "vms", "metrics"):
+            ledger.setdefault(section, {})
+        yield ledger
+        tmp = pool_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(ledger, indent=4))
+        tmp.replace(pool_file)
+
+
+@contextlib.contextmanager
+def fill_lock(pool_file: pathlib.Path):
+    """Nicht-blockierender Lock für das Auffüllen; liefert False, wenn schon ein Lauf aktiv ist."""
+    pool_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(pool_file.with_suffix(".fill.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def _metrics(ledger: dict, key: str) -> dict:
+    metrics = ledger["metrics"].setdefault(key, {})
+    for name in ("hits", "misses", "recycled", "provisioned", "failed"):
+        metrics.setdefault(name, 0)
+    metrics.setdefault("claim_seconds", 0.0)
+    metrics.setdefault("provision_seconds", 0.0)
+    return metrics
+
+
+def take_ready(ledger: dict, key: str, now: float) -> tuple[str, dict] | None:
+    """Markiert die älteste bereite, nicht abgelaufene VM des Pools als vergeben."""
+    max_age = ledger["pools"].get(key, {}).get("max_age", DEFAULT_MAX_AGE)
+    candidates = [
+        (entry["ready_at"], vm_id) for vm_id, entry in ledger["vms"].items()
+        if entry["key"] == key and entry["state"] == "ready" and now - entry["ready_at"] <= max_age
+    ]
+    if not candidates:
+        return None
+    _, vm_id = min(candidates)
+    entry = ledger["vms"][vm_id]
+    entry["state"] = "claimed"
+    entry["claimed_at"] = now
+    return vm_id, entry
+
+
+def record_claim(ledger: dict, key: str, hit: bool, seconds: float | None = None):
+    metrics = _metrics(ledger, key)
+    metrics["hits" if hit else "misses"] += 1
+    count_cache("pool", hit)
+    if hit and seconds is not None:
+        metrics["claim_seconds"] += seconds
+        metrics["last_claim_seconds"] = round(seconds, 2)
+
+
+def record_provisioned(ledger: dict, key: str, seconds: float, ok: bool = True):
+    metrics = _metrics(ledger, key)
+    if ok:
+        metrics["provisioned"] += 1
+        metrics["provision_seconds"] += seconds
+    else:
+        metrics["failed"] += 1
+
+
+def plan_fill(ledger: dict, now: float) -> tuple[list[str], dict[str, int]]:
+    """Gibt (zu verwerfende VMs, fehlende VMs pro Pool) zurück.
+
+    Verworfen werden bereite VMs über `max_age` oder über der Pool-Größe
+    (die ältesten zuerst) sowie Provisionierungen eines abgebrochenen Laufs –
+    aufgerufen wird nur unter dem Auffüll-Lock, es kann also keine andere
+    Provisionierung aktiv sein.
+    """
+    discard = [vm_id for vm_id, entry in ledger["vms"].items() if entry["state"] == "provisioning"]
+    deficits = {}
+    for key, pool in ledger["pools"].items():
+        ready = sorted(
+            ((entry["ready_at"], vm_id) for vm_id, entry in ledger["vms"].items()
+             if entry["key"] == key and entry["state"] == "ready"),
+            reverse=True,
+        )
+        keep = [vm_id for ready_at, vm_id in ready if now - ready_at <= pool.get("max_age", DEFAULT_MAX_AGE)]
+        keep = keep[:pool.get("size", 0)]
+        discard += [vm_id for _, vm_id in ready if vm_id not in keep]
+        if pool.get("size", 0) > len(keep):
+            deficits[key] = pool["size"] - len(keep)
+    return discard, deficits
+
+
+def find_claimed(ledger: dict, name: str) -> str | None:
+    for vm_id, entry in ledger["vms"].items():
+        if entry["state"] == "claimed" and (entry.get("claimed_as") == name or vm_id == name):
+            return vm_id
+    return None
+
+
+def format_pool_status(ledger: dict, now: float) -> str:
+    if not ledger["pools"]:
+        return "Keine Pools konfiguriert."
+    lines = []
+    for key, pool in sorted(ledger["pools"].items()):
+        states = {"ready": 0, "provisioning": 0, "claimed": 0}
+        oldest = None
+        for entry in ledger["vms"].values():
+            if entry["key"] == key:
+                states[entry["state"]] = states.get(entry["state"], 0) + 1
+                if entry["state"] == "ready":
+                    oldest = max(oldest or 0, now - entry["ready_at"])
+        metrics = _metrics(ledger, key)
+        claims = metrics["hits"] + metrics["misses"]
+        hit_rate = f"{100 * metrics['hits'] / claims:.0f} %" if claims else "-"
+        avg_claim = f"{metrics['claim_seconds'] / metrics['hits']:.1f} s" if metrics["hits"] else "-"
+        avg_prov = (f"{metrics['provision_seconds'] / metrics['provisioned']:.0f} s"
+                    if metrics["provisioned"] else "-")
+        lines.append(
+            f"{key}: {states['ready']}/{pool.get('size', 0)} bereit, {states['provisioning']} in Provisionierung, "
+            f"{states['claimed']} vergeben (max. Alter {format_duration(pool.get('max_age', DEFAULT_MAX_AGE))}"
+            f"{', älteste ' + format_duration(oldest) if oldest is not None else ''})"
+        )
+        lines.append(
+            f"  Treffer {metrics['hits']}, Fehlgriffe {metrics['misses']} ({hit_rate}), Claim Ø {avg_claim}, "
+            f"Provisionierung Ø {avg_prov}, verworfen {metrics['recycled']}, fehlgeschlagen {metrics['failed']}"
+        )
+    return "\n".join(lines)
+
+
+# =============================================================================
+# Übergabe an den Anfragenden
+# =============================================================================
+
+def injection_script(username: str, ssh_key: str, hostname: str) -> str:
+    """Shell-Skript (root), das den SSH-Key ergänzt und den Hostnamen setzt.
+
+    Der Hostname landet ungequotet im sed-Ausdruck und muss daher RFC 1123 entsprechen.
+    """
+    if not _HOSTNAME_RE.match(hostname):
+        raise ValueError(f"Ungültiger Hostname: {hostname!r}")
+    home = f"/home/{username}"
+    key = shlex.quote(ssh_key.strip())
+    host = shlex.quote(hostname)
+    return (
+        "set -e\n"
+        f"install -d -m 700 -o {username} -g {username} {home}/.ssh\n"
+        f"grep -qxF {key} {home}/.ssh/authorized_keys 2>/dev/null || echo {key} >> {home}/.ssh/authorized_keys\n"
+        f"chown {username}:{username} {home}/.ssh/authorized_keys\n"
+        f"chmod 600 {home}/.ssh/authorized_keys\n"
+        f"hostnamectl set-hostname {host}\n"
+        f"sed -i 's/^127\\.0\\.1\\.1\\s.*/127.0.1.1 {hostname}/' /etc/hosts\n"
+    )
+
+
+def ssh_inject(username: str, ip: str, script: str) -> bool:
+    """Fallback ohne Guest-Agent: Skript per SSH + sudo ausführen (Key des Pool-Betreibers)."""
+    result = subprocess.run(
+        ["ssh", *_SSH_OPTS, f"{username}@{ip}", f"sudo sh -c {shlex.quote(script)}"],
+        capture_output=True, text=True, check=False,
+    )
+    return result.returncode == 0
+
+
+def spawn_refill(module: str, log_file: pathlib.Path):
+    """Startet `python -m <module> fill` losgelöst im Hintergrund."""
+    ui.spawn_module(module, ["fill"], log_file)
+
+
+# =============================================================================
+# Auffüllen / Übernehmen (backend-unabhängig)
+# =============================================================================
+#
+# Ein Backend liefert fünf Funktionen:
+#   prune(ledger)                         Einträge ohne VM entfernen
+#   new_vm(key, pool) -> vm_id            Namen/ID für eine neue Pool-VM
+#   provision(vm_id, key, pool) -> ip     VM vollständig aufbauen (None bei Fehlschlag)
+#   inject(vm_id, entry, pool, key, host) SSH-Key + Hostname setzen (bool)
+#   discard(vm_id, pool)                  VM löschen
+# dazu optional rename(vm_id, pool, name).
+
+def fill_pools(pool_file: pathlib.Path, backend: dict) -> bool:
+    """Verwirft abgelaufene VMs und baut fehlende nach; False, wenn bereits ein Lauf aktiv ist."""
+    with fill_lock(pool_file) as acquired:
+        if not acquired:
+            print("Pool wird bereits aufgefüllt.")
+            return False
+        ui.NON_INTERACTIVE = True
+
+        with locked_pool(pool_file) as ledger:
+            backend["prune"](ledger)
+            discard, deficits = plan_fill(ledger, time.time())
+            doomed = []
+            for vm_id in discard:
+                entry = ledger["vms"].pop(vm_id)
+                if entry["state"] == "ready":
+                    _metrics(ledger, entry["key"])["recycled"] += 1
+                doomed.append((vm_id, dict(ledger["pools"][entry["key"]])))
+            pools = {key: dict(ledger["pools"][key]) for key in deficits}
+        for vm_id, pool in doomed:
+            progress(f"Verwerfe Pool-VM {vm_id}…")
+            backend["discard"](vm_id, pool)
+
+        for key, missing in deficits.items():
+            pool = pools[key]
+            for _ in range(missing):
+                vm_id = backend["new_vm"](key, pool)
+                started = time.time()
+                with locked_pool(pool_file) as ledger:
+                    ledger["vms"][vm_id] = {"key": key, "state": "provisioning", "created": started}
+
+                progress(f"Provisioniere Pool-VM {vm_id} ({key})…")
+                ip = backend["provision"](vm_id, key, pool)
+
+                with locked_pool(pool_file) as ledger:
+                    record_provisioned(ledger, key, time.time() - started, ok=ip is not None)
+                    if ip and vm_id in ledger["vms"]:
+                        ledger["vms"][vm_id].update(state="ready", ready_at=time.time(), ip=ip)
+                    else:
+                        ledger["vms"].pop(vm_id, None)
+                if ip:
+                    success(f"Pool-VM {vm_id} bereit ({ip}).")
+                else:
+                    print(f"⚠ Pool-VM {vm_id} konnte nicht provisioniert werden – wird verworfen.")
+                    backend["discard"](vm_id, pool)
+        return True
+
+
+def claim_vm(pool_file: pathlib.Path, backend: dict, key: str, name: str, ssh_key: str,
+             hostname: str | None = None, wait: int = 0, refill: bool = True) -> dict:
+    """Übergibt eine bereite VM; wartet bei leerem Pool bis zu `wait` Sekunden."""
+    if not _HOSTNAME_RE.match(hostname or name):
+        fail(f"Ungültiger Hostname '{hostname or name}' (RFC 1123: Buchstaben, Ziffern, '-', Labels bis 63 Zeichen).")
+    started = time.monotonic()
+    deadline = started + wait
+    missed = False
+    while True:
+        with locked_pool(pool_file) as ledger:
+            if key not in ledger["pools"]:
+                fail(f"Kein Pool für {key} konfiguriert.")
+            pool = dict(ledger["pools"][key])
+            backend["prune"](ledger)
+            taken = take_ready(ledger, key, time.time())
+            if taken is None and not missed:
+                record_claim(ledger, key, hit=False)
+                missed = True
+        if taken or time.monotonic() >= deadline:
+            break
+        if refill:
+            backend["refill"]()
+            refill = False  # pro Claim nur einmal anstoßen
+        time.sleep(CLAIM_POLL_INTERVAL)
+
+    if taken is None:
+        if refill:
+            backend["refill"]()
+        fail(f"Pool {key} ist leer (Fehlgriff) – Auffüllen läuft im Hintergrund.")
+
+    vm_id, entry = taken
+    if not backend["inject"](vm_id, entry, pool, ssh_key, hostname or name):
+        with locked_pool(pool_file) as ledger:
+            ledger["vms"].pop(vm_id, None)
+        backend["discard"](vm_id, pool)
+        fail(f"SSH-Key/Hostname konnten in {vm_id} nicht gesetzt werden – VM verworfen.")
+    if "rename" in backend:
+        backend["rename"](vm_id, pool, name)
+
+    seconds = time.monotonic() - started
+    with locked_pool(pool_file) as ledger:
+        if vm_id in ledger["vms"]:
+            ledger["vms"][vm_id].update(claimed_as=name, hostname=hostname or name)
+        if not missed:
+            record_claim(ledger, key, hit=True, seconds=seconds)
+    if refill:
+        backend["refill"]()
+    return {"name": name, "vm": vm_id, "ip": entry["ip"], "username": pool["username"],
+            "hit": not missed, "seconds": round(seconds, 2)}
+
+
+def release_vm(pool_file: pathlib.Path, backend: dict, name: str):
+    with locked_pool(pool_file) as ledger:
+        vm_id = find_claimed(ledger, name)
+        if vm_id is None:
+            fail(f"Keine vergebene Pool-VM '{name}' gefunden.")
+        entry = ledger["vms"].pop(vm_id)
+        pool = dict(ledger["pools"].get(entry["key"], {}))
+    backend["discard"](vm_id, pool)
+    success(f"Pool-VM '{name}' ({vm_id}) gelöscht.")
+
+
+def configure_pool(pool_file: pathlib.Path, key: str, required: tuple[str, ...], defaults: dict | None = None,
+                   **settings):
+    """Legt einen Pool an (mit `defaults`) oder überschreibt die angegebenen Werte."""
+    with locked_pool(pool_file) as ledger:
+        pool = ledger["pools"].setdefault(key, {"size": DEFAULT_SIZE, "max_age": DEFAULT_MAX_AGE, **(defaults or {})})
+        pool.update({name: value for name, value in settings.items() if value is not None})
+        for name in required:
+            if not pool.get(name):
+                fail(f"Pool {key}: '{name}' fehlt (bei der ersten Konfiguration angeben).")
+    success(f"Pool {key}: {pool['size']} VMs, max. Alter {format_duration(pool['max_age'])}.")
+
+
+# =============================================================================
+# libvirt
+# =============================================================================
+
+def _prune(ledger: dict):
+    """Entfernt Einträge von Domains, die libvirt nicht mehr kennt (z.B. manuell gelöscht).
+
+    VMs in Provisionierung bleiben stehen – ihre Domain existiert erst nach virt-install.
+    """
+    domains = virt.list_domains()
+    if domains is None:
+        return
+    for vm_id, entry in list(ledger["vms"].items()):
+        if vm_id not in domains and entry["state"] != "provisioning":
+            del ledger["vms"][vm_id]
+
+
+def _new_vm(key: str, pool: dict) -> str:
+    return f"pool-{key_slug(key)}-{secrets.token_hex(3)}"
+
+
+def stage_vm(vmname: str, distro: str, arch: str, profile: str, settings: dict,
+             staging_lock=None) -> bool:
+    """Baut eine VM ohne Rückfragen auf und startet sie (ohne auf cloud-init zu warten).
+
+    `settings` braucht username, hashed_password, ssh_key (Pfad), templates und
+    optional net_type/bridge_interface/overlay. Die cloud-init-Dateien liegen im
+    Workspace der VM; nur das gemeinsame Basis-Image wird bei parallelen
+    Aufbauten (Daemon) über `staging_lock` geschützt.
+    """
+    from .build import build_cloud_config
+    from .cloud_init import create_meta_data, create_network_config
+    from .overlay import overlay_settings
+    from .vm import create_vm, ensure_base_image, ensure_overlay_image
+
+    workspace = ensure_workspace(workspace_dir(vmname))
+    with phase("build"):
+        build_cloud_config(
+            pathlib.Path(settings["templates"]), workspace / USER_DATA,
+            username=settings["username"],
+            hashed_password=settings["hashed_password"],
+            ssh_key_content=pathlib.Path(settings["ssh_key"]).read_text().strip(),
+            arch=arch,
+        )
+        create_meta_data(vmname, workspace)
+    with phase("base_image"), staging_lock or contextlib.nullcontext():
+        ensure_base_image(arch, distro)
+    overlay = overlay_settings(profile, settings.get("overlay"))
+    with phase("overlay"):
+        ensure_overlay_image(vmname, arch, distro, overlay)
+    create_network_config(distro, workspace)
+    with phase("create"):
+        return create_vm(vmname, settings["username"], arch, settings.get("net_type") or "default",
+                         settings.get("bridge_interface"), distro, profile, overlay=overlay,
+                         workspace=workspace)
+
+
+def provision_vm(vmname: str, distro: str, arch: str, profile: str, settings: dict,
+                 staging_lock=None) -> str | None:
+    """Wie `stage_vm`, wartet danach auf cloud-init; gibt die IP zurück."""
+    from .vm import get_vm_ip, wait_for_cloud_init
+
+    if not stage_vm(vmname, distro, arch, profile, settings, staging_lock):
+        return None
+    with phase("cloud_init"):
+        if not wait_for_cloud_init(vmname):
+            return None
+    with phase("ip"):
+        return get_vm_ip(vmname)
+
+
+def _provision(vmname: str, key: str, pool: dict) -> str | None:
+    distro, arch, profile = key.split("|")
+    return provision_vm(vmname, distro, arch, profile, pool)
+
+
+def _inject(vmname: str, entry: dict, pool: dict, ssh_key: str, hostname: str) -> bool:
+    from .vm import guest_exec
+
+    script = injection_script(pool["username"], ssh_key, hostname)
+    result = guest_exec(vmname, "/bin/sh", ["-c", script], timeout=10)
+    if result is not None and result[0] == 0:
+        return True
+    return ssh_inject(pool["username"], entry["ip"], script)
+
+
+def _rename(vmname: str, pool: dict, name: str):
+    # Laufende Domains lassen sich nicht umbenennen (virsh domrename) – der Name wird als Titel gesetzt
+    subprocess.run(["virsh", "desc", vmname, "--live", "--config", "--title", name],
+                   capture_output=True, check=False)
+
+
+def _discard(vmname: str, pool: dict):
+    from .vm import delete_vm
+    delete_vm(vmname, skip_confirm=True)
+
+
+BACKEND = {
+    "prune": _prune,
+    "new_vm": _new_vm,
+    "provision": _provision,
+    "inject": _inject,
+    "rename": _rename,
+    "discard": _discard,
+    "refill": lambda: spawn_refill(__name__, POOL_FILE.with_suffix(".log")),
+}
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def add_pool_arguments(parser: argparse.ArgumentParser, profiles: dict):
+    parser.add_argument("--distro", default="debian/13", help="Distro und Version (Standard: debian/13)")
+    parser.add_argument("--arch", choices=["amd64", "arm64"], default="amd64", help="Ziel-Architektur")
+    parser.add_argument("--profile", choices=list(profiles), default=DEFAULT_PROFILE, help="Profil")
+
+
+def add_configure_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--size", type=int, help=f"Anzahl bereiter VMs, 0 leert den Pool (Standard: {DEFAULT_SIZE})")
+    parser.add_argument("--max-age", dest="max_age", type=parse_duration,
+                        help="Bereite VMs nach dieser Zeit neu bauen, z.B. 12h (Standard: 24h)")
+    parser.add_argument("--username", help="Benutzer in den Pool-VMs")
+    parser.add_argument("--hashed-password", dest="hashed_password", help="Gehashtes Passwort (SHA-512)")
+    parser.add_argument("--ssh-key", dest="ssh_key", help="Öffentlicher SSH-Key des Pool-Betreibers")
+    parser.add_argument("--templates", help="Template-Verzeichnis (Standard: ./templates)")
+
+
+def add_pool_commands(sub, profiles: dict):
+    """Gemeinsame Unterbefehle status/fill/claim/release."""
+    sub.add_parser("status", help="Pools, VM-Zustände und Treffer/Fehlgriffe anzeigen")
+    sub.add_parser("fill", help="Abgelaufene VMs verwerfen und Pools auffüllen")
+
+    p_claim = sub.add_parser("claim", help="Bereite VM übernehmen")
+    add_pool_arguments(p_claim, profiles)
+    p_claim.add_argument("--name", required=True, help="Name der VM für den Anfragenden")
+    p_claim.add_argument("--ssh-key", dest="ssh_key", required=True, help="Öffentlicher SSH-Key des Anfragenden")
+    p_claim.add_argument("--hostname", help="Hostname in der VM (Standard: --name)")
+    p_claim.add_argument("--wait", type=int, default=0, help="Bei leerem Pool bis zu N Sekunden warten")
+    p_claim.add_argument("--no-refill", dest="refill", action="store_false", help="Nicht im Hintergrund auffüllen")
+    p_claim.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+
+    p_release = sub.add_parser("release", help="Vergebene VM löschen")
+    p_release.add_argument("name")
+
+
+def common_settings(args) -> dict:
+    """Gemeinsame configure-Werte; Pfade werden absolut gespeichert (Auffüllen läuft im Hintergrund)."""
+    templates = args.templates or ("templates" if pathlib.Path("templates").is_dir() else None)
+    return {
+        "size": args.size,
+        "max_age": args.max_age,
+        "username": args.username,
+        "hashed_password": args.hashed_password,
+        "ssh_key": str(pathlib.Path(args.ssh_key).expanduser().resolve()) if args.ssh_key else None,
+        "templates": str(pathlib.Path(templates).resolve()) if templates else None,
+    }
+
+
+def run_pool_command(args, pool_file: pathlib.Path, backend: dict):
+    if args.command == "status":
+        with locked_pool(pool_file) as ledger:
+            backend["prune"](ledger)
+            print(format_pool_status(ledger, time.time()))
+    elif args.command == "fill":
+        fill_pools(pool_file, backend)
+    elif args.command == "claim":
+        ssh_key = pathlib.Path(args.ssh_key).expanduser().read_text()
+        result = claim_vm(pool_file, backend, pool_key(args.distro, args.arch, args.profile), args.name,
+                          ssh_key, args.hostname, args.wait, args.refill)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            success(f"VM '{args.name}' ({result['vm']}) in {result['seconds']} s übernommen.")
+            print(f"ssh {result['username']}@{result['ip']}")
+    elif args.command == "release":
+        release_vm(pool_file, backend, args.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm-Pool fertig provisionierter VMs (libvirt)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_conf = sub.add_parser("configure", help="Pool anlegen oder ändern")
+    add_pool_arguments(p_conf, PROFILES)
+    add_configure_arguments(p_conf)
+    p_conf.add_argument("--net-type", dest="net_type", choices=["default", "bridge"])
+    p_conf.add_argument("--bridge-interface", dest="bridge_interface")
+    add_pool_commands(sub, PROFILES)
+    args = parser.parse_args()
+
+    if args.command == "configure":
+        configure_pool(
+            POOL_FILE, pool_key(args.distro, args.arch, args.profile), REQUIRED_SETTINGS,
+            **common_settings(args), net_type=args.net_type, bridge_interface=args.bridge_interface,
+        )
+    else:
+        run_pool_command(args, POOL_FILE, BACKEND)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Performance-Profile für libvirt-VMs (Größe, Disk-I/O, IOThreads).
+
+Ein Profil legt vCPUs, RAM, Cache-Modus und AIO-Backend der Disk,
+discard/unmap, die Anzahl IOThreads sowie das Layout fest:
+- `virtio-blk`: eine Disk pro virtio-blk-Gerät, Multiqueue über `driver.queues`
+- `virtio-scsi`: eigener virtio-scsi-Controller mit IOThread und Queues
+
+Dazu kommen die qcow2-Overlay-Optionen (siehe `overlay.py`).
+
+Das Profil `default` erzeugt exakt die bisherigen virt-install- und
+qemu-img-Parameter.
+"""
+
+import json
+import pathlib
+import subprocess
+
+from .ui import fail, progress, success
+from .workspace import write_atomic
+
+PROFILES: dict[str, dict] = {
+    "default": {
+        "description": "bisheriges Verhalten: 2 vCPU, 4 GB, virtio-blk mit Hypervisor-Defaults",
+        "vcpus": 2, "memory": 4096, "bus": "virtio-blk",
+        "cache": None, "io": None, "discard": None, "iothreads": 0, "queues": 0,
+        "overlay": {"size": "30G"},
+    },
+    "balanced": {
+        "description": "2 vCPU, 4 GB, O_DIRECT + native AIO, eigener IOThread",
+        "vcpus": 2, "memory": 4096, "bus": "virtio-blk",
+        "cache": "none", "io": "native", "discard": "unmap", "iothreads": 1, "queues": 2,
+        "overlay": {"size": "30G", "cluster_size": "128k", "extended_l2": True, "lazy_refcounts": True},
+    },
+    "database": {
+        "description": "4 vCPU, 8 GB, virtio-scsi mit IOThread, io_uring, kein Host-Cache",
+        "vcpus": 4, "memory": 8192, "bus": "virtio-scsi",
+        "cache": "none", "io": "io_uring", "discard": "unmap", "iothreads": 1, "queues": 4,
+        "overlay": {"size": "60G", "cluster_size": "64k", "extended_l2": True,
+                    "preallocation": "metadata", "lazy_refcounts": True},
+    },
+    "build": {
+        "description": "8 vCPU, 16 GB, Host-Writeback-Cache, Multiqueue virtio-blk",
+        "vcpus": 8, "memory": 16384, "bus": "virtio-blk",
+        "cache": "writeback", "io": "threads", "discard": "unmap", "iothreads": 1, "queues": 8,
+        "overlay": {"size": "60G", "cluster_size": "256k", "extended_l2": True,
+                    "lazy_refcounts": True, "compression_type": "zstd"},
+    },
+}
+
+DEFAULT_PROFILE = "default"
+
+FIO_RESULTS_FILE = pathlib.Path(".fio-results.json")
+
+# Kurze Läufe auf einer Testdatei im Home-Verzeichnis – reicht für den Vergleich zwischen Profilen
+FIO_JOBS = {
+    "randread-4k": "--rw=randread --bs=4k --iodepth=32",
+    "randwrite-4k": "--rw=randwrite --bs=4k --iodepth=32",
+    "seqread-1m": "--rw=read --bs=1M --iodepth=8",
+}
+FIO_RUNTIME = 20
+FIO_SIZE = "1G"
+
+
+def get_profile(name: str | None) -> dict:
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        fail(f"Unbekanntes Profil '{name}'. Verfügbar: {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+# =============================================================================
+# virt-install-Parameter
+# =============================================================================
+
+def _disk_options(profile: dict) -> list[str]:
+    options = []
+    for key in ("cache", "io", "discard"):
+        if profile.get(key):
+            options.append(f"{key}={profile[key]}")
+    if profile["bus"] == "virtio-blk":
+        if profile.get("iothreads"):
+            options.append("driver.iothread=1")
+        if profile.get("queues"):
+            options.append(f"driver.queues={profile['queues']}")
+    return options
+
+
+def virt_install_options(profile: dict, disk_path: pathlib.Path) -> str:
+    """Größe, IOThreads, Controller und --disk als virt-install-Fragment (mit Leerzeichen am Ende)."""
+    parts = [f"--memory {profile['memory']}", f"--vcpus {profile['vcpus']}"]
+    if profile.get("iothreads"):
+        parts.append(f"--iothreads {profile['iothreads']}")
+
+    if profile["bus"] == "virtio-scsi":
+        controller = "type=scsi,model=virtio-scsi"
+        if profile.get("iothreads"):
+            controller += ",driver.iothread=1"
+        if profile.get("queues"):
+            controller += f",driver.queues={profile['queues']}"
+        parts.append(f"--controller {controller}")
+        bus = "scsi"
+    else:
+        bus = "virtio"
+
+    disk = ",".join([str(disk_path), "device=disk", f"bus={bus}", *_disk_options(profile)])
+    parts.append(f"--disk {disk}")
+    return " ".join(parts) + " "
+
+
+# =============================================================================
+# fio-Check im Gast
+# =============================================================================
+
+def _fio_command() -> str:
+    jobs = " ".join(
+        f"--name={name} {args}" for name, args in FIO_JOBS.items()
+    )
+    return (
+        "command -v fio >/dev/null || sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -q fio >/dev/null; "
+        f"fio --output-format=json --ioengine=libaio --direct=1 --filename=$HOME/.fio-test "
+        f"--size={FIO_SIZE} --runtime={FIO_RUNTIME} --time_based --stonewall {jobs}; "
+        "rc=$?; rm -f $HOME/.fio-test; exit $rc"
+    )
+
+
+def parse_fio(output: str) -> dict[str, dict]:
+    """Reduziert fio-JSON auf IOPS, Bandbreite (MiB/s) und p99-Latenz (ms) pro Job."""
+    try:
+        data = json.loads(output[output.index("{"):])
+    except (ValueError, json.JSONDecodeError):
+        fail("fio-Ausgabe konnte nicht gelesen werden.")
+
+    results = {}
+    for job in data.get("jobs", []):
+        side = job["write"] if job["write"].get("io_bytes") else job["read"]
+        p99 = side.get("clat_ns", {}).get("percentile", {}).get("99.000000", 0)
+        results[job["jobname"]] = {
+            "iops": round(side.get("iops", 0.0)),
+            "bw_mib": round(side.get("bw", 0) / 1024, 1),
+            "p99_ms": round(p99 / 1e6, 2),
+        }
+    return results
+
+
+def run_fio_check(username: str, ip: str) -> dict[str, dict]:
+    progress(f"Starte fio-Check in der VM ({len(FIO_JOBS)} Jobs à {FIO_RUNTIME} s)…")
+    result = subprocess.run(
+        ["ssh", "-o", "StrictHostKeyChecking=accept-new", f"{username}@{ip}", _fio_command()],
+        capture_output=True, text=True, check=False,
+    )
+    if result.returncode != 0:
+        fail(f"fio-Check fehlgeschlagen: {result.stderr.strip() or result.stdout.strip()}")
+    return parse_fio(result.stdout)
+
+
+def record_fio_results(vmname: str, profile_name: str, results: dict[str, dict]) -> dict[str, dict]:
+    """Speichert das Ergebnis und gibt alle bisherigen Ergebnisse der VM (pro Profil) zurück."""
+    data = {}
+    if FIO_RESULTS_FILE.exists():
+        try:
+            data = json.loads(FIO_RESULTS_FILE.read_text())
+        except json.JSONDecodeError:
+            data = {}
+    data.setdefault(vmname, {})[profile_name] = results
+    write_atomic(FIO_RESULTS_FILE, json.dumps(data, indent=4))
+    return data[vmname]
+
+
+def format_fio_report(by_profile: dict[str, dict]) -> str:
+    lines = [f"{'Profil':<10} {'Job':<14} {'IOPS':>9} {'MiB/s':>9} {'p99 ms':>9}"]
+    for profile_name, results in by_profile.items():
+        for job, values in results.items():
+            lines.append(
+                f"{profile_name:<10} {job:<14} {values['iops']:>9} {values['bw_mib']:>9} {values['p99_ms']:>9}"
+            )
+    return "\n".join(lines)
+
+
+def fio_check(vmname: str, profile_name: str, username: str, ip: str):
+    results = run_fio_check(username, ip)
+    by_profile = record_fio_results(vmname, profile_name, results)
+    success(f"fio-Check abgeschlossen (Ergebnisse in {FIO_RESULTS_FILE}).")
+    print(format_fio_report(by_profile))
+
+
+def describe_profiles() -> str:
+    return "\n".join(f"  {name:<10} {p['description']}" for name, p in PROFILES.items())
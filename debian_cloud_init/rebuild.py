@@ -0,0 +1,99 @@
+"""Schneller Neuaufbau über ein Golden-Overlay.
+
+Nach der ersten erfolgreichen Provisionierung wird die VM heruntergefahren und
+ihr Overlay als `<vmname>-golden.qcow2` gesichert (reflink, wo das Dateisystem
+es kann). Dazu wird ein Hash über cloud-init.yml und die VM-Parameter
+abgelegt (meta-data.yml nicht – die instance-id enthält einen Zeitstempel). Beim nächsten "löschen und neu erstellen" mit gleichem
+Hash wird nur das Overlay zurückkopiert und die VM neu gestartet – die Domain
+bleibt definiert, cloud-init läuft nicht erneut (gleiche instance-id).
+Weicht der Hash ab, folgt der normale vollständige Neuaufbau.
+"""
+
+import hashlib
+import json
+import pathlib
+import subprocess
+import time
+
+from . import virt
+from .metrics import count_cache
+from .stages import wait_for_provisioning
+from .ui import fail, progress, run_cmd, success
+from .vm import ISOS_PATH, read_provision_status, wait_for_cloud_init
+from .workspace import write_atomic
+
+
+def golden_paths(vmname: str) -> tuple[pathlib.Path, pathlib.Path]:
+    return ISOS_PATH / f"{vmname}-golden.qcow2", ISOS_PATH / f"{vmname}-golden.json"
+
+
+def config_hash(cloud_init_file: pathlib.Path, params: dict) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps(params, sort_keys=True).encode())
+    h.update(cloud_init_file.read_bytes())
+    return h.hexdigest()
+
+
+def golden_matches(vmname: str, digest: str) -> bool:
+    image, meta = golden_paths(vmname)
+    try:
+        matches = image.exists() and meta.exists() and json.loads(meta.read_text()).get("hash") == digest
+    except json.JSONDecodeError:
+        matches = False
+    count_cache("golden", matches)
+    return matches
+
+
+def discard_golden(vmname: str):
+    for path in golden_paths(vmname):
+        path.unlink(missing_ok=True)
+
+
+def _shutdown(vmname: str, timeout: int = 120):
+    subprocess.run(["virsh", "shutdown", vmname], capture_output=True, check=False)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if virt.domain_state(vmname) == "shut off":
+            return
+        time.sleep(2)
+    print("⚠ VM fährt nicht herunter – wird hart gestoppt.")
+    virt.destroy(vmname)
+
+
+def _copy(src: pathlib.Path, dst: pathlib.Path):
+    tmp = dst.with_suffix(".tmp")
+    run_cmd(f"cp --reflink=auto --sparse=always {src} {tmp}")
+    tmp.replace(dst)
+
+
+def capture_golden(vmname: str, digest: str, deferred: bool = False) -> bool:
+    """Sichert das Overlay nach erfolgreicher Provisionierung; gibt False bei Fehlschlag zurück."""
+    if not wait_for_cloud_init(vmname):
+        print("⚠ cloud-init nicht erfolgreich abgeschlossen – kein Golden-Overlay angelegt.")
+        return False
+    if deferred:
+        status = wait_for_provisioning(lambda: read_provision_status(vmname))
+        if not status or status.get("state") != "done":
+            print("⚠ Verzögerte Provisionierung nicht abgeschlossen – kein Golden-Overlay angelegt.")
+            return False
+
+    image, meta = golden_paths(vmname)
+    progress("Fahre VM für Golden-Overlay herunter…")
+    _shutdown(vmname)
+    _copy(ISOS_PATH / f"{vmname}.qcow2", image)
+    write_atomic(meta, json.dumps({"hash": digest, "created": time.strftime("%Y-%m-%dT%H:%M:%S")}, indent=4))
+    run_cmd(f"virsh start {vmname}")
+    success(f"Golden-Overlay gespeichert: {image}")
+    return True
+
+
+def revert_to_golden(vmname: str):
+    image, _ = golden_paths(vmname)
+    if not image.exists():
+        fail(f"Golden-Overlay fehlt: {image}")
+    started = time.monotonic()
+    progress("Setze VM auf Golden-Overlay zurück…")
+    virt.destroy(vmname)
+    _copy(image, ISOS_PATH / f"{vmname}.qcow2")
+    run_cmd(f"virsh start {vmname}")
+    success(f"VM '{vmname}' in {time.monotonic() - started:.1f} s zurückgesetzt (ohne cloud-init).")
@@ -0,0 +1,471 @@
+"""Deklarativer Modus: gewünschte VMs aus einer Spec, minimaler Plan, paralleles Anwenden.
+
+Die Generatoren arbeiten ein Skript ab und bauen im Zweifel alles neu. Hier
+wird stattdessen der Ist-Zustand aller VMs in wenigen Aufrufen gelesen
+(Domains, Overlays, Seed-ISOs bzw. VMIDs und Snippets auf Proxmox), mit der
+Spec verglichen und nur das Nötige ausgeführt:
+
+    create    VM fehlt
+    start     VM existiert, läuft aber nicht
+    reseed    Seed-ISO bzw. Snippets fehlen
+    resize    Disk kleiner als gewünscht
+    recreate  cloud-config oder VM-Parameter geändert, Disk müsste schrumpfen
+    delete    VM steht nicht mehr in der Spec (nur VMs, die dieser Modus angelegt hat)
+    adopt     bestehende VM ohne Eintrag wird übernommen (nur Hash merken)
+
+Die Aktionen verschiedener VMs laufen parallel (`--limit`). Welche VMs dieser
+Modus verwaltet und mit welchem Konfigurations-Hash, steht in
+`.reconcile-state.json` (Proxmox: `.proxmox-reconcile-state.json`). Ein
+zweiter Lauf gegen eine unveränderte Umgebung findet nichts zu tun.
+
+Spec (YAML, Pfade relativ zur Spec-Datei):
+
+    defaults:
+      distro: debian/13
+      username: ci
+      hashed_password: '$6$…'
+      ssh_key: ~/.ssh/id_ed25519.pub
+      templates: templates
+    vms:
+      web1: {}
+      db1: {profile: database, overlay: {size: 60G}}
+
+    python -m debian_cloud_init.reconcile plan lab.yml
+    python -m debian_cloud_init.reconcile apply lab.yml --limit 8 [--yes]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import re
+import socket
+import tempfile
+import time
+
+import yaml
+
+from . import ui, virt
+from .build import build_cloud_config
+from .cloud_init import YamlLoader, create_meta_data
+from .engine import CommandError, run_all
+from .metrics import phase, record_run
+from .overlay import overlay_settings, parse_size
+from .profiles import DEFAULT_PROFILE, PROFILES
+from .rebuild import config_hash
+from .seed_server import seed_url
+from .ui import fail, progress, success
+from .workspace import (
+    META_DATA,
+    USER_DATA,
+    ensure_workspace,
+    workspace_dir,
+    write_atomic,
+)
+
+STATE_FILE = pathlib.Path(".reconcile-state.json")
+DEFAULT_LIMIT = 4
+
+ACTIONS = ("delete", "recreate", "create", "adopt", "reseed", "resize", "start")
+DESTRUCTIVE = ("delete", "recreate")
+_SYMBOLS = {"create": "+", "delete": "-", "recreate": "±"}
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,62}$")
+
+
+# =============================================================================
+# Spec
+# =============================================================================
+
+def load_spec(path: pathlib.Path, required: tuple[str, ...], defaults: dict) -> dict[str, dict]:
+    """Liest die Spec und ergänzt jede VM um `defaults` der Datei und des Backends."""
+    try:
+        data = yaml.load(path.read_text(), Loader=YamlLoader) or {}
+    except (OSError, yaml.YAMLError) as e:
+        fail(f"Spec {path} nicht lesbar: {e}")
+    if not isinstance(data.get("vms"), dict):
+        fail(f"Spec {path}: Abschnitt 'vms' fehlt.")
+    base = {**defaults, **(data.get("defaults") or {})}
+    specs = {}
+    for name, settings in data["vms"].items():
+        name = str(name)
+        if not _NAME_RE.match(name):
+            fail(f"Spec {path}: ungültiger VM-Name '{name}'.")
+        spec = {**base, **(settings or {})}
+        missing = [key for key in required if not spec.get(key)]
+        if missing:
+            fail(f"Spec {path}: VM '{name}' fehlt {', '.join(missing)}.")
+        for key in ("ssh_key", "templates"):
+            if spec.get(key):
+                spec[key] = str((path.parent / pathlib.Path(spec[key]).expanduser()).resolve())
+        specs[name] = spec
+    return specs
+
+
+def load_state(state_file: pathlib.Path) -> dict[str, dict]:
+    if not state_file.exists():
+        return {}
+    try:
+        return json.loads(state_file.read_text())
+    except json.JSONDecodeError:
+        return {}
+
+
+# =============================================================================
+# Plan
+# =============================================================================
+#
+# desired:  Name → {"hash": …, "disk": Bytes}
+# observed: Name → {"state": "running"|"stopped"|…, "disk": Bytes|None,
+#                   "seed": bool|None, "broken": Grund|None, "record": {…}};
+#           fehlende VMs fehlen, "record" wird in den State übernommen (z.B. VMID)
+# state:    Name → zuletzt angewendeter Eintrag ({"hash", "disk", …})
+
+def _action(name: str, action: str, reason: str) -> dict:
+    return {"name": name, "action": action, "reason": reason}
+
+
+def plan(desired: dict[str, dict], observed: dict[str, dict], state: dict[str, dict]) -> list[dict]:
+    actions = []
+    for name in sorted(state.keys() - desired.keys()):
+        if name in observed:
+            actions.append(_action(name, "delete", "nicht mehr in der Spec"))
+    for name, want in sorted(desired.items()):
+        have = observed.get(name)
+        recorded = state.get(name)
+        if have is None:
+            actions.append(_action(name, "create", "VM fehlt"))
+            continue
+        if have.get("broken"):
+            actions.append(_action(name, "recreate", have["broken"]))
+            continue
+        if recorded is None:
+            actions.append(_action(name, "adopt", "bestehende VM ohne Eintrag"))
+        elif recorded.get("hash") != want["hash"]:
+            actions.append(_action(name, "recreate", "Konfiguration geändert"))
+            continue
+        if have.get("disk") is not None and want["disk"] < have["disk"]:
+            actions.append(_action(name, "recreate", "Disk kann nicht verkleinert werden"))
+            continue
+        if have.get("seed") is False:
+            actions.append(_action(name, "reseed", "Seed fehlt"))
+        if have.get("disk") is not None and want["disk"] > have["disk"]:
+            actions.append(_action(name, "resize", f"{_gib(have['disk'])} → {_gib(want['disk'])}"))
+        if have["state"] != "running":
+            actions.append(_action(name, "start", f"Zustand '{have['state']}'"))
+    return actions
+
+
+def _gib(size: int) -> str:
+    return f"{size / 1024 ** 3:g}G"
+
+
+def format_plan(actions: list[dict]) -> str:
+    if not actions:
+        return "Nichts zu tun – alle VMs entsprechen der Spec."
+    width = max(len(a["name"]) for a in actions)
+    lines = [f"  {_SYMBOLS.get(a['action'], '~')} {a['action']:<8}  {a['name']:<{width}}  ({a['reason']})"
+             for a in actions]
+    counts = {action: sum(a["action"] == action for a in actions) for action in ACTIONS}
+    lines.append("Plan: " + ", ".join(f"{count} {action}" for action, count in counts.items() if count))
+    return "\n".join(lines)
+
+
+# =============================================================================
+# Anwenden (backend-unabhängig)
+# =============================================================================
+#
+# Ein Backend liefert:
+#   state_file, required, defaults
+#   desire(name, spec) -> {"hash", "disk"}   cloud-config bauen, Soll-Werte berechnen
+#   inspect(specs, state) -> observed         Ist-Zustand aller VMs aus Spec und State
+#   prepare(actions, specs)                   Gemeinsames vorab, z.B. Basis-Images (nacheinander)
+#   actions[action](name, spec, entry)        eine Aktion; `entry` (State-Eintrag) darf
+#                                             ergänzt werden, z.B. um die VMID
+
+async def apply_plan(actions: list[dict], specs: dict[str, dict], entries: dict[str, dict], backend: dict,
+                     limit: int = DEFAULT_LIMIT) -> list[dict]:
+    """Führt die Aktionen aus – pro VM nacheinander, verschiedene VMs parallel."""
+    steps: dict[str, list[str]] = {}
+    for action in actions:
+        steps.setdefault(action["name"], []).append(action["action"])
+    semaphore = asyncio.Semaphore(limit)
+
+    async def one(name: str, todo: list[str]) -> dict:
+        async with semaphore:
+            started = time.monotonic()
+            entry = dict(entries.get(name, {}))
+            error = None
+            try:
+                for action in todo:
+                    await asyncio.to_thread(backend["actions"][action], name, specs.get(name), entry)
+            except (CommandError, OSError) as e:
+                error = str(e)
+            except SystemExit:
+                # `fail` hat die Meldung bereits ausgegeben
+                error = "abgebrochen"
+            return {"name": name, "actions": todo, "entry": entry, "error": error,
+                    "seconds": round(time.monotonic() - started, 1)}
+
+    return await asyncio.gather(*(one(name, todo) for name, todo in steps.items()))
+
+
+def update_state(state: dict[str, dict], results: list[dict], desired: dict[str, dict]) -> dict[str, dict]:
+    """Übernimmt erfolgreiche Aktionen; fehlgeschlagene VMs behalten ihren alten Eintrag."""
+    for result in results:
+        name = result["name"]
+        if result["error"]:
+            continue
+        if "delete" in result["actions"]:
+            state.pop(name, None)
+        else:
+            state[name] = {**result["entry"], **desired[name]}
+    return state
+
+
+def format_results(results: list[dict], seconds: float) -> str:
+    width = max([len(r["name"]) for r in results] + [4])
+    lines = []
+    for r in results:
+        status = f"FEHLER: {r['error']}" if r["error"] else f"{r['seconds']:>6.1f} s"
+        lines.append(f"  {r['name']:<{width}}  {', '.join(r['actions']):<24}  {status}")
+    failed = sum(1 for r in results if r["error"])
+    summary = f"{len(results) - failed} VM(s) in {seconds:.1f} s abgeglichen"
+    return "\n".join([*lines, summary + (f", {failed} Fehler" if failed else "")])
+
+
+def reconcile(spec_file: pathlib.Path, backend: dict, apply: bool = False, limit: int = DEFAULT_LIMIT,
+              assume_yes: bool = False) -> list[dict]:
+    """Plan ausgeben und mit `apply` anwenden; gibt die Aktionen zurück."""
+    specs = load_spec(spec_file, backend["required"], backend["defaults"])
+    state = load_state(backend["state_file"])
+    with phase("build"):
+        desired = {name: backend["desire"](name, spec) for name, spec in specs.items()}
+    with phase("inspect"):
+        observed = backend["inspect"](specs, state)
+    actions = plan(desired, observed, state)
+    print(format_plan(actions))
+    if not apply or not actions:
+        return actions
+
+    if (any(a["action"] in DESTRUCTIVE for a in actions) and not assume_yes
+            and not ui.ask_yes_no("Plan mit Löschungen bzw. Neuaufbau anwenden?", default=False)):
+        print("Abgebrochen.")
+        return actions
+    ui.NON_INTERACTIVE = True
+    with phase("base_image"):
+        backend["prepare"](actions, specs)
+    progress(f"Wende {len(actions)} Aktion(en) an, höchstens {limit} VMs gleichzeitig…")
+    started = time.monotonic()
+    entries = {name: {**state.get(name, {}), **observed.get(name, {}).get("record", {})}
+               for name in specs.keys() | state.keys()}
+    with phase("apply"):
+        results = asyncio.run(apply_plan(actions, specs, entries, backend, limit))
+    state = update_state(state, results, desired)
+    # Einträge von VMs, die weder in der Spec stehen noch existieren
+    for name in [name for name in state if name not in specs and name not in observed]:
+        del state[name]
+    write_atomic(backend["state_file"], json.dumps(state, indent=4))
+    print(format_results(results, time.monotonic() - started))
+    if any(r["error"] for r in results):
+        fail("Nicht alle Aktionen waren erfolgreich – erneut ausführen, um den Rest nachzuholen.")
+    return actions
+
+
+# =============================================================================
+# libvirt
+# =============================================================================
+
+REQUIRED_SETTINGS = ("username", "hashed_password", "ssh_key", "templates")
+DEFAULTS = {"distro": "debian/13", "arch": "amd64", "profile": DEFAULT_PROFILE, "net_type": "default"}
+
+
+def _overlay(spec: dict) -> dict:
+    return overlay_settings(spec["profile"], spec.get("overlay"))
+
+
+def _render(spec: dict, target: pathlib.Path):
+    build_cloud_config(
+        pathlib.Path(spec["templates"]), target,
+        username=spec["username"],
+        hashed_password=spec["hashed_password"],
+        ssh_key_content=pathlib.Path(spec["ssh_key"]).read_text().strip(),
+        arch=spec["arch"],
+    )
+
+
+def _desire(name: str, spec: dict) -> dict:
+    if spec["profile"] not in PROFILES:
+        fail(f"VM '{name}': unbekanntes Profil '{spec['profile']}'.")
+    overlay = _overlay(spec)
+    # Die Größe wird per resize angepasst und zählt deshalb nicht zum Hash
+    params = {key: spec.get(key) for key in ("distro", "arch", "username", "net_type", "bridge_interface", "profile")}
+    params["overlay"] = {key: value for key, value in overlay.items() if key != "size"}
+    # Nur für den Hash rendern: die user-data im Workspace liefert der Seed-Server aus und
+    # reprovision nutzt sie als Ausgangsstand – sie ändert sich erst mit create/recreate
+    with tempfile.TemporaryDirectory() as tmp:
+        target = pathlib.Path(tmp) / USER_DATA
+        _render(spec, target)
+        digest = config_hash(target, params)
+    return {"hash": digest, "disk": parse_size(overlay["size"])}
+
+
+def _state_name(state: str) -> str:
+    return {"shut off": "stopped", "shutoff": "stopped"}.get(state, state)
+
+
+def _seed_expected(distro: str) -> bool:
+    # Ohne Domain-XML (virt-install) bekommt nur Ubuntu eine Seed-ISO, mit Seed-Server keine VM
+    if seed_url():
+        return False
+    return not os.environ.get("DEBIAN_CLOUD_INIT_VIRT_INSTALL") or distro.startswith("ubuntu")
+
+
+def _disk_sizes(names: list[str]) -> dict[str, int]:
+    """Virtuelle Größe der Overlays – alle qemu-img-Aufrufe parallel."""
+    from .vm import ISOS_PATH
+
+    commands = [["qemu-img", "info", "--output=json", "-U", str(ISOS_PATH / f"{name}.qcow2")] for name in names]
+    sizes = {}
+    for name, result in zip(names, asyncio.run(run_all(commands, timeout=60)), strict=True):
+        if isinstance(result, CommandError):
+            continue
+        try:
+            sizes[name] = int(json.loads(result.stdout)["virtual-size"])
+        except (json.JSONDecodeError, KeyError, ValueError):
+            continue
+    return sizes
+
+
+def _inspect(specs: dict[str, dict], state: dict[str, dict]) -> dict[str, dict]:
+    from .vm import ISOS_PATH
+
+    domains = virt.domain_state_map()
+    if domains is None:
+        fail("libvirt ist nicht erreichbar.")
+    files = set(os.listdir(ISOS_PATH)) if ISOS_PATH.is_dir() else set()
+    present = sorted(name for name in specs.keys() | state.keys() if name in domains)
+    sizes = _disk_sizes([name for name in present if f"{name}.qcow2" in files])
+    observed = {}
+    for name in present:
+        distro = (specs.get(name) or state[name]).get("distro", "")
+        observed[name] = {
+            "state": _state_name(domains[name]),
+            "disk": sizes.get(name),
+            "seed": f"{name}-seed.iso" in files if _seed_expected(distro) else None,
+            "broken": None if f"{name}.qcow2" in files else "Overlay fehlt",
+        }
+    return observed
+
+
+def _prepare(actions: list[dict], specs: dict[str, dict]):
+    """Lädt fehlende Basis-Images einmal vorab statt in jeder parallelen Aktion."""
+    from .vm import ensure_base_image
+
+    images = {(specs[a["name"]]["arch"], specs[a["name"]]["distro"])
+              for a in actions if a["action"] in ("create", "recreate")}
+    for arch, distro in sorted(images):
+        ensure_base_image(arch, distro)
+
+
+def _create(name: str, spec: dict, entry: dict):
+    from .pool import stage_vm
+
+    if not stage_vm(name, spec["distro"], spec["arch"], spec["profile"], spec):
+        fail(f"VM '{name}' wurde nicht angelegt.")
+
+
+def _recreate(name: str, spec: dict, entry: dict):
+    from .teardown import tombstone_vm
+
+    tombstone_vm(name)
+    _create(name, spec, entry)
+
+
+def _start(name: str, spec: dict, entry: dict):
+    error = virt.start(name)
+    if error:
+        fail(f"VM '{name}' konnte nicht gestartet werden: {error}")
+    success(f"VM '{name}' gestartet.")
+
+
+def _reseed(name: str, spec: dict, entry: dict):
+    from .cloud_init import create_network_config
+    from .vm import create_seed_iso
+
+    workspace = ensure_workspace(workspace_dir(name))
+    if not (workspace / USER_DATA).exists():
+        # Unveränderter Hash: derselbe Stand, mit dem die VM angelegt wurde
+        _render(spec, workspace / USER_DATA)
+    # Neue meta-data (neue instance-id) nur, wenn keine mehr da ist – sonst liefe cloud-init erneut
+    if not (workspace / META_DATA).exists():
+        create_meta_data(name, workspace)
+    create_network_config(spec["distro"], workspace)
+    create_seed_iso(name, workspace)
+
+
+def _resize(name: str, spec: dict, entry: dict):
+    from .vm import ISOS_PATH
+
+    overlay = ISOS_PATH / f"{name}.qcow2"
+    size = parse_size(_overlay(spec)["size"])
+    if virt.domain_state(name) == "running":
+        # Laufende VM: qemu-img darf das Image nicht anfassen, QEMU vergrößert selbst
+        ui.run_cmd(f"virsh blockresize {name} {overlay} {size}B")
+    else:
+        ui.run_cmd(f"qemu-img resize {overlay} {size}")
+    success(f"Disk von '{name}' auf {_gib(size)} vergrößert.")
+
+
+def _adopt(name: str, spec: dict, entry: dict):
+    success(f"VM '{name}' übernommen.")
+
+
+def _delete(name: str, spec: dict | None, entry: dict):
+    from .vm import delete_vm
+
+    delete_vm(name, skip_confirm=True)
+
+
+BACKEND = {
+    "state_file": STATE_FILE,
+    "required": REQUIRED_SETTINGS,
+    "defaults": DEFAULTS,
+    "desire": _desire,
+    "inspect": _inspect,
+    "prepare": _prepare,
+    "actions": {
+        "create": _create,
+        "recreate": _recreate,
+        "start": _start,
+        "reseed": _reseed,
+        "resize": _resize,
+        "adopt": _adopt,
+        "delete": _delete,
+    },
+}
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def add_reconcile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("command", choices=["plan", "apply"], help="Nur anzeigen oder anwenden")
+    parser.add_argument("spec", type=pathlib.Path, help="YAML-Datei mit den gewünschten VMs")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT,
+                        help=f"Höchstens N VMs gleichzeitig bearbeiten (Standard: {DEFAULT_LIMIT})")
+    parser.add_argument("--yes", action="store_true", help="Löschen und Neuaufbau ohne Rückfrage")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VMs deklarativ an eine Spec angleichen (libvirt)")
+    add_reconcile_arguments(parser)
+    args = parser.parse_args()
+    with record_run("kvm", host=socket.gethostname()):
+        reconcile(args.spec, BACKEND, apply=args.command == "apply", limit=args.limit, assume_yes=args.yes)
+
+
+if __name__ == "__main__":
+    main()
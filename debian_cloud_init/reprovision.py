@@ -0,0 +1,423 @@
+"""Template-Änderungen in laufende VMs bringen, ohne sie neu aufzubauen.
+
+Bisher erreichte jede Änderung an system-config.txt, package-config.txt oder
+tools.yml eine VM nur über "löschen und neu erstellen". Hier wird die
+cloud-config jeder Session neu gerendert und mit dem Stand verglichen, der
+zuletzt in der VM angekommen ist (`applied-cloud-init.yml` im Workspace).
+Ausgeführt wird nur der Unterschied:
+
+    Pakete    neue Einträge unter `packages` per apt-get install
+    Befehle   package-config.txt und system-config.txt ab der ersten geänderten Zeile
+    Skripte   das Tools-Skript, wenn sich tools.yml geändert hat
+
+libvirt über SSH (Benutzer der Session, sudo), Proxmox über den Guest-Agent
+(`qm guest exec`), für alle laufenden VMs parallel (`--limit`). Entfernte
+Pakete und Befehle sowie Änderungen an anderen Schlüsseln (users,
+write_files, …) werden nicht rückgängig gemacht, sondern gemeldet – dafür
+bleibt der Neuaufbau. Nach Erfolg stehen der neue Stand im Workspace und
+sein Hash (`applied_hash`) in der Session.
+
+`--deferred` und `--optimize-packages` sollten so gesetzt sein wie beim
+Anlegen der VMs. Mit `--watch` wird bei jeder Änderung der Template-Dateien
+erneut abgeglichen.
+
+    python -m debian_cloud_init.reprovision --dry-run
+    python -m debian_cloud_init.reprovision --match 'lab-*' --limit 8
+    python -m debian_cloud_init.reprovision --watch
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import hashlib
+import pathlib
+import re
+import shlex
+import socket
+import tempfile
+import time
+
+import yaml
+
+from . import virt
+from .build import build_cloud_config, template_files
+from .cloud_init import YamlLoader
+from .engine import CommandError, run_async
+from .metrics import phase, record_run
+from .session import all_sessions, update_session
+from .stages import LIB_DIR, UNIT_NAME
+from .tools import SCRIPT_MARKER
+from .ui import fail, progress, success
+from .workspace import APPLIED_DATA, USER_DATA, record_applied, session_workspace
+
+DEFAULT_LIMIT = 8
+SCRIPT_TIMEOUT = 1800
+WATCH_INTERVAL = 2.0
+
+# Diese Schlüssel deckt der Abgleich ab; Änderungen an allen anderen brauchen einen Neuaufbau
+HANDLED_KEYS = ("packages", "package_update", "package_upgrade", "runcmd", "write_files")
+
+_STEP_RE = re.compile(rf"^{re.escape(LIB_DIR)}/steps/\d+-(.+)\.sh$")
+_ASSIGN_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+
+# =============================================================================
+# cloud-config vergleichen
+# =============================================================================
+
+def _commands(script: str) -> list[str]:
+    """Einzelbefehle eines Skripts; Zeilen mit `\\` am Ende bleiben zusammen."""
+    commands = []
+    current = ""
+    for line in script.splitlines():
+        current += line
+        if line.endswith("\\"):
+            current += "\n"
+            continue
+        if current.strip() and not current.lstrip().startswith("#"):
+            commands.append(current.strip())
+        current = ""
+    if current.strip():
+        commands.append(current.strip())
+    return commands
+
+
+def _package(entry) -> str:
+    # cloud-init erlaubt auch [name, version]
+    return "=".join(map(str, entry)) if isinstance(entry, list) else str(entry)
+
+
+def _managed_file(path: str) -> bool:
+    return path.startswith(LIB_DIR) or path.endswith(UNIT_NAME)
+
+
+def config_parts(cloud_config: dict) -> dict:
+    """Zerlegt eine cloud-config in Pakete, Einzelbefehle und ganze Skripte.
+
+    Sofort- und verzögerte Variante (runcmd bzw. Schritte in write_files)
+    ergeben dieselben Teile; das Tools-Skript bleibt als Ganzes erhalten.
+    """
+    commands: list[str] = []
+    scripts: dict[str, str] = {}
+    for entry in cloud_config.get("runcmd") or []:
+        entry = shlex.join(map(str, entry)) if isinstance(entry, list) else str(entry)
+        if entry.startswith(SCRIPT_MARKER):
+            scripts["tools"] = entry.strip()
+        else:
+            commands += _commands(entry)
+    for item in cloud_config.get("write_files") or []:
+        match = _STEP_RE.match(str(item.get("path", "")))
+        if not match:
+            continue
+        content = str(item.get("content", ""))
+        if content.startswith(SCRIPT_MARKER):
+            scripts[match.group(1)] = content.strip()
+        else:
+            commands += _commands(content)
+    return {
+        "packages": [_package(entry) for entry in cloud_config.get("packages") or []],
+        "commands": commands,
+        "scripts": scripts,
+    }
+
+
+def _other(cloud_config: dict) -> dict:
+    rest = {key: value for key, value in cloud_config.items() if key not in HANDLED_KEYS}
+    rest["write_files"] = [f for f in cloud_config.get("write_files") or [] if not _managed_file(str(f.get("path", "")))]
+    return rest
+
+
+def _replay(before: list[str], after: list[str]) -> list[str]:
+    """Neue Befehlsfolge ab der ersten geänderten Zeile, samt Wiederholungen.
+
+    Ein `apt-get update` hinter einer neuen Repo-Zeile steht auch im alten Stand,
+    muss aber erneut laufen. Variablen wie DISTRO_ID=… aus dem unveränderten
+    Anfang braucht auch eine geänderte Folgezeile. Ohne neue Zeile (nur
+    Entfernungen) bleibt die Folge leer.
+    """
+    start = 0
+    while start < min(len(before), len(after)) and before[start] == after[start]:
+        start += 1
+    known = set(before)
+    if all(command in known for command in after[start:]):
+        return []
+    return [c for c in after[:start] if _ASSIGN_RE.match(c)] + after[start:]
+
+
+def diff_configs(old: dict, new: dict) -> dict:
+    before, after = config_parts(old), config_parts(new)
+    commands = _replay(before["commands"], after["commands"])
+    old_other, new_other = _other(old), _other(new)
+    remaining = set(after["commands"])
+    return {
+        "packages": [p for p in after["packages"] if p not in before["packages"]],
+        "commands": commands,
+        "scripts": {name: script for name, script in after["scripts"].items()
+                    if before["scripts"].get(name) != script},
+        "removed": [p for p in before["packages"] if p not in after["packages"]]
+                   + [c for c in before["commands"] if c not in remaining],
+        "other": sorted(key for key in old_other.keys() | new_other.keys() if old_other.get(key) != new_other.get(key)),
+    }
+
+
+def has_changes(diff: dict) -> bool:
+    return bool(diff["packages"] or diff["commands"] or diff["scripts"])
+
+
+def update_script(diff: dict) -> str:
+    lines = ["set -e", "export DEBIAN_FRONTEND=noninteractive"]
+    if diff["packages"]:
+        lines += ["apt-get update", "apt-get install -y " + " ".join(map(shlex.quote, diff["packages"]))]
+    lines += diff["commands"]
+    lines += diff["scripts"].values()
+    return "\n".join(lines) + "\n"
+
+
+def format_diff(diff: dict) -> str:
+    parts = []
+    if diff["packages"]:
+        parts.append(f"+{len(diff['packages'])} Paket(e): {', '.join(diff['packages'])}")
+    if diff["commands"]:
+        parts.append(f"{len(diff['commands'])} Befehl(e)")
+    if diff["scripts"]:
+        parts.append(f"Skript(e): {', '.join(diff['scripts'])}")
+    lines = [", ".join(parts) or "nichts anzuwenden"]
+    lines += [f"    ~ {command.splitlines()[0]}" for command in diff["commands"]]
+    if diff["removed"]:
+        lines.append(f"  ⚠ Entfernt, wird nicht rückgängig gemacht: {', '.join(diff['removed'])}")
+    if diff["other"]:
+        lines.append(f"  ⚠ Geändert, nur per Neuaufbau: {', '.join(diff['other'])}")
+    return "\n".join(lines)
+
+
+# =============================================================================
+# Abgleich (backend-unabhängig)
+# =============================================================================
+#
+# Ein Backend liefert:
+#   workspace, build                          Workspace-Backend ("kvm") und Build-Backend ("libvirt")
+#   sessions() -> {Name: Session}
+#   update_session(name, **fields)
+#   running(sessions) -> {Name, …}            laufende VMs (möglichst in einem Aufruf)
+#   execute(name, session, script)            async; wirft CommandError
+
+def _load(path: pathlib.Path) -> dict:
+    return yaml.load(path.read_text(), Loader=YamlLoader) or {}
+
+
+def prepare_vm(name: str, session: dict, backend: dict, templates_dir: pathlib.Path,
+               optimize_packages: bool = False, deferred: bool = False, dry_run: bool = False) -> dict | None:
+    """Rendert die cloud-config neu und vergleicht sie mit dem angewendeten Stand (None: unverändert).
+
+    Mit `dry_run` wird in ein temporäres Verzeichnis gerendert, der Workspace bleibt unberührt.
+    """
+    workspace = session_workspace(session, backend["workspace"])
+    if not (workspace / APPLIED_DATA).exists():
+        if not (workspace / USER_DATA).exists():
+            print(f"⚠ {name}: kein angewendeter Stand in {workspace} – übersprungen.")
+            return None
+        # Ohne Aufzeichnung ist die user-data der Stand, mit dem die VM angelegt wurde –
+        # festhalten, bevor sie neu gerendert wird, sonst geht die Änderung verloren
+        record_applied(workspace)
+    old_content = (workspace / APPLIED_DATA).read_text()
+    with tempfile.TemporaryDirectory() as tmp:
+        target = pathlib.Path(tmp) / USER_DATA if dry_run else workspace / USER_DATA
+        build_cloud_config(
+            templates_dir, target,
+            username=session["username"],
+            hashed_password=session["hashed_password"],
+            ssh_key_content=pathlib.Path(session["ssh_key"]).read_text().strip(),
+            arch=session["arch"],
+            backend=backend["build"],
+            optimize_packages=optimize_packages,
+            deferred=deferred,
+        )
+        content = target.read_text()
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    if content == old_content or session.get("applied_hash") == digest:
+        return None
+    return {"name": name, "session": session, "workspace": workspace, "content": content, "hash": digest,
+            "diff": diff_configs(yaml.load(old_content, Loader=YamlLoader) or {}, yaml.load(content, Loader=YamlLoader) or {})}
+
+
+async def apply_updates(updates: list[dict], backend: dict, limit: int = DEFAULT_LIMIT) -> list[dict]:
+    """Führt die Update-Skripte aller VMs parallel aus (höchstens `limit` gleichzeitig)."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def one(update: dict) -> dict:
+        async with semaphore:
+            started = time.monotonic()
+            error = None
+            try:
+                await backend["execute"](update["name"], update["session"], update_script(update["diff"]))
+            except CommandError as e:
+                error = str(e)
+            return {"name": update["name"], "error": error, "seconds": round(time.monotonic() - started, 1)}
+
+    return await asyncio.gather(*(one(update) for update in updates))
+
+
+def reprovision(backend: dict, templates_dir: pathlib.Path, match: str | None = None, limit: int = DEFAULT_LIMIT,
+                dry_run: bool = False, optimize_packages: bool = False, deferred: bool = False) -> list[dict]:
+    """Ein Abgleich über alle passenden Sessions; gibt die Ergebnisse der angewendeten VMs zurück."""
+    sessions = {name: s for name, s in backend["sessions"]().items() if not match or fnmatch.fnmatch(name, match)}
+    if not sessions:
+        print("Keine passenden Sessions.")
+        return []
+    with phase("build"):
+        updates = [u for name, session in sorted(sessions.items())
+                   if (u := prepare_vm(name, session, backend, templates_dir, optimize_packages, deferred, dry_run))]
+    if not updates:
+        success("Alle VMs entsprechen den Templates.")
+        return []
+    for update in updates:
+        print(f"  {update['name']}: {format_diff(update['diff'])}")
+    if dry_run:
+        return []
+
+    running = backend["running"]({u["name"]: u["session"] for u in updates})
+    for update in updates:
+        if update["name"] not in running:
+            print(f"⚠ {update['name']} läuft nicht – wird beim nächsten Lauf abgeglichen.")
+    todo = [u for u in updates if u["name"] in running and has_changes(u["diff"])]
+    if not todo:
+        return []
+
+    progress(f"Wende Änderungen auf {len(todo)} VM(s) an, höchstens {limit} gleichzeitig…")
+    started = time.monotonic()
+    with phase("apply"):
+        results = asyncio.run(apply_updates(todo, backend, limit))
+    # Sessions nacheinander schreiben – die Datei wird komplett neu geschrieben
+    for update, result in zip(todo, results, strict=True):
+        if result["error"]:
+            print(f"❌ {result['name']}: {result['error']}")
+            continue
+        record_applied(update["workspace"], update["content"])
+        backend["update_session"](update["name"], applied_hash=update["hash"])
+        success(f"{result['name']} abgeglichen ({result['seconds']:.1f} s).")
+    failed = sum(1 for r in results if r["error"])
+    print(f"{len(results) - failed} VM(s) in {time.monotonic() - started:.1f} s abgeglichen"
+          + (f", {failed} Fehler" if failed else ""))
+    if failed:
+        fail("Nicht alle VMs wurden abgeglichen – erneut ausführen, um den Rest nachzuholen.")
+    return results
+
+
+def _mtimes(files: dict[str, pathlib.Path]) -> dict[str, int | None]:
+    return {key: path.stat().st_mtime_ns if path.exists() else None for key, path in files.items()}
+
+
+def watch(run, templates_dir: pathlib.Path, interval: float = WATCH_INTERVAL):
+    """Ruft `run()` sofort und nach jeder Änderung der Template-Dateien auf (Strg+C beendet)."""
+    files = template_files(templates_dir)
+    last = _mtimes(files)
+    while True:
+        try:
+            run()
+        except SystemExit:
+            pass  # Fehler sind ausgegeben; weiter beobachten
+        progress(f"Beobachte {templates_dir} (Strg+C beendet)…")
+        try:
+            while True:
+                time.sleep(interval)
+                current = _mtimes(files)
+                if current == last:
+                    continue
+                # Editoren schreiben oft in mehreren Schritten – warten, bis sich nichts mehr ändert
+                while current != last:
+                    last = current
+                    time.sleep(interval)
+                    current = _mtimes(files)
+                break
+        except KeyboardInterrupt:
+            print()
+            return
+
+
+# =============================================================================
+# libvirt
+# =============================================================================
+
+_SSH_OPTS = ["-o", "StrictHostKeyChecking=accept-new", "-o", "BatchMode=yes", "-o", "ConnectTimeout=5"]
+
+
+def _running(sessions: dict[str, dict]) -> set[str]:
+    states = virt.domain_state_map() or {}
+    return {name for name in sessions if states.get(name) == "running"}
+
+
+def _address(name: str) -> str | None:
+    addresses = virt.agent_ipv4_addresses(name)
+    if addresses:
+        return addresses[0]
+    macs = set(virt.domain_macs(name))
+    for lease in virt.dhcp_leases("default"):
+        if lease["mac"].lower() in macs or lease["hostname"] == name:
+            return lease["ip"]
+    return None
+
+
+def _identity(session: dict) -> list[str]:
+    # Privater Schlüssel neben dem öffentlichen der Session, sonst ssh-agent/Standard-Key
+    private = pathlib.Path(session["ssh_key"]).with_suffix("")
+    return ["-i", str(private)] if session["ssh_key"].endswith(".pub") and private.exists() else []
+
+
+async def _execute(name: str, session: dict, script: str):
+    ip = await asyncio.to_thread(_address, name)
+    if ip is None:
+        raise CommandError(["ssh", name], 255, "", "IP-Adresse nicht ermittelbar")
+    await run_async(["ssh", *_SSH_OPTS, *_identity(session), f"{session['username']}@{ip}", "sudo sh -s"],
+                    input=script, timeout=SCRIPT_TIMEOUT)
+
+
+BACKEND = {
+    "workspace": "kvm",
+    "build": "libvirt",
+    "sessions": all_sessions,
+    "update_session": update_session,
+    "running": _running,
+    "execute": _execute,
+}
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def add_reprovision_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--templates", type=pathlib.Path, default=pathlib.Path("templates"),
+                        help="Template-Verzeichnis (Standard: templates)")
+    parser.add_argument("--match", help="Nur Sessions, deren Name auf das Muster passt (z.B. 'lab-*')")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT,
+                        help=f"Höchstens N VMs gleichzeitig (Standard: {DEFAULT_LIMIT})")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true", help="Nur Unterschiede anzeigen")
+    parser.add_argument("--optimize-packages", dest="optimize_packages", action="store_true",
+                        help="Wie beim Anlegen der VMs: apt-Aufrufe zusammengefasst")
+    parser.add_argument("--deferred", action="store_true", help="Wie beim Anlegen der VMs: verzögerte Stufe")
+    parser.add_argument("--watch", action="store_true", help="Bei jeder Template-Änderung erneut abgleichen")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL,
+                        help=f"Prüfintervall für --watch in Sekunden (Standard: {WATCH_INTERVAL:g})")
+
+
+def run_reprovision(args, backend: dict):
+    def run():
+        reprovision(backend, args.templates, args.match, args.limit, args.dry_run,
+                    args.optimize_packages, args.deferred)
+
+    if args.watch:
+        watch(run, args.templates, args.interval)
+    else:
+        run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template-Änderungen in laufende VMs übernehmen (libvirt)")
+    add_reprovision_arguments(parser)
+    args = parser.parse_args()
+    with record_run("kvm", host=socket.gethostname()):
+        run_reprovision(args, BACKEND)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""NoCloud-net: cloud-init-Daten per HTTP statt Seed-ISO bzw. Snippets.
+
+Bisher bekommt jede lokale Ubuntu-VM eine eigene Seed-ISO (genisoimage),
+Debian-VMs gehen über virt-install `--cloud-init`, und auf Proxmox werden
+pro VM drei Snippets hochgeladen. Ist `DEBIAN_CLOUD_INIT_SEED_URL` gesetzt,
+entfällt das: die VM bekommt nur die SMBIOS-Seriennummer
+`ds=nocloud;s=<url>/<backend>/<vm>/<token>/`, und cloud-init holt user-data,
+meta-data und network-config beim Booten von diesem Server. Er liefert die
+Dateien direkt aus den Workspaces (`.workspaces/<backend>/<vm>/`) – ein
+Prozess reicht für beliebig viele VMs, und eine geänderte user-data muss
+nirgends neu kopiert werden.
+
+    GET /<backend>/<vm>/<token>/<datei>   VM aus dem Pfad (SMBIOS-Seriennummer)
+    GET /<datei>                          VM über die MAC des Clients (ARP-Tabelle
+                                          bzw. libvirt-DHCP-Leases), z.B. für Images
+                                          mit fest eingetragenem `seedfrom`
+    GET /metrics                          Metriken im Prometheus-Textformat
+
+    python -m debian_cloud_init.seed_server --listen 192.168.122.1:8765
+    DEBIAN_CLOUD_INIT_SEED_URL=http://192.168.122.1:8765 debian-cloud-init
+
+Die user-data enthält Passwort-Hash und SSH-Schlüssel. Damit keine VM die
+Daten einer anderen abrufen kann, steht im Pfad ein zufälliges Token pro VM
+(`seed-token` im Workspace); ohne passendes Token gibt es 404. Trotzdem nur
+auf einer Adresse lauschen, die ausschließlich die VMs erreichen.
+"""
+
+import argparse
+import hmac
+import os
+import pathlib
+import re
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from . import virt
+from .metrics import inc, render
+from .ui import fail, success
+from .workspace import (
+    META_DATA,
+    NETWORK_CONFIG,
+    SEED_TOKEN,
+    USER_DATA,
+    WORKSPACES_DIR,
+    ensure_workspace,
+    workspace_dir,
+    write_atomic,
+)
+
+SEED_URL_ENV = "DEBIAN_CLOUD_INIT_SEED_URL"
+DEFAULT_PORT = 8765
+ARP_TABLE = pathlib.Path("/proc/net/arp")
+
+# NoCloud-Dateiname → Datei im Workspace; vendor-data gibt es nicht, wird aber abgefragt
+FILES = {"user-data": USER_DATA, "meta-data": META_DATA, "network-config": NETWORK_CONFIG, "vendor-data": None}
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,62}$")
+_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,}$")
+
+
+# =============================================================================
+# Seed-URL für neue VMs
+# =============================================================================
+
+def seed_url() -> str | None:
+    url = os.environ.get(SEED_URL_ENV, "").strip()
+    return url.rstrip("/") or None
+
+
+def seed_token(workspace: pathlib.Path) -> str:
+    """Token der VM aus dem Workspace; wird beim ersten Aufruf erzeugt."""
+    path = workspace / SEED_TOKEN
+    if path.is_file():
+        return path.read_text().strip()
+    token = secrets.token_urlsafe(24)
+    write_atomic(ensure_workspace(workspace) / SEED_TOKEN, token + "\n")
+    return token
+
+
+def smbios_serial(vmname: str, backend: str = "kvm", workspace: pathlib.Path | None = None) -> str | None:
+    """SMBIOS-Seriennummer für den NoCloud-Datasource; None ohne `DEBIAN_CLOUD_INIT_SEED_URL`."""
+    url = seed_url()
+    if not url:
+        return None
+    token = seed_token(workspace or workspace_dir(vmname, backend))
+    return f"ds=nocloud;s={url}/{backend}/{vmname}/{token}/"
+
+
+def token_matches(workspace: pathlib.Path, token: str) -> bool:
+    try:
+        expected = (workspace / SEED_TOKEN).read_text().strip()
+    except OSError:
+        return False
+    return bool(expected) and hmac.compare_digest(expected, token)
+
+
+def listen_address(url: str) -> tuple[str, int]:
+    parts = urlsplit(url)
+    return parts.hostname or "", parts.port or DEFAULT_PORT
+
+
+def parse_listen(value: str) -> tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    if not host:
+        return value, DEFAULT_PORT
+    return host.strip("[]"), int(port)
+
+
+# =============================================================================
+# VM zur Anfrage finden
+# =============================================================================
+
+def parse_arp(text: str) -> dict[str, str]:
+    """`/proc/net/arp` → {IP: MAC}; unvollständige Einträge (00:00:…) fehlen."""
+    table = {}
+    for line in text.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 4 and parts[3] != "00:00:00:00:00:00":
+            table[parts[0]] = parts[3].lower()
+    return table
+
+
+def client_mac(ip: str) -> str | None:
+    try:
+        mac = parse_arp(ARP_TABLE.read_text()).get(ip)
+    except OSError:
+        mac = None
+    if mac:
+        return mac
+    for lease in virt.dhcp_leases("default"):
+        if lease["ip"] == ip:
+            return lease["mac"].lower()
+    return None
+
+
+class MacIndex:
+    """MAC → libvirt-Domain; wird nur neu aufgebaut, wenn eine MAC unbekannt ist."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.macs: dict[str, str] = {}
+
+    def lookup(self, mac: str) -> str | None:
+        with self.lock:
+            if mac not in self.macs:
+                self.macs = {m.lower(): name for name in sorted(virt.list_domains() or [])
+                             for m in virt.domain_macs(name)}
+            return self.macs.get(mac)
+
+
+def seed_file(workspace: pathlib.Path, vmname: str, kind: str) -> str | None:
+    """Inhalt der NoCloud-Datei `kind`; None, wenn es sie für die VM nicht gibt."""
+    if kind == "vendor-data":
+        return ""
+    path = workspace / FILES[kind]
+    if path.is_file():
+        return path.read_text()
+    if kind == "meta-data" and (workspace / USER_DATA).is_file():
+        # Ältere Proxmox-Workspaces ohne meta-data; feste instance-id, sonst liefe cloud-init bei jedem Boot
+        return f"instance-id: {vmname}\nlocal-hostname: {vmname}\n"
+    return None
+
+
+# =============================================================================
+# HTTP
+# =============================================================================
+
+class SeedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], workspaces: pathlib.Path = WORKSPACES_DIR):
+        super().__init__(address, _Handler)
+        self.workspaces = workspaces
+        self.mac_index = MacIndex()
+
+    def resolve(self, parts: list[str], client_ip: str) -> tuple[str, str | None]:
+        """(NoCloud-Datei, Inhalt) zum Pfad; Inhalt None → 404."""
+        match parts:
+            case [backend, vmname, token, kind] if (kind in FILES and _NAME_RE.match(backend)
+                                                    and _NAME_RE.match(vmname) and _TOKEN_RE.match(token)):
+                if not token_matches(self.workspaces / backend / vmname, token):
+                    return kind, None
+            case [kind] if kind in FILES:
+                mac = client_mac(client_ip)
+                vmname = self.mac_index.lookup(mac) if mac else None
+                if vmname is None:
+                    return kind, None
+                backend = "kvm"
+            case _:
+                return "other", None
+        return kind, seed_file(self.workspaces / backend / vmname, vmname, kind)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: SeedServer  # pyright: ignore[reportIncompatibleVariableOverride]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = [part for part in urlsplit(self.path).path.split("/") if part]
+        if parts == ["metrics"]:
+            self._send(200, render(), "text/plain; version=0.0.4; charset=utf-8")
+            return
+        kind, content = self.server.resolve(parts, self.client_address[0])
+        inc("seed_requests_total", file=kind, result="miss" if content is None else "ok")
+        if content is None:
+            self._send(404, "nicht gefunden\n")
+        else:
+            self._send(200, content)
+
+    def _send(self, status: int, text: str, content_type: str = "text/plain; charset=utf-8"):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start(address: tuple[str, int], workspaces: pathlib.Path = WORKSPACES_DIR) -> SeedServer:
+    """Startet den Server in einem Hintergrund-Thread (z.B. im Daemon)."""
+    server = SeedServer(address, workspaces)
+    threading.Thread(target=server.serve_forever, daemon=True, name="seed-server").start()
+    return server
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="NoCloud-net Seed-Server für alle VMs aus den Workspaces")
+    parser.add_argument("--listen", type=parse_listen,
+                        help=f"HOST[:PORT] (Standard: Host und Port aus ${SEED_URL_ENV}, Port {DEFAULT_PORT})")
+    parser.add_argument("--workspaces", type=pathlib.Path, default=WORKSPACES_DIR,
+                        help=f"Workspace-Verzeichnis (Standard: {WORKSPACES_DIR})")
+    args = parser.parse_args()
+
+    url = seed_url()
+    address = args.listen or (listen_address(url) if url else None)
+    if address is None:
+        fail(f"--listen oder {SEED_URL_ENV} angeben.")
+    server = SeedServer(address, args.workspaces)
+    success(f"Seed-Server lauscht auf {address[0]}:{address[1]} ({args.workspaces}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
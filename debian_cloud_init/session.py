@@ -3,7 +3,10 @@ import json
 import pathlib
 import subprocess
 
+from .facts import local_facts
+from .profiles import DEFAULT_PROFILE, PROFILES, describe_profiles
 from .ui import ask_yes_no, fail, progress
+from .workspace import workspace_dir, write_atomic
 
 SESSION_FILE = pathlib.Path(".session")
 
@@ -18,7 +21,7 @@ def load_session() -> dict | None:
 
 
 def save_session(data: dict):
-    SESSION_FILE.write_text(json.dumps(data, indent=4))
+    write_atomic(SESSION_FILE, json.dumps(data, indent=4))
 
 
 def _load_all() -> dict:
@@ -30,14 +33,14 @@ def _load_all() -> dict:
         if data and "vmname" in data:
             name = data["vmname"]
             data = {name: data}
-            SESSION_FILE.write_text(json.dumps(data, indent=4))
+            write_atomic(SESSION_FILE, json.dumps(data, indent=4))
         return data
     except (json.JSONDecodeError, KeyError):
         return {}
 
 
 def _save_all(sessions: dict):
-    SESSION_FILE.write_text(json.dumps(sessions, indent=4))
+    write_atomic(SESSION_FILE, json.dumps(sessions, indent=4))
 
 
 def _select_session(sessions: dict) -> tuple[dict, bool]:
@@ -47,7 +50,7 @@ def _select_session(sessions: dict) -> tuple[dict, bool]:
     for i, name in enumerate(names):
         s = sessions[name]
         net = s.get("bridge_interface") or s.get("net_type", "default")
-        print(f"  [{i}] {name}  ({s['distro']}, {s['arch']}, {net})")
+        print(f"  [{i}] {name}  ({s['distro']}, {s['arch']}, {net}, {s.get('profile', DEFAULT_PROFILE)})")
     print("  [n] Neue VM erstellen")
 
     choice = input("Auswahl [0]: ").strip().lower()
@@ -124,14 +127,7 @@ def _create_session(sessions: dict) -> tuple[dict, bool]:
     bridge_interface = None
 
     if ask_yes_no("Soll das Netzwerk auf 'Bridge' gesetzt werden? (Nein = Default NAT)", default=False):
-        result = subprocess.run(["ip", "-o", "link", "show"], capture_output=True, text=True, check=False)
-        interfaces = []
-        for line in result.stdout.splitlines():
-            parts = line.split(": ")
-            if len(parts) >= 2:
-                iface = parts[1].split("@")[0]
-                if iface not in ("lo",) and not iface.startswith(("virbr", "docker", "br-", "veth")):
-                    interfaces.append(iface)
+        interfaces = local_facts(["interfaces"])["interfaces"]
 
         if not interfaces:
             print("⚠ Keine physischen Netzwerk-Interfaces gefunden. Verwende NAT.")
@@ -147,6 +143,15 @@ def _create_session(sessions: dict) -> tuple[dict, bool]:
             except (ValueError, IndexError):
                 print("⚠ Ungültige Auswahl. Verwende NAT.")
 
+    profile = DEFAULT_PROFILE
+    if ask_yes_no(f"Performance-Profil wählen? (Nein = {DEFAULT_PROFILE})", default=False):
+        print(describe_profiles())
+        sel = input(f"Profil [{DEFAULT_PROFILE}]: ").strip() or DEFAULT_PROFILE
+        if sel in PROFILES:
+            profile = sel
+        else:
+            print(f"⚠ Unbekanntes Profil. Verwende {DEFAULT_PROFILE}.")
+
     session_data = {
         "vmname": vmname,
         "hostname": hostname,
@@ -157,6 +162,8 @@ def _create_session(sessions: dict) -> tuple[dict, bool]:
         "hashed_password": hashed_password,
         "net_type": net_type,
         "bridge_interface": bridge_interface,
+        "profile": profile,
+        "workspace": str(workspace_dir(vmname)),
     }
 
     sessions[vmname] = session_data
@@ -173,8 +180,19 @@ def get_or_create_session() -> tuple[dict, bool]:
     return _select_session(sessions)
 
 
+def all_sessions() -> dict:
+    return _load_all()
+
+
 def delete_session(vmname: str):
     sessions = _load_all()
     if vmname in sessions:
         del sessions[vmname]
         _save_all(sessions)
+
+
+def update_session(vmname: str, **fields):
+    sessions = _load_all()
+    if vmname in sessions:
+        sessions[vmname].update(fields)
+        _save_all(sessions)
@@ -0,0 +1,178 @@
+"""Aufteilung der Provisionierung in eine kritische und eine verzögerte Stufe.
+
+Kritisch (innerhalb von cloud-init): User, SSH, Netzwerk und qemu-guest-agent.
+Sobald diese Stufe fertig ist, meldet cloud-init `done` und die VM ist per SSH
+nutzbar. Alles andere (Docker-Repository, Pakete, Tools, System-Konfiguration)
+läuft danach als systemd-Unit `debian-cloud-init-deferred.service` mit eigener
+Statusdatei. Die Zeitpunkte werden als Sekunden seit dem Boot (/proc/uptime)
+festgehalten, damit die Uhr des Hosts keine Rolle spielt.
+"""
+
+import time
+
+from .cloud_init import LiteralString
+from .metrics import count_timeout
+from .ui import progress, success
+
+LIB_DIR = "/usr/local/lib/debian-cloud-init"
+STATE_DIR = "/var/lib/debian-cloud-init"
+STATUS_FILE = f"{STATE_DIR}/provision.status"
+UNIT_NAME = "debian-cloud-init-deferred.service"
+
+# cloud-final.service läuft nach multi-user.target – WantedBy=multi-user.target
+# ergäbe zusammen mit After=cloud-final.service einen Ordering-Zyklus.
+_UNIT = f"""\
+[Unit]
+Description=debian-cloud-init: verzoegerte Provisionierung
+After=cloud-final.service network-online.target
+Wants=network-online.target
+ConditionPathExists=!{STATE_DIR}/deferred.done
+
+[Service]
+Type=oneshot
+ExecStart={LIB_DIR}/deferred.sh
+TimeoutStartSec=0
+
+[Install]
+WantedBy=cloud-init.target
+"""
+
+# Nur ASCII – sonst schreibt PyYAML den Block nicht als Literal (|).
+_RUNNER = f"""\
+#!/bin/sh
+# Verzoegerte Provisionierung - Fortschritt in {STATUS_FILE},
+# Ausgabe via: journalctl -u {UNIT_NAME}
+STATUS={STATUS_FILE}
+READY=$(sed -n 's/^ready=//p' "$STATUS" 2>/dev/null)
+STARTED=$(cut -d' ' -f1 /proc/uptime)
+FAILED=""
+
+write_status() {{
+  printf 'state=%s\\nstep=%s\\nready=%s\\nstarted=%s\\nfinished=%s\\nfailed=%s\\n' \\
+    "$1" "$2" "$READY" "$STARTED" "${{3:-}}" "$FAILED" > "$STATUS.tmp"
+  mv -f "$STATUS.tmp" "$STATUS"
+}}
+
+total=$(ls {LIB_DIR}/steps/*.sh | wc -l)
+n=0
+for step in {LIB_DIR}/steps/*.sh; do
+  n=$((n + 1))
+  name=$(basename "$step" .sh)
+  write_status running "$n/$total ${{name#*-}}"
+  echo "=== Schritt $n/$total: ${{name#*-}} ==="
+  sh -e "$step" || FAILED="$FAILED ${{name#*-}}"
+done
+
+FINISHED=$(cut -d' ' -f1 /proc/uptime)
+if [ -n "$FAILED" ]; then
+  write_status failed "$total/$total" "$FINISHED"
+  exit 1
+fi
+write_status done "$total/$total" "$FINISHED"
+touch {STATE_DIR}/deferred.done
+"""
+
+CRITICAL_RUNCMD = [
+    "systemctl enable --now qemu-guest-agent",
+    f"mkdir -p {STATE_DIR}",
+    f"printf 'state=pending\\nready=%s\\n' \"$(cut -d' ' -f1 /proc/uptime)\" > {STATUS_FILE}",
+    "systemctl daemon-reload",
+    f"systemctl enable {UNIT_NAME}",
+    # --no-block: die Unit wartet per After= auf das Ende von cloud-final
+    f"systemctl start --no-block {UNIT_NAME}",
+]
+
+
+# =============================================================================
+# cloud-config umbauen
+# =============================================================================
+
+def deferred_write_files(steps: list[tuple[str, str]]) -> list[dict]:
+    """write_files-Einträge für Runner, Unit und die einzelnen Schritte.
+
+    `steps` ist eine Liste aus (Name, Shell-Skript); die Reihenfolge bleibt über
+    das Nummern-Präfix der Dateinamen erhalten.
+    """
+    files = [
+        {"path": f"/etc/systemd/system/{UNIT_NAME}", "permissions": "0644", "content": LiteralString(_UNIT)},
+        {"path": f"{LIB_DIR}/deferred.sh", "permissions": "0755", "content": LiteralString(_RUNNER)},
+    ]
+    for index, (name, script) in enumerate(steps, start=1):
+        content = script if script.endswith("\n") else script + "\n"
+        files.append({
+            "path": f"{LIB_DIR}/steps/{index:02d}-{name}.sh",
+            "permissions": "0755",
+            "content": LiteralString(content),
+        })
+    return files
+
+
+def apply_deferred_stage(cloud_config: dict, steps: list[tuple[str, str]]):
+    """Verschiebt `steps` in die verzögerte Stufe; runcmd enthält nur noch den kritischen Teil."""
+    packages = list(cloud_config.get("packages") or [])
+    if "qemu-guest-agent" not in packages:
+        packages.append("qemu-guest-agent")
+    cloud_config["packages"] = packages
+    cloud_config["package_update"] = True
+    cloud_config["write_files"] = list(cloud_config.get("write_files") or []) + deferred_write_files(steps)
+    cloud_config["runcmd"] = list(CRITICAL_RUNCMD)
+
+
+# =============================================================================
+# Status auswerten
+# =============================================================================
+
+def parse_status(text: str) -> dict:
+    status = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            status[key.strip()] = value.strip()
+    for key in ("ready", "started", "finished"):
+        try:
+            status[key] = float(status[key]) if status.get(key) else None
+        except ValueError:
+            status[key] = None
+    status["failed"] = status.get("failed", "").split()
+    return status
+
+
+def format_status(status: dict) -> str:
+    parts = []
+    if status.get("ready") is not None:
+        parts.append(f"bereit nach {status['ready']:.0f} s")
+    state = status.get("state", "pending")
+    if state == "done" and status.get("finished") is not None:
+        parts.append(f"vollständig provisioniert nach {status['finished']:.0f} s")
+    elif state == "failed":
+        parts.append(f"verzögerte Stufe fehlgeschlagen ({', '.join(status['failed'])})")
+    elif state == "running":
+        parts.append(f"verzögerte Stufe läuft (Schritt {status.get('step', '?')})")
+    else:
+        parts.append("verzögerte Stufe wartet auf Start")
+    return ", ".join(parts) + " (seit Boot)"
+
+
+def wait_for_provisioning(read_status, timeout: int = 1800, interval: int = 10) -> dict | None:
+    """Pollt `read_status()` bis die verzögerte Stufe beendet ist.
+
+    Meldet den Zeitpunkt "bereit" einmal, sobald er bekannt ist. Gibt den
+    letzten Status zurück oder None, wenn nie einer gelesen werden konnte.
+    """
+    progress("Warte auf Provisionierung…")
+    status = None
+    ready_reported = False
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = read_status() or status
+        if status:
+            if status.get("ready") is not None and not ready_reported:
+                success(f"VM bereit nach {status['ready']:.0f} s (seit Boot).")
+                ready_reported = True
+            if status.get("state") in ("done", "failed"):
+                return status
+            print(f"  {format_status(status)}", end="\r", flush=True)
+        time.sleep(interval)
+    print()
+    count_timeout("provisioning")
+    return status
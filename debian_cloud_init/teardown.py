@@ -0,0 +1,232 @@
+"""Paralleles Löschen vieler VMs und Tombstones für den Neuaufbau.
+
+`delete_vm` blockiert, bis Domain, NVRAM und Speicher weg sind – für ein Lab
+mit 20 VMs läuft das streng nacheinander. Hier gibt es:
+
+- `teardown_all(targets, destroy, limit)` – löscht alle Ziele nebenläufig,
+  höchstens `limit` gleichzeitig pro Host, und misst freigegebenen Platz und
+  Dauer pro VM (backend-unabhängig, nutzt auch `proxmox_cloud_init.teardown`)
+- `tombstone_vm(vmname)` – für "löschen und neu erstellen": Domain stoppen
+  und entfernen, Overlay/Seed/Golden nach `ISOS_PATH/.trash` verschieben und
+  dort im Hintergrund löschen; der Neuaufbau startet sofort
+
+    python -m debian_cloud_init.teardown --match 'lab-*'
+    python -m debian_cloud_init.teardown --fleet --limit 8 --yes
+    python -m debian_cloud_init.teardown --reap
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import pathlib
+import time
+from collections.abc import Awaitable, Callable
+
+from . import ui, virt
+from .engine import CommandError, run_async
+from .numa import release_pinning
+from .rebuild import golden_paths
+from .session import all_sessions, delete_session
+from .ui import ask_yes_no, progress, run_cmd, success
+from .vm import ISOS_PATH
+from .workspace import remove_workspace
+
+DEFAULT_LIMIT = 4
+
+Destroy = Callable[[dict], Awaitable[int]]
+
+
+def trash_dir() -> pathlib.Path:
+    return ISOS_PATH / ".trash"
+
+
+def format_bytes(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+
+def allocated_bytes(paths: list[pathlib.Path]) -> int:
+    """Tatsächlich belegter Platz (sparse Images zählen nur ihre Blöcke)."""
+    total = 0
+    for path in paths:
+        try:
+            total += path.stat().st_blocks * 512
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def remove_files(paths: list[pathlib.Path]) -> int:
+    freed = allocated_bytes(paths)
+    for path in paths:
+        path.unlink(missing_ok=True)
+    return freed
+
+
+# =============================================================================
+# Engine (backend-unabhängig)
+# =============================================================================
+#
+# Ein Ziel ist ein dict mit mindestens "name" und "host" (für das Limit pro
+# Host); `destroy(target)` löscht die VM und gibt die freigegebenen Bytes
+# zurück, Fehler als CommandError/OSError.
+
+async def teardown_all(targets: list[dict], destroy: Destroy, limit: int = DEFAULT_LIMIT) -> list[dict]:
+    semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def one(target: dict) -> dict:
+        semaphore = semaphores.setdefault(target["host"], asyncio.Semaphore(limit))
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                freed, error = await destroy(target), None
+            except (CommandError, OSError) as e:
+                freed, error = 0, str(e)
+            return {"name": target["name"], "host": target["host"], "freed": freed,
+                    "seconds": round(time.monotonic() - started, 1), "error": error}
+
+    return await asyncio.gather(*(one(target) for target in targets))
+
+
+def format_report(results: list[dict], seconds: float) -> str:
+    width = max([len(r["name"]) for r in results] + [4])
+    lines = []
+    for r in results:
+        if r["error"]:
+            lines.append(f"  {r['name']:<{width}}  FEHLER: {r['error']}")
+        else:
+            lines.append(f"  {r['name']:<{width}}  {format_bytes(r['freed']):>10}  {r['seconds']:>6.1f} s")
+    deleted = [r for r in results if not r["error"]]
+    summary = (f"{len(deleted)} VM(s) in {seconds:.1f} s gelöscht, "
+               f"{format_bytes(sum(r['freed'] for r in deleted))} freigegeben")
+    if len(deleted) != len(results):
+        summary += f", {len(results) - len(deleted)} Fehler"
+    return "\n".join([*lines, summary])
+
+
+def run_teardown(targets: list[dict], destroy: Destroy, forget: Callable[[dict], None],
+                 limit: int = DEFAULT_LIMIT, assume_yes: bool = False) -> list[dict]:
+    """Bestätigung, paralleles Löschen, Sessions der gelöschten VMs entfernen, Bericht."""
+    if not targets:
+        print("Keine passenden VMs gefunden.")
+        return []
+    print("Zu löschende VMs:")
+    for target in targets:
+        print(f"  - {target['name']} ({target['host']})")
+    if not assume_yes and not ask_yes_no(f"{len(targets)} VM(s) löschen?", default=False):
+        print("Abgebrochen.")
+        return []
+
+    progress(f"Lösche {len(targets)} VM(s), höchstens {limit} gleichzeitig pro Host…")
+    started = time.monotonic()
+    results = asyncio.run(teardown_all(targets, destroy, limit))
+    for target, result in zip(targets, results, strict=True):
+        if not result["error"]:
+            forget(target)
+    print(format_report(results, time.monotonic() - started))
+    return results
+
+
+# =============================================================================
+# libvirt
+# =============================================================================
+
+def vm_files(vmname: str) -> list[pathlib.Path]:
+    """Disks der Domain plus Overlay, Seed-ISO und Golden-Dateien unter ISOS_PATH."""
+    paths = [pathlib.Path(p) for p in virt.domain_disks(vmname)]
+    paths += [ISOS_PATH / f"{vmname}.qcow2", ISOS_PATH / f"{vmname}-seed.iso", *golden_paths(vmname)]
+    return [path for path in dict.fromkeys(paths) if path.exists()]
+
+
+async def destroy_domain(target: dict) -> int:
+    name = target["name"]
+    files = await asyncio.to_thread(vm_files, name)
+    await run_async(["virsh", "destroy", name], check=False, timeout=60)
+    await run_async(["virsh", "undefine", name, "--nvram"], timeout=60)
+    await asyncio.to_thread(release_pinning, name)
+    await asyncio.to_thread(remove_workspace, name)
+    return await asyncio.to_thread(remove_files, files)
+
+
+def _select(match: str | None, fleet: bool) -> list[dict]:
+    domains = virt.list_domains() or set()
+    names = set()
+    if fleet:
+        names |= set(all_sessions()) & domains
+    if match:
+        names |= set(fnmatch.filter(domains, match))
+    return [{"name": name, "host": "local"} for name in sorted(names)]
+
+
+def tombstone_vm(vmname: str):
+    """Räumt den VM-Namen sofort frei; der Speicher wird im Hintergrund gelöscht."""
+    if not virt.domain_exists(vmname):
+        print("✔ Keine bestehende VM gefunden.")
+        return
+
+    progress(f"Stoppe und entferne VM '{vmname}'…")
+    virt.destroy(vmname)
+    files = vm_files(vmname)
+
+    trash = trash_dir()
+    trash.mkdir(exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    doomed = []
+    for path in files:
+        if path.parent == ISOS_PATH:
+            path.rename(trash / f"{stamp}-{path.name}")
+        else:
+            doomed.append(path)
+
+    if not virt.undefine(vmname, remove_storage=False):
+        run_cmd(f"virsh undefine {vmname} --nvram")
+    release_pinning(vmname)
+    remove_files(doomed)
+
+    ui.spawn_module(__name__, ["--reap"], ISOS_PATH / ".teardown.log")
+    success(f"VM '{vmname}' entfernt – Speicher wird im Hintergrund gelöscht ({trash}).")
+
+
+def reap_trash() -> int:
+    """Löscht alles im Tombstone-Verzeichnis; gibt die freigegebenen Bytes zurück."""
+    trash = trash_dir()
+    if not trash.is_dir():
+        return 0
+    return remove_files([path for path in trash.iterdir() if path.is_file()])
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def add_teardown_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--match", help="VMs, deren Name auf das Muster passt (z.B. 'lab-*')")
+    parser.add_argument("--fleet", action="store_true", help="Alle VMs mit gespeicherter Session")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT,
+                        help=f"Höchstens N Löschvorgänge gleichzeitig pro Host (Standard: {DEFAULT_LIMIT})")
+    parser.add_argument("--yes", action="store_true", help="Ohne Rückfrage löschen")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Viele VMs parallel löschen (libvirt)")
+    add_teardown_arguments(parser)
+    parser.add_argument("--reap", action="store_true", help="Tombstones aus ISOS_PATH/.trash löschen")
+    args = parser.parse_args()
+
+    if args.reap:
+        started = time.monotonic()
+        freed = reap_trash()
+        success(f"Tombstones gelöscht: {format_bytes(freed)} in {time.monotonic() - started:.1f} s.")
+        return
+    if not args.match and not args.fleet:
+        parser.error("--match oder --fleet angeben")
+    run_teardown(_select(args.match, args.fleet), destroy_domain, lambda t: delete_session(t["name"]),
+                 args.limit, args.yes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Erzeugt das Tools-Installationsskript aus `templates/tools.yml`.
+
+Das Skript wird für die Architektur der VM gerendert, lädt alle Tools
+parallel herunter, prüft jede Datei per SHA-256 und installiert sie atomar
+(`install` in eine temporäre Datei + `mv`) nach /usr/local/bin. Die Dauer
+entspricht damit etwa dem langsamsten Einzel-Download.
+"""
+
+import pathlib
+import re
+
+import yaml
+
+from .cloud_init import YamlLoader
+from .ui import fail
+
+INSTALL_DIR = "/usr/local/bin"
+
+_SAFE_VALUE = re.compile(r'^[^"`\\$\s]+$')
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9._-]+$")
+
+# Erste Zeile des Skripts – daran erkennt `reprovision` den Tools-Block in runcmd
+SCRIPT_MARKER = "# Generiert aus templates/tools.yml"
+
+# runcmd-Einträge laufen gemeinsam in einem /bin/sh-Skript – daher POSIX-sh und
+# eine Subshell, damit trap/exit keine nachfolgenden runcmd-Befehle beeinflussen.
+# Nur ASCII: sonst schreibt PyYAML den Block nicht als Literal (|), sondern gequotet.
+_SCRIPT_HEAD = SCRIPT_MARKER + """ fuer {arch} - nicht von Hand bearbeiten
+(
+WORK=$(mktemp -d)
+trap 'rm -rf "$WORK"' EXIT
+
+# fetch NAME URL CHECKSUM_URL SHA256 [EXTRACT]
+fetch() {{
+  name=$1 url=$2 sum_url=$3 sha=$4 member=${{5:-}}
+  file="$WORK/$name.download"
+  curl -fsSL --retry 3 -o "$file" "$url" || {{ echo "FEHLER $name: Download fehlgeschlagen" >&2; return 1; }}
+  if [ -z "$sha" ]; then
+    sha=$(curl -fsSL --retry 3 "$sum_url" | awk -v f="${{url##*/}}" 'NF == 1 || $2 == f || $2 == "*" f {{ print $1; exit }}')
+  fi
+  echo "$sha  $file" | sha256sum -c --quiet - || {{ echo "FEHLER $name: Pruefsumme ungueltig" >&2; return 1; }}
+  if [ -n "$member" ]; then
+    mkdir -p "$WORK/$name.d"
+    tar -xzf "$file" -C "$WORK/$name.d" "$member" || return 1
+    mv "$WORK/$name.d/$member" "$WORK/$name.bin"
+  else
+    mv "$file" "$WORK/$name.bin"
+  fi
+  echo "OK $name geladen"
+}}
+
+"""
+
+# $WORK/<name>.bin existiert nur nach erfolgreichem Download + Prüfsumme
+_SCRIPT_TAIL = """
+wait
+failed=0
+for name in {names}; do
+  if [ -f "$WORK/$name.bin" ]; then
+    install -m 555 "$WORK/$name.bin" "{install_dir}/.$name.new" && mv -f "{install_dir}/.$name.new" "{install_dir}/$name"
+  else
+    failed=1
+  fi
+done
+exit $failed
+)
+"""
+
+
+def load_manifest(path: pathlib.Path) -> list[dict]:
+    try:
+        data = yaml.load(path.read_text(), Loader=YamlLoader) or {}
+    except (OSError, yaml.YAMLError) as e:
+        fail(f"Fehler beim Laden des Tools-Manifests: {e}")
+
+    tools = data.get("tools") or []
+    for tool in tools:
+        name = tool.get("name", "")
+        if not _SAFE_NAME.match(name):
+            fail(f"Ungültiger Tool-Name im Manifest: {name!r}")
+        if "url" not in tool:
+            fail(f"Tool '{name}': 'url' fehlt.")
+        if "version" not in tool and "version_url" not in tool:
+            fail(f"Tool '{name}': 'version' oder 'version_url' fehlt.")
+        if "checksum_url" not in tool and "sha256" not in tool:
+            fail(f"Tool '{name}': 'checksum_url' oder 'sha256' fehlt.")
+    return tools
+
+
+def _value(tool: dict, key: str, arch: str) -> str:
+    template = str(tool.get(key) or "")
+    arch_name = (tool.get("arch") or {}).get(arch, arch)
+    # Version wird erst im Gast aufgelöst (version_url) – daher als Shell-Variable
+    value = template.replace("{arch}", arch_name).replace("{version}", "${version}")
+    if value and not _SAFE_VALUE.match(value.replace("${version}", "")):
+        fail(f"Tool '{tool['name']}': unzulässige Zeichen in '{key}'.")
+    return value
+
+
+def render_tools_script(tools: list[dict], arch: str) -> str:
+    parts = [_SCRIPT_HEAD.format(arch=arch)]
+    for tool in tools:
+        name = tool["name"]
+        sha = str((tool.get("sha256") or {}).get(arch, ""))
+        if "sha256" in tool and not sha:
+            fail(f"Tool '{name}': keine Prüfsumme für {arch} im Manifest.")
+        if "version_url" in tool:
+            version = f'$(curl -fsSL --retry 3 "{_value(tool, "version_url", arch)}")'
+        else:
+            version = f'"{_value(tool, "version", arch)}"'
+        parts.append(
+            f"(\n"
+            f"  version={version}\n"
+            f'  fetch {name} "{_value(tool, "url", arch)}" "{_value(tool, "checksum_url", arch)}" '
+            f'"{sha}" "{_value(tool, "extract", arch)}"\n'
+            f") &\n"
+        )
+    names = " ".join(tool["name"] for tool in tools)
+    parts.append(_SCRIPT_TAIL.format(names=names, install_dir=INSTALL_DIR))
+    return "".join(parts)
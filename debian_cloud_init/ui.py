@@ -4,6 +4,11 @@ import sys
 import time
 from typing import NoReturn
 
+from .metrics import command_label
+
+# Für Hintergrundprozesse (z.B. Pool-Auffüllung): Fragen nicht stellen, sondern den Default nehmen
+NON_INTERACTIVE = False
+
 
 def progress(msg):
     print(f"\n➡ {msg}")
@@ -34,6 +39,8 @@ def ask_int(question, default: int) -> int:
 
 
 def ask_yes_no(question, default=True):
+    if NON_INTERACTIVE:
+        return default
     suffix = "[J/n]" if default else "[j/N]"
     while True:
         ans = input(f"{question} {suffix}: ").strip().lower()
@@ -46,14 +53,33 @@ def ask_yes_no(question, default=True):
         print("Bitte mit 'j' für Ja oder 'n' für Nein antworten.")
 
 
-def run_cmd(cmd):
-    print(f"→ {cmd}")
+def clean_env() -> dict:
+    """Umgebung ohne aktives venv – Host-Tools (virt-install, qemu-img …) sollen das System-Python nutzen."""
     env = os.environ.copy()
     venv = env.get("VIRTUAL_ENV", "")
     if venv:
         venv_bin = venv + "/bin"
         env["PATH"] = ":".join(p for p in env["PATH"].split(":") if p != venv_bin)
         env.pop("VIRTUAL_ENV", None)
-    result = subprocess.run(cmd, shell=True, env=env, check=False)
+    return env
+
+
+def spawn_module(module: str, args: list[str], log_file):
+    """Startet `python -m <module> <args>` losgelöst im Hintergrund (Ausgabe ins Log)."""
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_file, "a") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", module, *args],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+            start_new_session=True, cwd=os.getcwd(),
+        )
+
+
+def run_cmd(cmd):
+    # engine importiert clean_env aus diesem Modul
+    from .engine import echo_line, run_sync
+
+    print(f"→ {cmd}")
+    result = run_sync(["sh", "-c", cmd], timeout=None, check=False, on_line=echo_line, label=command_label(cmd))
     if result.returncode != 0:
         fail("Fehler beim Ausführen des Befehls.")
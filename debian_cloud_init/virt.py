@@ -0,0 +1,318 @@
+"""libvirt-Abfragen über eine langlebige Verbindung, Fallback `virsh`.
+
+Mit installierten libvirt-python-Bindings (`pip install libvirt-python` bzw.
+`apt install python3-libvirt`) laufen Status-Abfragen, IP-Ermittlung,
+DHCP-Leases, Guest-Agent-Befehle, destroy und undefine über eine einzige
+Verbindung, die beim ersten Zugriff geöffnet wird. Das spart einen
+`virsh`-Fork (und Verbindungsaufbau) pro Abfrage – relevant in den
+Polling-Schleifen. Ohne Bindings (oder mit `DEBIAN_CLOUD_INIT_VIRSH=1`)
+wird wie bisher `virsh` aufgerufen.
+
+Die URI folgt `LIBVIRT_DEFAULT_URI`, also derselben Verbindung wie `virsh`.
+"""
+
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+from typing import Any
+
+try:
+    import libvirt  # pyright: ignore[reportMissingImports]
+    import libvirt_qemu  # pyright: ignore[reportMissingImports]
+except ImportError:  # optionale Abhängigkeit
+    # Any: ohne Bindings wird vor jedem Zugriff über connection() auf virsh ausgewichen
+    libvirt: Any = None
+    libvirt_qemu: Any = None
+
+_conn = None
+
+# virDomainState → Ausgabe von `virsh domstate`
+_STATE_NAMES = {
+    0: "no state",
+    1: "running",
+    2: "idle",
+    3: "paused",
+    4: "in shutdown",
+    5: "shut off",
+    6: "crashed",
+    7: "pmsuspended",
+}
+
+
+def connection():
+    """Gibt die gemeinsame Verbindung zurück (None ohne Bindings oder bei Verbindungsfehler)."""
+    global _conn
+    if libvirt is None or os.environ.get("DEBIAN_CLOUD_INIT_VIRSH"):
+        return None
+    if _conn is not None and _conn.isAlive():
+        return _conn
+    try:
+        # libvirt schreibt Fehler sonst zusätzlich selbst nach stderr
+        libvirt.registerErrorHandler(lambda _ctx, _err: None, None)
+        _conn = libvirt.open(os.environ.get("LIBVIRT_DEFAULT_URI"))
+    except libvirt.libvirtError:
+        _conn = None
+    return _conn
+
+
+def _domain(conn, name: str):
+    try:
+        return conn.lookupByName(name)
+    except libvirt.libvirtError:
+        return None
+
+
+def _virsh(*args: str) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(["virsh", *args], capture_output=True, text=True, check=False)
+
+
+# =============================================================================
+# Abfragen
+# =============================================================================
+
+def list_domains() -> set[str] | None:
+    """Namen aller definierten Domains (None, wenn libvirt nicht erreichbar ist)."""
+    conn = connection()
+    if conn is not None:
+        try:
+            return {dom.name() for dom in conn.listAllDomains()}
+        except libvirt.libvirtError:
+            return None
+    result = _virsh("list", "--all", "--name")
+    if result.returncode != 0:
+        return None
+    return {line.strip() for line in result.stdout.splitlines() if line.strip()}
+
+
+def domain_exists(name: str) -> bool:
+    conn = connection()
+    if conn is not None:
+        return _domain(conn, name) is not None
+    return _virsh("domstate", name).returncode == 0
+
+
+def domain_state(name: str) -> str:
+    """Zustand wie `virsh domstate` ("running", "shut off", …); leer, wenn die Domain fehlt."""
+    conn = connection()
+    if conn is not None:
+        dom = _domain(conn, name)
+        if dom is None:
+            return ""
+        return _STATE_NAMES.get(dom.state()[0], "no state")
+    result = _virsh("domstate", name)
+    return result.stdout.strip() if result.returncode == 0 else ""
+
+
+def domain_state_map() -> dict[str, str] | None:
+    """Name → Zustand aller Domains in einem Aufruf (None, wenn libvirt nicht erreichbar ist)."""
+    conn = connection()
+    if conn is not None:
+        try:
+            return {dom.name(): _STATE_NAMES.get(dom.state()[0], "no state") for dom in conn.listAllDomains()}
+        except libvirt.libvirtError:
+            return None
+    result = _virsh("list", "--all")
+    if result.returncode != 0:
+        return None
+    return parse_domain_list(result.stdout)
+
+
+def parse_domain_list(output: str) -> dict[str, str]:
+    """Ausgabe von `virsh list --all` (Id, Name, State) → Name → Zustand."""
+    states = {}
+    for line in output.splitlines()[2:]:
+        parts = line.split(None, 2)
+        if len(parts) == 3:
+            states[parts[1]] = parts[2].strip()
+    return states
+
+
+def domain_states() -> list[str] | None:
+    """Zustände aller Domains (None, wenn libvirt nicht erreichbar ist)."""
+    states = domain_state_map()
+    return None if states is None else list(states.values())
+
+
+def agent_ipv4_addresses(name: str) -> list[str]:
+    """IPv4-Adressen laut Guest-Agent (ohne Loopback)."""
+    conn = connection()
+    if conn is not None:
+        dom = _domain(conn, name)
+        if dom is None:
+            return []
+        try:
+            interfaces = dom.interfaceAddresses(libvirt.VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_AGENT)
+        except libvirt.libvirtError:
+            return []
+        return [
+            addr["addr"]
+            for iface, data in interfaces.items() if iface != "lo"
+            for addr in data.get("addrs") or []
+            if addr["type"] == libvirt.VIR_IP_ADDR_TYPE_IPV4
+        ]
+
+    result = _virsh("domifaddr", name, "--source", "agent")
+    if result.returncode != 0:
+        return []
+    addresses = []
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) >= 4 and parts[-2].lower() == "ipv4" and parts[0] != "lo":
+            addresses.append(parts[-1].split("/")[0])
+    return addresses
+
+
+def dhcp_leases(network: str = "default") -> list[dict]:
+    """DHCP-Leases des Netzwerks als `{"mac", "ip", "hostname"}`."""
+    conn = connection()
+    if conn is not None:
+        try:
+            leases = conn.networkLookupByName(network).DHCPLeases()
+        except libvirt.libvirtError:
+            return []
+        return [
+            {"mac": lease["mac"], "ip": lease["ipaddr"], "hostname": lease.get("hostname") or ""}
+            for lease in leases if lease["type"] == libvirt.VIR_IP_ADDR_TYPE_IPV4
+        ]
+
+    result = _virsh("net-dhcp-leases", network)
+    if result.returncode != 0:
+        return []
+    leases = []
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # Expiry time | MAC | Protocol | IP/Prefix | Hostname | Client ID
+        if len(parts) >= 6 and parts[3] == "ipv4":
+            leases.append({"mac": parts[2], "ip": parts[4].split("/")[0],
+                           "hostname": parts[5] if parts[5] != "-" else ""})
+    return leases
+
+
+def _domain_xml(name: str) -> str:
+    conn = connection()
+    if conn is not None:
+        dom = _domain(conn, name)
+        return dom.XMLDesc(0) if dom is not None else ""
+    result = _virsh("dumpxml", name)
+    return result.stdout if result.returncode == 0 else ""
+
+
+def _disk_sources(xml: str) -> list[str]:
+    return [
+        path
+        for source in ET.fromstring(xml).iterfind("./devices/disk[@device='disk']/source")
+        if (path := source.get("file"))
+    ]
+
+
+def domain_macs(name: str) -> list[str]:
+    xml = _domain_xml(name)
+    if not xml:
+        return []
+    return [mac.get("address", "").lower() for mac in ET.fromstring(xml).iterfind("./devices/interface/mac")]
+
+
+def domain_disks(name: str) -> list[str]:
+    """Dateipfade der Festplatten (ohne CDROMs)."""
+    xml = _domain_xml(name)
+    return _disk_sources(xml) if xml else []
+
+
+def agent_command(name: str, command: str, timeout: int = 5) -> str | None:
+    """Roh-JSON-Antwort des Guest-Agents (None bei Fehler)."""
+    conn = connection()
+    if conn is not None:
+        dom = _domain(conn, name)
+        if dom is None:
+            return None
+        try:
+            return libvirt_qemu.qemuAgentCommand(dom, command, timeout, 0)
+        except libvirt.libvirtError:
+            return None
+    result = _virsh("qemu-agent-command", name, command)
+    return result.stdout if result.returncode == 0 else None
+
+
+# =============================================================================
+# Lebenszyklus
+# =============================================================================
+
+def define_and_start(xml: str) -> str | None:
+    """Definiert die Domain persistent und startet sie; gibt bei Fehler die Meldung zurück."""
+    conn = connection()
+    if conn is not None:
+        try:
+            conn.defineXML(xml).create()
+        except libvirt.libvirtError as e:
+            return str(e)
+        return None
+
+    name = ET.fromstring(xml).findtext("name", "")
+    result = subprocess.run(["virsh", "define", "/dev/stdin"], input=xml, capture_output=True, text=True,
+                            check=False)
+    if result.returncode == 0:
+        result = _virsh("start", name)
+    if result.returncode != 0:
+        return result.stderr.strip() or f"virsh endete mit Exit-Code {result.returncode}"
+    return None
+
+
+def start(name: str) -> str | None:
+    """Startet eine definierte Domain; gibt bei Fehler die Meldung zurück."""
+    conn = connection()
+    if conn is not None:
+        dom = _domain(conn, name)
+        if dom is None:
+            return f"Domain '{name}' existiert nicht"
+        try:
+            dom.create()
+        except libvirt.libvirtError as e:
+            return str(e)
+        return None
+    result = _virsh("start", name)
+    return None if result.returncode == 0 else result.stderr.strip() or f"virsh endete mit Exit-Code {result.returncode}"
+
+
+def destroy(name: str):
+    """Stoppt die Domain hart; ignoriert, wenn sie nicht läuft."""
+    conn = connection()
+    if conn is not None:
+        dom = _domain(conn, name)
+        if dom is not None and dom.isActive():
+            try:
+                dom.destroy()
+            except libvirt.libvirtError:
+                pass
+        return
+    _virsh("destroy", name)
+
+
+def undefine(name: str, remove_storage: bool = True) -> bool:
+    """Entfernt Domain, NVRAM und (mit `remove_storage`) Speicher-Volumes nativ.
+
+    Gibt False zurück, wenn keine native Verbindung besteht oder libvirt das
+    Entfernen ablehnt – der Aufrufer nimmt dann `virsh undefine --nvram`
+    (ggf. mit `--remove-all-storage`).
+    """
+    conn = connection()
+    if conn is None:
+        return False
+    dom = _domain(conn, name)
+    if dom is None:
+        return True
+    disks = _disk_sources(dom.XMLDesc(0)) if remove_storage else []
+    try:
+        dom.undefineFlags(
+            libvirt.VIR_DOMAIN_UNDEFINE_NVRAM
+            | libvirt.VIR_DOMAIN_UNDEFINE_MANAGED_SAVE
+            | libvirt.VIR_DOMAIN_UNDEFINE_SNAPSHOTS_METADATA
+        )
+    except libvirt.libvirtError:
+        return False
+    # wie --remove-all-storage: nur Volumes, die ein Storage-Pool verwaltet
+    for path in disks:
+        try:
+            conn.storageVolLookupByPath(path).delete(0)
+        except libvirt.libvirtError:
+            pass
+    return True
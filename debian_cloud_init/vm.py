@@ -1,12 +1,30 @@
-import grp
+import base64
+import json
 import os
 import pathlib
+import shlex
 import shutil
-import subprocess
 import tempfile
 import time
 
+from . import virt
+from .domain import arch_settings, domain_xml
+from .facts import invalidate, local_facts, missing_tools
+from .metrics import count_cache, count_retry, count_timeout
+from .numa import release_pinning, reserve_pinning, virt_install_numa_options
+from .overlay import create_options, overlay_settings, virt_install_cache_options
+from .profiles import DEFAULT_PROFILE, get_profile, virt_install_options
+from .seed_server import smbios_serial
+from .stages import STATUS_FILE, parse_status
 from .ui import ask_yes_no, fail, progress, run_cmd, success
+from .workspace import (
+    META_DATA,
+    NETWORK_CONFIG,
+    USER_DATA,
+    record_applied,
+    remove_workspace,
+    workspace_dir,
+)
 
 ISOS_PATH = pathlib.Path(os.environ.get("ISOS_PATH", "/isos"))
 
@@ -16,18 +34,20 @@ ISOS_PATH = pathlib.Path(os.environ.get("ISOS_PATH", "/isos"))
 # =============================================================================
 
 def ensure_isos_folder():
-    if ISOS_PATH.exists():
-        stat_info = ISOS_PATH.stat()
-        current_uid = os.getuid()
-        kvm_gid = grp.getgrnam("kvm").gr_gid
-
-        if stat_info.st_uid == current_uid and stat_info.st_gid == kvm_gid:
+    # Besitzer und kvm-GID stehen im Fakten-Cache; nur die Existenz wird jedes Mal geprüft
+    facts = local_facts(["uid", "kvm_gid", "isos"], refresh=not ISOS_PATH.exists())
+    isos = facts["isos"]
+    if isos["exists"]:
+        if facts["kvm_gid"] is None:
+            fail("Gruppe 'kvm' existiert nicht – ist libvirt/qemu installiert?")
+        if isos["uid"] == facts["uid"] and isos["gid"] == facts["kvm_gid"]:
             success(f"{ISOS_PATH} existiert und hat korrekte Rechte.")
             return
 
         print(f"⚠ {ISOS_PATH} existiert, aber Rechte stimmen nicht.")
         if ask_yes_no("Rechte korrigieren?"):
             run_cmd(f"sudo chown {os.getlogin()}:kvm {ISOS_PATH}")
+            invalidate("local", keys=["isos"])
             success("Rechte korrigiert.")
         else:
             fail("Abbruch.")
@@ -35,11 +55,22 @@ def ensure_isos_folder():
         print(f"⚠ {ISOS_PATH} existiert nicht.")
         if ask_yes_no(f"Soll {ISOS_PATH} erzeugt werden?"):
             run_cmd(f"sudo mkdir -p {ISOS_PATH}")
+            invalidate("local", keys=["isos"])
             success(f"{ISOS_PATH} wurde angelegt.")
         else:
             fail("Abbruch.")
 
 
+def ensure_tools():
+    """Bricht früh ab, wenn ein Tool fehlt (laut Fakten-Cache, ohne jedes Mal PATH zu durchsuchen)."""
+    tools = ["qemu-img", "genisoimage"]
+    if os.environ.get("DEBIAN_CLOUD_INIT_VIRT_INSTALL"):
+        tools.append("virt-install")
+    missing = missing_tools(tools)
+    if missing:
+        fail(f"Benötigte Tools fehlen: {', '.join(missing)} (Pakete qemu-utils, genisoimage, virtinst).")
+
+
 # =============================================================================
 # Images
 # =============================================================================
@@ -67,6 +98,7 @@ def ensure_base_image(arch="amd64", distro="debian/13"):
     image_name, url = _image_info(distro, arch)
     base_img = ISOS_PATH / image_name
 
+    count_cache("base_image", base_img.exists())
     if base_img.exists():
         success(f"Basis-Image ({arch}) vorhanden.")
         return
@@ -74,13 +106,16 @@ def ensure_base_image(arch="amd64", distro="debian/13"):
     print(f"⚠ Basis-Image für {arch} fehlt.")
     distro_label = distro.replace("/", " ").capitalize()
     if ask_yes_no(f"Soll das {distro_label} {arch} Cloud-Image heruntergeladen werden?"):
-        run_cmd(f"wget -O {ISOS_PATH / image_name} {url}")
+        # Erst nach vollständigem Download sichtbar – parallele Läufe prüfen nur exists()
+        partial = ISOS_PATH / f".{image_name}.{os.getpid()}.part"
+        run_cmd(f"wget -O {partial} {url} && mv {partial} {base_img}")
         success(f"Basis-Image {arch} heruntergeladen.")
     else:
         fail("Abbruch.")
 
 
-def ensure_overlay_image(vmname, arch, distro="debian/13"):
+def ensure_overlay_image(vmname, arch, distro="debian/13", settings=None):
+    settings = settings or overlay_settings(DEFAULT_PROFILE)
     overlay = ISOS_PATH / f"{vmname}.qcow2"
     base_image_name, _ = _image_info(distro, arch)
     base_image_path = ISOS_PATH / base_image_name
@@ -99,8 +134,8 @@ def ensure_overlay_image(vmname, arch, distro="debian/13"):
     run_cmd(
         f"qemu-img create -f qcow2 "
         f"-F qcow2 "
-        f"-o backing_file={base_image_path} "
-        f"{overlay} 30G"
+        f"-o backing_file={base_image_path}{create_options(settings)} "
+        f"{overlay} {settings['size']}"
     )
     success(f"Overlay-Image erstellt: {overlay} (Basis: {arch})")
 
@@ -110,15 +145,7 @@ def ensure_overlay_image(vmname, arch, distro="debian/13"):
 # =============================================================================
 
 def delete_vm(vmname, skip_confirm=False):
-    result = subprocess.run(
-        f"virsh list --all | grep -w {vmname}",
-        shell=True,
-        capture_output=True,
-        text=True,
-        check=False,
-    )
-
-    if result.returncode != 0:
+    if not virt.domain_exists(vmname):
         print("✔ Keine bestehende VM gefunden.")
         return
 
@@ -127,10 +154,12 @@ def delete_vm(vmname, skip_confirm=False):
         fail("Abbruch.")
 
     progress("Stoppe VM…")
-    subprocess.run(f"virsh destroy {vmname}", shell=True, check=False)
+    virt.destroy(vmname)
 
     progress("Lösche VM…")
-    run_cmd(f"virsh undefine {vmname} --remove-all-storage --nvram")
+    if not virt.undefine(vmname):
+        run_cmd(f"virsh undefine {vmname} --remove-all-storage --nvram")
+    release_pinning(vmname)
 
     overlay = ISOS_PATH / f"{vmname}.qcow2"
     if overlay.exists():
@@ -140,6 +169,10 @@ def delete_vm(vmname, skip_confirm=False):
     if seed_iso.exists():
         run_cmd(f"rm -f {seed_iso}")
 
+    from .rebuild import discard_golden
+    discard_golden(vmname)
+    remove_workspace(vmname)
+
     success(f"VM '{vmname}' wurde vollständig gelöscht.")
 
 
@@ -147,8 +180,8 @@ def delete_vm(vmname, skip_confirm=False):
 # Seed-ISO + VM erstellen
 # =============================================================================
 
-def create_seed_iso(vmname: str, network_config_file: pathlib.Path | None = None) -> pathlib.Path:
-    """Erstellt eine cloud-init Seed-ISO als SCSI-CDROM.
+def create_seed_iso(vmname: str, workspace: pathlib.Path) -> pathlib.Path:
+    """Erstellt eine cloud-init Seed-ISO als SCSI-CDROM aus dem Workspace der VM.
 
     EFI + IDE CDROM (intern von --cloud-init) ist inkompatibel mit q35+UEFI.
     Lösung: ISO manuell via genisoimage → als SCSI CDROM anhängen.
@@ -157,12 +190,12 @@ def create_seed_iso(vmname: str, network_config_file: pathlib.Path | None = None
 
     with tempfile.TemporaryDirectory() as tmpdir:
         tmp = pathlib.Path(tmpdir)
-        shutil.copy(ISOS_PATH / "cloud-init.yml", tmp / "user-data")
-        shutil.copy(ISOS_PATH / "meta-data.yml", tmp / "meta-data")
+        shutil.copy(workspace / USER_DATA, tmp / "user-data")
+        shutil.copy(workspace / META_DATA, tmp / "meta-data")
 
         extra = ""
-        if network_config_file:
-            shutil.copy(network_config_file, tmp / "network-config")
+        if (workspace / NETWORK_CONFIG).exists():
+            shutil.copy(workspace / NETWORK_CONFIG, tmp / "network-config")
             extra = f" {tmp / 'network-config'}"
 
         run_cmd(
@@ -174,58 +207,93 @@ def create_seed_iso(vmname: str, network_config_file: pathlib.Path | None = None
     return seed_iso
 
 
-def create_vm(vmname, username, arch, net_type="default", bridge_interface=None, distro="debian/13", network_config_file=None):
-    src = pathlib.Path("cloud-init.yml")
-    dst = ISOS_PATH / "cloud-init.yml"
-    if not src.exists():
-        fail("cloud-init.yml wurde nicht gefunden. Erstelle zuerst die Cloud-Init-Datei.")
-
-    progress(f"Kopiere cloud-init.yml nach {ISOS_PATH}…")
-    run_cmd(f"cp {src} {dst}")
-    success(f"cloud-init.yml wurde nach {ISOS_PATH} kopiert.")
+def create_vm(vmname, username, arch, net_type="default", bridge_interface=None, distro="debian/13",
+              profile=DEFAULT_PROFILE, numa=False, overlay=None, workspace=None):
+    workspace = workspace or workspace_dir(vmname)
+    if not (workspace / USER_DATA).exists():
+        fail(f"{workspace / USER_DATA} wurde nicht gefunden. Erstelle zuerst die Cloud-Init-Datei.")
 
     if net_type == "bridge" and bridge_interface:
-        net_config = f"--network type=direct,source={bridge_interface},source_mode=bridge,model=virtio"
         progress(f"Verwende Bridge-Netzwerk ({bridge_interface})...")
     else:
-        net_config = "--network network=default,model=virtio"
         progress("Verwende Default-NAT-Netzwerk...")
 
+    sizing = get_profile(profile)
+    progress(f"Verwende Profil '{profile}' ({sizing['vcpus']} vCPU, {sizing['memory']} MB)...")
+
     if not ask_yes_no("Soll die VM jetzt angelegt werden?"):
         print("VM-Erstellung übersprungen.")
-        return
+        return False
+
+    if numa and arch == "arm64":
+        print("⚠ NUMA-Pinning ist nur mit KVM (amd64) sinnvoll – wird ignoriert.")
+        numa = False
+
+    plan = None
+    if numa:
+        progress("Reserviere NUMA-Knoten, CPUs und Hugepages…")
+        plan = reserve_pinning(vmname, sizing["vcpus"], sizing["memory"])
+
+    overlay = overlay or overlay_settings(profile)
+    virt_type = arch_settings(arch)["virt_type"]
+
+    # Mit Seed-Server holt sich die VM ihre Daten selbst – keine Seed-ISO, kein --cloud-init
+    serial = smbios_serial(vmname, workspace=workspace)
+    if serial:
+        progress(f"cloud-init-Daten kommen vom Seed-Server ({serial})…")
+
+    if os.environ.get("DEBIAN_CLOUD_INIT_VIRT_INSTALL"):
+        seed_iso = create_seed_iso(vmname, workspace) if distro.startswith("ubuntu") and not serial else None
+        progress("Erstelle VM…")
+        run_cmd(_virt_install_command(vmname, arch, distro, sizing, seed_iso, net_type, bridge_interface,
+                                      overlay, plan, workspace, serial))
+    else:
+        seed_iso = None if serial else create_seed_iso(vmname, workspace)
+        xml = domain_xml(vmname, arch, distro, profile, ISOS_PATH / f"{vmname}.qcow2", seed_iso,
+                         net_type, bridge_interface, overlay, plan, smbios_serial=serial)
+        progress("Erstelle VM…")
+        error = virt.define_and_start(xml)
+        if error:
+            fail(f"VM konnte nicht angelegt werden: {error}")
+
+    record_applied(workspace)
+    success(f"VM '{vmname}' in {arch} mit ({virt_type}-Modus) wurde angelegt und gestartet.")
+    return True
 
-    if arch == "arm64":
-        virt_type = "qemu"
-        machine = "virt"
-        cpu_model = "max"
-        arch_binary = "aarch64"
+
+def _virt_install_command(vmname, arch, distro, sizing, seed_iso, net_type, bridge_interface, overlay, plan,
+                          workspace, serial=None) -> str:
+    """Bisheriger Weg über virt-install (DEBIAN_CLOUD_INIT_VIRT_INSTALL=1)."""
+    settings = arch_settings(arch)
+
+    if net_type == "bridge" and bridge_interface:
+        net_config = f"--network type=direct,source={bridge_interface},source_mode=bridge,model=virtio"
     else:
-        virt_type = "kvm"
-        machine = "q35"
-        cpu_model = "host-passthrough"
-        arch_binary = "x86_64"
+        net_config = "--network network=default,model=virtio"
+
+    cpu_cell, numa_options = virt_install_numa_options(plan) if plan else ("", "")
 
-    if distro.startswith("ubuntu"):
-        seed_iso = create_seed_iso(vmname, network_config_file)
+    if serial:
+        cloud_init_param = f"--sysinfo {shlex.quote(f'smbios,system.serial={serial}')} "
+    elif seed_iso:
         cloud_init_param = f"--disk {seed_iso},device=cdrom,bus=scsi "
     else:
         cloud_init_param = (
-            f"--cloud-init user-data={ISOS_PATH / 'cloud-init.yml'},"
-            f"meta-data={ISOS_PATH / 'meta-data.yml'} "
+            f"--cloud-init user-data={workspace / USER_DATA},"
+            f"meta-data={workspace / META_DATA} "
         )
 
-    cmd = (
+    return (
         f"virt-install "
         f"--name {vmname} "
-        f"--arch {arch_binary} "
-        f"--machine {machine} "
-        f"--cpu {cpu_model} "
-        "--memory 4096 "
-        "--vcpus 2 "
-        f"--disk {ISOS_PATH / f'{vmname}.qcow2'},device=disk,bus=virtio "
+        f"--arch {settings['arch']} "
+        f"--machine {settings['machine']} "
+        f"--cpu {settings['cpu']}{cpu_cell} "
+        f"{virt_install_options(sizing, ISOS_PATH / f'{vmname}.qcow2')}"
+        f"{numa_options}"
+        f"{virt_install_cache_options(overlay)}"
         f"--os-variant {_os_variant(distro)} "
-        f"--virt-type {virt_type} "
+        f"--virt-type {settings['virt_type']} "
         "--graphics none "
         "--console pty,target_type=serial "
         f"{net_config} "
@@ -235,10 +303,6 @@ def create_vm(vmname, username, arch, net_type="default", bridge_interface=None,
         "--import"
     )
 
-    progress("Erstelle VM…")
-    run_cmd(cmd)
-    success(f"VM '{vmname}' in {arch} mit ({virt_type}-Modus) wurde angelegt und gestartet.")
-
 
 # =============================================================================
 # IP-Ermittlung + SSH
@@ -248,15 +312,7 @@ def get_vm_ip(vmname):
     progress("Warte darauf, dass die VM startet…")
 
     for _ in range(120):
-        state = subprocess.run(
-            f"virsh domstate {vmname}",
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=False,
-        ).stdout.strip()
-
-        if "running" in state.lower():
+        if virt.domain_state(vmname) == "running":
             break
         time.sleep(1)
     else:
@@ -264,43 +320,82 @@ def get_vm_ip(vmname):
 
     progress("Ermittle IP-Adresse der VM…")
 
-    for _ in range(60):
-        result = subprocess.run(
-            f"virsh domifaddr {vmname} --source agent",
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        if result.returncode == 0 and "ipv4" in result.stdout.lower():
-            for line in result.stdout.splitlines():
-                if "ipv4" in line.lower():
-                    ip = line.split()[3].split("/")[0]
-                    success(f"IP-Adresse gefunden: {ip}")
-                    return ip
-
-        result = subprocess.run(
-            "virsh net-dhcp-leases default",
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        if result.returncode == 0:
-            for line in result.stdout.splitlines():
-                if vmname in line or "ipv4" in line.lower():
-                    parts = line.split()
-                    for p in parts:
-                        if p.count(".") == 3 and "/" in p:
-                            ip = p.split("/")[0]
-                            success(f"IP-Adresse gefunden: {ip}")
-                            return ip
+    macs = None
+    for attempt in range(60):
+        if attempt:
+            count_retry("ip_discovery")
+        addresses = virt.agent_ipv4_addresses(vmname)
+        if addresses:
+            success(f"IP-Adresse gefunden: {addresses[0]}")
+            return addresses[0]
+
+        if macs is None:
+            macs = set(virt.domain_macs(vmname))
+        for lease in virt.dhcp_leases("default"):
+            if lease["mac"].lower() in macs or lease["hostname"] == vmname:
+                success(f"IP-Adresse gefunden: {lease['ip']}")
+                return lease["ip"]
 
         time.sleep(1)
 
+    count_timeout("ip_discovery")
     fail("Konnte die IP-Adresse der VM nicht ermitteln.")
 
 
+def _agent_command(vmname: str, command: dict) -> dict | None:
+    output = virt.agent_command(vmname, json.dumps(command))
+    if output is None:
+        return None
+    try:
+        return json.loads(output).get("return")
+    except json.JSONDecodeError:
+        return None
+
+
+def guest_exec(vmname: str, path: str, args: list[str], timeout: float = 5.0) -> tuple[int, str] | None:
+    """Führt ein Programm via qemu-guest-agent aus; gibt (Exit-Code, stdout) oder None zurück."""
+    started = _agent_command(vmname, {
+        "execute": "guest-exec",
+        "arguments": {"path": path, "arg": args, "capture-output": True},
+    })
+    if not started or "pid" not in started:
+        return None
+
+    for _ in range(max(1, int(timeout / 0.5))):
+        data = _agent_command(vmname, {"execute": "guest-exec-status", "arguments": {"pid": started["pid"]}})
+        if data is None:
+            return None
+        if data.get("exited"):
+            out = base64.b64decode(data.get("out-data", "")).decode(errors="replace")
+            return data.get("exitcode", 1), out
+        time.sleep(0.5)
+    return None
+
+
+def read_provision_status(vmname: str) -> dict | None:
+    """Liest die Statusdatei der verzögerten Stufe via guest-exec (qemu-guest-agent)."""
+    result = guest_exec(vmname, "/bin/cat", [STATUS_FILE])
+    if result is None or result[0] != 0:
+        return None
+    return parse_status(result[1])
+
+
+def wait_for_cloud_init(vmname: str, timeout: int = 1800, interval: int = 10) -> bool:
+    """Wartet, bis `cloud-init status` im Gast done (True) oder error (False) meldet."""
+    progress("Warte auf Abschluss von cloud-init…")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = guest_exec(vmname, "/usr/bin/cloud-init", ["status"])
+        if result is not None:
+            if "status: done" in result[1]:
+                return True
+            if "status: error" in result[1]:
+                return False
+        time.sleep(interval)
+    count_timeout("cloud_init")
+    return False
+
+
 def print_ssh_command(username, ip):
     print("\n=== SSH-Verbindung ===")
     print(f"ssh {username}@{ip}")
@@ -0,0 +1,58 @@
+"""Arbeitsverzeichnis pro VM für die erzeugten cloud-init-Dateien.
+
+Bisher landeten cloud-init.yml, meta-data.yml und network-config.yml unter
+festen Namen im aktuellen Verzeichnis bzw. in ISOS_PATH – zwei gleichzeitige
+Läufe tauschten dabei unbemerkt ihre user-data. Jetzt bekommt jede VM ein
+eigenes Verzeichnis `.workspaces/<backend>/<vmname>/`, dessen Pfad in der
+Session steht. Alle Dateien werden atomar geschrieben (temporäre Datei +
+rename), so dass genisoimage, virt-install oder ein Upload nie eine halbe
+Datei sehen.
+"""
+
+import os
+import pathlib
+import shutil
+import threading
+
+WORKSPACES_DIR = pathlib.Path(".workspaces")
+
+USER_DATA = "cloud-init.yml"
+META_DATA = "meta-data.yml"
+NETWORK_CONFIG = "network-config.yml"
+# Stand der cloud-config, der zuletzt in der VM angekommen ist (Basis für `reprovision`)
+APPLIED_DATA = "applied-cloud-init.yml"
+# Zufälliges Token im Seed-URL der VM – nur wer es kennt, bekommt ihre user-data
+SEED_TOKEN = "seed-token"
+
+
+def workspace_dir(vmname: str, backend: str = "kvm") -> pathlib.Path:
+    return WORKSPACES_DIR / backend / vmname
+
+
+def session_workspace(session: dict, backend: str = "kvm") -> pathlib.Path:
+    """Workspace laut Session; ältere Sessions ohne Eintrag bekommen den Standardpfad."""
+    return pathlib.Path(session.get("workspace") or workspace_dir(session["vmname"], backend))
+
+
+def ensure_workspace(directory: pathlib.Path) -> pathlib.Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def write_atomic(path: pathlib.Path, content: str):
+    # Eindeutig pro Prozess und Thread – der Daemon baut mehrere VMs gleichzeitig
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_text(content)
+        tmp.replace(path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def record_applied(directory: pathlib.Path, content: str | None = None):
+    """Merkt sich die angewendete cloud-config – ohne `content` die aktuelle user-data."""
+    write_atomic(directory / APPLIED_DATA, content if content is not None else (directory / USER_DATA).read_text())
+
+
+def remove_workspace(vmname: str, backend: str = "kvm"):
+    shutil.rmtree(workspace_dir(vmname, backend), ignore_errors=True)
@@ -0,0 +1,164 @@
+"""Fakten eines Proxmox-Hosts in einem einzigen SSH-Aufruf ermitteln.
+
+Ein Shell-Skript liefert Node-Name, `/cluster/resources` (Nodes, Storages),
+die Bridges jedes Nodes und die ISO-Images der lokalen Storages samt Pfad
+(`pvesm path` + `test -f`). Die Ergebnisse landen im Fakten-Cache
+(`debian_cloud_init.facts`) und dienen als Vorgaben im Assistenten und um
+die Image-Prüfung in `ensure_image` zu überspringen.
+
+    python -m proxmox_cloud_init.facts --host 192.168.1.10 [--refresh]
+"""
+
+import argparse
+import json
+
+from debian_cloud_init.facts import (
+    cache_key,
+    cached_facts,
+    facts_entry,
+    format_facts,
+    peek_facts,
+    update_facts,
+)
+from debian_cloud_init.ui import progress
+
+from .vm import ssh_run
+
+BACKEND = "proxmox"
+
+TTLS = {
+    "node": 86400,
+    "nodes": 3600,
+    "storages": 3600,
+    "bridges": 3600,
+    "images": 600,
+}
+
+_PROBE = r"""
+echo '@@node'; hostname
+echo '@@resources'; pvesh get /cluster/resources --output-format json
+for n in $(ls /etc/pve/nodes 2>/dev/null); do
+    echo "@@bridges $n"; timeout 10 pvesh get /nodes/$n/network --type any_bridge --output-format json 2>/dev/null
+done
+echo '@@images'
+for s in $(pvesm status --content iso 2>/dev/null | awk 'NR > 1 && $3 == "active" {print $1}'); do
+    for v in $(pvesm list "$s" --content iso 2>/dev/null | awk 'NR > 1 {print $1}'); do
+        p=$(pvesm path "$v" 2>/dev/null) && test -f "$p" && echo "$v $p"
+    done
+done
+"""
+
+
+class ProbeError(Exception):
+    pass
+
+
+# =============================================================================
+# Probe
+# =============================================================================
+
+def _sections(output: str) -> dict[str, str]:
+    sections: dict[str, list[str]] = {}
+    current = None
+    for line in output.splitlines():
+        if line.startswith("@@"):
+            current = line[2:].strip()
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    return {name: "\n".join(lines) for name, lines in sections.items()}
+
+
+def _json(text: str) -> list:
+    try:
+        data = json.loads(text or "[]")
+    except json.JSONDecodeError:
+        return []
+    return data if isinstance(data, list) else []
+
+
+def parse_probe(output: str) -> dict:
+    sections = _sections(output)
+    if "node" not in sections or "resources" not in sections:
+        raise ProbeError("unerwartete Ausgabe")
+    resources = _json(sections["resources"])
+    storages: dict[str, list[dict]] = {}
+    for r in resources:
+        if r.get("type") == "storage" and r.get("status", "available") == "available":
+            storages.setdefault(r["node"], []).append({
+                "storage": r["storage"],
+                "content": sorted(c for c in (r.get("content") or "").split(",") if c),
+                "shared": bool(r.get("shared")),
+            })
+    images = {}
+    for line in sections.get("images", "").splitlines():
+        volid, _, path = line.partition(" ")
+        if path:
+            images[volid] = path
+    return {
+        "node": sections["node"].strip(),
+        "nodes": sorted(r["node"] for r in resources if r.get("type") == "node" and r.get("status") == "online"),
+        "storages": {node: sorted(entries, key=lambda e: e["storage"]) for node, entries in storages.items()},
+        "bridges": {
+            name.split(" ", 1)[1]: sorted(entry["iface"] for entry in _json(text) if entry.get("iface"))
+            for name, text in sections.items() if name.startswith("bridges ")
+        },
+        "images": images,
+    }
+
+
+def probe(host: str, user: str) -> dict:
+    progress(f"Ermittle Nodes, Storages, Bridges und Images auf {host}…")
+    result = ssh_run(host, user, _PROBE, check=False, capture=True)
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"Exit-Code {result.returncode}")
+    return parse_probe(result.stdout)
+
+
+def host_facts(host: str, user: str, keys: list[str] | None = None, refresh: bool = False) -> dict:
+    """Fakten aus dem Cache oder frisch vom Host; leer, wenn der Host nicht erreichbar ist."""
+    try:
+        return cached_facts(BACKEND, host, lambda: probe(host, user), TTLS, keys, refresh)
+    except ProbeError as e:
+        print(f"⚠ Host-Fakten von {host} nicht lesbar ({e}) – verwende Standardwerte.")
+        return {}
+
+
+# =============================================================================
+# Abfragen
+# =============================================================================
+
+def node_storages(facts: dict, node: str, content: str = "images") -> list[str]:
+    return [s["storage"] for s in facts.get("storages", {}).get(node, []) if content in s["content"]]
+
+
+def node_bridges(facts: dict, node: str) -> list[str]:
+    return facts.get("bridges", {}).get(node, [])
+
+
+def known_image(host: str, storage: str, filename: str) -> str | None:
+    """Pfad eines Images laut Cache – ohne SSH; None, wenn unbekannt oder der Cache abgelaufen ist."""
+    facts = peek_facts(BACKEND, host, TTLS, ["images"])
+    return facts["images"].get(f"{storage}:iso/{filename}") if facts else None
+
+
+def record_image(host: str, storage: str, filename: str, path: str):
+    facts = peek_facts(BACKEND, host, TTLS, ["images"])
+    if facts is not None:
+        update_facts(BACKEND, host, images={**facts["images"], f"{storage}:iso/{filename}": path})
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m proxmox_cloud_init.facts",
+                                     description="Fakten eines Proxmox-Hosts anzeigen")
+    parser.add_argument("--host", required=True)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--refresh", action="store_true", help="Host neu prüfen statt Cache zu verwenden")
+    args = parser.parse_args()
+    facts = host_facts(args.host, args.user, refresh=args.refresh)
+    if facts:
+        print(format_facts({cache_key(BACKEND, args.host): facts_entry(BACKEND, args.host)}))
+
+
+if __name__ == "__main__":
+    main()
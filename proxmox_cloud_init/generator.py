@@ -1,39 +1,78 @@
 #!/usr/bin/env python3
 
+import argparse
+import json
 import pathlib
 
-import yaml
-
-from debian_cloud_init.cloud_init import (
-    LiteralString,
-    ensure_file_exists,
-    validate_yaml,
+from debian_cloud_init.build import build_cloud_config, preview_package_optimization
+from debian_cloud_init.metrics import (
+    fleet,
+    phase,
+    record_run,
+    register_collector,
+    set_labels,
+)
+from debian_cloud_init.stages import UNIT_NAME, format_status, wait_for_provisioning
+from debian_cloud_init.ui import ask_yes_no, success
+from debian_cloud_init.workspace import (
+    USER_DATA,
+    ensure_workspace,
+    record_applied,
+    session_workspace,
+    workspace_dir,
 )
-from debian_cloud_init.ui import ask_yes_no, fail, progress, success
 
-from .session import delete_session, get_or_create_session
+from .facts import BACKEND
+from .profiles import DEFAULT_PROFILE, PROFILES
+from .session import all_sessions, delete_session, get_or_create_session, update_session
+from .teardown import tombstone_vm
 from .vm import (
     create_vm,
-    delete_vm,
     get_vm_ip,
     print_ssh_command,
+    read_provision_status,
     ssh_run,
 )
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Debian/Ubuntu Cloud-Init VM auf Proxmox erstellen")
+    parser.add_argument("--profile", choices=list(PROFILES),
+                        help="Hardware-Profil (SCSI/IOThreads, NIC-Queues, NUMA, Hugepages, Ballooning); wird in der Session gespeichert")
+    parser.add_argument("--force-build", dest="force_build", action="store_true",
+                        help="cloud-init.yml auch bei unveränderten Templates neu erzeugen")
+    parser.add_argument("--optimize-packages", dest="optimize_packages", action="store_true",
+                        help="apt-Aufrufe zu packages: + einer Installations-Transaktion zusammenfassen")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true",
+                        help="Nur den Diff der Paket-Optimierung anzeigen, nichts schreiben")
+    parser.add_argument("--deferred", action="store_true",
+                        help="Pakete, Tools und System-Konfiguration erst nach dem Boot als systemd-Unit ausführen")
+    parser.add_argument("--wait", action="store_true",
+                        help="Mit --deferred: auf die vollständige Provisionierung warten und Zeiten ausgeben")
+    args = parser.parse_args()
+
+    with record_run("proxmox"):
+        _setup(args)
+
+
+def _record_fleet(host: str, user: str):
+    """Zustand der VMs aus den Sessions dieses Hosts (ein pvesh-Aufruf, nur beim Schreiben der Metriken)."""
+    result = ssh_run(host, user, "pvesh get /cluster/resources --type vm --output-format json",
+                     check=False, capture=True)
+    if result.returncode != 0:
+        return
+    vmids = {s.get("proxmox_vmid") for s in all_sessions().values() if s.get("proxmox_host") == host}
+    fleet([r.get("status", "") for r in json.loads(result.stdout) if r.get("vmid") in vmids],
+          backend="proxmox", host=host)
+
+
+def _setup(args):
     templates_dir = pathlib.Path("templates")
 
-    template_file = templates_dir / "cloud-init-template.yml"
-    package_config_file = templates_dir / "package-config.txt"
-    system_config_file = templates_dir / "system-config.txt"
-    tools_file = templates_dir / "amd64-tools.sh"
-    output_file = pathlib.Path("cloud-init.yml")
-
     # -------------------------------------------------------------------------
     # SESSION LADEN ODER NEUE PARAMETER ABFRAGEN
     # -------------------------------------------------------------------------
-    session, is_persistent = get_or_create_session()
+    session, is_persistent = get_or_create_session(args.profile)
 
     host = session["proxmox_host"]
     ssh_user = session["proxmox_ssh_user"]
@@ -50,75 +89,59 @@ def main():
     ssh_key_path = pathlib.Path(session["ssh_key"])
     ssh_key_content = ssh_key_path.read_text().strip()
     hashed_password = session["hashed_password"]
+    profile = args.profile or session.get("proxmox_profile", DEFAULT_PROFILE)
+    if profile != session.get("proxmox_profile", DEFAULT_PROFILE):
+        update_session(vmname, proxmox_profile=profile)
+    set_labels(host=host, distro=distro, arch=arch)
+    if is_persistent and "workspace" not in session:
+        update_session(vmname, workspace=str(workspace_dir(vmname, BACKEND)))
+    output_file = ensure_workspace(session_workspace(session, BACKEND)) / USER_DATA
+    register_collector(lambda: _record_fleet(host, ssh_user))
 
     # -------------------------------------------------------------------------
     # CLOUD-INIT GENERIEREN (immer, unabhängig vom VM-Zustand)
     # -------------------------------------------------------------------------
 
-    if not ensure_file_exists(tools_file):
-        fail(f"Pflichtdatei fehlt: {tools_file}")
-    if not ensure_file_exists(system_config_file):
-        fail(f"Pflichtdatei fehlt: {system_config_file}")
-    if not ensure_file_exists(package_config_file):
-        fail(f"Pflichtdatei fehlt: {package_config_file}")
-
-    tools_content = tools_file.read_text()
-    system_config_content = system_config_file.read_text()
-    package_runcmd = [
-        line.strip()
-        for line in package_config_file.read_text().splitlines()
-        if line.strip()
-    ]
-
-    try:
-        cloud_config = yaml.safe_load(template_file.read_text()) or {}
-    except (OSError, yaml.YAMLError) as e:
-        fail(f"Fehler beim Laden des Templates: {e}")
-
-    # Proxmox-spezifisch: qemu-guest-agent für IP-Erkennung via pvesh
-    packages = cloud_config.get("packages", [])
-    cloud_config["packages"] = packages
-    cloud_config.setdefault("package_update", True)
-
-    cloud_config["users"] = [
-        {
-            "name": username,
-            "passwd": hashed_password,
-            "lock_passwd": False,
-            "groups": ["sudo"],
-            "shell": "/bin/bash",
-            "sudo": ["ALL=(ALL) NOPASSWD:ALL"],
-            "ssh_authorized_keys": [ssh_key_content],
-        }
-    ]
-
-    cloud_config["runcmd"] = package_runcmd + [
-        LiteralString(tools_content),
-        LiteralString(system_config_content),
-    ]
-
-    progress("Schreibe cloud-init.yml…")
-    try:
-        yaml_body = yaml.dump(cloud_config, sort_keys=False, Dumper=yaml.SafeDumper)
-        output_file.write_text("#cloud-config\n" + yaml_body)
-    except (OSError, yaml.YAMLError) as e:
-        fail(f"Fehler beim Schreiben der cloud-init.yml: {e}")
-
-    progress("Validiere YAML…")
-    validate_yaml(output_file)
-    success("cloud-init.yml erfolgreich erstellt.")
+    if args.dry_run:
+        print(preview_package_optimization(
+            templates_dir,
+            username=username,
+            hashed_password=hashed_password,
+            ssh_key_content=ssh_key_content,
+            arch=arch,
+            backend="proxmox",
+        ) or "Keine apt-Aufrufe zum Zusammenfassen gefunden.")
+        return
+
+    with phase("build"):
+        build_cloud_config(
+            templates_dir, output_file,
+            username=username,
+            hashed_password=hashed_password,
+            ssh_key_content=ssh_key_content,
+            arch=arch,
+            backend="proxmox",
+            optimize_packages=args.optimize_packages,
+            deferred=args.deferred,
+            force=args.force_build,
+        )
+    success(f"{output_file} erfolgreich erstellt.")
 
     if is_persistent:
         print(f"Session geladen: {vmname} (ID {vmid}) auf {host} ({distro}, {arch})")
         result = ssh_run(host, ssh_user, f"qm status {vmid} 2>/dev/null", check=False, capture=True)
         if "running" in result.stdout and ask_yes_no(f"VM {vmid} läuft. IP anzeigen?"):
-            ip = get_vm_ip(host, ssh_user, node, vmid)
+            with phase("ip"):
+                ip = get_vm_ip(host, ssh_user, node, vmid)
             if ip:
                 print_ssh_command(username, ip)
+                status = read_provision_status(host, ssh_user, vmid)
+                if status:
+                    print(f"Provisionierung: {format_status(status)}")
             return
 
         if ask_yes_no(f"Soll VM {vmid} ({vmname}) gelöscht und neu erstellt werden?"):
-            delete_vm(host, ssh_user, vmid, vmname, skip_confirm=True)
+            vmid = tombstone_vm(host, ssh_user, vmid, vmname)
             delete_session(vmname)
         else:
             return
@@ -129,19 +152,32 @@ def main():
 
     print(f"\n=== Proxmox VM-Setup ({host}, Node: {node}) ===")
 
-    create_vm(
-        host=host,
-        user=ssh_user,
-        node=node,
-        vmid=vmid,
-        vmname=vmname,
-        arch=arch,
-        distro=distro,
-        storage=storage,
-        bridge=bridge,
-        snippets_path=snippets_path,
-        cloud_init_yml=output_file,
-    )
+    with phase("create"):
+        created = create_vm(
+            host=host,
+            user=ssh_user,
+            node=node,
+            vmid=vmid,
+            vmname=vmname,
+            arch=arch,
+            distro=distro,
+            storage=storage,
+            bridge=bridge,
+            snippets_path=snippets_path,
+            cloud_init_yml=output_file,
+            group=session.get("proxmox_group"),
+            profile=profile,
+        )
+    if created:
+        record_applied(output_file.parent)
+
+    if created and args.deferred:
+        if args.wait:
+            with phase("provisioning"):
+                status = wait_for_provisioning(lambda: read_provision_status(host, ssh_user, vmid))
+            print(f"Provisionierung: {format_status(status) if status else 'Status nicht lesbar'}")
+        else:
+            print(f"Verzögerte Provisionierung läuft nach dem Boot weiter: journalctl -u {UNIT_NAME}")
 
     success("Alle Schritte abgeschlossen.")
 
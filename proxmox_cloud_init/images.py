@@ -0,0 +1,380 @@
+"""Cloud-Images über den Download-Dienst des Proxmox-Storage bereitstellen.
+
+Statt `wget` auf dem einen Host, mit dem wir sprechen, lädt Proxmox das Image
+selbst (`pvesh create /nodes/<node>/storage/<storage>/download-url`) und prüft
+dabei die Prüfsumme aus den SHA512SUMS/SHA256SUMS der Distribution. Die
+Images liegen als ISO-Inhalt im Storage (Debian-qcow2 mit Endung `.img`, die
+Proxmox für ISO-Inhalte verlangt; `qm importdisk` erkennt das Format selbst).
+
+Welche Images auf welchem Node/Storage liegen, steht in einem lokalen Index
+(`.proxmox-images`, max. `INDEX_MAX_AGE` alt). `prefetch` lädt ein Image
+parallel auf alle Nodes, denen es fehlt – bei gemeinsamem Storage (NFS,
+CephFS, …) nur einmal. Die erste VM auf einem neuen Node wartet dann nicht
+mehr auf den Download.
+
+    python -m proxmox_cloud_init.images prefetch --host 192.168.1.10 --distro debian/13 --arch amd64
+    python -m proxmox_cloud_init.images status --host 192.168.1.10 --refresh
+    python -m proxmox_cloud_init.images push --host 10.0.0.5 --distro debian/13   # Host ohne Internet
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import shlex
+import time
+
+from debian_cloud_init.engine import CommandError
+from debian_cloud_init.metrics import count_cache
+from debian_cloud_init.pool import format_duration
+from debian_cloud_init.ui import ask_yes_no, fail, progress, success
+
+from .facts import known_image, record_image
+from .placement import fetch_cluster_resources
+from .vm import _image_info, ssh_run, ssh_run_async
+
+INDEX_FILE = pathlib.Path(".proxmox-images")
+INDEX_MAX_AGE = 600
+DEFAULT_STORAGE = "local"
+DOWNLOAD_TIMEOUT = 3600
+# Hosts ohne Internet: Images immer von hier übertragen (siehe `proxmox_cloud_init.push`)
+PUSH_ENV = "DEBIAN_CLOUD_INIT_IMAGE_PUSH"
+
+
+def image_spec(distro: str, arch: str) -> dict:
+    """Name, URL, Dateiname im Storage und Prüfsummen-Quelle eines Cloud-Images."""
+    name, url = _image_info(distro, arch)
+    base = url.rsplit("/", 1)[0]
+    if distro.startswith("ubuntu/"):
+        sums_url, algorithm = f"{base}/SHA256SUMS", "sha256"
+    else:
+        sums_url, algorithm = f"{base}/SHA512SUMS", "sha512"
+    return {
+        "name": name,
+        "url": url,
+        "filename": name if name.endswith((".img", ".iso")) else f"{name}.img",
+        "sums_url": sums_url,
+        "algorithm": algorithm,
+    }
+
+
+def parse_checksums(text: str, name: str) -> str | None:
+    """Prüfsumme für `name` aus einer SHA*SUMS-Datei ("<hash>  <datei>" oder "<hash> *<datei>")."""
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].lstrip("*") == name:
+            return parts[0].lower()
+    return None
+
+
+def host_checksum(host: str, user: str, spec: dict) -> str | None:
+    """Lädt die Prüfsummen-Datei auf dem Proxmox-Host (gleicher Netzweg wie der Download)."""
+    result = ssh_run(host, user, f"wget -qO- {shlex.quote(spec['sums_url'])}", capture=True, check=False)
+    return parse_checksums(result.stdout, spec["name"]) if result.returncode == 0 else None
+
+
+def fetch_checksum(host: str, user: str, spec: dict) -> str:
+    checksum = host_checksum(host, user, spec)
+    if not checksum:
+        fail(f"Keine Prüfsumme für {spec['name']} in {spec['sums_url']} gefunden.")
+    return checksum
+
+
+# =============================================================================
+# Index: welche Images liegen wo
+# =============================================================================
+#
+#   {"<host>": {"updated": 1700000000,
+#               "storages": {"local": false, "cephfs": true},      # shared?
+#               "volumes": {"pve1/local": ["debian-13-generic-amd64.qcow2.img"], …}}}
+
+def storage_targets(resources: list[dict], storage: str | None = None) -> list[dict]:
+    """Online-Nodes mit ISO-fähigem Storage aus `/cluster/resources`."""
+    online = {r["node"] for r in resources if r.get("type") == "node" and r.get("status") == "online"}
+    targets = []
+    for r in resources:
+        if r.get("type") != "storage" or r.get("node") not in online:
+            continue
+        if r.get("status", "available") != "available" or "iso" not in (r.get("content") or "").split(","):
+            continue
+        if storage and r["storage"] != storage:
+            continue
+        targets.append({"node": r["node"], "storage": r["storage"], "shared": bool(r.get("shared"))})
+    return sorted(targets, key=lambda t: (t["storage"], t["node"]))
+
+
+def download_targets(targets: list[dict]) -> list[dict]:
+    """Ein Ziel pro gemeinsamem Storage, sonst eines pro Node."""
+    seen = set()
+    result = []
+    for target in targets:
+        key = target["storage"] if target["shared"] else (target["node"], target["storage"])
+        if key not in seen:
+            seen.add(key)
+            result.append(target)
+    return result
+
+
+def _load_index() -> dict:
+    if not INDEX_FILE.exists():
+        return {}
+    try:
+        return json.loads(INDEX_FILE.read_text())
+    except json.JSONDecodeError:
+        return {}
+
+
+def _save_index(index: dict):
+    INDEX_FILE.write_text(json.dumps(index, indent=4))
+
+
+async def _list_content(host: str, user: str, target: dict) -> list[str]:
+    result = await ssh_run_async(
+        host, user,
+        f"pvesh get /nodes/{target['node']}/storage/{target['storage']}/content --content iso --output-format json",
+        timeout=60,
+    )
+    return sorted(entry["volid"].split("/", 1)[-1] for entry in json.loads(result.stdout or "[]"))
+
+
+async def _list_all(host: str, user: str, targets: list[dict]) -> dict[str, list[str]]:
+    listed = download_targets(targets)
+    contents = await asyncio.gather(*(_list_content(host, user, t) for t in listed), return_exceptions=True)
+    by_key = {}
+    for target, content in zip(listed, contents, strict=True):
+        if not isinstance(content, BaseException):
+            by_key[target["storage"] if target["shared"] else (target["node"], target["storage"])] = content
+    volumes = {}
+    for target in targets:
+        key = target["storage"] if target["shared"] else (target["node"], target["storage"])
+        if key in by_key:
+            volumes[f"{target['node']}/{target['storage']}"] = by_key[key]
+    return volumes
+
+
+def refresh_index(host: str, user: str, resources: list[dict] | None = None) -> dict:
+    """Liest ISO-Inhalte aller Nodes/Storages neu ein (ein SSH-Aufruf pro Node bzw. gemeinsamem Storage)."""
+    targets = storage_targets(resources if resources is not None else fetch_cluster_resources(host, user))
+    entry = {
+        "updated": time.time(),
+        "storages": {t["storage"]: t["shared"] for t in targets},
+        "volumes": asyncio.run(_list_all(host, user, targets)),
+    }
+    index = _load_index()
+    index[host] = entry
+    _save_index(index)
+    return entry
+
+
+def load_index(host: str, user: str, max_age: float = INDEX_MAX_AGE, resources: list[dict] | None = None) -> dict:
+    entry = _load_index().get(host)
+    if entry and time.time() - entry.get("updated", 0) <= max_age:
+        return entry
+    return refresh_index(host, user, resources)
+
+
+def record_volume(host: str, node: str, storage: str, filename: str, shared: bool = False):
+    """Trägt ein geladenes Image ein – bei gemeinsamem Storage für alle Nodes."""
+    index = _load_index()
+    entry = index.setdefault(host, {"updated": 0, "storages": {}, "volumes": {}})
+    keys = [key for key in entry["volumes"] if key.split("/", 1)[1] == storage] if shared else []
+    for key in keys or [f"{node}/{storage}"]:
+        files = entry["volumes"].setdefault(key, [])
+        if filename not in files:
+            files.append(filename)
+            files.sort()
+    _save_index(index)
+
+
+def missing_targets(entry: dict, targets: list[dict], filename: str) -> list[dict]:
+    return [t for t in targets if filename not in entry["volumes"].get(f"{t['node']}/{t['storage']}", [])]
+
+
+# =============================================================================
+# Download
+# =============================================================================
+
+def download_command(node: str, storage: str, spec: dict, checksum: str) -> str:
+    return (
+        f"pvesh create /nodes/{node}/storage/{storage}/download-url"
+        f" --content iso --filename {shlex.quote(spec['filename'])} --url {shlex.quote(spec['url'])}"
+        f" --checksum {checksum} --checksum-algorithm {spec['algorithm']}"
+    )
+
+
+async def download_all(host: str, user: str, targets: list[dict], spec: dict, checksum: str) -> list[dict]:
+    """Lädt parallel auf alle Ziele; Ergebnis pro Ziel mit Dauer und Fehler."""
+
+    async def one(target: dict) -> dict:
+        started = time.monotonic()
+        try:
+            await ssh_run_async(host, user, download_command(target["node"], target["storage"], spec, checksum),
+                                timeout=DOWNLOAD_TIMEOUT)
+            error = None
+        except CommandError as e:
+            error = str(e)
+        return {**target, "seconds": round(time.monotonic() - started, 1), "error": error}
+
+    return await asyncio.gather(*(one(target) for target in targets))
+
+
+def _volume_path(host: str, user: str, storage: str, filename: str) -> str | None:
+    volume = shlex.quote(f"{storage}:iso/{filename}")
+    result = ssh_run(host, user, f'p=$(pvesm path {volume} 2>/dev/null) && test -f "$p" && echo "$p"',
+                     capture=True, check=False)
+    return result.stdout.strip() if result.returncode == 0 and result.stdout.strip() else None
+
+
+def _local_node(host: str, user: str) -> str:
+    return ssh_run(host, user, "hostname", capture=True).stdout.strip()
+
+
+def ensure_image(host: str, user: str, arch: str, distro: str, node: str | None = None,
+                 storage: str = DEFAULT_STORAGE) -> str:
+    """Stellt das Image auf dem Storage des Nodes bereit und gibt den Dateipfad für `qm importdisk` zurück."""
+    spec = image_spec(distro, arch)
+    path = known_image(host, storage, spec["filename"]) or _volume_path(host, user, storage, spec["filename"])
+    count_cache("proxmox_image", bool(path))
+    if path:
+        success(f"Basis-Image auf Proxmox vorhanden: {spec['filename']} ({storage})")
+        return path
+
+    print(f"⚠ Basis-Image fehlt auf Proxmox: {spec['filename']} ({storage})")
+    distro_label = distro.replace("/", " ").capitalize()
+    if not ask_yes_no(f"Soll das {distro_label} {arch} Cloud-Image direkt auf Proxmox heruntergeladen werden?"):
+        fail("Abbruch.")
+
+    node = node or _local_node(host, user)
+    checksum = None if os.environ.get(PUSH_ENV) else host_checksum(host, user, spec)
+    if not checksum:
+        if not os.environ.get(PUSH_ENV):
+            print("⚠ Der Host erreicht die Prüfsummen der Distribution nicht (kein Internet?) – "
+                  "das Image wird von hier übertragen.")
+        from .push import push_image  # lokaler Import um zirkuläre Imports zu vermeiden
+
+        path = push_image(host, user, arch, distro, storage, node)
+        record_image(host, storage, spec["filename"], path)
+        return path
+    progress(f"Proxmox lädt {spec['filename']} auf {node}/{storage} (Prüfsumme {spec['algorithm']})…")
+    result = asyncio.run(download_all(host, user, [{"node": node, "storage": storage, "shared": False}],
+                                      spec, checksum))[0]
+    if result["error"]:
+        fail(f"Download fehlgeschlagen: {result['error']}")
+    shared = _load_index().get(host, {}).get("storages", {}).get(storage, False)
+    record_volume(host, node, storage, spec["filename"], shared)
+
+    path = _volume_path(host, user, storage, spec["filename"])
+    if not path:
+        fail(f"Image {spec['filename']} nach dem Download nicht auf {storage} gefunden.")
+    record_image(host, storage, spec["filename"], path)
+    success(f"Basis-Image heruntergeladen und geprüft: {spec['filename']} ({result['seconds']} s)")
+    return path
+
+
+def prefetch(host: str, user: str, images: list[tuple[str, str]], storage: str | None = None,
+             nodes: list[str] | None = None, refresh: bool = False) -> list[dict]:
+    """Lädt die Images auf alle Nodes/Storages, denen sie fehlen – alle Downloads parallel."""
+    resources = fetch_cluster_resources(host, user)
+    entry = load_index(host, user, 0 if refresh else INDEX_MAX_AGE, resources)
+    targets = storage_targets(resources, storage or DEFAULT_STORAGE)
+    if nodes:
+        targets = [t for t in targets if t["node"] in nodes]
+    if not targets:
+        fail(f"Kein Online-Node mit Storage '{storage or DEFAULT_STORAGE}' für ISO-Inhalte gefunden.")
+
+    jobs = []
+    for distro, arch in images:
+        spec = image_spec(distro, arch)
+        missing = download_targets(missing_targets(entry, targets, spec["filename"]))
+        if missing:
+            jobs.append((spec, missing))
+        else:
+            success(f"{spec['filename']} liegt bereits auf allen Zielen.")
+    if not jobs:
+        return []
+
+    checksums = {spec["name"]: fetch_checksum(host, user, spec) for spec, _ in jobs}
+    for spec, missing in jobs:
+        where = ", ".join(f"{t['node']}/{t['storage']}" for t in missing)
+        progress(f"Lade {spec['filename']} parallel auf {where}…")
+
+    async def run_all() -> list[list[dict]]:
+        return await asyncio.gather(*(download_all(host, user, missing, spec, checksums[spec["name"]])
+                                      for spec, missing in jobs))
+
+    started = time.monotonic()
+    results = []
+    for (spec, _), outcome in zip(jobs, asyncio.run(run_all()), strict=True):
+        for result in outcome:
+            result["filename"] = spec["filename"]
+            if result["error"]:
+                print(f"  ❌ {result['node']}/{result['storage']}: {spec['filename']} – {result['error']}")
+            else:
+                record_volume(host, result["node"], result["storage"], spec["filename"], result["shared"])
+                print(f"  ✔ {result['node']}/{result['storage']}: {spec['filename']} ({result['seconds']} s)")
+            results.append(result)
+    failed = sum(1 for r in results if r["error"])
+    summary = f"{len(results) - failed} Download(s) in {time.monotonic() - started:.1f} s"
+    print(summary + (f", {failed} Fehler" if failed else ""))
+    return results
+
+
+def format_index(entry: dict) -> str:
+    if not entry.get("volumes"):
+        return "Keine ISO-Storages gefunden."
+    lines = []
+    for key in sorted(entry["volumes"]):
+        storage = key.split("/", 1)[1]
+        label = f"{key} (shared)" if entry["storages"].get(storage) else key
+        files = entry["volumes"][key]
+        lines.append(f"  {label}")
+        lines += [f"      {name}" for name in files] or ["      –"]
+    lines.append(f"Stand: vor {format_duration(time.time() - entry.get('updated', 0))}")
+    return "\n".join(lines)
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Cloud-Images auf Proxmox-Nodes bereitstellen")
+    parser.add_argument("--host", required=True, help="Proxmox Host")
+    parser.add_argument("--user", default="root", help="SSH-User")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_pre = sub.add_parser("prefetch", help="Images parallel auf alle Nodes laden")
+    p_pre.add_argument("--distro", action="append", help="Distro und Version (mehrfach, Standard: debian/13)")
+    p_pre.add_argument("--arch", action="append", choices=["amd64", "arm64"],
+                       help="Architektur (mehrfach, Standard: amd64)")
+    p_pre.add_argument("--storage", default=DEFAULT_STORAGE, help=f"Storage (Standard: {DEFAULT_STORAGE})")
+    p_pre.add_argument("--node", action="append", dest="nodes", help="Nur diese Nodes (mehrfach)")
+    p_pre.add_argument("--refresh", action="store_true", help="Index vorher neu einlesen")
+
+    p_push = sub.add_parser("push", help="Image von hier übertragen (Hosts ohne Internet)")
+    p_push.add_argument("--distro", default="debian/13", help="Distro und Version (Standard: debian/13)")
+    p_push.add_argument("--arch", choices=["amd64", "arm64"], default="amd64")
+    p_push.add_argument("--storage", default=DEFAULT_STORAGE, help=f"Storage (Standard: {DEFAULT_STORAGE})")
+
+    p_status = sub.add_parser("status", help="Index anzeigen")
+    p_status.add_argument("--refresh", action="store_true", help="Index neu einlesen")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        entry = refresh_index(args.host, args.user) if args.refresh else load_index(args.host, args.user)
+        print(format_index(entry))
+        return
+    if args.command == "push":
+        from .push import push_image
+
+        push_image(args.host, args.user, args.arch, args.distro, args.storage, _local_node(args.host, args.user))
+        return
+    images = [(distro, arch) for distro in args.distro or ["debian/13"] for arch in args.arch or ["amd64"]]
+    results = prefetch(args.host, args.user, images, args.storage, args.nodes, args.refresh)
+    if any(r["error"] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Ressourcenbasierte Platzierung von VMs im Proxmox-Cluster.
+
+Liest Auslastung von Nodes und Storages über `/cluster/resources` und wählt
+Node + Storage per Bin-Packing aus:
+
+- `spread` – möglichst gleichmäßig verteilen (meiste freie Ressourcen zuerst)
+- `pack`   – Nodes auffüllen, bevor der nächste verwendet wird
+
+Anti-Affinity-Gruppen werden als VM-Tag `aa-<gruppe>` geführt: VMs derselben
+Gruppe landen nie auf demselben Node.
+
+Ist nur der Storage 'auto', wird allein auf dem angegebenen Node gesucht.
+"""
+
+import argparse
+import json
+
+from debian_cloud_init.ui import fail, progress, success
+
+POLICIES = ("spread", "pack")
+
+# Maximales Verhältnis vergebener vCPUs zu physischen CPUs pro Node
+CPU_OVERCOMMIT = 4.0
+# Reserve, die auf jedem Node frei bleiben soll (Host-OS, ZFS-ARC, …)
+MEMORY_HEADROOM = 0.10
+
+_GIB = 1024 ** 3
+_MIB = 1024 ** 2
+
+AFFINITY_TAG_PREFIX = "aa-"
+
+
+# =============================================================================
+# Cluster-Zustand lesen
+# =============================================================================
+
+def fetch_cluster_resources(host: str, user: str) -> list[dict]:
+    from .vm import ssh_run  # lokaler Import um zirkuläre Imports zu vermeiden
+
+    result = ssh_run(host, user, "pvesh get /cluster/resources --output-format json", capture=True)
+    try:
+        return json.loads(result.stdout)
+    except json.JSONDecodeError as e:
+        fail(f"Ungültige Antwort von /cluster/resources: {e}")
+
+
+def fetch_node_addresses(host: str, user: str) -> dict[str, str]:
+    """Liefert {node: ip} aus `/cluster/status` (leer bei Einzel-Node ohne Cluster)."""
+    from .vm import ssh_run
+
+    result = ssh_run(host, user, "pvesh get /cluster/status --output-format json", capture=True, check=False)
+    if result.returncode != 0:
+        return {}
+    try:
+        entries = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return {}
+    return {e["name"]: e["ip"] for e in entries if e.get("type") == "node" and e.get("ip")}
+
+
+def _vm_groups(vm: dict) -> set[str]:
+    tags = vm.get("tags") or ""
+    return {
+        t[len(AFFINITY_TAG_PREFIX):]
+        for t in tags.replace(",", ";").split(";")
+        if t.startswith(AFFINITY_TAG_PREFIX)
+    }
+
+
+def cluster_state(resources: list[dict]) -> dict:
+    """Verdichtet `/cluster/resources` zu einem veränderbaren Planungszustand."""
+    nodes: dict[str, dict] = {}
+    for r in resources:
+        if r.get("type") != "node" or r.get("status") != "online":
+            continue
+        nodes[r["node"]] = {
+            "maxcpu": r.get("maxcpu", 0),
+            "cpu": r.get("cpu", 0.0),
+            "maxmem": r.get("maxmem", 0),
+            "mem": r.get("mem", 0),
+            "vcpus": 0,
+            "groups": set(),
+        }
+
+    storages: list[dict] = []
+    for r in resources:
+        if r.get("type") == "qemu" and r.get("node") in nodes:
+            node = nodes[r["node"]]
+            node["groups"] |= _vm_groups(r)
+            if r.get("status") == "running":
+                node["vcpus"] += r.get("maxcpu", 0)
+        elif r.get("type") == "storage" and r.get("status", "available") == "available":
+            if "images" not in (r.get("content") or "").split(","):
+                continue
+            storages.append({
+                "storage": r["storage"],
+                "node": r["node"],
+                "shared": bool(r.get("shared")),
+                "disk": r.get("disk", 0),
+                "maxdisk": r.get("maxdisk", 0),
+            })
+
+    return {"nodes": nodes, "storages": storages}
+
+
+# =============================================================================
+# Bewertung
+# =============================================================================
+
+def _free_fractions(node: dict, cores: int, memory_mb: int) -> tuple[float, float] | None:
+    """Freier Anteil von RAM und CPU nach der Platzierung, None wenn sie nicht passt."""
+    if not node["maxmem"] or not node["maxcpu"]:
+        return None
+
+    mem_after = node["mem"] + memory_mb * _MIB
+    if mem_after > node["maxmem"] * (1 - MEMORY_HEADROOM):
+        return None
+    if node["vcpus"] + cores > node["maxcpu"] * CPU_OVERCOMMIT:
+        return None
+
+    mem_free = 1 - mem_after / node["maxmem"]
+    # Aktuelle Last und vergebene vCPUs gleichermaßen berücksichtigen
+    committed = (node["vcpus"] + cores) / (node["maxcpu"] * CPU_OVERCOMMIT)
+    cpu_free = 1 - max(node["cpu"], committed)
+    return mem_free, cpu_free
+
+
+def score_node(node: dict, cores: int, memory_mb: int, policy: str = "spread") -> float | None:
+    fractions = _free_fractions(node, cores, memory_mb)
+    if fractions is None:
+        return None
+    free = sum(fractions) / 2
+    return free if policy == "spread" else -free
+
+
+def _storage_candidates(state: dict, node: str, disk_gb: int, storage: str | None) -> list[dict]:
+    needed = disk_gb * _GIB
+    return [
+        s for s in state["storages"]
+        if s["node"] == node
+        and (storage is None or s["storage"] == storage)
+        and s["maxdisk"] - s["disk"] >= needed
+    ]
+
+
+def score_storage(entry: dict, disk_gb: int, policy: str = "spread") -> float:
+    free = (entry["maxdisk"] - entry["disk"] - disk_gb * _GIB) / entry["maxdisk"]
+    return free if policy == "spread" else -free
+
+
+# =============================================================================
+# Platzierung
+# =============================================================================
+
+def place(state: dict, cores: int, memory_mb: int, disk_gb: int,
+          policy: str = "spread", group: str | None = None,
+          storage: str | None = None, node: str | None = None) -> dict | None:
+    """Wählt Node + Storage und bucht die Ressourcen im Zustand ein.
+
+    Mit `node` wird nur dieser Node betrachtet (nur der Storage ist offen).
+    Gibt {"node", "storage", "score"} zurück oder None, wenn nichts passt.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unbekannte Policy: {policy}")
+
+    best = None
+    for name, info in state["nodes"].items():
+        if node and name != node:
+            continue
+        if group and group in info["groups"]:
+            continue
+        node_score = score_node(info, cores, memory_mb, policy)
+        if node_score is None:
+            continue
+        candidates = _storage_candidates(state, name, disk_gb, storage)
+        if not candidates:
+            continue
+        target = max(candidates, key=lambda s: score_storage(s, disk_gb, policy))
+        if best is None or node_score > best[0]:
+            best = (node_score, name, target)
+
+    if best is None:
+        return None
+
+    node_score, name, target = best
+    info = state["nodes"][name]
+    info["mem"] += memory_mb * _MIB
+    info["vcpus"] += cores
+    if group:
+        info["groups"].add(group)
+    # Shared Storage taucht pro Node einmal auf – alle Einträge gemeinsam buchen
+    for s in state["storages"]:
+        if s["storage"] == target["storage"] and (s["shared"] or s["node"] == name):
+            s["disk"] += disk_gb * _GIB
+
+    return {"node": name, "storage": target["storage"], "score": round(node_score, 4)}
+
+
+def plan_fleet(state: dict, specs: list[dict], policy: str = "spread") -> dict[str, dict]:
+    """Platziert mehrere VMs nacheinander (größte zuerst, First-Fit-Decreasing).
+
+    Jede Platzierung wird sofort im Zustand eingebucht, dadurch wird ein Node
+    innerhalb eines Batches nicht überbucht, während andere leer stehen.
+    specs: [{"name", "cores", "memory", "disk_gb", "group"?, "storage"?, "node"?}, …]
+    """
+    ordered = sorted(specs, key=lambda s: (s["memory"], s["cores"], s["disk_gb"]), reverse=True)
+    plan = {}
+    for spec in ordered:
+        result = place(
+            state, spec["cores"], spec["memory"], spec["disk_gb"],
+            policy=policy, group=spec.get("group"), storage=spec.get("storage"), node=spec.get("node"),
+        )
+        if result is None:
+            fail(f"Keine passende Node/Storage-Kombination für '{spec['name']}' gefunden.")
+        plan[spec["name"]] = result
+    return plan
+
+
+def choose_placement(host: str, user: str, cores: int, memory_mb: int, disk_gb: int,
+                     policy: str = "spread", group: str | None = None,
+                     storage: str | None = None, node: str | None = None) -> dict:
+    """Platziert eine einzelne VM anhand der aktuellen Cluster-Auslastung."""
+    progress("Ermittle Cluster-Auslastung…")
+    state = cluster_state(fetch_cluster_resources(host, user))
+    result = place(state, cores, memory_mb, disk_gb, policy=policy, group=group, storage=storage, node=node)
+    if result is None:
+        if node:
+            fail(f"Node '{node}' hat nicht genug freie Ressourcen ({cores} Kerne, {memory_mb} MB, {disk_gb} GB).")
+        fail("Kein Node mit ausreichend freien Ressourcen gefunden.")
+    result["address"] = fetch_node_addresses(host, user).get(result["node"])
+    success(f"Platzierung: Node {result['node']}, Storage {result['storage']} (Policy: {policy})")
+    return result
+
+
+# =============================================================================
+# CLI: Platzierungsplan für eine Flotte anzeigen
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Platzierungsplan für Proxmox-VMs berechnen")
+    parser.add_argument("--host", required=True, help="Proxmox Host")
+    parser.add_argument("--user", default="root", help="SSH-User")
+    parser.add_argument("--count", type=int, default=1, help="Anzahl VMs")
+    parser.add_argument("--prefix", default="vm", help="Namenspräfix der VMs")
+    parser.add_argument("--cores", type=int, default=2)
+    parser.add_argument("--memory", type=int, default=4096, help="RAM in MB")
+    parser.add_argument("--disk", type=int, default=30, help="Disk in GB")
+    parser.add_argument("--policy", choices=POLICIES, default="spread")
+    parser.add_argument("--group", help="Anti-Affinity-Gruppe")
+    args = parser.parse_args()
+
+    state = cluster_state(fetch_cluster_resources(args.host, args.user))
+    specs = [
+        {"name": f"{args.prefix}{i + 1}", "cores": args.cores, "memory": args.memory,
+         "disk_gb": args.disk, "group": args.group}
+        for i in range(args.count)
+    ]
+    plan = plan_fleet(state, specs, policy=args.policy)
+
+    print("\n=== Platzierungsplan ===")
+    for name in sorted(plan):
+        print(f"  {name:<20} → {plan[name]['node']:<12} {plan[name]['storage']}")
+
+
+if __name__ == "__main__":
+    main()
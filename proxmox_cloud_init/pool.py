@@ -0,0 +1,162 @@
+"""Warm-Pool fertig provisionierter VMs auf Proxmox – Gegenstück zu `debian_cloud_init.pool`.
+
+Ledger, Auswahl und Metriken kommen aus dem libvirt-Modul; hier stehen nur
+die Proxmox-Operationen. Das Ledger liegt wie die Session im aktuellen
+Verzeichnis. Pool-VMs bekommen ihre ID aus dem konfigurierten VMID-Bereich
+(`.proxmox-vmid-ranges`), beim Claim wird die VM per `qm set --name` auf den
+gewünschten Namen umbenannt.
+
+    python -m proxmox_cloud_init.pool configure --host pve1 --node pve1 --storage local-lvm \\
+        --bridge vmbr0 --vmid-range ci --size 3 --username ci --hashed-password '$6$…' --ssh-key ~/.ssh/id_ed25519.pub
+    python -m proxmox_cloud_init.pool claim --name build-42 --ssh-key ci.pub --json
+"""
+
+import argparse
+import json
+import pathlib
+import shlex
+
+from debian_cloud_init.pool import (
+    REQUIRED_SETTINGS,
+    add_configure_arguments,
+    add_pool_arguments,
+    add_pool_commands,
+    common_settings,
+    configure_pool,
+    injection_script,
+    key_slug,
+    pool_key,
+    run_pool_command,
+    spawn_refill,
+    ssh_inject,
+)
+
+from .profiles import PROFILES
+from .vmid import allocate_vmids
+
+POOL_FILE = pathlib.Path(".proxmox-pool.json")
+
+PROXMOX_SETTINGS = ("host", "ssh_user", "node", "storage", "snippets_path", "bridge")
+PROXMOX_DEFAULTS = {"ssh_user": "root", "snippets_path": "/var/lib/vz/snippets"}
+
+
+def _existing_vmids(host: str, user: str) -> set[str] | None:
+    from .vm import ssh_run
+
+    result = ssh_run(host, user, "pvesh get /cluster/resources --type vm --output-format json",
+                     capture=True, check=False)
+    if result.returncode != 0:
+        return None
+    try:
+        return {str(vm["vmid"]) for vm in json.loads(result.stdout)}
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+
+def _prune(ledger: dict):
+    """Entfernt Einträge von VMs, die es im Cluster nicht mehr gibt (pro Host eine Abfrage)."""
+    existing: dict[tuple[str, str], set[str] | None] = {}
+    for vm_id, entry in list(ledger["vms"].items()):
+        pool = ledger["pools"].get(entry["key"])
+        if pool is None or entry["state"] == "provisioning":
+            continue
+        target = (pool["host"], pool["ssh_user"])
+        if target not in existing:
+            existing[target] = _existing_vmids(*target)
+        if existing[target] is not None and vm_id not in existing[target]:
+            del ledger["vms"][vm_id]
+
+
+def _new_vm(key: str, pool: dict) -> str:
+    return str(allocate_vmids(pool["host"], pool["ssh_user"], 1, pool.get("vmid_range"))[0])
+
+
+def _provision(vm_id: str, key: str, pool: dict) -> str | None:
+    from debian_cloud_init.build import build_cloud_config
+
+    from .vm import create_vm, get_vm_ip, wait_for_cloud_init
+
+    distro, arch, profile = key.split("|")
+    cloud_init_file = POOL_FILE.with_name(f".proxmox-pool-{key_slug(key)}.yml")
+    build_cloud_config(
+        pathlib.Path(pool["templates"]), cloud_init_file,
+        username=pool["username"],
+        hashed_password=pool["hashed_password"],
+        ssh_key_content=pathlib.Path(pool["ssh_key"]).read_text().strip(),
+        arch=arch,
+        backend="proxmox",
+    )
+    vmid = int(vm_id)
+    if not create_vm(pool["host"], pool["ssh_user"], pool["node"], vmid, f"pool-{key_slug(key)}-{vmid}",
+                     arch, distro, pool["storage"], pool["bridge"], pool["snippets_path"], cloud_init_file,
+                     profile=profile):
+        return None
+    if not wait_for_cloud_init(pool["host"], pool["ssh_user"], vmid):
+        return None
+    return get_vm_ip(pool["host"], pool["ssh_user"], pool["node"], vmid)
+
+
+def _inject(vm_id: str, entry: dict, pool: dict, ssh_key: str, hostname: str) -> bool:
+    from .vm import guest_exec
+
+    script = injection_script(pool["username"], ssh_key, hostname)
+    result = guest_exec(pool["host"], pool["ssh_user"], int(vm_id), f"sh -c {shlex.quote(script)}")
+    if result is not None and result[0] == 0:
+        return True
+    return ssh_inject(pool["username"], entry["ip"], script)
+
+
+def _rename(vm_id: str, pool: dict, name: str):
+    from .vm import ssh_run
+
+    ssh_run(pool["host"], pool["ssh_user"], f"qm set {vm_id} --name {shlex.quote(name)}", check=False)
+
+
+def _discard(vm_id: str, pool: dict):
+    from .vm import delete_vm
+
+    delete_vm(pool["host"], pool["ssh_user"], int(vm_id), vm_id, skip_confirm=True)
+
+
+BACKEND = {
+    "prune": _prune,
+    "new_vm": _new_vm,
+    "provision": _provision,
+    "inject": _inject,
+    "rename": _rename,
+    "discard": _discard,
+    "refill": lambda: spawn_refill(__name__, POOL_FILE.with_suffix(".log")),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm-Pool fertig provisionierter VMs (Proxmox)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_conf = sub.add_parser("configure", help="Pool anlegen oder ändern")
+    add_pool_arguments(p_conf, PROFILES)
+    add_configure_arguments(p_conf)
+    p_conf.add_argument("--host", help="Proxmox-Host (SSH)")
+    p_conf.add_argument("--ssh-user", dest="ssh_user", help="SSH-Benutzer auf dem Host (Standard: root)")
+    p_conf.add_argument("--node", help="Proxmox-Node")
+    p_conf.add_argument("--storage", help="Storage für die Disks")
+    p_conf.add_argument("--snippets-path", dest="snippets_path", help="Snippets-Verzeichnis auf dem Host (Standard: /var/lib/vz/snippets)")
+    p_conf.add_argument("--bridge", help="Netzwerk-Bridge")
+    p_conf.add_argument("--vmid-range", dest="vmid_range", help="Benannter VMID-Bereich aus .proxmox-vmid-ranges")
+    add_pool_commands(sub, PROFILES)
+    args = parser.parse_args()
+
+    if args.command == "configure":
+        configure_pool(
+            POOL_FILE, pool_key(args.distro, args.arch, args.profile), REQUIRED_SETTINGS + PROXMOX_SETTINGS,
+            PROXMOX_DEFAULTS, **common_settings(args),
+            host=args.host, ssh_user=args.ssh_user, node=args.node,
+            storage=args.storage, snippets_path=args.snippets_path, bridge=args.bridge,
+            vmid_range=args.vmid_range,
+        )
+    else:
+        run_pool_command(args, POOL_FILE, BACKEND)
+
+
+if __name__ == "__main__":
+    main()
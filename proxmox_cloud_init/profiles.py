@@ -0,0 +1,69 @@
+"""Hardware-Profile für Proxmox-VMs – Gegenstück zu `debian_cloud_init.profiles`.
+
+Gleiche Profilnamen wie beim libvirt-Backend. Ein Profil legt Größe,
+SCSI-Controller (`virtio-scsi-single` = ein Controller + IOThread pro Disk),
+Disk-Optionen (iothread, discard, ssd, cache, aio), NIC-Queues, NUMA,
+Hugepages und Ballooning fest. `default` erzeugt exakt die bisherigen
+`qm`-Aufrufe.
+"""
+
+from debian_cloud_init.profiles import DEFAULT_PROFILE
+from debian_cloud_init.ui import fail
+
+PROFILES: dict[str, dict] = {
+    "default": {
+        "description": "bisheriges Verhalten: 2 Kerne, 4 GB, virtio-scsi-pci, Single-Queue-NIC",
+        "cores": 2, "memory": 4096, "scsihw": "virtio-scsi-pci", "disk": {},
+        "net_queues": 0, "numa": False, "hugepages": None, "balloon": None,
+    },
+    "balanced": {
+        "description": "2 Kerne, 4 GB, virtio-scsi-single + IOThread, discard/ssd, 2 NIC-Queues",
+        "cores": 2, "memory": 4096, "scsihw": "virtio-scsi-single",
+        "disk": {"iothread": 1, "discard": "on", "ssd": 1, "cache": "none", "aio": "native"},
+        "net_queues": 2, "numa": False, "hugepages": None, "balloon": None,
+    },
+    "database": {
+        "description": "4 Kerne, 8 GB, IOThread + io_uring, NUMA, 2 MB Hugepages, kein Ballooning",
+        "cores": 4, "memory": 8192, "scsihw": "virtio-scsi-single",
+        "disk": {"iothread": 1, "discard": "on", "ssd": 1, "cache": "none", "aio": "io_uring"},
+        # Hugepages lassen sich nicht ballonieren – Balloon-Gerät daher aus
+        "net_queues": 4, "numa": True, "hugepages": "2", "balloon": 0,
+    },
+    "build": {
+        "description": "8 Kerne, 16 GB, Writeback-Cache, 8 NIC-Queues, Ballooning bis 8 GB",
+        "cores": 8, "memory": 16384, "scsihw": "virtio-scsi-single",
+        "disk": {"iothread": 1, "discard": "on", "ssd": 1, "cache": "writeback", "aio": "threads"},
+        "net_queues": 8, "numa": False, "hugepages": None, "balloon": 8192,
+    },
+}
+
+
+def get_profile(name: str | None) -> dict:
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        fail(f"Unbekanntes Profil '{name}'. Verfügbar: {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def qm_create_options(profile: dict, bridge: str) -> str:
+    """Zusätzliche `qm create`-Parameter (Netzwerk, NUMA, Hugepages, Balloon) mit führendem Leerzeichen."""
+    net = f"virtio,bridge={bridge}"
+    if profile.get("net_queues"):
+        net += f",queues={profile['net_queues']}"
+    options = f" --net0 {net}"
+    if profile.get("numa"):
+        options += " --numa 1"
+    if profile.get("hugepages"):
+        options += f" --hugepages {profile['hugepages']}"
+    if profile.get("balloon") is not None:
+        options += f" --balloon {profile['balloon']}"
+    return options
+
+
+def disk_options(profile: dict) -> str:
+    """Optionen für `--scsi0 <disk>,…` (leer beim default-Profil)."""
+    return "".join(f",{key}={value}" for key, value in profile.get("disk", {}).items())
+
+
+def describe_profiles() -> str:
+    return "\n".join(f"  {name:<10} {p['description']}" for name, p in PROFILES.items())
@@ -0,0 +1,257 @@
+"""Basis-Images vom lokalen Cache auf Proxmox-Hosts ohne Internetzugang übertragen.
+
+Das Image aus ISOS_PATH (bei Bedarf lokal heruntergeladen) wird über SSH als
+zstd-Strom übertragen und auf dem Host direkt am Zielort im Storage
+entpackt – ohne Zwischenkopie lokal oder remote. Liegt dort schon eine
+ältere Fassung desselben Images (gleicher Dateiname, z.B. "latest"), werden
+nur geänderte Blöcke (`BLOCK_SIZE`) übertragen: der Host liefert SHA-256 pro
+Block (perl/Digest::SHA, auf jedem Proxmox vorhanden), geänderte Blöcke
+werden an ihrem Offset überschrieben. Zum Schluss wird die Prüfsumme der
+Zieldatei mit der lokalen verglichen.
+
+Benötigt `zstd` lokal und auf dem Host (Proxmox bringt es für vzdump mit).
+
+    python -m proxmox_cloud_init.images push --host 10.0.0.5 --distro debian/13 --arch amd64
+"""
+
+import hashlib
+import shlex
+import struct
+import subprocess
+import threading
+import time
+import urllib.request
+from collections.abc import Iterable, Iterator
+
+from debian_cloud_init.teardown import format_bytes
+from debian_cloud_init.ui import fail, progress, success
+from debian_cloud_init.vm import ISOS_PATH
+from debian_cloud_init.vm import ensure_base_image as ensure_local_image
+
+from .images import DEFAULT_STORAGE, image_spec, parse_checksums, record_volume
+from .vm import _SSH_OPTS, ssh_run
+
+BLOCK_SIZE = 4 * 1024 * 1024
+ZSTD_LEVEL = 3
+PROGRESS_INTERVAL = 0.5
+
+# Offset (8 Byte) + Länge (4 Byte), big-endian – passend zu unpack("Q>N") im Perl-Skript
+_FRAME_HEADER = struct.Struct(">QI")
+
+_BLOCK_HASHES = (
+    'use Digest::SHA qw(sha256_hex); open(my $f, "<", $ARGV[0]) or exit 0; binmode $f;'
+    ' while (read($f, my $b, $ARGV[1])) { print sha256_hex($b), "\\n" }'
+)
+
+_APPLY_FRAMES = (
+    'open(my $f, "+<", $ARGV[0]) or die "open: $!"; binmode $f; binmode STDIN;'
+    ' while ((my $n = read(STDIN, my $h, 12)) > 0) {'
+    ' $n == 12 or die "short header"; my ($o, $l) = unpack("Q>N", $h);'
+    ' read(STDIN, my $d, $l) == $l or die "short block";'
+    ' seek($f, $o, 0) or die "seek: $!"; print $f $d or die "write: $!"; }'
+    ' truncate($f, $ARGV[1]) or die "truncate: $!"; close($f) or die "close: $!";'
+)
+
+
+def _ssh_argv(host: str, user: str, cmd: str) -> list[str]:
+    return ["ssh", *_SSH_OPTS, f"{user}@{host}", cmd]
+
+
+def _run_remote(host: str, user: str, cmd: str) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(_ssh_argv(host, user, cmd), capture_output=True, text=True, check=False)
+
+
+# =============================================================================
+# Blöcke vergleichen
+# =============================================================================
+
+def scan_image(path, algorithm: str, block_size: int = BLOCK_SIZE) -> tuple[list[str], str]:
+    """SHA-256 pro Block und Prüfsumme der ganzen Datei in einem Durchlauf."""
+    blocks = []
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            blocks.append(hashlib.sha256(block).hexdigest())
+            digest.update(block)
+    return blocks, digest.hexdigest()
+
+
+def changed_blocks(local: list[str], remote: list[str]) -> list[int]:
+    return [i for i, digest in enumerate(local) if i >= len(remote) or remote[i] != digest]
+
+
+def delta_frames(path, blocks: list[int], block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Geänderte Blöcke als Frames (Header + Daten) für `_APPLY_FRAMES`."""
+    with open(path, "rb") as f:
+        for index in blocks:
+            f.seek(index * block_size)
+            data = f.read(block_size)
+            yield _FRAME_HEADER.pack(index * block_size, len(data)) + data
+
+
+def file_chunks(path, chunk_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+# =============================================================================
+# Übertragung
+# =============================================================================
+
+def _report(sent: int, total: int, wire: int, started: float, final: bool = False):
+    elapsed = max(time.monotonic() - started, 1e-6)
+    percent = 100 * sent / total if total else 100.0
+    line = (f"\r  {percent:5.1f}%  {format_bytes(sent)} / {format_bytes(total)}"
+            f"  {format_bytes(int(sent / elapsed))}/s  (übertragen: {format_bytes(wire)})")
+    print(line, end="\n" if final else "", flush=True)
+
+
+def stream(host: str, user: str, remote_cmd: str, chunks: Iterable[bytes], total: int) -> dict:
+    """Schickt `chunks` zstd-komprimiert an `remote_cmd` (liest von stdin) und meldet den Fortschritt.
+
+    Beendet sich die Gegenseite vorzeitig (SSH-Anmeldung, volle Platte, `die` im
+    Perl-Skript), wird zstd weiter geleert und nichts mehr nachgeschoben – sonst
+    blockieren beide Pipes gegenseitig.
+    """
+    ssh = subprocess.Popen(_ssh_argv(host, user, remote_cmd), stdin=subprocess.PIPE,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    zstd = subprocess.Popen(["zstd", "-q", "-c", f"-{ZSTD_LEVEL}", "-T0"],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert ssh.stdin is not None and ssh.stderr is not None
+    assert zstd.stdin is not None and zstd.stdout is not None
+    ssh_in, ssh_err, zstd_in, zstd_out = ssh.stdin, ssh.stderr, zstd.stdin, zstd.stdout
+    wire = [0]
+
+    def pump():
+        broken = False
+        while data := zstd_out.read(1024 * 1024):
+            if broken:
+                continue
+            try:
+                ssh_in.write(data)
+                wire[0] += len(data)
+            except BrokenPipeError:
+                broken = True
+        try:
+            ssh_in.close()
+        except BrokenPipeError:
+            pass
+
+    pumper = threading.Thread(target=pump, daemon=True)
+    pumper.start()
+    started = last = time.monotonic()
+    sent = 0
+    try:
+        for chunk in chunks:
+            if ssh.poll() is not None:
+                break
+            zstd_in.write(chunk)
+            sent += len(chunk)
+            if time.monotonic() - last >= PROGRESS_INTERVAL:
+                _report(sent, total, wire[0], started)
+                last = time.monotonic()
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            zstd_in.close()
+        except BrokenPipeError:
+            pass
+        zstd.wait()
+        pumper.join()
+        stderr = ssh_err.read().decode(errors="replace")
+        ssh.wait()
+    _report(sent, total, wire[0], started, final=True)
+    if ssh.returncode != 0 or zstd.returncode != 0:
+        fail(f"Übertragung fehlgeschlagen: {stderr.strip() or f'Exit-Code {ssh.returncode}'}")
+    return {"sent": sent, "wire": wire[0], "seconds": round(time.monotonic() - started, 1)}
+
+
+def _resolve_path(host: str, user: str, storage: str, filename: str) -> str:
+    result = ssh_run(host, user, f"pvesm path {shlex.quote(f'{storage}:iso/{filename}')}", capture=True)
+    return result.stdout.strip()
+
+
+def _remote_blocks(host: str, user: str, path: str) -> list[str]:
+    result = _run_remote(host, user, f"perl -e {shlex.quote(_BLOCK_HASHES)} {shlex.quote(path)} {BLOCK_SIZE}")
+    return result.stdout.split() if result.returncode == 0 else []
+
+
+def _remote_checksum(host: str, user: str, path: str, algorithm: str) -> str:
+    result = _run_remote(host, user, f"{algorithm}sum {shlex.quote(path)}")
+    return result.stdout.split()[0] if result.returncode == 0 and result.stdout.strip() else ""
+
+
+def _commit_part(host: str, user: str, path: str, algorithm: str, checksum: str):
+    """`<path>.part` nur nach passender Prüfsumme an die Stelle des Images schieben.
+
+    So bleibt bei Abbruch oder Fehler das alte Image unverändert – `known_image`
+    würde sonst beim nächsten Lauf eine kaputte Basis ausliefern.
+    """
+    part = f"{path}.part"
+    remote_checksum = _remote_checksum(host, user, part, algorithm)
+    if remote_checksum != checksum:
+        _run_remote(host, user, f"rm -f {shlex.quote(part)}")
+        fail(f"Prüfsumme auf {host} stimmt nicht: {remote_checksum or 'nicht lesbar'} ≠ {checksum}")
+    result = _run_remote(host, user, f"mv -f {shlex.quote(part)} {shlex.quote(path)}")
+    if result.returncode != 0:
+        fail(f"Image auf {host} nicht ersetzbar: {result.stderr.strip()}")
+
+
+def _published_checksum(spec: dict) -> str | None:
+    """Prüfsumme aus SHA*SUMS der Distribution (lokal abgerufen; None ohne Netz)."""
+    try:
+        with urllib.request.urlopen(spec["sums_url"], timeout=10) as response:
+            return parse_checksums(response.read().decode(), spec["name"])
+    except OSError:
+        return None
+
+
+def push_image(host: str, user: str, arch: str, distro: str, storage: str = DEFAULT_STORAGE,
+               node: str | None = None) -> str:
+    """Überträgt das Image in den Storage des Hosts; gibt den Remote-Pfad zurück."""
+    spec = image_spec(distro, arch)
+    ensure_local_image(arch, distro)
+    local = ISOS_PATH / spec["name"]
+
+    progress(f"Prüfe {spec['name']} lokal und auf {host}…")
+    blocks, checksum = scan_image(local, spec["algorithm"], BLOCK_SIZE)
+    published = _published_checksum(spec)
+    if published and published != checksum:
+        print(f"⚠ Lokales Image weicht von {spec['sums_url']} ab (veraltet?) – übertrage trotzdem die lokale Fassung.")
+    path = _resolve_path(host, user, storage, spec["filename"])
+    remote = _remote_blocks(host, user, path)
+    size = local.stat().st_size
+    quoted = shlex.quote(path)
+    part = shlex.quote(f"{path}.part")
+    cleanup = f"|| {{ rm -f {part}; exit 1; }}"
+
+    if remote:
+        changed = changed_blocks(blocks, remote)
+        if not changed and len(remote) == len(blocks):
+            print("  Remote-Image ist bereits aktuell.")
+            result = {"sent": 0, "wire": 0, "seconds": 0.0}
+            remote_checksum = _remote_checksum(host, user, path, spec["algorithm"])
+            if remote_checksum != checksum:
+                fail(f"Prüfsumme auf {host} stimmt nicht: {remote_checksum or 'nicht lesbar'} ≠ {checksum}")
+        else:
+            progress(f"Übertrage {len(changed)} von {len(blocks)} Blöcken nach {host}:{path}…")
+            total = sum(min(BLOCK_SIZE, size - i * BLOCK_SIZE) for i in changed)
+            result = stream(host, user,
+                            f"set -o pipefail; cp --reflink=auto {quoted} {part}"
+                            f" && zstd -dc | perl -e {shlex.quote(_APPLY_FRAMES)} {part} {size} {cleanup}",
+                            delta_frames(local, changed, BLOCK_SIZE), total)
+            _commit_part(host, user, path, spec["algorithm"], checksum)
+    else:
+        progress(f"Übertrage {spec['name']} nach {host}:{path}…")
+        result = stream(host, user, f"set -o pipefail; zstd -dc > {part} {cleanup}", file_chunks(local), size)
+        _commit_part(host, user, path, spec["algorithm"], checksum)
+
+    if node:
+        record_volume(host, node, storage, spec["filename"])
+    ratio = f", Kompression {result['sent'] / result['wire']:.1f}x" if result["wire"] else ""
+    success(f"{spec['filename']} auf {host} ({format_bytes(result['wire'])} in {result['seconds']} s{ratio}).")
+    origin = " = SHA*SUMS der Distribution" if published == checksum else ""
+    print(f"{spec['algorithm']}: {checksum} (geprüft auf {host}{origin})")
+    return path
@@ -0,0 +1,305 @@
+"""Deklarativer Modus für Proxmox – Gegenstück zu `debian_cloud_init.reconcile`.
+
+Plan, paralleles Anwenden und State kommen aus dem libvirt-Modul; hier
+stehen nur die Proxmox-Operationen. Der Ist-Zustand kommt pro Host aus
+einem einzigen SSH-Aufruf (`/cluster/resources` und das Snippets-
+Verzeichnis). VMs werden über die gemerkte VMID gefunden, sonst über den
+Namen (adopt). Start, Resize und Löschen laufen über `pvesh` mit dem Node
+der VM und funktionieren daher von jedem Cluster-Knoten aus.
+
+Spec wie beim libvirt-Modus, zusätzlich host, node, storage, bridge und
+optional ssh_user, snippets_path, disk (Standard 30G), vmid_range, group,
+placement (Policy, Standard spread). Mit node und/oder storage 'auto' werden
+alle neu anzulegenden VMs eines Hosts gemeinsam per `plan_fleet` platziert.
+
+    python -m proxmox_cloud_init.reconcile plan lab.yml
+    python -m proxmox_cloud_init.reconcile apply lab.yml --limit 8
+"""
+
+import argparse
+import json
+import math
+import pathlib
+import tempfile
+
+from debian_cloud_init.build import build_cloud_config
+from debian_cloud_init.metrics import record_run
+from debian_cloud_init.overlay import parse_size
+from debian_cloud_init.rebuild import config_hash
+from debian_cloud_init.reconcile import (
+    REQUIRED_SETTINGS,
+    add_reconcile_arguments,
+    reconcile,
+)
+from debian_cloud_init.seed_server import seed_url
+from debian_cloud_init.ui import fail, progress, success
+from debian_cloud_init.workspace import (
+    USER_DATA,
+    ensure_workspace,
+    record_applied,
+    remove_workspace,
+    workspace_dir,
+)
+
+from .facts import BACKEND as BACKEND_NAME
+from .placement import (
+    POLICIES,
+    cluster_state,
+    fetch_cluster_resources,
+    fetch_node_addresses,
+    plan_fleet,
+)
+from .profiles import DEFAULT_PROFILE, PROFILES
+from .teardown import destroy_script, tombstone_vm
+from .vm import create_vm, ensure_base_image, ssh_run, upload_snippets
+from .vmid import allocate_vmids
+
+STATE_FILE = pathlib.Path(".proxmox-reconcile-state.json")
+
+PROXMOX_SETTINGS = ("host", "node", "storage", "bridge")
+DEFAULTS = {
+    "distro": "debian/13",
+    "arch": "amd64",
+    "profile": DEFAULT_PROFILE,
+    "ssh_user": "root",
+    "snippets_path": "/var/lib/vz/snippets",
+    "disk": "30G",
+    "placement": "spread",
+}
+
+_GIB = 1024 ** 3
+_SNIPPETS = ("user-data", "meta-data", "network-config")
+
+
+# =============================================================================
+# Soll- und Ist-Zustand
+# =============================================================================
+
+def _render(spec: dict, target: pathlib.Path):
+    build_cloud_config(
+        pathlib.Path(spec["templates"]), target,
+        username=spec["username"],
+        hashed_password=spec["hashed_password"],
+        ssh_key_content=pathlib.Path(spec["ssh_key"]).read_text().strip(),
+        arch=spec["arch"],
+        backend="proxmox",
+    )
+
+
+def _desire(name: str, spec: dict) -> dict:
+    if spec["profile"] not in PROFILES:
+        fail(f"VM '{name}': unbekanntes Profil '{spec['profile']}'.")
+    if spec["placement"] not in POLICIES:
+        fail(f"VM '{name}': unbekannte Placement-Policy '{spec['placement']}'.")
+    # Die Disk-Größe wird per resize angepasst und zählt deshalb nicht zum Hash
+    params = {key: spec.get(key) for key in ("distro", "arch", "username", "node", "storage", "bridge",
+                                              "profile", "group")}
+    # Wie beim libvirt-Modus nur für den Hash rendern, der Workspace ändert sich erst mit create/recreate
+    with tempfile.TemporaryDirectory() as tmp:
+        target = pathlib.Path(tmp) / USER_DATA
+        _render(spec, target)
+        digest = config_hash(target, params)
+    # host, ssh_user und snippets_path landen im State – für VMs, die später aus der Spec fallen
+    return {"hash": digest, "disk": parse_size(spec["disk"]),
+            "host": spec["host"], "ssh_user": spec["ssh_user"], "snippets_path": spec["snippets_path"]}
+
+
+def inspect_script(snippets_path: str) -> str:
+    return (
+        "echo '@@resources'; pvesh get /cluster/resources --type vm --output-format json\n"
+        f"echo '@@snippets'; ls -1 {snippets_path} 2>/dev/null\n"
+    )
+
+
+def parse_inspect(output: str) -> tuple[list[dict], set[str]]:
+    """Zerlegt die Ausgabe von `inspect_script` in VMs (ohne Tombstones) und Snippet-Dateien."""
+    sections: dict[str, list[str]] = {}
+    current = None
+    for line in output.splitlines():
+        if line.startswith("@@"):
+            current = line[2:].strip()
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    try:
+        resources = json.loads("\n".join(sections.get("resources", [])) or "[]")
+    except json.JSONDecodeError:
+        resources = []
+    vms = [vm for vm in resources if isinstance(vm, dict) and vm.get("type") == "qemu"
+           and "tombstone" not in str(vm.get("tags", ""))]
+    return vms, {line.strip() for line in sections.get("snippets", []) if line.strip()}
+
+
+def match_vm(name: str, vms: list[dict], vmid: int | None) -> dict | None:
+    """Die gemerkte VMID gewinnt; sonst die erste VM mit dem Namen."""
+    for vm in vms:
+        if vmid is not None and vm.get("vmid") == vmid and vm.get("name") == name:
+            return vm
+    return next((vm for vm in vms if vm.get("name") == name), None)
+
+
+def _inspect(specs: dict[str, dict], state: dict[str, dict]) -> dict[str, dict]:
+    targets: dict[tuple[str, str, str], list[str]] = {}
+    for name in specs.keys() | state.keys():
+        source = specs.get(name) or state[name]
+        if not source.get("host"):
+            continue
+        key = (source["host"], source.get("ssh_user", "root"), source.get("snippets_path", DEFAULTS["snippets_path"]))
+        targets.setdefault(key, []).append(name)
+
+    observed = {}
+    for (host, user, snippets_path), names in sorted(targets.items()):
+        progress(f"Lese Zustand von {host}…")
+        result = ssh_run(host, user, inspect_script(snippets_path), capture=True, check=False)
+        if result.returncode != 0:
+            fail(f"Zustand von {host} nicht lesbar: {result.stderr.strip()}")
+        vms, snippets = parse_inspect(result.stdout)
+        for name in names:
+            vm = match_vm(name, vms, state.get(name, {}).get("vmid"))
+            if vm is None:
+                continue
+            observed[name] = {
+                "state": vm.get("status", "unknown"),
+                "disk": vm.get("maxdisk") or None,
+                # Mit Seed-Server gibt es keine Snippets, die fehlen könnten
+                "seed": None if seed_url() else all(f"{name}-{kind}.yml" in snippets for kind in _SNIPPETS),
+                "broken": None,
+                "record": {"vmid": vm["vmid"], "node": vm["node"]},
+            }
+    return observed
+
+
+# =============================================================================
+# Aktionen
+# =============================================================================
+
+def _fleet_spec(name: str, spec: dict) -> dict:
+    profile = PROFILES[spec["profile"]]
+    return {
+        "name": name, "cores": profile["cores"], "memory": profile["memory"],
+        "disk_gb": math.ceil(parse_size(spec["disk"]) / _GIB), "group": spec.get("group"),
+        "node": None if spec["node"] == "auto" else spec["node"],
+        "storage": None if spec["storage"] == "auto" else spec["storage"],
+    }
+
+
+def _place(names: list[str], specs: dict[str, dict]):
+    """Platziert VMs mit node/storage 'auto' gemeinsam, ein Cluster-Zustand und Plan pro Host und Policy.
+
+    Ergebnis landet in der Spec: node, storage und die Adresse des Ziel-Nodes für `qm create`.
+    """
+    batches: dict[tuple[str, str, str], list[str]] = {}
+    for name in names:
+        spec = specs[name]
+        batches.setdefault((spec["host"], spec["ssh_user"], spec["placement"]), []).append(name)
+    for (host, user, policy), batch in sorted(batches.items()):
+        progress(f"Ermittle Cluster-Auslastung von {host}…")
+        state = cluster_state(fetch_cluster_resources(host, user))
+        addresses = fetch_node_addresses(host, user)
+        plan = plan_fleet(state, [_fleet_spec(name, specs[name]) for name in batch], policy=policy)
+        for name, result in plan.items():
+            specs[name].update(node=result["node"], storage=result["storage"], address=addresses.get(result["node"]))
+            success(f"Platzierung '{name}': Node {result['node']}, Storage {result['storage']} (Policy: {policy})")
+
+
+def _prepare(actions: list[dict], specs: dict[str, dict]):
+    """Platziert neue VMs und stellt jedes benötigte Cloud-Image einmal pro Node bereit, bevor die VMs parallel entstehen."""
+    building = [a["name"] for a in actions if a["action"] in ("create", "recreate")]
+    _place([name for name in building if "auto" in (specs[name]["node"], specs[name]["storage"])], specs)
+    images = set()
+    for name in building:
+        spec = specs[name]
+        images.add((spec["host"], spec["ssh_user"], spec["arch"], spec["distro"], spec["node"]))
+    for host, user, arch, distro, node in sorted(images):
+        ensure_base_image(host, user, arch, distro, node)
+
+
+def _build(name: str, spec: dict, entry: dict, vmid: int):
+    cloud_init_file = ensure_workspace(workspace_dir(name, BACKEND_NAME)) / USER_DATA
+    _render(spec, cloud_init_file)
+    # Nach automatischer Platzierung läuft qm create auf dem Ziel-Node
+    if not create_vm(spec.get("address") or spec["host"], spec["ssh_user"], spec["node"], vmid, name,
+                     spec["arch"], spec["distro"], spec["storage"], spec["bridge"],
+                     spec["snippets_path"], cloud_init_file, group=spec.get("group"),
+                     profile=spec["profile"], disk_gb=math.ceil(parse_size(spec["disk"]) / _GIB)):
+        fail(f"VM '{name}' wurde nicht angelegt.")
+    record_applied(cloud_init_file.parent)
+    entry.update(vmid=vmid, node=spec["node"])
+
+
+def _create(name: str, spec: dict, entry: dict):
+    _build(name, spec, entry, allocate_vmids(spec["host"], spec["ssh_user"], 1, spec.get("vmid_range"))[0])
+
+
+def _destroy(entry: dict):
+    ssh_run(entry["host"], entry["ssh_user"], destroy_script(entry["node"], entry["vmid"]))
+    success(f"VM {entry['vmid']} gelöscht.")
+
+
+def _recreate(name: str, spec: dict, entry: dict):
+    if entry.get("host", spec["host"]) != spec["host"]:
+        # Anderer Host bzw. Cluster: dort löschen, hier neu anlegen
+        _destroy(entry)
+        _create(name, spec, entry)
+        return
+    _build(name, spec, entry, tombstone_vm(spec["host"], spec["ssh_user"], entry["vmid"], name))
+
+
+def _start(name: str, spec: dict, entry: dict):
+    ssh_run(spec["host"], spec["ssh_user"], f"pvesh create /nodes/{entry['node']}/qemu/{entry['vmid']}/status/start")
+    success(f"VM '{name}' ({entry['vmid']}) gestartet.")
+
+
+def _reseed(name: str, spec: dict, entry: dict):
+    cloud_init_file = ensure_workspace(workspace_dir(name, BACKEND_NAME)) / USER_DATA
+    if not cloud_init_file.exists():
+        # Unveränderter Hash: derselbe Stand, mit dem die VM angelegt wurde
+        _render(spec, cloud_init_file)
+    upload_snippets(spec["host"], spec["ssh_user"], spec["snippets_path"], name, cloud_init_file)
+
+
+def _resize(name: str, spec: dict, entry: dict):
+    disk_gb = math.ceil(parse_size(spec["disk"]) / _GIB)
+    ssh_run(spec["host"], spec["ssh_user"],
+            f"pvesh set /nodes/{entry['node']}/qemu/{entry['vmid']}/resize --disk scsi0 --size {disk_gb}G")
+    success(f"Disk von '{name}' auf {disk_gb}G vergrößert.")
+
+
+def _adopt(name: str, spec: dict, entry: dict):
+    success(f"VM '{name}' ({entry['vmid']}) übernommen.")
+
+
+def _delete(name: str, spec: dict | None, entry: dict):
+    _destroy(entry)
+    remove_workspace(name, BACKEND_NAME)
+
+
+BACKEND = {
+    "state_file": STATE_FILE,
+    "required": REQUIRED_SETTINGS + PROXMOX_SETTINGS,
+    "defaults": DEFAULTS,
+    "desire": _desire,
+    "inspect": _inspect,
+    "prepare": _prepare,
+    "actions": {
+        "create": _create,
+        "recreate": _recreate,
+        "start": _start,
+        "reseed": _reseed,
+        "resize": _resize,
+        "adopt": _adopt,
+        "delete": _delete,
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VMs deklarativ an eine Spec angleichen (Proxmox)")
+    add_reconcile_arguments(parser)
+    args = parser.parse_args()
+    with record_run("proxmox"):
+        reconcile(args.spec, BACKEND, apply=args.command == "apply", limit=args.limit, assume_yes=args.yes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Template-Änderungen in laufende Proxmox-VMs bringen – Gegenstück zu `debian_cloud_init.reprovision`.
+
+Vergleich und Ablauf kommen aus dem libvirt-Modul. Ob eine VM läuft, steht
+pro Host in einem `/cluster/resources`-Aufruf; das Update-Skript läuft über
+den Guest-Agent (`qm guest exec --pass-stdin`) und braucht daher weder
+SSH-Zugang zur VM noch ihre IP.
+
+    python -m proxmox_cloud_init.reprovision --dry-run
+    python -m proxmox_cloud_init.reprovision --match 'lab-*' --watch
+"""
+
+import argparse
+import json
+
+from debian_cloud_init.engine import CommandError
+from debian_cloud_init.metrics import record_run
+from debian_cloud_init.reprovision import (
+    SCRIPT_TIMEOUT,
+    add_reprovision_arguments,
+    run_reprovision,
+)
+
+from .facts import BACKEND as BACKEND_NAME
+from .session import all_sessions, update_session
+from .vm import ssh_run, ssh_run_async
+
+
+def _running(sessions: dict[str, dict]) -> set[str]:
+    running = set()
+    hosts = {(s["proxmox_host"], s["proxmox_ssh_user"]) for s in sessions.values()}
+    for host, user in sorted(hosts):
+        result = ssh_run(host, user, "pvesh get /cluster/resources --type vm --output-format json",
+                         capture=True, check=False)
+        try:
+            vms = json.loads(result.stdout) if result.returncode == 0 else []
+        except json.JSONDecodeError:
+            vms = []
+        active = {vm.get("vmid") for vm in vms if vm.get("status") == "running"}
+        running |= {name for name, s in sessions.items()
+                    if (s["proxmox_host"], s["proxmox_ssh_user"]) == (host, user) and s["proxmox_vmid"] in active}
+    return running
+
+
+def guest_command(vmid: int) -> str:
+    return f"qm guest exec {vmid} --timeout {SCRIPT_TIMEOUT} --pass-stdin 1 -- sh"
+
+
+async def _execute(name: str, session: dict, script: str):
+    vmid = session["proxmox_vmid"]
+    result = await ssh_run_async(session["proxmox_host"], session["proxmox_ssh_user"], guest_command(vmid),
+                                 input=script, timeout=SCRIPT_TIMEOUT + 60)
+    # qm endet mit 0, sobald der Agent antwortet – maßgeblich ist der Exit-Code im Gast
+    argv = ["qm", "guest", "exec", str(vmid)]
+    try:
+        data = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        raise CommandError(argv, None, result.stdout, "Antwort des Guest-Agents unlesbar") from None
+    if data.get("exitcode", 1) != 0:
+        raise CommandError(argv, data.get("exitcode"), data.get("out-data", ""), data.get("err-data", ""))
+
+
+BACKEND = {
+    "workspace": BACKEND_NAME,
+    "build": "proxmox",
+    "sessions": all_sessions,
+    "update_session": update_session,
+    "running": _running,
+    "execute": _execute,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template-Änderungen in laufende VMs übernehmen (Proxmox)")
+    add_reprovision_arguments(parser)
+    args = parser.parse_args()
+    with record_run("proxmox"):
+        run_reprovision(args, BACKEND)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@ import pathlib
 import subprocess
 
 from debian_cloud_init.ui import ask_yes_no, fail, progress
+from debian_cloud_init.workspace import workspace_dir, write_atomic
+
+from .facts import BACKEND, host_facts, node_bridges, node_storages
+from .profiles import get_profile
 
 SESSION_FILE = pathlib.Path(".proxmox-session")
 
@@ -17,14 +21,14 @@ def _load_all() -> dict:
         if data and "vmname" in data:
             name = data["vmname"]
             data = {name: data}
-            SESSION_FILE.write_text(json.dumps(data, indent=4))
+            write_atomic(SESSION_FILE, json.dumps(data, indent=4))
         return data
     except (json.JSONDecodeError, KeyError):
         return {}
 
 
 def _save_all(sessions: dict):
-    SESSION_FILE.write_text(json.dumps(sessions, indent=4))
+    write_atomic(SESSION_FILE, json.dumps(sessions, indent=4))
 
 
 def _sync_sessions(sessions: dict) -> dict:
@@ -64,7 +68,7 @@ def _sync_sessions(sessions: dict) -> dict:
     return sessions
 
 
-def _select_session(sessions: dict) -> tuple[dict, bool]:
+def _select_session(sessions: dict, profile: str | None = None) -> tuple[dict, bool]:
     """Zeigt vorhandene Sessions zur Auswahl. Gibt (session, is_persistent) zurück."""
     names = list(sessions.keys())
 
@@ -79,14 +83,14 @@ def _select_session(sessions: dict) -> tuple[dict, bool]:
     choice = input("Auswahl [0]: ").strip().lower()
 
     if choice == "n":
-        return _create_session(sessions)
+        return _create_session(sessions, profile)
     if choice == "i":
         return _import_session(sessions)
     if choice == "s":
         sessions = _sync_sessions(sessions)
         if not sessions:
-            return _create_session(sessions)
-        return _select_session(sessions)
+            return _create_session(sessions, profile)
+        return _select_session(sessions, profile)
 
     try:
         idx = int(choice) if choice else 0
@@ -96,6 +100,26 @@ def _select_session(sessions: dict) -> tuple[dict, bool]:
         return sessions[names[0]], True
 
 
+def _suggest(previous: str | None, available: list[str], fallback: str) -> str:
+    """Vorgabe für einen Prompt: bisheriger Wert, solange der Host ihn kennt, sonst der erste verfügbare."""
+    if previous and (not available or previous in available):
+        return previous
+    if fallback in available or not available:
+        return fallback
+    return available[0]
+
+
+def _choices(label: str, available: list[str]) -> list[str]:
+    if available:
+        print(f"  {label} laut Host: {', '.join(available)}")
+    return available
+
+
+def _bridges(facts: dict, node: str) -> list[str]:
+    # Bei 'auto' steht der Node noch nicht fest – Bridges sind im Cluster meist gleich benannt
+    return node_bridges(facts, node) or node_bridges(facts, facts.get("node", ""))
+
+
 def _import_session(sessions: dict) -> tuple[dict, bool]:
     """Importiert eine bereits existierende VM auf Proxmox in die Session-Verwaltung."""
     print("\n--- Bestehende Proxmox VM importieren ---")
@@ -111,10 +135,14 @@ def _import_session(sessions: dict) -> tuple[dict, bool]:
         fail("Proxmox Host darf nicht leer sein.")
 
     proxmox_ssh_user = input(f"SSH-User [{_default('proxmox_ssh_user', 'root')}]: ").strip() or _default("proxmox_ssh_user", "root")
-    proxmox_node = input(f"Proxmox Node-Name [{_default('proxmox_node', 'pve')}]: ").strip() or _default("proxmox_node", "pve")
-    proxmox_storage = input(f"Storage-Pool [{_default('proxmox_storage', 'local-lvm')}]: ").strip() or _default("proxmox_storage", "local-lvm")
+    facts = host_facts(proxmox_host, proxmox_ssh_user)
+    node_default = _suggest(ref.get("proxmox_node"), facts.get("nodes", []), facts.get("node") or "pve")
+    proxmox_node = input(f"Proxmox Node-Name [{node_default}]: ").strip() or node_default
+    storage_default = _suggest(ref.get("proxmox_storage"), _choices("Storages", node_storages(facts, proxmox_node)), "local-lvm")
+    proxmox_storage = input(f"Storage-Pool [{storage_default}]: ").strip() or storage_default
     proxmox_snippets_path = input(f"Snippets-Pfad [{_default('proxmox_snippets_path', '/var/lib/vz/snippets')}]: ").strip() or _default("proxmox_snippets_path", "/var/lib/vz/snippets")
-    proxmox_bridge = input(f"Netzwerk-Bridge [{_default('proxmox_bridge', 'vmbr0')}]: ").strip() or _default("proxmox_bridge", "vmbr0")
+    bridge_default = _suggest(ref.get("proxmox_bridge"), _choices("Bridges", _bridges(facts, proxmox_node)), "vmbr0")
+    proxmox_bridge = input(f"Netzwerk-Bridge [{bridge_default}]: ").strip() or bridge_default
 
     vmid_input = input("VM-ID der bestehenden VM: ").strip()
     try:
@@ -189,6 +217,7 @@ def _import_session(sessions: dict) -> tuple[dict, bool]:
         "arch": arch,
         "ssh_key": str(ssh_key_path),
         "hashed_password": hashed_password,
+        "workspace": str(workspace_dir(vmname, BACKEND)),
     }
 
     sessions[vmname] = session_data
@@ -197,7 +226,45 @@ def _import_session(sessions: dict) -> tuple[dict, bool]:
     return session_data, True
 
 
-def _create_session(sessions: dict) -> tuple[dict, bool]:
+def _auto_placement(host: str, user: str, node: str, storage: str,
+                    profile: str | None = None) -> tuple[str, str, str, str | None]:
+    """Wählt Node und/oder Storage anhand der Cluster-Auslastung (Eingabe 'auto').
+
+    Ist der Node angegeben, wird nur dort ein Storage gesucht.
+    """
+    from .placement import POLICIES, choose_placement
+    from .vm import DEFAULT_DISK_GB
+
+    policy = input(f"Placement-Policy {list(POLICIES)} [spread]: ").strip() or "spread"
+    if policy not in POLICIES:
+        print("Unbekannte Policy, verwende 'spread'.")
+        policy = "spread"
+    group = input("Anti-Affinity-Gruppe (leer = keine): ").strip() or None
+
+    # Platzierung mit der Größe des Profils; abweichende Größen werden erst in create_vm abgefragt
+    hardware = get_profile(profile)
+    result = choose_placement(
+        host, user, cores=hardware["cores"], memory_mb=hardware["memory"], disk_gb=DEFAULT_DISK_GB,
+        policy=policy, group=group,
+        storage=None if storage == "auto" else storage, node=None if node == "auto" else node,
+    )
+
+    # qm-Befehle laufen auf dem Ziel-Node, also dessen Adresse verwenden
+    return result["node"], result["storage"], result.get("address") or host, group
+
+
+def _auto_vmid(host: str, user: str) -> int:
+    """Reserviert die nächste freie VM-ID (leere Eingabe beim VM-ID-Prompt)."""
+    from .vmid import allocate_vmids, load_ranges
+
+    ranges = load_ranges()
+    range_name = None
+    if len(ranges) > 1:
+        range_name = input(f"VMID-Bereich {sorted(ranges)} [default]: ").strip() or None
+    return allocate_vmids(host, user, 1, range_name)[0]
+
+
+def _create_session(sessions: dict, profile: str | None = None) -> tuple[dict, bool]:
     print("\n--- Neue Proxmox VM-Parameter festlegen ---")
 
     # Proxmox-Verbindung aus vorhandener Session als Default übernehmen
@@ -212,17 +279,33 @@ def _create_session(sessions: dict) -> tuple[dict, bool]:
         fail("Proxmox Host darf nicht leer sein.")
 
     proxmox_ssh_user = input(f"SSH-User [{_default('proxmox_ssh_user', 'root')}]: ").strip() or _default("proxmox_ssh_user", "root")
-    proxmox_node = input(f"Proxmox Node-Name [{_default('proxmox_node', 'pve')}]: ").strip() or _default("proxmox_node", "pve")
+    facts = host_facts(proxmox_host, proxmox_ssh_user)
+    node_default = _suggest(ref.get("proxmox_node"), facts.get("nodes", []), facts.get("node") or "pve")
+    proxmox_node = input(f"Proxmox Node-Name [{node_default}] ('auto' = nach Auslastung): ").strip() or node_default
 
-    vmid_input = input("VM-ID (z.B. 100): ").strip()
-    try:
-        proxmox_vmid = int(vmid_input)
-    except ValueError:
-        fail("VM-ID muss eine Zahl sein.")
+    vmid_input = input("VM-ID (z.B. 100, leer = automatisch): ").strip()
+    proxmox_vmid = None
+    if vmid_input:
+        try:
+            proxmox_vmid = int(vmid_input)
+        except ValueError:
+            fail("VM-ID muss eine Zahl sein.")
 
-    proxmox_storage = input(f"Storage-Pool [{_default('proxmox_storage', 'local-lvm')}]: ").strip() or _default("proxmox_storage", "local-lvm")
+    storage_default = _suggest(ref.get("proxmox_storage"), _choices("Storages", node_storages(facts, proxmox_node)), "local-lvm")
+    proxmox_storage = input(f"Storage-Pool [{storage_default}] ('auto' = nach Auslastung): ").strip() or storage_default
     proxmox_snippets_path = input(f"Snippets-Pfad [{_default('proxmox_snippets_path', '/var/lib/vz/snippets')}]: ").strip() or _default("proxmox_snippets_path", "/var/lib/vz/snippets")
-    proxmox_bridge = input(f"Netzwerk-Bridge [{_default('proxmox_bridge', 'vmbr0')}]: ").strip() or _default("proxmox_bridge", "vmbr0")
+    bridge_default = _suggest(ref.get("proxmox_bridge"), _choices("Bridges", _bridges(facts, proxmox_node)), "vmbr0")
+    proxmox_bridge = input(f"Netzwerk-Bridge [{bridge_default}]: ").strip() or bridge_default
+
+    proxmox_group = None
+    if "auto" in (proxmox_node, proxmox_storage):
+        proxmox_node, proxmox_storage, proxmox_host, proxmox_group = _auto_placement(
+            proxmox_host, proxmox_ssh_user, proxmox_node, proxmox_storage, profile
+        )
+
+    if proxmox_vmid is None:
+        # Erst nach der Platzierung reservieren, damit Lease und qm create auf demselben Host liegen
+        proxmox_vmid = _auto_vmid(proxmox_host, proxmox_ssh_user)
 
     distros = [
         ("debian", "13"),
@@ -291,6 +374,8 @@ def _create_session(sessions: dict) -> tuple[dict, bool]:
         "arch": arch,
         "ssh_key": str(ssh_key_path),
         "hashed_password": hashed_password,
+        "proxmox_group": proxmox_group,
+        "workspace": str(workspace_dir(vmname, BACKEND)),
     }
 
     sessions[vmname] = session_data
@@ -298,13 +383,18 @@ def _create_session(sessions: dict) -> tuple[dict, bool]:
     return session_data, False
 
 
-def get_or_create_session() -> tuple[dict, bool]:
+def get_or_create_session(profile: str | None = None) -> tuple[dict, bool]:
+    """`profile` bestimmt bei einer neuen Session die Größe für die automatische Platzierung."""
     sessions = _load_all()
 
     if not sessions:
-        return _create_session(sessions)
+        return _create_session(sessions, profile)
 
-    return _select_session(sessions)
+    return _select_session(sessions, profile)
+
+
+def all_sessions() -> dict:
+    return _load_all()
 
 
 def delete_session(vmname: str):
@@ -312,3 +402,10 @@ def delete_session(vmname: str):
     if vmname in sessions:
         del sessions[vmname]
         _save_all(sessions)
+
+
+def update_session(vmname: str, **fields):
+    sessions = _load_all()
+    if vmname in sessions:
+        sessions[vmname].update(fields)
+        _save_all(sessions)
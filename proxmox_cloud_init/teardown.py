@@ -0,0 +1,134 @@
+"""Paralleles Löschen vieler Proxmox-VMs – Gegenstück zu `debian_cloud_init.teardown`.
+
+Pro VM ein SSH-Aufruf: Konfiguration lesen (für die freigegebene
+Disk-Kapazität), stoppen, mit allen Disks löschen. Die Aufrufe laufen über
+`pvesh` mit dem Node der VM und funktionieren daher von jedem Cluster-Knoten
+aus; höchstens `--limit` gleichzeitig pro SSH-Host.
+
+`tombstone_vm` benennt die alte VM beim Neuaufbau um und löscht sie auf dem
+Host im Hintergrund; der Neuaufbau bekommt eine neue ID aus demselben
+VMID-Bereich und startet sofort.
+
+    python -m proxmox_cloud_init.teardown --fleet
+    python -m proxmox_cloud_init.teardown --match 'lab-*' --host 192.168.1.10
+"""
+
+import argparse
+import fnmatch
+import json
+import re
+
+from debian_cloud_init.overlay import parse_size
+from debian_cloud_init.teardown import add_teardown_arguments, run_teardown
+from debian_cloud_init.ui import progress, success
+from debian_cloud_init.workspace import remove_workspace
+
+from .facts import BACKEND
+from .session import all_sessions, delete_session
+from .vm import ssh_run, ssh_run_async
+from .vmid import allocate_vmids, range_containing
+
+_DISK_KEY_RE = re.compile(r"^(scsi|virtio|sata|ide|efidisk|tpmstate)\d+$")
+_SIZE_RE = re.compile(r"(?:^|,)size=(\d+[KMGT]?)(?:,|$)")
+
+
+def disk_bytes(config: dict) -> int:
+    """Summe der Disk-Größen aus `qm config` (ohne CDROMs und Cloud-Init-Laufwerk)."""
+    total = 0
+    for key, value in config.items():
+        if not _DISK_KEY_RE.match(key) or "media=cdrom" in str(value) or "cloudinit" in str(value):
+            continue
+        match = _SIZE_RE.search(str(value))
+        if match:
+            total += parse_size(match.group(1))
+    return total
+
+
+def destroy_script(node: str, vmid: int) -> str:
+    path = f"/nodes/{node}/qemu/{vmid}"
+    return (
+        "set -e\n"
+        f"pvesh get {path}/config --output-format json\n"
+        f"pvesh create {path}/status/stop --timeout 30 >/dev/null 2>&1 || true\n"
+        f"pvesh delete {path} --purge 1 --destroy-unreferenced-disks 1 >/dev/null\n"
+    )
+
+
+async def _destroy(target: dict) -> int:
+    result = await ssh_run_async(target["host"], target["user"], destroy_script(target["node"], target["vmid"]))
+    try:
+        return disk_bytes(json.loads(result.stdout.splitlines()[0]))
+    except (IndexError, json.JSONDecodeError):
+        return 0
+
+
+def _cluster_vms(host: str, user: str) -> list[dict]:
+    result = ssh_run(host, user, "pvesh get /cluster/resources --type vm --output-format json",
+                     capture=True, check=False)
+    if result.returncode != 0:
+        return []
+    try:
+        return [vm for vm in json.loads(result.stdout) if vm.get("type") == "qemu"]
+    except json.JSONDecodeError:
+        return []
+
+
+def _select(match: str | None, fleet: bool, host: str | None, user: str) -> list[dict]:
+    targets = {}
+    if fleet:
+        for name, s in all_sessions().items():
+            targets[(s["proxmox_host"], s["proxmox_vmid"])] = {
+                "name": name, "host": s["proxmox_host"], "user": s["proxmox_ssh_user"],
+                "node": s["proxmox_node"], "vmid": s["proxmox_vmid"],
+            }
+    if match and host:
+        for vm in _cluster_vms(host, user):
+            if fnmatch.fnmatch(vm.get("name", ""), match):
+                targets[(host, vm["vmid"])] = {
+                    "name": vm["name"], "host": host, "user": user, "node": vm["node"], "vmid": vm["vmid"],
+                }
+    return sorted(targets.values(), key=lambda t: (t["host"], t["vmid"]))
+
+
+def _forget(target: dict):
+    sessions = all_sessions()
+    session = sessions.get(target["name"])
+    if session and session["proxmox_vmid"] == target["vmid"]:
+        delete_session(target["name"])
+        remove_workspace(target["name"], BACKEND)
+
+
+# =============================================================================
+# Neuaufbau
+# =============================================================================
+
+def tombstone_vm(host: str, user: str, vmid: int, vmname: str) -> int:
+    """Benennt die VM um, löscht sie im Hintergrund und reserviert eine neue ID."""
+    result = ssh_run(host, user, f"qm status {vmid} 2>/dev/null", check=False, capture=True)
+    if result.returncode == 0:
+        progress(f"VM {vmid} wird im Hintergrund gelöscht…")
+        # Tag ersetzt auch ein Anti-Affinity-Tag – die alte VM zählt nicht mehr zur Gruppe
+        ssh_run(host, user,
+                f"qm set {vmid} --name {vmname}-deleted --tags tombstone && "
+                f"setsid nohup sh -c 'qm stop {vmid} --timeout 30; "
+                f"qm destroy {vmid} --destroy-unreferenced-disks 1 --purge 1' >/dev/null 2>&1 </dev/null &")
+    new_vmid = allocate_vmids(host, user, 1, range_containing(vmid))[0]
+    success(f"Neuaufbau als VM {new_vmid}.")
+    return new_vmid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Viele Proxmox-VMs parallel löschen")
+    add_teardown_arguments(parser)
+    parser.add_argument("--host", help="Proxmox-Host für --match (Cluster-weite Suche)")
+    parser.add_argument("--user", default="root", help="SSH-User für --host")
+    args = parser.parse_args()
+
+    if not args.fleet and not (args.match and args.host):
+        parser.error("--fleet oder --match mit --host angeben")
+    run_teardown(_select(args.match, args.fleet, args.host, args.user), _destroy, _forget,
+                 args.limit, args.yes)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,33 @@
+import base64
 import json
 import pathlib
 import subprocess
 import tempfile
 import time
-from typing import Literal, overload
 
+from debian_cloud_init.engine import (
+    DEFAULT_TIMEOUT,
+    CommandError,
+    LineHandler,
+    echo_line,
+    log_line,
+    run_async,
+    run_sync,
+)
+from debian_cloud_init.metrics import (
+    command_label,
+    count_retry,
+    count_timeout,
+    phase,
+)
+from debian_cloud_init.seed_server import smbios_serial
+from debian_cloud_init.stages import STATUS_FILE, parse_status
 from debian_cloud_init.ui import ask_int, ask_yes_no, fail, progress, success
+from debian_cloud_init.workspace import META_DATA, NETWORK_CONFIG, write_atomic
+
+from .placement import AFFINITY_TAG_PREFIX
+from .profiles import DEFAULT_PROFILE, disk_options, get_profile, qm_create_options
+from .vmid import refresh_vmids, release_vmids
 
 # =============================================================================
 # SSH / SCP Hilfsfunktionen
@@ -13,23 +35,29 @@ from debian_cloud_init.ui import ask_int, ask_yes_no, fail, progress, success
 
 _SSH_OPTS = ["-o", "StrictHostKeyChecking=accept-new", "-o", "BatchMode=yes"]
 
+DEFAULT_DISK_GB = 30
+
 
-@overload
-def ssh_run(host: str, user: str, cmd: str, *, check: bool = ..., capture: Literal[True]) -> subprocess.CompletedProcess[str]: ...
-@overload
-def ssh_run(host: str, user: str, cmd: str, *, check: bool = ..., capture: Literal[False] = ...) -> subprocess.CompletedProcess[bytes]: ...
-def ssh_run(host: str, user: str, cmd: str, *, check: bool = True, capture: bool = False) -> subprocess.CompletedProcess[str] | subprocess.CompletedProcess[bytes]:
-    full_cmd = ["ssh"] + _SSH_OPTS + [f"{user}@{host}", cmd]
-    if capture:
-        result = subprocess.run(full_cmd, capture_output=True, text=True, check=False)
-        if check and result.returncode != 0:
+def ssh_run(host: str, user: str, cmd: str, *, check: bool = True, capture: bool = False) -> subprocess.CompletedProcess[str]:
+    """SSH-Befehl über `run_sync`; ohne `capture` erscheint die Ausgabe im Terminal."""
+    try:
+        result = run_sync(["ssh"] + _SSH_OPTS + [f"{user}@{host}", cmd], timeout=None, check=False,
+                          on_line=log_line if capture else echo_line, label=f"ssh {command_label(cmd)}")
+    except CommandError as e:
+        fail(f"SSH-Fehler ({host}): {e}")
+    if check and result.returncode != 0:
+        if capture:
             fail(f"SSH-Fehler ({host}): {result.stderr.strip() or result.stdout.strip()}")
-        return result
-    else:
-        result = subprocess.run(full_cmd, check=False)
-        if check and result.returncode != 0:
-            fail(f"SSH-Fehler ({host}): Befehl fehlgeschlagen.")
-        return result
+        fail(f"SSH-Fehler ({host}): Befehl fehlgeschlagen.")
+    return result
+
+
+async def ssh_run_async(host: str, user: str, cmd: str, *, timeout: float | None = DEFAULT_TIMEOUT,
+                        check: bool = True, input: str | None = None,
+                        on_line: LineHandler = log_line) -> subprocess.CompletedProcess[str]:
+    """Wie `ssh_run`, aber nebenläufig, mit Timeout und CommandError statt Programmende."""
+    return await run_async(["ssh"] + _SSH_OPTS + [f"{user}@{host}", cmd],
+                           timeout=timeout, check=check, input=input, on_line=on_line)
 
 
 def scp_to(host: str, user: str, local_path: pathlib.Path, remote_path: str):
@@ -43,9 +71,6 @@ def scp_to(host: str, user: str, local_path: pathlib.Path, remote_path: str):
 # Cloud-Image auf Proxmox-Host sicherstellen
 # =============================================================================
 
-_IMAGE_REMOTE_DIR = "/var/lib/vz/template/iso"
-
-
 def _image_info(distro: str, arch: str) -> tuple[str, str]:
     name, version = distro.split("/", 1)
     if name == "ubuntu":
@@ -58,55 +83,42 @@ def _image_info(distro: str, arch: str) -> tuple[str, str]:
     return image_name, url
 
 
-def ensure_base_image(host: str, user: str, arch: str, distro: str) -> str:
-    """Stellt sicher, dass das Cloud-Image auf dem Proxmox-Host existiert.
-    Gibt den Remote-Pfad zurück."""
-    image_name, url = _image_info(distro, arch)
-    remote_path = f"{_IMAGE_REMOTE_DIR}/{image_name}"
+def ensure_base_image(host: str, user: str, arch: str, distro: str, node: str | None = None) -> str:
+    """Stellt sicher, dass das Cloud-Image im Storage des Nodes liegt (Download durch
+    Proxmox mit Prüfsumme, siehe `proxmox_cloud_init.images`). Gibt den Remote-Pfad zurück."""
+    from .images import ensure_image  # lokaler Import um zirkuläre Imports zu vermeiden
 
-    result = ssh_run(host, user, f"test -f {remote_path}", check=False, capture=True)
-    if result.returncode == 0:
-        success(f"Basis-Image auf Proxmox vorhanden: {image_name}")
-        return remote_path
-
-    print(f"⚠ Basis-Image fehlt auf Proxmox: {image_name}")
-    distro_label = distro.replace("/", " ").capitalize()
-    if ask_yes_no(f"Soll das {distro_label} {arch} Cloud-Image direkt auf Proxmox heruntergeladen werden?"):
-        progress(f"Lade {image_name} auf Proxmox herunter…")
-        ssh_run(host, user, f"wget -q --show-progress -O {remote_path} {url}")
-        success(f"Basis-Image heruntergeladen: {image_name}")
-        return remote_path
-    else:
-        fail("Abbruch.")
+    return ensure_image(host, user, arch, distro, node)
 
 
 # =============================================================================
 # Cloud-Init Snippets hochladen
 # =============================================================================
 
+# Wildcard-Match deckt alle Interface-Namen ab (ens18, eth0, enp1s0, …)
+NETWORK_CONTENT = (
+    "version: 2\n"
+    "ethernets:\n"
+    "  all-en:\n"
+    "    match:\n"
+    "      name: 'en*'\n"
+    "    dhcp4: true\n"
+    "    dhcp6: false\n"
+    "  all-eth:\n"
+    "    match:\n"
+    "      name: 'eth*'\n"
+    "    dhcp4: true\n"
+    "    dhcp6: false\n"
+)
+
+
+def meta_data(vmname: str) -> str:
+    return f"instance-id: {vmname}-{int(time.time())}\nlocal-hostname: {vmname}\n"
+
+
 def upload_snippets(host: str, user: str, snippets_path: str, vmname: str,
                     cloud_init_yml: pathlib.Path) -> None:
     """Lädt user-data, meta-data und network-config als Snippets auf Proxmox hoch."""
-    meta_content = (
-        f"instance-id: {vmname}-{int(time.time())}\n"
-        f"local-hostname: {vmname}\n"
-    )
-    # Wildcard-Match deckt alle Interface-Namen ab (ens18, eth0, enp1s0, …)
-    network_content = (
-        "version: 2\n"
-        "ethernets:\n"
-        "  all-en:\n"
-        "    match:\n"
-        "      name: 'en*'\n"
-        "    dhcp4: true\n"
-        "    dhcp6: false\n"
-        "  all-eth:\n"
-        "    match:\n"
-        "      name: 'eth*'\n"
-        "    dhcp4: true\n"
-        "    dhcp6: false\n"
-    )
-
     tmp_files: list[pathlib.Path] = []
     try:
         progress("Lade cloud-init Snippets auf Proxmox hoch…")
@@ -115,8 +127,8 @@ def upload_snippets(host: str, user: str, snippets_path: str, vmname: str,
         scp_to(host, user, cloud_init_yml, f"{snippets_path}/{vmname}-user-data.yml")
 
         for name, content in [
-            (f"{vmname}-meta-data.yml", meta_content),
-            (f"{vmname}-network-config.yml", network_content),
+            (f"{vmname}-meta-data.yml", meta_data(vmname)),
+            (f"{vmname}-network-config.yml", NETWORK_CONTENT),
         ]:
             with tempfile.NamedTemporaryFile(mode="w", suffix=".yml", delete=False) as f:
                 f.write(content)
@@ -130,6 +142,17 @@ def upload_snippets(host: str, user: str, snippets_path: str, vmname: str,
     success("Snippets hochgeladen: user-data, meta-data, network-config")
 
 
+def write_seed_files(vmname: str, workspace: pathlib.Path):
+    """meta-data und network-config in den Workspace – der Seed-Server liefert sie statt der Snippets."""
+    write_atomic(workspace / META_DATA, meta_data(vmname))
+    write_atomic(workspace / NETWORK_CONFIG, NETWORK_CONTENT)
+
+
+def seed_serial_option(serial: str) -> str:
+    # Proxmox verlangt base64 für Werte mit ';', '=' oder '/'
+    return f"serial={base64.b64encode(serial.encode()).decode()},base64=1"
+
+
 # =============================================================================
 # VM löschen
 # =============================================================================
@@ -158,20 +181,32 @@ def delete_vm(host: str, user: str, vmid: int, vmname: str, skip_confirm: bool =
 
 def create_vm(host: str, user: str, node: str, vmid: int, vmname: str,
               arch: str, distro: str, storage: str, bridge: str,
-              snippets_path: str, cloud_init_yml: pathlib.Path):
-
-    upload_snippets(host, user, snippets_path, vmname, cloud_init_yml)
-    base_image_path = ensure_base_image(host, user, arch, distro)
+              snippets_path: str, cloud_init_yml: pathlib.Path, group: str | None = None,
+              profile: str = DEFAULT_PROFILE, disk_gb: int | None = None):
+    """Legt die VM an; mit `disk_gb` ohne Größen-Rückfrage (Kerne/RAM aus dem Profil)."""
+    from .facts import BACKEND
+
+    hardware = get_profile(profile)
+    serial = smbios_serial(vmname, BACKEND, cloud_init_yml.parent)
+    if serial:
+        progress(f"cloud-init-Daten kommen vom Seed-Server ({serial})…")
+        write_seed_files(vmname, cloud_init_yml.parent)
+    else:
+        upload_snippets(host, user, snippets_path, vmname, cloud_init_yml)
+    with phase("base_image"):
+        base_image_path = ensure_base_image(host, user, arch, distro, node)
 
     if not ask_yes_no("Soll die VM jetzt angelegt werden?"):
         print("VM-Erstellung übersprungen.")
-        return
+        return False
 
-    DEFAULT_CORES = 2
-    DEFAULT_MEMORY = 4096
-    DEFAULT_DISK_GB = 30
+    DEFAULT_CORES = hardware["cores"]
+    DEFAULT_MEMORY = hardware["memory"]
 
-    if ask_yes_no(
+    if disk_gb:
+        cores = DEFAULT_CORES
+        memory = DEFAULT_MEMORY
+    elif ask_yes_no(
         f"Standard-Größe verwenden? (CPU: {DEFAULT_CORES} Kerne, RAM: {DEFAULT_MEMORY} MB, Disk: {DEFAULT_DISK_GB} GB)",
         default=True,
     ):
@@ -183,9 +218,12 @@ def create_vm(host: str, user: str, node: str, vmid: int, vmname: str,
         memory = ask_int("RAM in MB", DEFAULT_MEMORY)
         disk_gb = ask_int("Disk-Größe in GB", DEFAULT_DISK_GB)
 
-    # Basis-VM anlegen
-    progress(f"Erstelle VM {vmid} ({vmname})…")
+    # Basis-VM anlegen – Lease vorher verlängern, die Rückfragen können lange dauern
+    refresh_vmids(host, user, [vmid])
+    progress(f"Erstelle VM {vmid} ({vmname}, Profil '{profile}')…")
     machine = "virt" if arch == "arm64" else "q35"
+    # Anti-Affinity-Gruppe als Tag, damit die Placement-Engine sie wiederfindet
+    tags = f" --tags {AFFINITY_TAG_PREFIX}{group}" if group else ""
     ssh_run(host, user,
         f"qm create {vmid}"
         f" --name {vmname}"
@@ -193,11 +231,14 @@ def create_vm(host: str, user: str, node: str, vmid: int, vmname: str,
         f" --cores {cores}"
         f" --cpu host"
         f" --machine {machine}"
-        f" --net0 virtio,bridge={bridge}"
+        f"{qm_create_options(hardware, bridge)}"
         f" --serial0 socket"
         f" --vga serial0"
         f" --agent enabled=1"
+        f"{tags}"
     )
+    # Die angelegte VM belegt die ID jetzt selbst – Lease freigeben
+    release_vmids(host, user, [vmid])
 
     # Cloud-Image als Disk importieren (zeigt Fortschritt direkt)
     progress("Importiere Cloud-Image als Disk…")
@@ -218,21 +259,25 @@ def create_vm(host: str, user: str, node: str, vmid: int, vmname: str,
     # Disk als scsi0 anhängen und auf 30G vergrößern
     progress("Konfiguriere Disk…")
     ssh_run(host, user,
-        f"qm set {vmid} --scsihw virtio-scsi-pci --scsi0 {disk_ref}"
+        f"qm set {vmid} --scsihw {hardware['scsihw']} --scsi0 {disk_ref}{disk_options(hardware)}"
     )
     ssh_run(host, user, f"qm resize {vmid} scsi0 {disk_gb}G")
 
-    # Cloud-Init Drive hinzufügen
-    progress("Füge Cloud-Init Drive hinzu…")
-    ssh_run(host, user, f"qm set {vmid} --ide2 {storage}:cloudinit")
-
-    # Snippets als cicustom setzen (user, meta, network explizit — kein --ipconfig0 nötig)
-    ssh_run(host, user,
-        f'qm set {vmid} --cicustom '
-        f'"user=local:snippets/{vmname}-user-data.yml,'
-        f'meta=local:snippets/{vmname}-meta-data.yml,'
-        f'network=local:snippets/{vmname}-network-config.yml"'
-    )
+    if serial:
+        # NoCloud-net: kein Cloud-Init Drive, die VM findet den Seed-Server über die Seriennummer
+        ssh_run(host, user, f"qm set {vmid} --smbios1 {seed_serial_option(serial)}")
+    else:
+        # Cloud-Init Drive hinzufügen
+        progress("Füge Cloud-Init Drive hinzu…")
+        ssh_run(host, user, f"qm set {vmid} --ide2 {storage}:cloudinit")
+
+        # Snippets als cicustom setzen (user, meta, network explizit — kein --ipconfig0 nötig)
+        ssh_run(host, user,
+            f'qm set {vmid} --cicustom '
+            f'"user=local:snippets/{vmname}-user-data.yml,'
+            f'meta=local:snippets/{vmname}-meta-data.yml,'
+            f'network=local:snippets/{vmname}-network-config.yml"'
+        )
 
     # Boot-Reihenfolge
     ssh_run(host, user, f"qm set {vmid} --boot order=scsi0")
@@ -241,6 +286,7 @@ def create_vm(host: str, user: str, node: str, vmid: int, vmname: str,
     progress(f"Starte VM {vmid}…")
     ssh_run(host, user, f"qm start {vmid}")
     success(f"VM '{vmname}' (ID: {vmid}) wurde angelegt und gestartet.")
+    return True
 
 
 # =============================================================================
@@ -275,18 +321,23 @@ def _extract_ip_from_interfaces(data) -> str | None:
 def get_vm_ip(host: str, user: str, node: str, vmid: int) -> str | None:
     progress("Warte auf VM-Start…")
 
-    for _ in range(60):
+    for attempt in range(60):
+        if attempt:
+            count_retry("vm_start")
         result = ssh_run(host, user, f"qm status {vmid}", capture=True, check=False)
         if "running" in result.stdout:
             break
         time.sleep(2)
     else:
+        count_timeout("vm_start")
         fail("VM ist nicht gestartet.")
 
     progress("Ermittle IP via Guest-Agent…")
     print("  (benötigt qemu-guest-agent in der VM)")
 
     for attempt in range(24):  # 24 × 5 s = 2 Minuten
+        if attempt:
+            count_retry("ip_discovery")
         result = ssh_run(
             host, user,
             f"pvesh get /nodes/{node}/qemu/{vmid}/agent/network-get-interfaces"
@@ -306,6 +357,7 @@ def get_vm_ip(host: str, user: str, node: str, vmid: int) -> str | None:
         time.sleep(5)
 
     print()
+    count_timeout("ip_discovery")
     print("⚠ Guest-Agent hat nicht geantwortet.")
     print("  Mögliche Ursachen:")
     print("  - qemu-guest-agent nicht installiert → in templates/package-config.txt eintragen: qemu-guest-agent")
@@ -328,6 +380,42 @@ def get_vm_ip(host: str, user: str, node: str, vmid: int) -> str | None:
     return None
 
 
+def guest_exec(host: str, user: str, vmid: int, command: str) -> tuple[int, str] | None:
+    """Führt `command` via `qm guest exec` aus; gibt (Exit-Code, stdout) oder None zurück."""
+    result = ssh_run(host, user, f"qm guest exec {vmid} -- {command}", capture=True, check=False)
+    if result.returncode != 0:
+        return None
+    try:
+        data = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return None
+    return data.get("exitcode", 1), data.get("out-data", "")
+
+
+def read_provision_status(host: str, user: str, vmid: int) -> dict | None:
+    """Liest die Statusdatei der verzögerten Stufe via `qm guest exec`."""
+    result = guest_exec(host, user, vmid, f"cat {STATUS_FILE}")
+    if result is None or result[0] != 0:
+        return None
+    return parse_status(result[1])
+
+
+def wait_for_cloud_init(host: str, user: str, vmid: int, timeout: int = 1800, interval: int = 10) -> bool:
+    """Wartet, bis `cloud-init status` im Gast done (True) oder error (False) meldet."""
+    progress("Warte auf Abschluss von cloud-init…")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = guest_exec(host, user, vmid, "cloud-init status")
+        if result is not None:
+            if "status: done" in result[1]:
+                return True
+            if "status: error" in result[1]:
+                return False
+        time.sleep(interval)
+    count_timeout("cloud_init")
+    return False
+
+
 def print_ssh_command(username: str, ip: str):
     print("\n=== SSH-Verbindung ===")
     print(f"ssh {username}@{ip}")
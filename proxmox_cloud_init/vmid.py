@@ -0,0 +1,173 @@
+"""Nebenläufigkeitssichere Vergabe von VM-IDs.
+
+Die Reservierung läuft in einem einzigen SSH-Aufruf auf dem Proxmox-Host:
+unter einem Lock werden belegte IDs aus `/cluster/resources` und noch gültige
+Leases gesammelt, die nächsten freien IDs im gewünschten Bereich gewählt und
+als Lease-Dateien (Inhalt: Ablaufzeitpunkt) angelegt. Parallele Läufe anderer
+Operatoren sehen diese Leases und wählen andere IDs.
+
+Leases und Lock liegen in /etc/pve (pmxcfs) und gelten damit clusterweit –
+auch wenn die Placement-Engine Läufe per SSH auf verschiedene Nodes schickt.
+`flock` wirkt dort nur lokal; der Lock ist daher ein Verzeichnis, dessen
+`mkdir` pmxcfs clusterweit atomar ausführt. Vor `qm create` wird das Lease
+mit `refresh_vmids` verlängert, damit lange Rückfragen es nicht ablaufen lassen.
+
+Bereiche pro Team/Flotte stehen in `.proxmox-vmid-ranges`:
+
+    {"default": [100, 999], "ci": [9000, 9499]}
+"""
+
+import argparse
+import json
+import pathlib
+
+from debian_cloud_init.ui import fail, progress, success
+
+RANGES_FILE = pathlib.Path(".proxmox-vmid-ranges")
+LEASE_DIR = "/etc/pve/debian-cloud-init/vmid-leases"
+LEASE_TTL = 3600
+# Lock eines abgebrochenen Laufs gilt nach dieser Zeit als verwaist
+LOCK_STALE = 120
+
+DEFAULT_RANGE = (100, 999999999)
+
+# Platzhalter werden per str.format ersetzt – daher doppelte geschweifte Klammern
+_LOCK = r"""
+set -e
+L={lease_dir}
+mkdir -p "$L"
+tries=0
+until mkdir "$L/.lock" 2>/dev/null; do
+  age=$(( $(date +%s) - $(stat -c %Y "$L/.lock" 2>/dev/null || date +%s) ))
+  [ "$age" -lt {stale} ] || rmdir "$L/.lock" 2>/dev/null || true
+  tries=$((tries + 1))
+  [ "$tries" -lt 60 ] || {{ echo "lock timeout" >&2; exit 75; }}
+  sleep 0.5
+done
+trap 'rmdir "$L/.lock"' EXIT
+now=$(date +%s)
+"""
+
+_RESERVE_SCRIPT = _LOCK + r"""
+for f in "$L"/[0-9]*; do
+  [ -e "$f" ] || continue
+  [ "$(cat "$f")" -ge "$now" ] 2>/dev/null || rm -f "$f"
+done
+{{ pvesh get /cluster/resources --type vm --output-format json | grep -o '"vmid":[0-9]*' | cut -d: -f2
+   ls "$L" | grep -E '^[0-9]+$' || true; }} | sort -n -u > "$L/.used"
+ids=$(awk -v lo={low} -v hi={high} -v n={count} -v used="$L/.used" 'BEGIN {{
+  while ((getline id < used) > 0) taken[id] = 1
+  c = 0
+  for (i = lo; i <= hi && c < n; i++) if (!(i in taken)) {{ print i; c++ }}
+}}')
+[ "$(echo "$ids" | grep -c .)" -eq {count} ] || {{ echo "range exhausted" >&2; exit 76; }}
+for id in $ids; do echo $((now + {ttl})) > "$L/$id"; done
+echo "$ids"
+"""
+
+# Abgelaufene Leases werden neu angelegt, solange die ID nicht inzwischen vergeben ist
+_REFRESH_SCRIPT = _LOCK + r"""
+used=$(pvesh get /cluster/resources --type vm --output-format json | grep -o '"vmid":[0-9]*' | cut -d: -f2)
+for id in {ids}; do
+  if [ ! -e "$L/$id" ] || [ "$(cat "$L/$id")" -lt "$now" ] 2>/dev/null; then
+    if echo "$used" | grep -qx "$id"; then echo "$id vergeben" >&2; exit 77; fi
+  fi
+  echo $((now + {ttl})) > "$L/$id"
+done
+"""
+
+
+def load_ranges() -> dict[str, tuple[int, int]]:
+    if not RANGES_FILE.exists():
+        return {"default": DEFAULT_RANGE}
+    try:
+        data = json.loads(RANGES_FILE.read_text())
+        ranges = {name: (int(lo), int(hi)) for name, (lo, hi) in data.items()}
+    except (json.JSONDecodeError, TypeError, ValueError):
+        fail(f"Ungültige Bereichsdatei: {RANGES_FILE}")
+    ranges.setdefault("default", DEFAULT_RANGE)
+    return ranges
+
+
+def resolve_range(name: str | None) -> tuple[int, int]:
+    ranges = load_ranges()
+    key = name or "default"
+    if key not in ranges:
+        fail(f"Unbekannter VMID-Bereich '{key}'. Verfügbar: {', '.join(sorted(ranges))}")
+    return ranges[key]
+
+
+def range_containing(vmid: int) -> str | None:
+    """Name des engsten Bereichs, in dem die ID liegt (None = Standardbereich)."""
+    matches = [(hi - lo, name) for name, (lo, hi) in load_ranges().items() if lo <= vmid <= hi]
+    return min(matches)[1] if matches else None
+
+
+def allocate_vmids(host: str, user: str, count: int = 1, range_name: str | None = None,
+                   ttl: int = LEASE_TTL) -> list[int]:
+    """Reserviert `count` freie VM-IDs atomar in einem Round-Trip."""
+    from .vm import ssh_run  # lokaler Import um zirkuläre Imports zu vermeiden
+
+    low, high = resolve_range(range_name)
+    script = _RESERVE_SCRIPT.format(lease_dir=LEASE_DIR, stale=LOCK_STALE, low=low, high=high, count=count, ttl=ttl)
+
+    progress(f"Reserviere {count} VM-ID(s) im Bereich {low}-{high}…")
+    result = ssh_run(host, user, script, check=False, capture=True)
+    if result.returncode == 75:
+        fail("VMID-Lock auf dem Proxmox-Host konnte nicht erhalten werden.")
+    if result.returncode == 76:
+        fail(f"Keine {count} freien VM-IDs im Bereich {low}-{high}.")
+    if result.returncode != 0:
+        fail(f"VMID-Reservierung fehlgeschlagen: {result.stderr.strip()}")
+
+    try:
+        ids = [int(line) for line in result.stdout.split()]
+    except ValueError:
+        fail(f"Unerwartete Antwort bei der VMID-Reservierung: {result.stdout.strip()}")
+    if len(ids) != count:
+        fail(f"Erwartet {count} VM-IDs, erhalten: {ids}")
+
+    success(f"VM-ID(s) reserviert: {', '.join(map(str, ids))}")
+    return ids
+
+
+def refresh_vmids(host: str, user: str, vmids: list[int], ttl: int = LEASE_TTL):
+    """Verlängert Leases kurz vor `qm create`; beendet das Programm, wenn eine ID inzwischen vergeben ist."""
+    from .vm import ssh_run
+
+    if not vmids:
+        return
+    script = _REFRESH_SCRIPT.format(lease_dir=LEASE_DIR, stale=LOCK_STALE, ids=" ".join(map(str, vmids)), ttl=ttl)
+    result = ssh_run(host, user, script, check=False, capture=True)
+    if result.returncode == 75:
+        fail("VMID-Lock auf dem Proxmox-Host konnte nicht erhalten werden.")
+    if result.returncode == 77:
+        fail(f"Lease für VM-ID(s) {', '.join(map(str, vmids))} ist abgelaufen und die ID inzwischen vergeben.")
+    if result.returncode != 0:
+        fail(f"VMID-Lease konnte nicht verlängert werden: {result.stderr.strip()}")
+
+
+def release_vmids(host: str, user: str, vmids: list[int]):
+    """Gibt Leases frei – nach `qm create` schützt die existierende VM die ID selbst."""
+    from .vm import ssh_run
+
+    if not vmids:
+        return
+    files = " ".join(f"{LEASE_DIR}/{vmid}" for vmid in vmids)
+    ssh_run(host, user, f"rm -f {files}", check=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VM-IDs auf dem Proxmox-Host reservieren")
+    parser.add_argument("--host", required=True, help="Proxmox Host")
+    parser.add_argument("--user", default="root", help="SSH-User")
+    parser.add_argument("--count", type=int, default=1, help="Anzahl IDs")
+    parser.add_argument("--range", dest="range_name", help="Bereichsname aus .proxmox-vmid-ranges")
+    args = parser.parse_args()
+
+    for vmid in allocate_vmids(args.host, args.user, args.count, args.range_name):
+        print(vmid)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Unit-Tests für build.py"""
+
+import pathlib
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+import yaml
+
+from debian_cloud_init import build
+from debian_cloud_init.build import (
+    build_cloud_config,
+    dump_cloud_config,
+    render_cloud_config,
+    template_files,
+)
+
+REPO_TEMPLATES = pathlib.Path(__file__).resolve().parent.parent / "templates"
+
+_PARAMS: dict[str, Any] = {
+    "username": "wlanboy",
+    "hashed_password": "$6$salt$hash",
+    "ssh_key_content": "ssh-rsa AAAAB3NzaC1 user@host",
+}
+
+
+@pytest.fixture
+def templates(tmp_path):
+    templates_dir = tmp_path / "templates"
+    templates_dir.mkdir()
+    for name in ("cloud-init-template.yml", "package-config.txt", "system-config.txt", "tools.yml"):
+        (templates_dir / name).write_text((REPO_TEMPLATES / name).read_text())
+    return templates_dir
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    with patch.object(build, "BUILD_CACHE_FILE", tmp_path / ".build-cache.json"):
+        yield tmp_path / ".build-cache.json"
+
+
+# =============================================================================
+# render_cloud_config / dump_cloud_config
+# =============================================================================
+
+
+class TestRenderCloudConfig:
+    def test_users_populated(self, templates):
+        cfg = render_cloud_config(template_files(templates), **_PARAMS)
+        user = cfg["users"][0]
+        assert user["name"] == "wlanboy"
+        assert user["ssh_authorized_keys"] == ["ssh-rsa AAAAB3NzaC1 user@host"]
+
+    def test_runcmd_ends_with_literal_blocks(self, templates):
+        cfg = render_cloud_config(template_files(templates), **_PARAMS)
+        assert cfg["runcmd"][0] == "apt-get update"
+        assert "kubectl" in cfg["runcmd"][-2]
+        assert "swapoff" in cfg["runcmd"][-1]
+
+    def test_proxmox_backend_sets_package_update(self, templates):
+        cfg = render_cloud_config(template_files(templates), **_PARAMS, backend="proxmox")
+        assert cfg["package_update"] is True
+        assert cfg["packages"] == []
+
+    def test_libyaml_output_identical_to_pure_python(self, templates):
+        cfg = render_cloud_config(template_files(templates), **_PARAMS)
+        pure = "#cloud-config\n" + yaml.dump(cfg, sort_keys=False, Dumper=yaml.SafeDumper)
+        assert dump_cloud_config(cfg) == pure
+
+    def test_literal_blocks_kept(self, templates):
+        cfg = render_cloud_config(template_files(templates), **_PARAMS)
+        assert "- |\n" in dump_cloud_config(cfg)
+
+    def test_template_parsed_once_and_not_shared(self, templates):
+        files = template_files(templates)
+        with patch("debian_cloud_init.build.yaml.load", wraps=yaml.load) as mock_load:
+            first = render_cloud_config(files, **_PARAMS)
+            second = render_cloud_config(files, **{**_PARAMS, "username": "other"})
+        template = files["template"].read_text()
+        assert [c.args[0] for c in mock_load.call_args_list].count(template) == 1
+        assert first["users"][0]["name"] == "wlanboy"
+        assert second["users"][0]["name"] == "other"
+
+    def test_changed_template_parsed_again(self, templates):
+        files = template_files(templates)
+        render_cloud_config(files, **_PARAMS)
+        files["template"].write_text(files["template"].read_text() + "\ntimezone: Europe/Berlin\n")
+        assert render_cloud_config(files, **_PARAMS)["timezone"] == "Europe/Berlin"
+
+
+# =============================================================================
+# build_cloud_config
+# =============================================================================
+
+
+class TestBuildCloudConfig:
+    def test_first_build_writes_file(self, templates, cache_file, tmp_path):
+        output = tmp_path / "cloud-init.yml"
+        assert build_cloud_config(templates, output, **_PARAMS) is True
+        assert output.read_text().startswith("#cloud-config\n")
+        assert cache_file.exists()
+
+    def test_unchanged_inputs_skip_rebuild(self, templates, cache_file, tmp_path):
+        output = tmp_path / "cloud-init.yml"
+        build_cloud_config(templates, output, **_PARAMS)
+        with patch.object(build, "render_cloud_config") as mock_render:
+            assert build_cloud_config(templates, output, **_PARAMS) is False
+        mock_render.assert_not_called()
+
+    def test_changed_template_triggers_rebuild(self, templates, cache_file, tmp_path):
+        output = tmp_path / "cloud-init.yml"
+        build_cloud_config(templates, output, **_PARAMS)
+        (templates / "system-config.txt").write_text("echo changed\n")
+        assert build_cloud_config(templates, output, **_PARAMS) is True
+        assert "echo changed" in output.read_text()
+
+    def test_changed_params_trigger_rebuild(self, templates, cache_file, tmp_path):
+        output = tmp_path / "cloud-init.yml"
+        build_cloud_config(templates, output, **_PARAMS)
+        assert build_cloud_config(templates, output, **{**_PARAMS, "username": "other"}) is True
+
+    def test_modified_output_triggers_rebuild(self, templates, cache_file, tmp_path):
+        output = tmp_path / "cloud-init.yml"
+        build_cloud_config(templates, output, **_PARAMS)
+        output.write_text("#cloud-config\n{}\n")
+        assert build_cloud_config(templates, output, **_PARAMS) is True
+
+    def test_force_rebuilds(self, templates, cache_file, tmp_path):
+        output = tmp_path / "cloud-init.yml"
+        build_cloud_config(templates, output, **_PARAMS)
+        assert build_cloud_config(templates, output, **_PARAMS, force=True) is True
+
+    def test_missing_template_file_exits(self, templates, cache_file, tmp_path):
+        (templates / "system-config.txt").unlink()
+        with pytest.raises(SystemExit):
+            build_cloud_config(templates, tmp_path / "cloud-init.yml", **_PARAMS)
+
+    def test_optimize_packages_changes_output(self, templates, cache_file, tmp_path):
+        output = tmp_path / "cloud-init.yml"
+        build_cloud_config(templates, output, **_PARAMS)
+        assert build_cloud_config(templates, output, **_PARAMS, optimize_packages=True) is True
+        assert "package_update: true" in output.read_text()
+
+    def test_arch_changes_tools_script(self, templates, cache_file, tmp_path):
+        output = tmp_path / "cloud-init.yml"
+        build_cloud_config(templates, output, **_PARAMS, arch="arm64")
+        content = output.read_text()
+        assert "linux-arm64" in content
+        assert "linux-amd64" not in content
@@ -0,0 +1,242 @@
+"""Unit-Tests für daemon.py und client.py"""
+
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from debian_cloud_init import client, ui
+from debian_cloud_init.client import (
+    DaemonError,
+    DaemonUnavailable,
+    request,
+    wait_for_job,
+)
+from debian_cloud_init.daemon import (
+    DaemonServer,
+    JobQueue,
+    RequestError,
+    provision_params,
+)
+
+DEFAULTS = {"username": "ci", "hashed_password": "$6$x", "templates": "/srv/templates"}
+
+
+@pytest.fixture
+def restore_stdout():
+    stdout, interactive = sys.stdout, ui.NON_INTERACTIVE
+    yield
+    sys.stdout, ui.NON_INTERACTIVE = stdout, interactive
+
+
+def _wait(jobs: JobQueue, job_id: str) -> dict:
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job is not None and job["state"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Auftrag {job_id} nicht fertig")
+
+
+# =============================================================================
+# Warteschlange
+# =============================================================================
+
+
+class TestJobQueue:
+    def test_result_and_log(self, restore_stdout):
+        jobs = JobQueue(workers=1)
+        jobs.start()
+
+        def job(params):
+            print(f"baue {params['name']}")
+            return {"ip": "10.0.0.5"}
+
+        job_id = jobs.submit("provision", "vm1", {"name": "vm1"}, job)["id"]
+        result = _wait(jobs, job_id)
+        assert result["state"] == "done"
+        assert result["result"] == {"ip": "10.0.0.5"}
+        assert result["log"] == ["baue vm1"]
+        assert "params" not in result
+
+    def test_fail_only_ends_job(self, restore_stdout):
+        jobs = JobQueue(workers=1)
+        jobs.start()
+
+        def job(params):
+            ui.fail("Image fehlt")
+
+        failed = _wait(jobs, jobs.submit("provision", "vm1", {}, job)["id"])
+        assert failed["state"] == "failed"
+        assert failed["error"] == "Image fehlt"
+        ok = _wait(jobs, jobs.submit("provision", "vm2", {}, lambda p: {})["id"])
+        assert ok["state"] == "done"
+
+    def test_exception_fails_job(self, restore_stdout):
+        jobs = JobQueue(workers=1)
+        jobs.start()
+
+        def job(params):
+            raise RuntimeError("kaputt")
+
+        assert _wait(jobs, jobs.submit("teardown", "vm1", {}, job)["id"])["error"] == "kaputt"
+
+    def test_worker_limit(self, restore_stdout):
+        jobs = JobQueue(workers=2)
+        jobs.start()
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def job(params):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return {}
+
+        ids = [jobs.submit("provision", f"vm{i}", {}, job)["id"] for i in range(5)]
+        for job_id in ids:
+            _wait(jobs, job_id)
+        assert peak[0] == 2
+        assert jobs.counts()["done"] == 5
+
+    def test_active(self, restore_stdout):
+        jobs = JobQueue(workers=1)
+        blocker = threading.Event()
+        jobs.start()
+
+        def job(_params: dict) -> dict:
+            blocker.wait(5)
+            return {}
+
+        job_id = jobs.submit("provision", "vm1", {}, job)["id"]
+        active = jobs.active("vm1")
+        assert active is not None and active["id"] == job_id
+        assert jobs.active("vm2") is None
+        blocker.set()
+        _wait(jobs, job_id)
+        assert jobs.active("vm1") is None
+
+
+# =============================================================================
+# Anfragen
+# =============================================================================
+
+
+class TestProvisionParams:
+    def test_defaults_applied(self):
+        params = provision_params({"name": "build-1", "ssh_key": "ssh-ed25519 AAA", "arch": None}, DEFAULTS)
+        assert params["distro"] == "debian/13"
+        assert params["arch"] == "amd64"
+        assert params["username"] == "ci"
+
+    def test_request_overrides_defaults(self):
+        params = provision_params({"name": "b", "ssh_key": "k", "username": "dev"}, DEFAULTS)
+        assert params["username"] == "dev"
+
+    @pytest.mark.parametrize("body", [
+        {"name": "../etc", "ssh_key": "k"},
+        {"name": "ok", "ssh_key": "k", "arch": "riscv64"},
+        {"name": "ok", "ssh_key": "k", "profile": "nope"},
+        {"name": "ok"},
+        {"name": 123, "ssh_key": "k"},
+        {"name": "ok", "ssh_key": "k", "distro": ["debian/13"]},
+        {"name": "ok", "ssh_key": "k", "arch": {"x": 1}},
+        {"name": "ok", "ssh_key": "k", "profile": 1},
+        {"name": "ok", "ssh_key": ["k"]},
+    ])
+    def test_invalid(self, body):
+        with pytest.raises(RequestError) as exc:
+            provision_params(body, DEFAULTS)
+        assert exc.value.status == 400
+
+
+# =============================================================================
+# HTTP über Unix-Socket
+# =============================================================================
+
+
+@pytest.fixture
+def daemon(tmp_path, restore_stdout):
+    socket_path = tmp_path / "d.sock"
+    jobs = JobQueue(workers=1)
+    server = DaemonServer(socket_path, jobs, DEFAULTS)
+    jobs.start()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+
+
+class TestApi:
+    def test_provision_and_poll(self, daemon):
+        with patch("debian_cloud_init.daemon.virt.domain_exists", return_value=False), \
+             patch("debian_cloud_init.daemon.provision_job",
+                   side_effect=lambda p, lock: {"name": p["name"], "ip": "10.0.0.9"}) as mock_job:
+            response = request("POST", "/vms", {"name": "build-1", "ssh_key": "ssh-ed25519 AAA"}, daemon)
+            job = wait_for_job(response["job"], daemon, interval=0.01)
+        assert job["state"] == "done"
+        assert job["result"]["ip"] == "10.0.0.9"
+        assert mock_job.call_args.args[0]["templates"] == "/srv/templates"
+
+    def test_existing_vm_conflicts(self, daemon):
+        with patch("debian_cloud_init.daemon.virt.domain_exists", return_value=True), \
+             pytest.raises(DaemonError) as exc:
+            request("POST", "/vms", {"name": "vm1", "ssh_key": "k"}, daemon)
+        assert exc.value.status == 409
+
+    def test_teardown_unknown_vm(self, daemon):
+        with patch("debian_cloud_init.daemon.virt.domain_exists", return_value=False), \
+             pytest.raises(DaemonError) as exc:
+            request("DELETE", "/vms/nope", socket_path=daemon)
+        assert exc.value.status == 404
+
+    def test_teardown_queued(self, daemon):
+        with patch("debian_cloud_init.daemon.virt.domain_exists", return_value=True), \
+             patch("debian_cloud_init.daemon.teardown_job", return_value={"name": "vm1", "freed": 1}):
+            response = request("DELETE", "/vms/vm1", socket_path=daemon)
+            job = wait_for_job(response["job"], daemon, interval=0.01)
+        assert (job["kind"], job["state"]) == ("teardown", "done")
+
+    def test_vm_status(self, daemon):
+        with patch("debian_cloud_init.daemon.virt.domain_state", return_value="running"), \
+             patch("debian_cloud_init.daemon.virt.agent_ipv4_addresses", return_value=["10.0.0.3"]), \
+             patch("debian_cloud_init.daemon.all_sessions", return_value={}):
+            status = request("GET", "/vms/vm1", socket_path=daemon)
+        assert status == {"name": "vm1", "state": "running", "addresses": ["10.0.0.3"], "session": False,
+                          "jobs": []}
+
+    def test_health_and_unknown_path(self, daemon):
+        assert request("GET", "/health", socket_path=daemon)["ok"] is True
+        with pytest.raises(DaemonError) as exc:
+            request("GET", "/nope", socket_path=daemon)
+        assert exc.value.status == 404
+
+    def test_socket_owner_only(self, daemon):
+        assert daemon.stat().st_mode & 0o777 == 0o600
+
+    def test_second_daemon_refused(self, daemon):
+        with pytest.raises(OSError, match="bereits ein Daemon"):
+            DaemonServer(daemon, JobQueue(workers=1), {})
+
+    def test_stale_socket_replaced(self, tmp_path, restore_stdout):
+        socket_path = tmp_path / "stale.sock"
+        socket_path.touch()
+        server = DaemonServer(socket_path, JobQueue(workers=1), {})
+        server.server_close()
+        assert not socket_path.exists()
+
+
+class TestClient:
+    def test_no_daemon(self, tmp_path):
+        with pytest.raises(DaemonUnavailable):
+            request("GET", "/health", socket_path=tmp_path / "missing.sock")
+
+    def test_socket_from_env(self, monkeypatch):
+        monkeypatch.setenv("DEBIAN_CLOUD_INIT_SOCKET", "/run/dci.sock")
+        assert str(client.default_socket_path()) == "/run/dci.sock"
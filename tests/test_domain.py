@@ -0,0 +1,171 @@
+"""Unit-Tests für domain.py
+
+Die Golden-Files in tests/golden/ halten das vom Generator erzeugte
+Gerätelayout fest, damit Änderungen daran auffallen. Nach einer gewollten Änderung
+mit `UPDATE_GOLDEN=1 pytest tests/test_domain.py` neu schreiben.
+"""
+
+import os
+import pathlib
+import xml.etree.ElementTree as ET
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import virt
+from debian_cloud_init.domain import _find, _template, domain_xml, os_id
+from debian_cloud_init.overlay import overlay_settings
+from debian_cloud_init.vm import create_vm
+from debian_cloud_init.workspace import SEED_TOKEN
+
+GOLDEN = pathlib.Path(__file__).parent / "golden"
+ISOS = pathlib.Path("/isos")
+PLAN = {"node": 1, "cpus": [8, 9, 10, 11], "emulator": [12], "memory_mb": 8192}
+
+CASES = {
+    "amd64-default-nat": {"vmname": "vm1", "arch": "amd64", "distro": "debian/13", "profile_name": "default"},
+    "amd64-balanced-bridge": {"vmname": "web", "arch": "amd64", "distro": "debian/12", "profile_name": "balanced",
+                              "net_type": "bridge", "bridge_interface": "eno1"},
+    "amd64-database-numa": {"vmname": "pg", "arch": "amd64", "distro": "ubuntu/24.04", "profile_name": "database",
+                            "pinning": PLAN},
+    "arm64-default-nat": {"vmname": "arm", "arch": "arm64", "distro": "debian/13", "profile_name": "default"},
+}
+
+
+def _render(case: dict) -> str:
+    name = case["vmname"]
+    return domain_xml(disk=ISOS / f"{name}.qcow2", seed_iso=ISOS / f"{name}-seed.iso",
+                      overlay=overlay_settings(case["profile_name"]), **case)
+
+
+# =============================================================================
+# Golden-Files
+# =============================================================================
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_golden(case):
+    path = GOLDEN / f"domain-{case}.xml"
+    xml = _render(CASES[case])
+    if os.environ.get("UPDATE_GOLDEN"):
+        path.write_text(xml)
+    assert xml == path.read_text()
+
+
+# =============================================================================
+# domain_xml
+# =============================================================================
+
+
+class TestDomainXml:
+    def test_template_cached_and_not_mutated(self):
+        _render(CASES["amd64-database-numa"])
+        template = _template("amd64", "q35", "database")
+        assert template.find("cputune") is None
+        assert _find(template, "name").text is None
+        assert _template("amd64", "q35", "database") is template
+
+    def test_untuned_overlay_has_no_metadata_cache(self):
+        root = ET.fromstring(_render(CASES["amd64-default-nat"]))
+        assert root.find("devices/disk/driver/metadata_cache") is None
+
+    def test_paths_escaped(self):
+        xml = domain_xml("vm", "amd64", "debian/13", "default", pathlib.Path("/a&b/vm.qcow2"), ISOS / "s.iso")
+        assert _find(ET.fromstring(xml), "devices/disk/source").get("file") == "/a&b/vm.qcow2"
+
+    def test_seed_server_instead_of_cdrom(self):
+        serial = "ds=nocloud;s=http://192.168.122.1:8765/kvm/vm/"
+        xml = domain_xml("vm", "amd64", "debian/13", "default", ISOS / "vm.qcow2", None,
+                         pinning=PLAN, smbios_serial=serial)
+        root = ET.fromstring(xml)
+        assert root.find("devices/disk[@device='cdrom']") is None
+        assert root.findtext("sysinfo[@type='smbios']/system/entry[@name='serial']") == serial
+        assert _find(root, "os/smbios").get("mode") == "sysinfo"
+        tags = [child.tag for child in root]
+        assert tags.index("numatune") < tags.index("sysinfo") < tags.index("os")
+
+    def test_os_id(self):
+        assert os_id("debian/13") == "http://debian.org/debian/13"
+        assert os_id("ubuntu/24.04") == "http://ubuntu.com/ubuntu/24.04"
+
+
+# =============================================================================
+# create_vm
+# =============================================================================
+
+
+def _create(tmp_path, monkeypatch, define_error=None, **kwargs):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "cloud-init.yml").write_text("#cloud-config\n")
+    with patch("debian_cloud_init.vm.ISOS_PATH", ISOS), \
+         patch("debian_cloud_init.vm.ask_yes_no", return_value=True), \
+         patch("debian_cloud_init.vm.progress"), \
+         patch("debian_cloud_init.vm.create_seed_iso", return_value=ISOS / "vm1-seed.iso") as mock_seed, \
+         patch("debian_cloud_init.vm.virt.define_and_start", return_value=define_error) as mock_define, \
+         patch("debian_cloud_init.vm.run_cmd") as mock_run:
+        assert create_vm("vm1", "user", "amd64", workspace=tmp_path, **kwargs) is True
+    return mock_seed, mock_define, mock_run
+
+
+class TestCreateVm:
+    def test_defines_domain_without_virt_install(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("DEBIAN_CLOUD_INIT_VIRT_INSTALL", raising=False)
+        mock_seed, mock_define, mock_run = _create(tmp_path, monkeypatch)
+        mock_seed.assert_called_once_with("vm1", tmp_path)
+        assert mock_define.call_args.args[0] == (GOLDEN / "domain-amd64-default-nat.xml").read_text()
+        assert not any("virt-install" in c.args[0] for c in mock_run.call_args_list)
+
+    def test_define_error_exits(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("DEBIAN_CLOUD_INIT_VIRT_INSTALL", raising=False)
+        with pytest.raises(SystemExit):
+            _create(tmp_path, monkeypatch, define_error="kaputt")
+
+    def test_virt_install_fallback(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("DEBIAN_CLOUD_INIT_VIRT_INSTALL", "1")
+        mock_seed, mock_define, mock_run = _create(tmp_path, monkeypatch)
+        mock_seed.assert_not_called()
+        mock_define.assert_not_called()
+        cmd = mock_run.call_args_list[-1].args[0]
+        assert cmd.startswith("virt-install --name vm1 --arch x86_64 --machine q35 ")
+        assert f"--cloud-init user-data={tmp_path / 'cloud-init.yml'},meta-data={tmp_path / 'meta-data.yml'}" in cmd
+
+    def test_seed_server_skips_seed_iso(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("DEBIAN_CLOUD_INIT_VIRT_INSTALL", raising=False)
+        monkeypatch.setenv("DEBIAN_CLOUD_INIT_SEED_URL", "http://192.168.122.1:8765")
+        mock_seed, mock_define, _ = _create(tmp_path, monkeypatch)
+        mock_seed.assert_not_called()
+        assert "ds=nocloud;s=http://192.168.122.1:8765/kvm/vm1/" in mock_define.call_args.args[0]
+
+    def test_seed_server_with_virt_install(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("DEBIAN_CLOUD_INIT_VIRT_INSTALL", "1")
+        monkeypatch.setenv("DEBIAN_CLOUD_INIT_SEED_URL", "http://192.168.122.1:8765")
+        _, _, mock_run = _create(tmp_path, monkeypatch)
+        cmd = mock_run.call_args_list[-1].args[0]
+        token = (tmp_path / SEED_TOKEN).read_text().strip()
+        assert f"--sysinfo 'smbios,system.serial=ds=nocloud;s=http://192.168.122.1:8765/kvm/vm1/{token}/' " in cmd
+        assert "--cloud-init" not in cmd
+
+
+# =============================================================================
+# virt.define_and_start
+# =============================================================================
+
+
+class TestDefineAndStart:
+    XML = "<domain type='kvm'><name>vm1</name></domain>"
+
+    def test_virsh_define_then_start(self):
+        with patch.object(virt, "libvirt", None), \
+             patch("debian_cloud_init.virt.subprocess.run", return_value=MagicMock(returncode=0)) as mock_run:
+            assert virt.define_and_start(self.XML) is None
+        define, start = mock_run.call_args_list
+        assert define.args[0] == ["virsh", "define", "/dev/stdin"]
+        assert define.kwargs["input"] == self.XML
+        assert start.args[0] == ["virsh", "start", "vm1"]
+
+    def test_virsh_error_returned(self):
+        failed = MagicMock(returncode=1, stderr="error: invalid XML\n")
+        with patch.object(virt, "libvirt", None), \
+             patch("debian_cloud_init.virt.subprocess.run", return_value=failed) as mock_run:
+            assert virt.define_and_start(self.XML) == "error: invalid XML"
+        assert mock_run.call_count == 1
@@ -0,0 +1,145 @@
+"""Unit-Tests für engine.py"""
+
+import asyncio
+import subprocess
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init.engine import (
+    CommandError,
+    CommandTimeout,
+    run_all,
+    run_async,
+    run_sync,
+)
+from proxmox_cloud_init.vm import ssh_run, ssh_run_async
+
+PY = sys.executable
+
+
+def _script(code: str) -> list[str]:
+    return [PY, "-c", code]
+
+
+# =============================================================================
+# run_async / run_sync
+# =============================================================================
+
+
+class TestRun:
+    def test_stdout_captured(self):
+        result = run_sync(["echo", "hallo welt"])
+        assert result.returncode == 0
+        assert result.stdout == "hallo welt\n"
+
+    def test_no_shell_interpretation(self):
+        assert run_sync(["echo", "$HOME; ls"]).stdout == "$HOME; ls\n"
+
+    def test_nonzero_raises_with_stderr(self):
+        with pytest.raises(CommandError) as exc_info:
+            run_sync(_script("import sys; print('kaputt', file=sys.stderr); sys.exit(3)"))
+        assert exc_info.value.returncode == 3
+        assert "kaputt" in exc_info.value.stderr
+        assert "Exit-Code 3: kaputt" in str(exc_info.value)
+
+    def test_check_false_returns_result(self):
+        assert run_sync(["false"], check=False).returncode == 1
+
+    def test_missing_binary(self):
+        with pytest.raises(CommandError) as exc_info:
+            run_sync(["/nonexistent/tool"])
+        assert exc_info.value.returncode == 127
+
+    def test_input_passed_to_stdin(self):
+        assert run_sync(["cat"], input="a\nb\n").stdout == "a\nb\n"
+
+    def test_lines_streamed_in_order(self):
+        lines = []
+        run_sync(_script("import sys\nfor i in range(3): print(i, flush=True)\nprint('e', file=sys.stderr)"),
+                 on_line=lambda argv, stream, line: lines.append((stream, line)))
+        assert [line for stream, line in lines if stream == "stdout"] == ["0", "1", "2"]
+        assert ("stderr", "e") in lines
+
+    def test_long_single_line(self):
+        # pvesh … --output-format json liefert alles in einer Zeile
+        assert len(run_sync(_script("print('x' * 200000)")).stdout) == 200001
+
+    def test_line_over_limit_raises_and_kills(self):
+        with patch("debian_cloud_init.engine.LINE_LIMIT", 1024), pytest.raises(CommandError) as exc_info:
+            run_sync(_script("import time; print('x' * 5000, flush=True); time.sleep(10)"))
+        assert "länger als 1024" in str(exc_info.value)
+
+
+class TestTimeoutAndCancel:
+    def test_timeout_kills_process(self):
+        started = time.monotonic()
+        with pytest.raises(CommandTimeout) as exc_info:
+            run_sync(["sleep", "10"], timeout=0.2)
+        assert time.monotonic() - started < 5
+        assert exc_info.value.returncode is None
+        assert "Timeout" in str(exc_info.value)
+
+    def test_cancel_kills_process(self):
+        async def scenario():
+            task = asyncio.create_task(run_async(["sleep", "10"]))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        started = time.monotonic()
+        asyncio.run(scenario())
+        assert time.monotonic() - started < 5
+
+
+# =============================================================================
+# run_all
+# =============================================================================
+
+
+class TestRunAll:
+    def test_runs_concurrently(self):
+        started = time.monotonic()
+        results = asyncio.run(run_all([["sleep", "0.5"]] * 4, limit=4))
+        assert time.monotonic() - started < 1.5
+        assert [r.returncode for r in results] == [0, 0, 0, 0]
+
+    def test_errors_returned_in_place(self):
+        results = asyncio.run(run_all([["true"], ["false"], ["echo", "x"]]))
+        assert results[0].returncode == 0
+        assert isinstance(results[1], CommandError)
+        assert results[2].stdout == "x\n"
+
+
+# =============================================================================
+# Proxmox
+# =============================================================================
+
+
+class TestSshRunAsync:
+    def test_builds_ssh_argv(self):
+        async def fake_run(argv, **kwargs):
+            return subprocess.CompletedProcess(argv, 0, "", "")
+
+        with patch("proxmox_cloud_init.vm.run_async", side_effect=fake_run) as mock_run:
+            asyncio.run(ssh_run_async("pve", "root", "qm list"))
+        argv = mock_run.call_args.args[0]
+        assert argv[0] == "ssh"
+        assert argv[-2:] == ["root@pve", "qm list"]
+        assert "BatchMode=yes" in argv
+
+
+class TestSshRun:
+    def test_wraps_run_sync(self):
+        with patch("proxmox_cloud_init.vm.run_sync", return_value=MagicMock(returncode=0, stdout="ok\n")) as mock_run:
+            assert ssh_run("pve", "root", "qm list", capture=True).stdout == "ok\n"
+        assert mock_run.call_args.args[0][-2:] == ["root@pve", "qm list"]
+        assert mock_run.call_args.kwargs["label"] == "ssh qm"
+
+    def test_failure_exits(self):
+        with patch("proxmox_cloud_init.vm.run_sync", return_value=MagicMock(returncode=1, stdout="", stderr="denied")), \
+             pytest.raises(SystemExit):
+            ssh_run("pve", "root", "qm list", capture=True)
@@ -0,0 +1,192 @@
+"""Unit-Tests für debian_cloud_init/facts.py und proxmox_cloud_init/facts.py"""
+
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import facts
+from debian_cloud_init.facts import (
+    cached_facts,
+    invalidate,
+    missing_tools,
+    parse_interfaces,
+)
+from proxmox_cloud_init import facts as proxmox_facts
+from proxmox_cloud_init.facts import host_facts, known_image, parse_probe, record_image
+
+TTLS = {"a": 100, "b": 10}
+
+IP_LINK = (
+    "1: lo: <LOOPBACK,UP> mtu 65536 qdisc noqueue state UNKNOWN\n"
+    "2: enp3s0: <BROADCAST,MULTICAST,UP> mtu 1500 qdisc fq_codel state UP\n"
+    "3: virbr0: <BROADCAST,MULTICAST,UP> mtu 1500 qdisc noqueue state DOWN\n"
+    "4: eth0@if12: <BROADCAST,MULTICAST,UP> mtu 1500 qdisc noqueue state UP\n"
+    "5: docker0: <NO-CARRIER,BROADCAST,MULTICAST,UP> mtu 1500 qdisc noqueue state DOWN\n"
+)
+
+PROBE_OUTPUT = "\n".join([
+    "@@node",
+    "pve1",
+    "@@resources",
+    json.dumps([
+        {"type": "node", "node": "pve1", "status": "online"},
+        {"type": "node", "node": "pve2", "status": "offline"},
+        {"type": "storage", "node": "pve1", "storage": "local-lvm", "content": "images,rootdir",
+         "status": "available", "shared": 0},
+        {"type": "storage", "node": "pve1", "storage": "local", "content": "iso,snippets",
+         "status": "available", "shared": 0},
+        {"type": "storage", "node": "pve1", "storage": "nfs", "content": "images", "status": "unknown"},
+        {"type": "qemu", "node": "pve1", "vmid": 100},
+    ]),
+    "@@bridges pve1",
+    json.dumps([{"iface": "vmbr1"}, {"iface": "vmbr0"}]),
+    "@@bridges pve2",
+    "@@images",
+    "local:iso/debian-13-generic-amd64.qcow2.img /var/lib/vz/template/iso/debian-13-generic-amd64.qcow2.img",
+])
+
+
+@pytest.fixture
+def facts_file(tmp_path):
+    with patch.object(facts, "FACTS_FILE", tmp_path / ".host-facts"):
+        yield tmp_path / ".host-facts"
+
+
+def _write(facts_file, entries: dict):
+    facts_file.write_text(json.dumps(entries))
+
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+
+class TestCachedFacts:
+    def test_first_call_probes_and_stores(self, facts_file):
+        probe = MagicMock(return_value={"a": 1, "b": 2})
+        assert cached_facts("proxmox", "pve", probe, TTLS) == {"a": 1, "b": 2}
+        assert json.loads(facts_file.read_text())["proxmox/pve"]["facts"] == {"a": 1, "b": 2}
+
+    def test_fresh_entry_not_probed(self, facts_file):
+        _write(facts_file, {"local": {"probed": time.time(), "facts": {"a": 1, "b": 2}}})
+        probe = MagicMock()
+        assert cached_facts("local", None, probe, TTLS)["a"] == 1
+        probe.assert_not_called()
+
+    def test_ttl_per_key(self, facts_file):
+        _write(facts_file, {"local": {"probed": time.time() - 50, "facts": {"a": 1, "b": 2}}})
+        probe = MagicMock(return_value={"a": 3, "b": 4})
+        assert cached_facts("local", None, probe, TTLS, keys=["a"])["a"] == 1
+        assert cached_facts("local", None, probe, TTLS, keys=["b"])["b"] == 4
+        probe.assert_called_once()
+
+    def test_refresh_forces_probe(self, facts_file):
+        _write(facts_file, {"local": {"probed": time.time(), "facts": {"a": 1, "b": 2}}})
+        assert cached_facts("local", None, lambda: {"a": 5, "b": 6}, TTLS, refresh=True)["a"] == 5
+
+    def test_failed_probe_keeps_cache(self, facts_file):
+        def probe():
+            raise proxmox_facts.ProbeError("ssh")
+
+        with pytest.raises(proxmox_facts.ProbeError):
+            cached_facts("proxmox", "pve", probe, TTLS)
+        assert not facts_file.exists()
+
+
+class TestInvalidate:
+    def test_single_key_forces_probe(self, facts_file):
+        _write(facts_file, {"local": {"probed": time.time(), "facts": {"a": 1, "b": 2}}})
+        assert invalidate("local", keys=["b"]) == 1
+        probe = MagicMock(return_value={"a": 3, "b": 4})
+        assert cached_facts("local", None, probe, TTLS, keys=["a"])["a"] == 1
+        assert cached_facts("local", None, probe, TTLS, keys=["b"])["b"] == 4
+
+    def test_host_only(self, facts_file):
+        _write(facts_file, {
+            "local": {"probed": 1, "facts": {}},
+            "proxmox/a": {"probed": 1, "facts": {}},
+            "proxmox/b": {"probed": 1, "facts": {}},
+        })
+        assert invalidate("proxmox", "a") == 1
+        assert sorted(json.loads(facts_file.read_text())) == ["local", "proxmox/b"]
+
+    def test_backend(self, facts_file):
+        _write(facts_file, {"local": {"probed": 1, "facts": {}}, "proxmox/a": {"probed": 1, "facts": {}}})
+        assert invalidate("proxmox") == 1
+        assert list(json.loads(facts_file.read_text())) == ["local"]
+
+
+# =============================================================================
+# Lokaler Host
+# =============================================================================
+
+
+class TestLocalFacts:
+    def test_parse_interfaces(self):
+        assert parse_interfaces(IP_LINK) == ["enp3s0", "eth0"]
+
+    def test_missing_tool_searched_again(self, facts_file):
+        _write(facts_file, {"local": {"probed": time.time(), "facts": {"tools": {"qemu-img": None}}}})
+        with patch("debian_cloud_init.facts.shutil.which", return_value="/usr/bin/qemu-img"), \
+             patch("debian_cloud_init.facts.subprocess.run", return_value=MagicMock(stdout=IP_LINK)):
+            assert missing_tools(["qemu-img"]) == []
+        assert json.loads(facts_file.read_text())["local"]["facts"]["interfaces"] == ["enp3s0", "eth0"]
+
+    def test_present_tools_not_searched(self, facts_file):
+        _write(facts_file, {"local": {"probed": time.time(), "facts": {"tools": {"qemu-img": "/usr/bin/qemu-img"}}}})
+        with patch("debian_cloud_init.facts.shutil.which") as mock_which:
+            assert missing_tools(["qemu-img"]) == []
+        mock_which.assert_not_called()
+
+
+# =============================================================================
+# Proxmox
+# =============================================================================
+
+
+class TestProxmoxFacts:
+    def test_parse_probe(self):
+        result = parse_probe(PROBE_OUTPUT)
+        assert result["node"] == "pve1"
+        assert result["nodes"] == ["pve1"]
+        assert [s["storage"] for s in result["storages"]["pve1"]] == ["local", "local-lvm"]
+        assert proxmox_facts.node_storages(result, "pve1") == ["local-lvm"]
+        assert result["bridges"] == {"pve1": ["vmbr0", "vmbr1"], "pve2": []}
+        assert result["images"]["local:iso/debian-13-generic-amd64.qcow2.img"].startswith("/var/lib/vz/")
+
+    def test_single_ssh_call(self, facts_file):
+        with patch("proxmox_cloud_init.facts.ssh_run",
+                   return_value=MagicMock(returncode=0, stdout=PROBE_OUTPUT)) as mock_ssh, \
+             patch("proxmox_cloud_init.facts.progress"):
+            host_facts("pve", "root")
+            host_facts("pve", "root", keys=["bridges"])
+        mock_ssh.assert_called_once()
+
+    def test_unreachable_host_returns_empty(self, facts_file):
+        with patch("proxmox_cloud_init.facts.ssh_run",
+                   return_value=MagicMock(returncode=255, stdout="", stderr="Connection refused")), \
+             patch("proxmox_cloud_init.facts.progress"):
+            assert host_facts("pve", "root") == {}
+        assert not facts_file.exists()
+
+    def test_known_and_recorded_images(self, facts_file):
+        _write(facts_file, {"proxmox/pve": {"probed": time.time(), "facts": {"images": {}}}})
+        assert known_image("pve", "local", "a.img") is None
+        record_image("pve", "local", "a.img", "/var/lib/vz/template/iso/a.img")
+        assert known_image("pve", "local", "a.img") == "/var/lib/vz/template/iso/a.img"
+
+    def test_expired_images_ignored(self, facts_file):
+        _write(facts_file, {"proxmox/pve": {"probed": time.time() - 3600,
+                                            "facts": {"images": {"local:iso/a.img": "/x/a.img"}}}})
+        assert known_image("pve", "local", "a.img") is None
+
+    def test_ensure_image_skips_ssh_for_known_image(self, facts_file):
+        from proxmox_cloud_init.images import ensure_image
+
+        _write(facts_file, {"proxmox/pve": {"probed": time.time(), "facts": {
+            "images": {"local:iso/debian-13-generic-amd64.qcow2.img": "/x/debian-13-generic-amd64.qcow2.img"}}}})
+        with patch("proxmox_cloud_init.images.ssh_run") as mock_ssh:
+            assert ensure_image("pve", "root", "amd64", "debian/13") == "/x/debian-13-generic-amd64.qcow2.img"
+        mock_ssh.assert_not_called()
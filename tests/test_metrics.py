@@ -0,0 +1,156 @@
+"""Unit-Tests für debian_cloud_init/metrics.py"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from debian_cloud_init import metrics
+from debian_cloud_init.metrics import (
+    command_label,
+    count_cache,
+    fleet,
+    flush,
+    inc,
+    merge,
+    observe,
+    record_run,
+    render,
+    scoped_labels,
+)
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    with patch.object(metrics, "_live", {}), patch.object(metrics, "_pending", {}), \
+         patch.object(metrics, "_collectors", []):
+        token = metrics._labels.set(None)
+        yield
+        metrics._labels.reset(token)
+
+
+@pytest.fixture
+def textfile(tmp_path, monkeypatch):
+    monkeypatch.setenv(metrics.ENV, str(tmp_path))
+    return tmp_path / metrics.TEXTFILE_NAME
+
+
+# =============================================================================
+# Ausgabe
+# =============================================================================
+
+
+class TestRender:
+    def test_empty(self):
+        assert render() == ""
+
+    def test_counter_with_labels(self):
+        with scoped_labels(backend="kvm", distro="debian/13"):
+            count_cache("base_image", True)
+        out = render()
+        assert "# TYPE debian_cloud_init_cache_requests_total counter" in out
+        assert ('debian_cloud_init_cache_requests_total{backend="kvm",cache="base_image",'
+                'distro="debian/13",result="hit"} 1') in out
+
+    def test_histogram_buckets_cumulative(self):
+        observe("phase_duration_seconds", 7, phase="build")
+        observe("phase_duration_seconds", 45, phase="build")
+        lines = render().splitlines()
+        assert 'debian_cloud_init_phase_duration_seconds_bucket{phase="build",le="5"} 0' in lines
+        assert 'debian_cloud_init_phase_duration_seconds_bucket{phase="build",le="10"} 1' in lines
+        assert 'debian_cloud_init_phase_duration_seconds_bucket{phase="build",le="60"} 2' in lines
+        assert 'debian_cloud_init_phase_duration_seconds_bucket{phase="build",le="+Inf"} 2' in lines
+        assert 'debian_cloud_init_phase_duration_seconds_sum{phase="build"} 52' in lines
+        assert 'debian_cloud_init_phase_duration_seconds_count{phase="build"} 2' in lines
+
+    def test_label_values_escaped(self):
+        inc("retries_total", operation='a"b\\c')
+        assert 'operation="a\\"b\\\\c"' in render()
+
+    def test_command_label(self):
+        assert command_label("qm set 100 --ipconfig0 ip=dhcp") == "qm"
+        assert command_label("/usr/bin/pvesh get /nodes") == "pvesh"
+        assert command_label("  $(cat x)") == "sh"
+
+
+class TestFleet:
+    def test_all_states_emitted(self):
+        fleet(["running", "shut off", "crashed"], backend="kvm", host="h")
+        out = render()
+        assert 'debian_cloud_init_fleet_vms{backend="kvm",host="h",state="running"} 1' in out
+        assert 'debian_cloud_init_fleet_vms{backend="kvm",host="h",state="stopped"} 1' in out
+        assert 'debian_cloud_init_fleet_vms{backend="kvm",host="h",state="paused"} 0' in out
+        assert 'debian_cloud_init_fleet_vms{backend="kvm",host="h",state="other"} 1' in out
+
+    def test_gauge_ignores_context_labels(self):
+        with scoped_labels(distro="debian/13"):
+            fleet([], backend="kvm")
+        assert "distro" not in render()
+
+    def test_failing_collector_ignored(self):
+        def broken():
+            raise RuntimeError("libvirt weg")
+
+        metrics.register_collector(broken)
+        metrics.register_collector(lambda: fleet(["running"]))
+        assert 'state="running"} 1' in render()
+
+
+# =============================================================================
+# Textdatei
+# =============================================================================
+
+
+class TestFlush:
+    def test_without_env_writes_nothing(self, tmp_path, monkeypatch):
+        monkeypatch.delenv(metrics.ENV, raising=False)
+        inc("runs_total", result="ok")
+        flush()
+        assert list(tmp_path.iterdir()) == []
+
+    def test_counters_accumulate_across_runs(self, textfile):
+        inc("runs_total", result="ok")
+        flush()
+        inc("runs_total", result="ok")
+        flush()
+        assert 'debian_cloud_init_runs_total{result="ok"} 2' in textfile.read_text()
+        assert not list(textfile.parent.glob(".*.tmp"))
+
+    def test_gauges_replaced(self, textfile):
+        fleet(["running", "running"])
+        flush()
+        fleet(["running"])
+        flush()
+        assert 'debian_cloud_init_fleet_vms{state="running"} 1' in textfile.read_text()
+
+    def test_corrupt_state_restarted(self, textfile):
+        textfile.with_name(textfile.name + ".json").write_text("{")
+        inc("runs_total", result="ok")
+        flush()
+        assert 'result="ok"} 1' in textfile.read_text()
+
+    def test_merge_histograms(self):
+        hist = {"buckets": [1, 2], "sum": 3.0, "count": 2}
+        state = {"command_duration_seconds": {"k": dict(hist)}}
+        merge(state, {"command_duration_seconds": {"k": dict(hist)}})
+        assert state["command_duration_seconds"]["k"] == {"buckets": [2, 4], "sum": 6.0, "count": 4}
+
+
+class TestRecordRun:
+    def test_ok(self, textfile):
+        with record_run("proxmox", host="pve"):
+            pass
+        state = json.loads(textfile.with_name(textfile.name + ".json").read_text())
+        keys = list(state["runs_total"])
+        assert json.loads(keys[0]) == [["backend", "proxmox"], ["host", "pve"], ["result", "ok"]]
+        assert 'phase="total"' in textfile.read_text()
+
+    def test_fail_counted_as_error(self, textfile):
+        with pytest.raises(SystemExit), record_run("kvm"):
+            raise SystemExit(1)
+        assert 'debian_cloud_init_runs_total{backend="kvm",result="error"} 1' in textfile.read_text()
+
+    def test_write_error_does_not_abort(self, textfile, capsys):
+        with patch("debian_cloud_init.metrics.flush", side_effect=PermissionError("nope")), record_run("kvm"):
+            pass
+        assert "Metriken konnten nicht geschrieben werden" in capsys.readouterr().out
@@ -0,0 +1,236 @@
+"""Unit-Tests für numa.py"""
+
+import json
+import pathlib
+from unittest.mock import patch
+
+import pytest
+
+from debian_cloud_init import numa
+from debian_cloud_init.numa import (
+    format_cpulist,
+    hugepages_needed,
+    parse_capabilities,
+    parse_cpulist,
+    plan_pinning,
+    prune_ledger,
+    read_sysfs_topology,
+    release_pinning,
+    reserve_pinning,
+    virt_install_numa_options,
+)
+from debian_cloud_init.vm import create_vm
+
+_CAPABILITIES = """\
+<capabilities><host><topology><cells num='2'>
+  <cell id='0'>
+    <memory unit='KiB'>16777216</memory>
+    <pages unit='KiB' size='4'>4194304</pages>
+    <pages unit='KiB' size='2048'>1024</pages>
+    <cpus num='2'><cpu id='0'/><cpu id='1'/></cpus>
+  </cell>
+  <cell id='1'>
+    <memory unit='KiB'>16777216</memory>
+    <pages unit='KiB' size='2048'>0</pages>
+    <cpus num='2'><cpu id='2'/><cpu id='3'/></cpus>
+  </cell>
+</cells></topology></host></capabilities>
+"""
+
+
+def _topology(free_pages=(4096, 4096)):
+    return {
+        0: {"cpus": [0, 1, 2, 3, 4, 5, 6, 7], "memory_mb": 32768, "hugepages_total": 4096, "hugepages_free": free_pages[0]},
+        1: {"cpus": [8, 9, 10, 11, 12, 13, 14, 15], "memory_mb": 32768, "hugepages_total": 4096, "hugepages_free": free_pages[1]},
+    }
+
+
+def _make_node(root, node, cpulist, free_pages):
+    node_dir = root / f"node{node}"
+    hp = node_dir / "hugepages" / "hugepages-2048kB"
+    hp.mkdir(parents=True)
+    (node_dir / "cpulist").write_text(cpulist + "\n")
+    (node_dir / "meminfo").write_text(f"Node {node} MemTotal:       16384000 kB\n")
+    (hp / "nr_hugepages").write_text("1024\n")
+    (hp / "free_hugepages").write_text(f"{free_pages}\n")
+
+
+@pytest.fixture
+def ledger_file(tmp_path):
+    with patch.object(numa, "LEDGER_FILE", tmp_path / ".numa-ledger.json"):
+        yield tmp_path / ".numa-ledger.json"
+
+
+# =============================================================================
+# Topologie
+# =============================================================================
+
+
+class TestCpulist:
+    def test_parse_ranges(self):
+        assert parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+
+    def test_format_roundtrip(self):
+        assert format_cpulist([11, 0, 1, 2, 3, 8, 10]) == "0-3,8,10-11"
+
+
+class TestReadTopology:
+    def test_sysfs(self, tmp_path):
+        _make_node(tmp_path, 0, "0-3", 1000)
+        _make_node(tmp_path, 1, "4-7", 12)
+        topology = read_sysfs_topology(tmp_path)
+        assert topology[0]["cpus"] == [0, 1, 2, 3]
+        assert topology[0]["memory_mb"] == 16000
+        assert topology[1]["hugepages_free"] == 12
+
+    def test_sysfs_memory_only_node_skipped(self, tmp_path):
+        _make_node(tmp_path, 0, "0-3", 0)
+        _make_node(tmp_path, 1, "", 0)
+        assert list(read_sysfs_topology(tmp_path)) == [0]
+
+    def test_virsh_capabilities(self):
+        topology = parse_capabilities(_CAPABILITIES)
+        assert topology[0]["cpus"] == [0, 1]
+        assert topology[0]["hugepages_total"] == 1024
+        assert topology[1]["hugepages_free"] == 0
+        assert topology[1]["memory_mb"] == 16384
+
+
+# =============================================================================
+# Planung
+# =============================================================================
+
+
+class TestPlanPinning:
+    def test_vcpus_and_emulator_on_one_node(self):
+        plan = plan_pinning(_topology(), {}, vcpus=4, memory_mb=4096)
+        assert plan["node"] == 0
+        assert plan["cpus"] == [0, 1, 2, 3]
+        assert plan["emulator"] == [4]
+
+    def test_ledger_cores_never_reused(self):
+        ledger = {"kafka": {"node": 0, "cpus": [0, 1, 2, 3], "emulator": [4], "memory_mb": 4096}}
+        plan = plan_pinning(_topology(), ledger, vcpus=4, memory_mb=4096)
+        assert plan["node"] == 1
+        assert not set(plan["cpus"] + plan["emulator"]) & {0, 1, 2, 3, 4}
+
+    def test_node_without_hugepages_skipped(self):
+        plan = plan_pinning(_topology(free_pages=(0, 4096)), {}, vcpus=2, memory_mb=4096)
+        assert plan["node"] == 1
+
+    def test_no_capacity_exits(self):
+        with pytest.raises(SystemExit):
+            plan_pinning(_topology(free_pages=(10, 10)), {}, vcpus=2, memory_mb=4096)
+
+    def test_pending_ledger_hugepages_subtracted(self):
+        # "kafka" ist definiert, aber noch nicht gestartet – sysfs zeigt seine Pages noch als frei
+        ledger = {"kafka": {"node": 0, "cpus": [0, 1], "emulator": [2], "memory_mb": 4096}}
+        plan = plan_pinning(_topology(free_pages=(3000, 4096)), ledger, vcpus=2, memory_mb=4096, active=set())
+        assert plan["node"] == 1
+
+    def test_running_ledger_hugepages_not_counted_twice(self):
+        ledger = {"kafka": {"node": 0, "cpus": [0, 1], "emulator": [2], "memory_mb": 4096}}
+        plan = plan_pinning(_topology(free_pages=(2048, 0)), ledger, vcpus=2, memory_mb=4096, active={"kafka"})
+        assert plan["node"] == 0
+
+    def test_hugepages_rounded_up(self):
+        assert hugepages_needed(4096) == 2048
+        assert hugepages_needed(3) == 2
+
+
+class TestLedger:
+    def test_reserve_records_and_release_frees(self, ledger_file):
+        with patch("debian_cloud_init.numa.read_host_topology", return_value=_topology()), \
+             patch("debian_cloud_init.numa._domain_states", return_value={"pg": "running"}):
+            reserve_pinning("pg", 2, 2048)
+        assert json.loads(ledger_file.read_text())["pg"]["cpus"] == [0, 1]
+        release_pinning("pg")
+        assert json.loads(ledger_file.read_text()) == {}
+
+    def test_second_reservation_gets_other_cores(self, ledger_file):
+        with patch("debian_cloud_init.numa.read_host_topology", return_value=_topology()), \
+             patch("debian_cloud_init.numa._domain_states", return_value={"a": "shut off", "b": "shut off"}):
+            first = reserve_pinning("a", 2, 2048)
+            second = reserve_pinning("b", 2, 2048)
+        assert not set(first["cpus"] + first["emulator"]) & set(second["cpus"] + second["emulator"])
+
+    def test_parallel_reservations_do_not_overcommit_hugepages(self, ledger_file):
+        with patch("debian_cloud_init.numa.read_host_topology", return_value=_topology(free_pages=(2048, 0))), \
+             patch("debian_cloud_init.numa._domain_states", return_value={"a": "shut off", "b": "shut off"}):
+            reserve_pinning("a", 2, 4096)
+            with pytest.raises(SystemExit):
+                reserve_pinning("b", 2, 4096)
+
+    def test_prune_removes_undefined_domains(self):
+        ledger = {"gone": {}, "alive": {}}
+        prune_ledger(ledger, {"alive"})
+        assert list(ledger) == ["alive"]
+
+    def test_prune_keeps_fresh_reservations(self):
+        ledger = {"stale": {"reserved_at": 1000}, "fresh": {"reserved_at": 1000 + numa.RESERVATION_GRACE}}
+        prune_ledger(ledger, set(), now=1001 + numa.RESERVATION_GRACE)
+        assert list(ledger) == ["fresh"]
+
+    def test_fresh_undefined_reservation_survives_parallel_reserve(self, ledger_file):
+        # "a" ist reserviert, aber noch nicht definiert, während "b" angelegt wird
+        with patch("debian_cloud_init.numa.read_host_topology", return_value=_topology()), \
+             patch("debian_cloud_init.numa._domain_states", return_value={}):
+            first = reserve_pinning("a", 2, 2048)
+            second = reserve_pinning("b", 2, 2048)
+        assert not set(first["cpus"] + first["emulator"]) & set(second["cpus"] + second["emulator"])
+        assert sorted(json.loads(ledger_file.read_text())) == ["a", "b"]
+
+    def test_prune_keeps_everything_without_libvirt(self):
+        ledger = {"gone": {}}
+        prune_ledger(ledger, None)
+        assert list(ledger) == ["gone"]
+
+    def test_release_without_ledger_is_noop(self, ledger_file):
+        release_pinning("vm")
+        assert not ledger_file.exists()
+
+
+# =============================================================================
+# virt-install
+# =============================================================================
+
+
+class TestVirtInstallNumaOptions:
+    def test_options(self):
+        plan = {"node": 1, "cpus": [8, 9], "emulator": [10], "memory_mb": 4096}
+        cpu_cell, options = virt_install_numa_options(plan)
+        assert cpu_cell == ",cell0.id=0,cell0.cpus=0-1,cell0.memory=4194304,cell0.unit=KiB"
+        assert "--cputune vcpupin0.vcpu=0,vcpupin0.cpuset=8,vcpupin1.vcpu=1,vcpupin1.cpuset=9,emulatorpin.cpuset=10 " in options
+        assert "memory.mode=strict,memory.nodeset=1" in options
+        assert "--memorybacking hugepages.page0.size=2048" in options
+
+    def test_create_vm_with_numa(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "cloud-init.yml").write_text("#cloud-config\n")
+        plan = {"node": 0, "cpus": [2, 3], "emulator": [4], "memory_mb": 4096}
+        with patch("debian_cloud_init.vm.ISOS_PATH", pathlib.Path("/isos")), \
+             patch("debian_cloud_init.vm.ask_yes_no", return_value=True), \
+             patch("debian_cloud_init.vm.progress"), \
+             patch("debian_cloud_init.vm.reserve_pinning", return_value=plan) as mock_reserve, \
+             patch("debian_cloud_init.vm.create_seed_iso"), \
+             patch("debian_cloud_init.vm.virt.define_and_start", return_value=None) as mock_define, \
+             patch("debian_cloud_init.vm.run_cmd"):
+            create_vm("pg", "user", "amd64", numa=True, workspace=tmp_path)
+        mock_reserve.assert_called_once_with("pg", 2, 4096)
+        xml = mock_define.call_args.args[0]
+        assert '<cell id="0" cpus="0-1" memory="4194304" unit="KiB" />' in xml
+        assert '<vcpupin vcpu="1" cpuset="3" />' in xml
+
+    def test_arm64_ignores_numa(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "cloud-init.yml").write_text("#cloud-config\n")
+        with patch("debian_cloud_init.vm.ISOS_PATH", pathlib.Path("/isos")), \
+             patch("debian_cloud_init.vm.ask_yes_no", return_value=True), \
+             patch("debian_cloud_init.vm.progress"), \
+             patch("debian_cloud_init.vm.reserve_pinning") as mock_reserve, \
+             patch("debian_cloud_init.vm.create_seed_iso"), \
+             patch("debian_cloud_init.vm.virt.define_and_start", return_value=None) as mock_define, \
+             patch("debian_cloud_init.vm.run_cmd"):
+            create_vm("pg", "user", "arm64", numa=True, workspace=tmp_path)
+        mock_reserve.assert_not_called()
+        assert "<cputune>" not in mock_define.call_args.args[0]
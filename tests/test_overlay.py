@@ -0,0 +1,134 @@
+"""Unit-Tests für overlay.py"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init.overlay import (
+    benchmark,
+    create_options,
+    format_benchmark,
+    l2_cache_bytes,
+    overlay_settings,
+    parse_overrides,
+    parse_size,
+    virt_install_cache_options,
+)
+from debian_cloud_init.vm import ensure_overlay_image
+
+# =============================================================================
+# Einstellungen
+# =============================================================================
+
+
+class TestSettings:
+    def test_parse_size_units(self):
+        assert parse_size("64k") == 65536
+        assert parse_size("30G") == 30 * 1024 ** 3
+
+    def test_default_profile_untuned(self):
+        assert create_options(overlay_settings("default")) == ""
+
+    def test_overrides_merge_over_profile(self):
+        settings = overlay_settings("default", {"cluster_size": "128k", "extended_l2": "on"})
+        assert create_options(settings) == ",cluster_size=128k,extended_l2=on"
+
+    def test_database_profile_options(self):
+        assert create_options(overlay_settings("database")) == (
+            ",cluster_size=64k,extended_l2=on,preallocation=metadata,lazy_refcounts=on"
+        )
+
+    def test_preallocation_needs_extended_l2(self):
+        with pytest.raises(SystemExit):
+            overlay_settings("default", {"preallocation": "metadata"})
+
+    def test_extended_l2_needs_16k_clusters(self):
+        with pytest.raises(SystemExit):
+            overlay_settings("default", {"cluster_size": "4k", "extended_l2": "on"})
+
+    def test_cluster_size_power_of_two(self):
+        with pytest.raises(SystemExit):
+            overlay_settings("default", {"cluster_size": "96k"})
+
+    def test_parse_overrides(self):
+        assert parse_overrides(["cluster-size=128k", "lazy_refcounts=on"]) == {
+            "cluster_size": "128k", "lazy_refcounts": "on",
+        }
+
+    def test_parse_overrides_unknown_key_exits(self):
+        with pytest.raises(SystemExit):
+            parse_overrides(["l2_cache=1M"])
+
+
+# =============================================================================
+# L2-Cache
+# =============================================================================
+
+
+class TestL2Cache:
+    def test_covers_whole_disk(self):
+        # 30G / 64k = 491520 Cluster × 8 B = 3840 KiB
+        settings = overlay_settings("default", {"cluster_size": "64k"})
+        assert l2_cache_bytes(settings) == 3840 * 1024
+
+    def test_extended_l2_doubles_entries(self):
+        plain = overlay_settings("default", {"cluster_size": "64k"})
+        extended = overlay_settings("default", {"cluster_size": "64k", "extended_l2": "on"})
+        assert l2_cache_bytes(extended) == 2 * l2_cache_bytes(plain)
+
+    def test_no_xml_for_default(self):
+        assert virt_install_cache_options(overlay_settings("default")) == ""
+
+    def test_xml_for_tuned_overlay(self):
+        opts = virt_install_cache_options(overlay_settings("balanced"))
+        assert "--xml ./devices/disk[1]/driver/metadata_cache/max_size=" in opts
+        assert "/@unit=bytes" in opts
+
+
+# =============================================================================
+# ensure_overlay_image
+# =============================================================================
+
+
+class TestEnsureOverlayImageSettings:
+    def _run(self, tmp_path, settings=None):
+        (tmp_path / "debian-13-generic-amd64.qcow2").touch()
+        with patch("debian_cloud_init.vm.ISOS_PATH", tmp_path), \
+             patch("debian_cloud_init.vm.progress"), \
+             patch("debian_cloud_init.vm.run_cmd") as mock_run:
+            ensure_overlay_image("vm", "amd64", "debian/13", settings)
+        return mock_run.call_args.args[0]
+
+    def test_default_command_unchanged(self, tmp_path):
+        cmd = self._run(tmp_path)
+        assert cmd.endswith(f"-o backing_file={tmp_path}/debian-13-generic-amd64.qcow2 {tmp_path}/vm.qcow2 30G")
+
+    def test_profile_options_and_size(self, tmp_path):
+        cmd = self._run(tmp_path, overlay_settings("database"))
+        assert "extended_l2=on,preallocation=metadata" in cmd
+        assert cmd.endswith(" 60G")
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+
+class TestBenchmark:
+    def test_iops_from_qemu_img_bench(self, tmp_path):
+        def fake_run(cmd, **kwargs):
+            if cmd[1] == "bench":
+                return MagicMock(stdout="Sending 100 write requests...\nRun completed in 0.500 seconds.\n")
+            return MagicMock(stdout="")
+
+        with patch("debian_cloud_init.overlay.subprocess.run", side_effect=fake_run) as mock_run, \
+             patch("debian_cloud_init.overlay.progress"), \
+             patch("pathlib.Path.unlink"):
+            results = benchmark(["default", "balanced"], count=100, workdir=tmp_path)
+        assert results == {"default": 200.0, "balanced": 200.0}
+        creates = [c.args[0] for c in mock_run.call_args_list if c.args[0][1] == "create"]
+        assert any("extended_l2=on" in " ".join(cmd) for cmd in creates)
+
+    def test_report_relative_to_default(self):
+        report = format_benchmark({"default": 1000.0, "database": 2500.0})
+        assert "2.50x" in report.splitlines()[2]
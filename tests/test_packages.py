@@ -0,0 +1,137 @@
+"""Unit-Tests für packages.py"""
+
+import pathlib
+
+import pytest
+
+from debian_cloud_init.packages import (
+    apply_additions,
+    diff_report,
+    install_packages,
+    is_apt_update,
+    is_repo_setup,
+    optimize_runcmd,
+)
+
+REPO_TEMPLATES = pathlib.Path(__file__).resolve().parent.parent / "templates"
+
+
+# =============================================================================
+# Zeilen-Erkennung
+# =============================================================================
+
+
+class TestLineRecognition:
+    @pytest.mark.parametrize("line", ["apt-get update", "sudo apt-get update", "apt update", "apt-get -q update"])
+    def test_update_recognised(self, line):
+        assert is_apt_update(line)
+
+    def test_update_with_shell_logic_not_recognised(self):
+        assert not is_apt_update("apt-get update && reboot")
+
+    def test_install_packages_parsed(self):
+        assert install_packages("apt-get install -y nano htop") == ["nano", "htop"]
+
+    def test_install_with_frontend_prefix(self):
+        assert install_packages("DEBIAN_FRONTEND=noninteractive apt-get -q install -y git") == ["git"]
+
+    @pytest.mark.parametrize("line", [
+        "apt-get install -y -t bookworm-backports linux-image-amd64",
+        "apt-get install -y -o Dpkg::Options::=--force-confold nginx",
+        "apt-get install -y --no-install-recommends qemu-guest-agent",
+        "apt-get -o Acquire::Retries=3 install -y git",
+    ])
+    def test_install_with_other_options_left_alone(self, line):
+        assert install_packages(line) is None
+
+    def test_install_with_shell_substitution_ignored(self):
+        assert install_packages("apt-get install -y linux-headers-$(uname -r)") is None
+
+    def test_non_apt_line_ignored(self):
+        assert install_packages("usermod -aG docker user") is None
+
+    def test_repo_setup_via_tee(self):
+        assert is_repo_setup('echo "deb x" | tee /etc/apt/sources.list.d/docker.list > /dev/null')
+
+    def test_add_apt_repository(self):
+        assert is_repo_setup("add-apt-repository -y ppa:foo/bar")
+
+
+# =============================================================================
+# optimize_runcmd
+# =============================================================================
+
+
+class TestOptimizeRuncmd:
+    def _templates(self):
+        lines = [
+            line.strip()
+            for line in (REPO_TEMPLATES / "package-config.txt").read_text().splitlines()
+            if line.strip()
+        ]
+        return lines, (REPO_TEMPLATES / "system-config.txt").read_text()
+
+    def test_early_packages_become_native_packages(self):
+        additions, _, _ = optimize_runcmd(*self._templates())
+        assert additions == {"package_update": True, "packages": ["ca-certificates", "curl"]}
+
+    def test_single_update_and_install_transaction(self):
+        _, runcmd, script = optimize_runcmd(*self._templates())
+        everything = "\n".join([*runcmd, script])
+        assert everything.count("apt-get update") == 1
+        assert everything.count("apt-get install") == 1
+
+    def test_merged_install_follows_repo_setup(self):
+        _, runcmd, _ = optimize_runcmd(*self._templates())
+        repo_idx = next(i for i, line in enumerate(runcmd) if "sources.list.d" in line)
+        assert "docker-ce" in runcmd[repo_idx + 1]
+        assert "qemu-guest-agent" in runcmd[repo_idx + 1]
+
+    def test_other_script_lines_keep_order(self):
+        _, _, script = optimize_runcmd(*self._templates())
+        lines = script.splitlines()
+        assert lines[0].startswith("usermod")
+        assert lines[-1] == "systemctl enable qemu-guest-agent"
+        assert script.endswith("\n")
+
+    def test_without_repo_everything_is_native(self):
+        additions, runcmd, script = optimize_runcmd(
+            ["apt-get update", "apt-get install -y git", "echo hi"], "apt-get install -y htop git\n",
+        )
+        assert additions["packages"] == ["git", "htop"]
+        assert runcmd == ["echo hi"]
+        assert script == "\n"
+
+    def test_nothing_to_optimise_unchanged(self):
+        additions, runcmd, script = optimize_runcmd(["echo a"], "echo b\n")
+        assert additions == {}
+        assert runcmd == ["echo a"]
+        assert script == "echo b\n"
+
+
+# =============================================================================
+# apply_additions / diff_report
+# =============================================================================
+
+
+class TestApplyAdditions:
+    def test_merges_with_existing_packages(self):
+        cfg = {"packages": ["curl", "jq"]}
+        apply_additions(cfg, {"packages": ["ca-certificates", "curl"], "package_update": True})
+        assert cfg["packages"] == ["curl", "jq", "ca-certificates"]
+        assert cfg["package_update"] is True
+
+    def test_empty_additions_leave_config_untouched(self):
+        cfg = {"runcmd": []}
+        apply_additions(cfg, {})
+        assert cfg == {"runcmd": []}
+
+
+class TestDiffReport:
+    def test_identical_text_empty_diff(self):
+        assert diff_report("a\n", "a\n") == ""
+
+    def test_changed_text_contains_markers(self):
+        report = diff_report("a\nb\n", "a\nc\n")
+        assert "-b" in report
+        assert "+c" in report
@@ -0,0 +1,318 @@
+"""Unit-Tests für pool.py"""
+
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import pool
+from debian_cloud_init.pool import (
+    claim_vm,
+    configure_pool,
+    fill_pools,
+    find_claimed,
+    format_duration,
+    format_pool_status,
+    injection_script,
+    key_slug,
+    locked_pool,
+    parse_duration,
+    plan_fill,
+    pool_key,
+    release_vm,
+    take_ready,
+)
+
+KEY = "debian/13|amd64|default"
+
+
+def _ledger(vms=None, size=2, max_age=3600):
+    return {
+        "pools": {KEY: {"size": size, "max_age": max_age, "username": "ci"}},
+        "vms": vms or {},
+        "metrics": {},
+    }
+
+
+def _ready(ready_at, ip="10.0.0.5"):
+    return {"key": KEY, "state": "ready", "created": ready_at - 100, "ready_at": ready_at, "ip": ip}
+
+
+def _backend(**overrides):
+    backend = {
+        "prune": MagicMock(),
+        "new_vm": MagicMock(side_effect=["vm-a", "vm-b", "vm-c"]),
+        "provision": MagicMock(return_value="10.0.0.9"),
+        "inject": MagicMock(return_value=True),
+        "rename": MagicMock(),
+        "discard": MagicMock(),
+        "refill": MagicMock(),
+    }
+    backend.update(overrides)
+    return backend
+
+
+@pytest.fixture
+def pool_file(tmp_path):
+    path = tmp_path / ".pool.json"
+    with patch("debian_cloud_init.pool.progress"), patch("debian_cloud_init.pool.success"), \
+         patch("debian_cloud_init.ui.NON_INTERACTIVE", False):
+        yield path
+
+
+def _write(pool_file, ledger):
+    pool_file.write_text(json.dumps(ledger))
+
+
+# =============================================================================
+# Schlüssel / Dauer
+# =============================================================================
+
+
+class TestKeys:
+    def test_pool_key_default_profile(self):
+        assert pool_key("debian/13", "amd64", None) == KEY
+
+    def test_slug(self):
+        assert key_slug("ubuntu/24.04|arm64|database") == "ubuntu-24.04-arm64-database"
+
+    def test_parse_duration(self):
+        assert parse_duration("90") == 90
+        assert parse_duration("30m") == 1800
+        assert parse_duration("12h") == 43200
+        assert parse_duration("2d") == 172800
+
+    def test_parse_duration_invalid_exits(self):
+        with pytest.raises(SystemExit):
+            parse_duration("zwei Tage")
+
+    def test_format_duration(self):
+        assert format_duration(86400) == "1d"
+        assert format_duration(5400) == "1.5h"
+        assert format_duration(120) == "2m"
+
+
+# =============================================================================
+# Ledger-Logik
+# =============================================================================
+
+
+class TestTakeReady:
+    def test_oldest_ready_taken(self):
+        ledger = _ledger({"new": _ready(900), "old": _ready(500)})
+        taken = take_ready(ledger, KEY, now=1000)
+        assert taken is not None
+        vm_id, entry = taken
+        assert vm_id == "old"
+        assert entry["state"] == "claimed"
+        assert ledger["vms"]["new"]["state"] == "ready"
+
+    def test_expired_not_taken(self):
+        ledger = _ledger({"old": _ready(0)}, max_age=100)
+        assert take_ready(ledger, KEY, now=1000) is None
+
+    def test_other_key_not_taken(self):
+        ledger = _ledger({"x": {**_ready(900), "key": "debian/12|amd64|default"}})
+        assert take_ready(ledger, KEY, now=1000) is None
+
+
+class TestPlanFill:
+    def test_deficit_for_empty_pool(self):
+        discard, deficits = plan_fill(_ledger(size=3), now=0)
+        assert discard == []
+        assert deficits == {KEY: 3}
+
+    def test_expired_discarded_and_replaced(self):
+        ledger = _ledger({"old": _ready(0), "fresh": _ready(9000)}, size=2, max_age=3600)
+        discard, deficits = plan_fill(ledger, now=10000)
+        assert discard == ["old"]
+        assert deficits == {KEY: 1}
+
+    def test_stale_provisioning_discarded(self):
+        ledger = _ledger({"half": {"key": KEY, "state": "provisioning", "created": 0}}, size=1)
+        discard, deficits = plan_fill(ledger, now=10)
+        assert discard == ["half"]
+        assert deficits == {KEY: 1}
+
+    def test_shrunk_pool_discards_oldest(self):
+        ledger = _ledger({"a": _ready(100), "b": _ready(200), "c": _ready(300)}, size=1)
+        discard, deficits = plan_fill(ledger, now=400)
+        assert sorted(discard) == ["a", "b"]
+        assert deficits == {}
+
+    def test_claimed_vms_not_counted(self):
+        ledger = _ledger({"c": {**_ready(100), "state": "claimed"}}, size=1)
+        assert plan_fill(ledger, now=200) == ([], {KEY: 1})
+
+
+class TestStatus:
+    def test_shows_counts_and_hit_rate(self):
+        ledger = _ledger({"a": _ready(100), "c": {**_ready(50), "state": "claimed"}}, size=2)
+        ledger["metrics"][KEY] = {"hits": 3, "misses": 1, "claim_seconds": 6.0}
+        text = format_pool_status(ledger, now=160)
+        assert "1/2 bereit" in text
+        assert "1 vergeben" in text
+        assert "Treffer 3, Fehlgriffe 1 (75 %)" in text
+        assert "Claim Ø 2.0 s" in text
+
+    def test_no_pools(self):
+        assert format_pool_status({"pools": {}, "vms": {}, "metrics": {}}, 0) == "Keine Pools konfiguriert."
+
+    def test_find_claimed_by_name(self):
+        ledger = _ledger({"vm-a": {**_ready(1), "state": "claimed", "claimed_as": "build-1"}})
+        assert find_claimed(ledger, "build-1") == "vm-a"
+        assert find_claimed(ledger, "build-2") is None
+
+
+class TestInjectionScript:
+    def test_key_and_hostname(self):
+        script = injection_script("ci", "ssh-ed25519 AAAA user@host", "build-1")
+        assert "'ssh-ed25519 AAAA user@host' >> /home/ci/.ssh/authorized_keys" in script
+        assert "hostnamectl set-hostname build-1" in script
+        assert script.isascii()
+
+    @pytest.mark.parametrize("hostname", ["a/b", "x'; reboot; '", "-web", "web-", "a" * 64, "web_1", ""])
+    def test_invalid_hostname_rejected(self, hostname):
+        with pytest.raises(ValueError):
+            injection_script("ci", "key", hostname)
+
+    def test_fqdn_accepted(self):
+        assert "127.0.1.1 build-1.lab.example" in injection_script("ci", "key", "build-1.lab.example")
+
+
+# =============================================================================
+# Auffüllen / Übernehmen
+# =============================================================================
+
+
+class TestConfigure:
+    def test_defaults_and_required(self, pool_file):
+        configure_pool(pool_file, KEY, ("username",), {"ssh_user": "root"}, username="ci", size=None)
+        with locked_pool(pool_file) as ledger:
+            assert ledger["pools"][KEY] == {"size": 2, "max_age": 86400, "ssh_user": "root", "username": "ci"}
+
+    def test_missing_required_exits(self, pool_file):
+        with pytest.raises(SystemExit):
+            configure_pool(pool_file, KEY, ("username",), size=3)
+
+
+class TestFill:
+    def test_provisions_missing(self, pool_file):
+        _write(pool_file, _ledger(size=2))
+        backend = _backend()
+        assert fill_pools(pool_file, backend)
+        with locked_pool(pool_file) as ledger:
+            assert {vm: e["state"] for vm, e in ledger["vms"].items()} == {"vm-a": "ready", "vm-b": "ready"}
+            assert ledger["metrics"][KEY]["provisioned"] == 2
+        backend["discard"].assert_not_called()
+
+    def test_failed_provision_discarded(self, pool_file):
+        _write(pool_file, _ledger(size=1))
+        backend = _backend(provision=MagicMock(return_value=None))
+        fill_pools(pool_file, backend)
+        with locked_pool(pool_file) as ledger:
+            assert ledger["vms"] == {}
+            assert ledger["metrics"][KEY]["failed"] == 1
+        backend["discard"].assert_called_once_with("vm-a", ledger["pools"][KEY])
+
+    def test_expired_recycled(self, pool_file):
+        _write(pool_file, _ledger({"old": _ready(0)}, size=1, max_age=10))
+        backend = _backend()
+        fill_pools(pool_file, backend)
+        assert backend["discard"].call_args.args[0] == "old"
+        with locked_pool(pool_file) as ledger:
+            assert ledger["metrics"][KEY]["recycled"] == 1
+            assert list(ledger["vms"]) == ["vm-a"]
+
+    def test_second_run_skipped_while_locked(self, pool_file):
+        _write(pool_file, _ledger(size=1))
+        backend = _backend()
+        with pool.fill_lock(pool_file) as acquired:
+            assert acquired
+            assert not fill_pools(pool_file, backend)
+        backend["provision"].assert_not_called()
+
+
+class TestClaim:
+    def test_hit(self, pool_file):
+        _write(pool_file, _ledger({"vm-a": _ready(time.time())}))
+        backend = _backend()
+        result = claim_vm(pool_file, backend, KEY, "build-1", "ssh-ed25519 AAAA")
+        assert result["ip"] == "10.0.0.5"
+        assert result["hit"]
+        assert result["username"] == "ci"
+        backend["inject"].assert_called_once()
+        assert backend["inject"].call_args.args[3:] == ("ssh-ed25519 AAAA", "build-1")
+        backend["rename"].assert_called_once_with("vm-a", _ledger()["pools"][KEY], "build-1")
+        backend["refill"].assert_called_once()
+        with locked_pool(pool_file) as ledger:
+            assert ledger["vms"]["vm-a"]["claimed_as"] == "build-1"
+            assert ledger["metrics"][KEY]["hits"] == 1
+
+    def test_miss_triggers_refill_and_exits(self, pool_file):
+        _write(pool_file, _ledger())
+        backend = _backend()
+        with pytest.raises(SystemExit):
+            claim_vm(pool_file, backend, KEY, "build-1", "key")
+        backend["refill"].assert_called_once()
+        with locked_pool(pool_file) as ledger:
+            assert ledger["metrics"][KEY]["misses"] == 1
+
+    def test_unknown_pool_exits(self, pool_file):
+        with pytest.raises(SystemExit):
+            claim_vm(pool_file, _backend(), KEY, "build-1", "key")
+
+    def test_invalid_hostname_exits_before_taking_vm(self, pool_file):
+        _write(pool_file, _ledger({"vm-a": _ready(time.time())}))
+        backend = _backend()
+        with pytest.raises(SystemExit):
+            claim_vm(pool_file, backend, KEY, "build-1", "key", hostname="a/b")
+        backend["inject"].assert_not_called()
+        with locked_pool(pool_file) as ledger:
+            assert ledger["vms"]["vm-a"]["state"] == "ready"
+
+    def test_failed_injection_discards_vm(self, pool_file):
+        _write(pool_file, _ledger({"vm-a": _ready(time.time())}))
+        backend = _backend(inject=MagicMock(return_value=False))
+        with pytest.raises(SystemExit):
+            claim_vm(pool_file, backend, KEY, "build-1", "key")
+        backend["discard"].assert_called_once()
+        with locked_pool(pool_file) as ledger:
+            assert ledger["vms"] == {}
+
+    def test_release(self, pool_file):
+        _write(pool_file, _ledger({"vm-a": {**_ready(1), "state": "claimed", "claimed_as": "build-1"}}))
+        backend = _backend()
+        release_vm(pool_file, backend, "build-1")
+        assert backend["discard"].call_args.args[0] == "vm-a"
+
+
+# =============================================================================
+# libvirt-Backend
+# =============================================================================
+
+
+class TestLibvirtBackend:
+    def test_prune_keeps_provisioning(self):
+        ledger = _ledger({
+            "gone": _ready(1),
+            "building": {"key": KEY, "state": "provisioning", "created": 0},
+            "alive": _ready(2),
+        })
+        with patch("debian_cloud_init.virt.list_domains", return_value={"alive"}):
+            pool._prune(ledger)
+        assert sorted(ledger["vms"]) == ["alive", "building"]
+
+    def test_inject_via_agent(self):
+        with patch("debian_cloud_init.vm.guest_exec", return_value=(0, "")) as mock_exec, \
+             patch("debian_cloud_init.pool.ssh_inject") as mock_ssh:
+            assert pool._inject("vm-a", _ready(1), {"username": "ci"}, "key", "build-1")
+        assert mock_exec.call_args.args[1:3] == ("/bin/sh", ["-c", injection_script("ci", "key", "build-1")])
+        mock_ssh.assert_not_called()
+
+    def test_inject_falls_back_to_ssh(self):
+        with patch("debian_cloud_init.vm.guest_exec", return_value=None), \
+             patch("debian_cloud_init.pool.ssh_inject", return_value=True) as mock_ssh:
+            assert pool._inject("vm-a", _ready(1), {"username": "ci"}, "key", "build-1")
+        assert mock_ssh.call_args.args[:2] == ("ci", "10.0.0.5")
@@ -0,0 +1,155 @@
+"""Unit-Tests für profiles.py"""
+
+import json
+import pathlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import profiles
+from debian_cloud_init.profiles import (
+    PROFILES,
+    format_fio_report,
+    get_profile,
+    parse_fio,
+    record_fio_results,
+    run_fio_check,
+    virt_install_options,
+)
+from debian_cloud_init.session import update_session
+from debian_cloud_init.vm import create_vm
+
+DISK = pathlib.Path("/isos/testvm.qcow2")
+
+
+def _fio_job(name, read_iops=0.0, write_iops=0.0, bw=0, p99=0):
+    def side(iops, io_bytes):
+        return {"iops": iops, "bw": bw, "io_bytes": io_bytes, "clat_ns": {"percentile": {"99.000000": p99}}}
+    return {
+        "jobname": name,
+        "read": side(read_iops, 1 if read_iops else 0),
+        "write": side(write_iops, 1 if write_iops else 0),
+    }
+
+
+# =============================================================================
+# get_profile / virt_install_options
+# =============================================================================
+
+
+class TestGetProfile:
+    def test_none_is_default(self):
+        assert get_profile(None) is PROFILES["default"]
+
+    def test_unknown_exits(self):
+        with pytest.raises(SystemExit):
+            get_profile("turbo")
+
+
+class TestVirtInstallOptions:
+    def test_default_matches_previous_command(self):
+        assert virt_install_options(PROFILES["default"], DISK) == (
+            "--memory 4096 --vcpus 2 --disk /isos/testvm.qcow2,device=disk,bus=virtio "
+        )
+
+    def test_balanced_virtio_blk_tuning(self):
+        opts = virt_install_options(PROFILES["balanced"], DISK)
+        assert "--iothreads 1 " in opts
+        assert "bus=virtio,cache=none,io=native,discard=unmap,driver.iothread=1,driver.queues=2" in opts
+        assert "--controller" not in opts
+
+    def test_database_uses_virtio_scsi_controller(self):
+        opts = virt_install_options(PROFILES["database"], DISK)
+        assert "--controller type=scsi,model=virtio-scsi,driver.iothread=1,driver.queues=4 " in opts
+        disk = opts.split("--disk ")[1]
+        assert disk == "/isos/testvm.qcow2,device=disk,bus=scsi,cache=none,io=io_uring,discard=unmap "
+
+    def test_sizing_from_profile(self):
+        opts = virt_install_options(PROFILES["build"], DISK)
+        assert opts.startswith("--memory 16384 --vcpus 8 ")
+
+
+class TestCreateVmProfile:
+    def test_profile_options_in_virt_install(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("DEBIAN_CLOUD_INIT_VIRT_INSTALL", "1")
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "cloud-init.yml").write_text("#cloud-config\n")
+        with patch("debian_cloud_init.vm.ISOS_PATH", pathlib.Path("/isos")), \
+             patch("debian_cloud_init.vm.ask_yes_no", return_value=True), \
+             patch("debian_cloud_init.vm.progress"), \
+             patch("debian_cloud_init.vm.run_cmd") as mock_run:
+            assert create_vm("testvm", "user", "amd64", profile="database", workspace=tmp_path) is True
+        virt_install = mock_run.call_args_list[-1].args[0]
+        assert "--memory 8192 --vcpus 4 --iothreads 1 " in virt_install
+        assert "model=virtio-scsi" in virt_install
+
+
+# =============================================================================
+# fio-Check
+# =============================================================================
+
+
+class TestParseFio:
+    def test_read_and_write_jobs(self):
+        output = "apt noise\n" + json.dumps({"jobs": [
+            _fio_job("randread-4k", read_iops=25000.4, bw=100000, p99=1_500_000),
+            _fio_job("randwrite-4k", write_iops=9000.0, bw=36000, p99=4_000_000),
+        ]})
+        results = parse_fio(output)
+        assert results["randread-4k"] == {"iops": 25000, "bw_mib": 97.7, "p99_ms": 1.5}
+        assert results["randwrite-4k"]["iops"] == 9000
+        assert results["randwrite-4k"]["p99_ms"] == 4.0
+
+    def test_garbage_exits(self):
+        with pytest.raises(SystemExit):
+            parse_fio("fio: command not found")
+
+
+class TestRunFioCheck:
+    def test_runs_via_ssh_in_guest(self):
+        result = MagicMock(returncode=0, stdout=json.dumps({"jobs": [_fio_job("seqread-1m", read_iops=300)]}))
+        with patch("debian_cloud_init.profiles.subprocess.run", return_value=result) as mock_run, \
+             patch("debian_cloud_init.profiles.progress"):
+            results = run_fio_check("user", "10.0.0.5")
+        cmd = mock_run.call_args.args[0]
+        assert cmd[0] == "ssh"
+        assert "user@10.0.0.5" in cmd
+        assert "--output-format=json" in cmd[-1]
+        assert results["seqread-1m"]["iops"] == 300
+
+    def test_failure_exits(self):
+        with patch("debian_cloud_init.profiles.subprocess.run", return_value=MagicMock(returncode=1, stderr="boom")), \
+             patch("debian_cloud_init.profiles.progress"), \
+             pytest.raises(SystemExit):
+            run_fio_check("user", "10.0.0.5")
+
+
+class TestFioResults:
+    def test_results_accumulate_per_profile(self, tmp_path):
+        with patch.object(profiles, "FIO_RESULTS_FILE", tmp_path / ".fio-results.json"):
+            record_fio_results("vm1", "default", {"randread-4k": {"iops": 1, "bw_mib": 1, "p99_ms": 1}})
+            by_profile = record_fio_results("vm1", "database", {"randread-4k": {"iops": 2, "bw_mib": 2, "p99_ms": 1}})
+        assert list(by_profile) == ["default", "database"]
+
+    def test_report_lists_every_profile(self):
+        report = format_fio_report({
+            "default": {"randread-4k": {"iops": 1000, "bw_mib": 3.9, "p99_ms": 2.1}},
+            "database": {"randread-4k": {"iops": 5000, "bw_mib": 19.5, "p99_ms": 0.8}},
+        })
+        lines = report.splitlines()
+        assert len(lines) == 3
+        assert lines[2].startswith("database")
+
+
+# =============================================================================
+# Session
+# =============================================================================
+
+
+class TestUpdateSession:
+    def test_profile_recorded(self, tmp_path):
+        session_file = tmp_path / ".session"
+        session_file.write_text(json.dumps({"vm1": {"vmname": "vm1"}}))
+        with patch("debian_cloud_init.session.SESSION_FILE", session_file):
+            update_session("vm1", profile="database")
+        assert json.loads(session_file.read_text())["vm1"]["profile"] == "database"
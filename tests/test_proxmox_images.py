@@ -0,0 +1,226 @@
+"""Unit-Tests für proxmox_cloud_init/images.py"""
+
+import asyncio
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import facts
+from debian_cloud_init.engine import CommandError
+from proxmox_cloud_init import images
+from proxmox_cloud_init.images import (
+    download_command,
+    download_targets,
+    ensure_image,
+    image_spec,
+    missing_targets,
+    parse_checksums,
+    prefetch,
+    record_volume,
+    storage_targets,
+)
+
+RESOURCES = [
+    {"type": "node", "node": "pve1", "status": "online"},
+    {"type": "node", "node": "pve2", "status": "online"},
+    {"type": "node", "node": "pve3", "status": "offline"},
+    {"type": "storage", "node": "pve1", "storage": "local", "content": "iso,vztmpl,snippets", "shared": 0},
+    {"type": "storage", "node": "pve2", "storage": "local", "content": "iso,vztmpl,snippets", "shared": 0},
+    {"type": "storage", "node": "pve3", "storage": "local", "content": "iso", "shared": 0},
+    {"type": "storage", "node": "pve1", "storage": "local-lvm", "content": "images,rootdir", "shared": 0},
+    {"type": "storage", "node": "pve1", "storage": "cephfs", "content": "iso,backup", "shared": 1},
+    {"type": "storage", "node": "pve2", "storage": "cephfs", "content": "iso,backup", "shared": 1},
+]
+
+DEBIAN_SUMS = (
+    "1111  debian-13-generic-arm64.qcow2\n"
+    "ABCDEF  debian-13-generic-amd64.qcow2\n"
+)
+
+
+def _result(returncode=0, stdout=""):
+    return MagicMock(returncode=returncode, stdout=stdout, stderr="")
+
+
+@pytest.fixture
+def index_file(tmp_path):
+    with patch.object(images, "INDEX_FILE", tmp_path / ".proxmox-images"), \
+         patch.object(facts, "FACTS_FILE", tmp_path / ".host-facts"):
+        yield tmp_path / ".proxmox-images"
+
+
+# =============================================================================
+# Images und Prüfsummen
+# =============================================================================
+
+
+class TestImageSpec:
+    def test_debian_gets_img_suffix_and_sha512(self):
+        spec = image_spec("debian/13", "amd64")
+        assert spec["filename"] == "debian-13-generic-amd64.qcow2.img"
+        assert spec["sums_url"] == "https://cdimage.debian.org/cdimage/cloud/trixie/latest/SHA512SUMS"
+        assert spec["algorithm"] == "sha512"
+
+    def test_ubuntu_keeps_name_and_sha256(self):
+        spec = image_spec("ubuntu/24.04", "arm64")
+        assert spec["filename"] == "ubuntu-24.04-server-cloudimg-arm64.img"
+        assert spec["sums_url"].endswith("/24.04/release/SHA256SUMS")
+        assert spec["algorithm"] == "sha256"
+
+    def test_parse_checksums(self):
+        assert parse_checksums(DEBIAN_SUMS, "debian-13-generic-amd64.qcow2") == "abcdef"
+        assert parse_checksums("cafe *ubuntu-24.04-server-cloudimg-amd64.img\n",
+                               "ubuntu-24.04-server-cloudimg-amd64.img") == "cafe"
+        assert parse_checksums(DEBIAN_SUMS, "missing.qcow2") is None
+
+    def test_download_command(self):
+        cmd = download_command("pve2", "local", image_spec("debian/13", "amd64"), "abc")
+        assert cmd.startswith("pvesh create /nodes/pve2/storage/local/download-url --content iso")
+        assert "--filename debian-13-generic-amd64.qcow2.img" in cmd
+        assert "--checksum abc --checksum-algorithm sha512" in cmd
+
+
+# =============================================================================
+# Ziele und Index
+# =============================================================================
+
+
+class TestTargets:
+    def test_only_online_iso_storages(self):
+        targets = storage_targets(RESOURCES)
+        assert [(t["node"], t["storage"]) for t in targets] == [
+            ("pve1", "cephfs"), ("pve2", "cephfs"), ("pve1", "local"), ("pve2", "local"),
+        ]
+
+    def test_shared_storage_downloaded_once(self):
+        targets = download_targets(storage_targets(RESOURCES))
+        assert [(t["node"], t["storage"]) for t in targets] == [("pve1", "cephfs"), ("pve1", "local"),
+                                                                ("pve2", "local")]
+
+    def test_missing_targets(self):
+        entry = {"volumes": {"pve1/local": ["a.img"], "pve2/local": []}}
+        targets = storage_targets(RESOURCES, "local")
+        assert [t["node"] for t in missing_targets(entry, targets, "a.img")] == ["pve2"]
+
+
+class TestIndex:
+    def test_refresh_lists_shared_storage_once(self, index_file):
+        listed = []
+
+        async def fake_ssh(host, user, cmd, **kwargs):
+            listed.append(cmd.split()[2])
+            return _result(stdout=json.dumps([{"volid": "x:iso/debian-13-generic-amd64.qcow2.img"}]))
+
+        with patch("proxmox_cloud_init.images.fetch_cluster_resources", return_value=RESOURCES), \
+             patch("proxmox_cloud_init.images.ssh_run_async", side_effect=fake_ssh):
+            entry = images.refresh_index("pve", "root")
+        assert sorted(listed) == ["/nodes/pve1/storage/cephfs/content", "/nodes/pve1/storage/local/content",
+                                  "/nodes/pve2/storage/local/content"]
+        assert entry["volumes"]["pve2/cephfs"] == ["debian-13-generic-amd64.qcow2.img"]
+        assert entry["storages"] == {"cephfs": True, "local": False}
+        assert json.loads(index_file.read_text())["pve"] == entry
+
+    def test_fresh_index_not_refreshed(self, index_file):
+        index_file.write_text(json.dumps({"pve": {"updated": time.time(), "storages": {}, "volumes": {}}}))
+        with patch("proxmox_cloud_init.images.refresh_index") as mock_refresh:
+            images.load_index("pve", "root")
+        mock_refresh.assert_not_called()
+
+    def test_record_volume_shared_marks_all_nodes(self, index_file):
+        index_file.write_text(json.dumps({"pve": {"updated": 1, "storages": {"cephfs": True},
+                                                  "volumes": {"pve1/cephfs": [], "pve2/cephfs": [],
+                                                              "pve1/local": []}}}))
+        record_volume("pve", "pve1", "cephfs", "a.img", shared=True)
+        volumes = json.loads(index_file.read_text())["pve"]["volumes"]
+        assert volumes == {"pve1/cephfs": ["a.img"], "pve2/cephfs": ["a.img"], "pve1/local": []}
+
+
+# =============================================================================
+# Bereitstellen
+# =============================================================================
+
+
+class TestEnsureImage:
+    def test_present_returns_storage_path(self, index_file):
+        with patch("proxmox_cloud_init.images.ssh_run",
+                   return_value=_result(stdout="/var/lib/vz/template/iso/debian-13-generic-amd64.qcow2.img\n")) as m:
+            path = ensure_image("pve", "root", "amd64", "debian/13", "pve1")
+        assert path == "/var/lib/vz/template/iso/debian-13-generic-amd64.qcow2.img"
+        assert "pvesm path local:iso/debian-13-generic-amd64.qcow2.img" in m.call_args.args[2]
+
+    def test_missing_downloads_with_checksum(self, index_file):
+        commands = []
+
+        async def fake_ssh(host, user, cmd, **kwargs):
+            commands.append(cmd)
+            return _result()
+
+        with patch("proxmox_cloud_init.images.ssh_run", side_effect=[
+            _result(returncode=1),
+            _result(stdout=DEBIAN_SUMS),
+            _result(stdout="/var/lib/vz/template/iso/debian-13-generic-amd64.qcow2.img\n"),
+        ]), \
+             patch("proxmox_cloud_init.images.ssh_run_async", side_effect=fake_ssh), \
+             patch("proxmox_cloud_init.images.ask_yes_no", return_value=True), \
+             patch("proxmox_cloud_init.images.progress"):
+            ensure_image("pve", "root", "amd64", "debian/13", "pve2")
+        assert commands == [download_command("pve2", "local", image_spec("debian/13", "amd64"), "abcdef")]
+        volumes = json.loads(index_file.read_text())["pve"]["volumes"]
+        assert volumes["pve2/local"] == ["debian-13-generic-amd64.qcow2.img"]
+
+    def test_declined_exits(self, index_file):
+        with patch("proxmox_cloud_init.images.ssh_run", return_value=_result(returncode=1)), \
+             patch("proxmox_cloud_init.images.ask_yes_no", return_value=False), \
+             pytest.raises(SystemExit):
+            ensure_image("pve", "root", "amd64", "debian/13", "pve1")
+
+    def test_missing_checksum_exits(self):
+        with patch("proxmox_cloud_init.images.ssh_run", return_value=_result(stdout="")), \
+             pytest.raises(SystemExit):
+            images.fetch_checksum("pve", "root", image_spec("debian/13", "amd64"))
+
+
+class TestPrefetch:
+    def test_parallel_to_missing_nodes_only(self, index_file):
+        index_file.write_text(json.dumps({"pve": {
+            "updated": time.time(), "storages": {"local": False},
+            "volumes": {"pve1/local": ["debian-13-generic-amd64.qcow2.img"], "pve2/local": []},
+        }}))
+        running, peak = [0], [0]
+
+        async def fake_ssh(host, user, cmd, **kwargs):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.02)
+            running[0] -= 1
+            if "arm64" in cmd and "pve1" in cmd:
+                raise CommandError(["ssh"], 1, "", "checksum mismatch")
+            return _result()
+
+        with patch("proxmox_cloud_init.images.fetch_cluster_resources", return_value=RESOURCES), \
+             patch("proxmox_cloud_init.images.ssh_run",
+                   return_value=_result(stdout=DEBIAN_SUMS.replace("1111", "2222"))), \
+             patch("proxmox_cloud_init.images.ssh_run_async", side_effect=fake_ssh), \
+             patch("proxmox_cloud_init.images.progress"):
+            results = prefetch("pve", "root", [("debian/13", "amd64"), ("debian/13", "arm64")])
+        assert sorted((r["filename"].split("-")[3][:5], r["node"]) for r in results) == [
+            ("amd64", "pve2"), ("arm64", "pve1"), ("arm64", "pve2"),
+        ]
+        assert peak[0] == 3
+        assert "checksum mismatch" in next(r["error"] for r in results if r["node"] == "pve1")
+        volumes = json.loads(index_file.read_text())["pve"]["volumes"]
+        assert "debian-13-generic-arm64.qcow2.img" not in volumes["pve1/local"]
+        assert "debian-13-generic-arm64.qcow2.img" in volumes["pve2/local"]
+
+    def test_nothing_missing(self, index_file):
+        index_file.write_text(json.dumps({"pve": {
+            "updated": time.time(), "storages": {"local": False},
+            "volumes": {"pve1/local": ["debian-13-generic-amd64.qcow2.img"],
+                        "pve2/local": ["debian-13-generic-amd64.qcow2.img"]},
+        }}))
+        with patch("proxmox_cloud_init.images.fetch_cluster_resources", return_value=RESOURCES), \
+             patch("proxmox_cloud_init.images.ssh_run_async") as mock_ssh:
+            assert prefetch("pve", "root", [("debian/13", "amd64")]) == []
+        mock_ssh.assert_not_called()
@@ -0,0 +1,168 @@
+"""Unit-Tests für proxmox/placement.py"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from proxmox_cloud_init.placement import (
+    choose_placement,
+    cluster_state,
+    place,
+    plan_fleet,
+    score_node,
+)
+
+_GIB = 1024 ** 3
+
+
+def _node(name, maxcpu=16, cpu=0.1, maxmem=64 * _GIB, mem=8 * _GIB, status="online"):
+    return {"type": "node", "node": name, "status": status,
+            "maxcpu": maxcpu, "cpu": cpu, "maxmem": maxmem, "mem": mem}
+
+
+def _storage(name, node, free_gb=500, shared=0, content="images,rootdir"):
+    return {"type": "storage", "storage": name, "node": node, "status": "available",
+            "content": content, "shared": shared, "maxdisk": 1000 * _GIB,
+            "disk": (1000 - free_gb) * _GIB}
+
+
+def _vm(vmid, node, tags="", maxcpu=2, status="running"):
+    return {"type": "qemu", "vmid": vmid, "node": node, "tags": tags,
+            "maxcpu": maxcpu, "status": status}
+
+
+def _cluster():
+    return [
+        _node("pve1", mem=40 * _GIB),
+        _node("pve2", mem=8 * _GIB),
+        _node("pve3", status="offline"),
+        _storage("local-lvm", "pve1"),
+        _storage("local-lvm", "pve2"),
+        _storage("local", "pve2", content="iso,vztmpl"),
+    ]
+
+
+# =============================================================================
+# cluster_state
+# =============================================================================
+
+
+class TestClusterState:
+    def test_offline_nodes_ignored(self):
+        state = cluster_state(_cluster())
+        assert set(state["nodes"]) == {"pve1", "pve2"}
+
+    def test_storage_without_images_content_ignored(self):
+        state = cluster_state(_cluster())
+        assert all(s["storage"] == "local-lvm" for s in state["storages"])
+
+    def test_affinity_tags_collected(self):
+        state = cluster_state([*_cluster(), _vm(100, "pve1", tags="aa-db;prod")])
+        assert state["nodes"]["pve1"]["groups"] == {"db"}
+
+    def test_running_vm_vcpus_counted(self):
+        state = cluster_state([*_cluster(), _vm(100, "pve1", maxcpu=4), _vm(101, "pve1", status="stopped")])
+        assert state["nodes"]["pve1"]["vcpus"] == 4
+
+
+# =============================================================================
+# score_node / place
+# =============================================================================
+
+
+class TestPlace:
+    def test_spread_prefers_least_loaded_node(self):
+        result = place(cluster_state(_cluster()), 2, 4096, 30, policy="spread")
+        assert result is not None
+        assert result["node"] == "pve2"
+
+    def test_pack_prefers_most_loaded_node(self):
+        result = place(cluster_state(_cluster()), 2, 4096, 30, policy="pack")
+        assert result is not None
+        assert result["node"] == "pve1"
+
+    def test_node_without_enough_memory_rejected(self):
+        node = cluster_state([_node("pve1", mem=60 * _GIB)])["nodes"]["pve1"]
+        assert score_node(node, 2, 8192) is None
+
+    def test_anti_affinity_excludes_node(self):
+        state = cluster_state([*_cluster(), _vm(100, "pve2", tags="aa-db")])
+        result = place(state, 2, 4096, 30, group="db")
+        assert result is not None
+        assert result["node"] == "pve1"
+
+    def test_no_storage_with_space_returns_none(self):
+        state = cluster_state([_node("pve1"), _storage("local-lvm", "pve1", free_gb=10)])
+        assert place(state, 2, 4096, 30) is None
+
+    def test_fixed_storage_respected(self):
+        resources = [*_cluster(), _storage("ceph", "pve2", free_gb=900, shared=1)]
+        result = place(cluster_state(resources), 2, 4096, 30, storage="local-lvm")
+        assert result is not None
+        assert result["storage"] == "local-lvm"
+
+    def test_fixed_node_respected(self):
+        result = place(cluster_state(_cluster()), 2, 4096, 30, policy="spread", node="pve1")
+        assert result is not None
+        assert result["node"] == "pve1"
+
+    def test_fixed_node_without_room_returns_none(self):
+        assert place(cluster_state(_cluster()), 2, 32768, 30, node="pve1") is None
+
+    def test_unknown_policy_raises(self):
+        with pytest.raises(ValueError):
+            place(cluster_state(_cluster()), 2, 4096, 30, policy="random")
+
+
+# =============================================================================
+# plan_fleet
+# =============================================================================
+
+
+class TestPlanFleet:
+    def _specs(self, count, group=None):
+        return [{"name": f"vm{i}", "cores": 2, "memory": 8192, "disk_gb": 30, "group": group}
+                for i in range(count)]
+
+    def test_spread_distributes_batch_over_nodes(self):
+        resources = [_node("pve1"), _node("pve2"),
+                     _storage("local-lvm", "pve1"), _storage("local-lvm", "pve2")]
+        plan = plan_fleet(cluster_state(resources), self._specs(4))
+        nodes = [p["node"] for p in plan.values()]
+        assert nodes.count("pve1") == 2
+        assert nodes.count("pve2") == 2
+
+    def test_pack_fills_one_node_first(self):
+        resources = [_node("pve1"), _node("pve2"),
+                     _storage("local-lvm", "pve1"), _storage("local-lvm", "pve2")]
+        plan = plan_fleet(cluster_state(resources), self._specs(3), policy="pack")
+        assert len({p["node"] for p in plan.values()}) == 1
+
+    def test_anti_affinity_group_larger_than_cluster_exits(self):
+        with pytest.raises(SystemExit):
+            plan_fleet(cluster_state(_cluster()), self._specs(3, group="web"))
+
+
+# =============================================================================
+# choose_placement
+# =============================================================================
+
+
+class TestChoosePlacement:
+    def test_returns_node_address_from_cluster_status(self):
+        status = [{"type": "node", "name": "pve2", "ip": "10.0.0.2"}]
+
+        def fake_ssh(host, user, cmd, **kwargs):
+            data = status if "/cluster/status" in cmd else _cluster()
+            return MagicMock(returncode=0, stdout=json.dumps(data))
+
+        with patch("proxmox_cloud_init.vm.ssh_run", side_effect=fake_ssh):
+            result = choose_placement("host", "root", 2, 4096, 30)
+        assert result["node"] == "pve2"
+        assert result["address"] == "10.0.0.2"
+
+    def test_fixed_node_without_room_exits(self):
+        with patch("proxmox_cloud_init.vm.ssh_run", return_value=MagicMock(returncode=0, stdout=json.dumps(_cluster()))), \
+             patch("proxmox_cloud_init.placement.progress"), pytest.raises(SystemExit):
+            choose_placement("host", "root", 2, 32768, 30, node="pve1")
@@ -0,0 +1,77 @@
+"""Unit-Tests für proxmox/pool.py"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+from proxmox_cloud_init import pool
+from proxmox_cloud_init.vm import guest_exec, wait_for_cloud_init
+
+KEY = "debian/13|amd64|default"
+POOL = {"host": "pve", "ssh_user": "root", "username": "ci"}
+
+
+def _ledger(vms):
+    return {"pools": {KEY: POOL}, "vms": vms, "metrics": {}}
+
+
+# =============================================================================
+# Backend
+# =============================================================================
+
+
+class TestPrune:
+    def test_removes_missing_vmids_once_per_host(self):
+        ledger = _ledger({
+            "9001": {"key": KEY, "state": "ready"},
+            "9002": {"key": KEY, "state": "claimed"},
+            "9003": {"key": KEY, "state": "provisioning"},
+        })
+        resources = json.dumps([{"vmid": 9001, "type": "qemu"}])
+        with patch("proxmox_cloud_init.vm.ssh_run", return_value=MagicMock(returncode=0, stdout=resources)) as mock_ssh:
+            pool._prune(ledger)
+        assert sorted(ledger["vms"]) == ["9001", "9003"]
+        assert mock_ssh.call_count == 1
+
+    def test_unreachable_host_keeps_entries(self):
+        ledger = _ledger({"9001": {"key": KEY, "state": "ready"}})
+        with patch("proxmox_cloud_init.vm.ssh_run", return_value=MagicMock(returncode=255, stdout="")):
+            pool._prune(ledger)
+        assert list(ledger["vms"]) == ["9001"]
+
+
+class TestClaimOperations:
+    def test_inject_via_qm_guest_exec(self):
+        with patch("proxmox_cloud_init.vm.ssh_run",
+                   return_value=MagicMock(returncode=0, stdout='{"exitcode": 0, "out-data": ""}')) as mock_ssh:
+            assert pool._inject("9001", {"ip": "10.0.0.5"}, POOL, "ssh-ed25519 AAAA", "build-1")
+        cmd = mock_ssh.call_args.args[2]
+        assert cmd.startswith("qm guest exec 9001 -- sh -c ")
+        assert "hostnamectl set-hostname build-1" in cmd
+
+    def test_inject_falls_back_to_ssh(self):
+        with patch("proxmox_cloud_init.vm.ssh_run", return_value=MagicMock(returncode=255, stdout="")), \
+             patch("proxmox_cloud_init.pool.ssh_inject", return_value=True) as mock_inject:
+            assert pool._inject("9001", {"ip": "10.0.0.5"}, POOL, "key", "build-1")
+        assert mock_inject.call_args.args[:2] == ("ci", "10.0.0.5")
+
+    def test_rename(self):
+        with patch("proxmox_cloud_init.vm.ssh_run") as mock_ssh:
+            pool._rename("9001", POOL, "build-1")
+        assert mock_ssh.call_args.args[2] == "qm set 9001 --name build-1"
+
+
+# =============================================================================
+# Guest-Agent
+# =============================================================================
+
+
+class TestGuestExec:
+    def test_parses_output(self):
+        with patch("proxmox_cloud_init.vm.ssh_run",
+                   return_value=MagicMock(returncode=0, stdout='{"exitcode": 0, "out-data": "status: done\\n"}')):
+            assert guest_exec("pve", "root", 9001, "cloud-init status") == (0, "status: done\n")
+
+    def test_wait_for_cloud_init_error(self):
+        with patch("proxmox_cloud_init.vm.progress"), \
+             patch("proxmox_cloud_init.vm.guest_exec", return_value=(1, "status: error\n")):
+            assert not wait_for_cloud_init("pve", "root", 9001, timeout=1, interval=0)
@@ -0,0 +1,101 @@
+"""Unit-Tests für proxmox/profiles.py"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init.profiles import PROFILES as LIBVIRT_PROFILES
+from proxmox_cloud_init import session as proxmox_session
+from proxmox_cloud_init.profiles import (
+    PROFILES,
+    disk_options,
+    get_profile,
+    qm_create_options,
+)
+from proxmox_cloud_init.session import update_session
+from proxmox_cloud_init.vm import create_vm
+
+
+def _ssh_side_effect(*args, **kwargs):
+    if "qm config" in args[2]:
+        return MagicMock(returncode=0, stdout="unused0: local-lvm:vm-100-disk-0\n")
+    return MagicMock(returncode=0, stdout="")
+
+
+def _create(tmp_path, profile):
+    cloud_init_yml = tmp_path / "cloud-init.yml"
+    cloud_init_yml.write_text("#cloud-config\n{}")
+    with patch("proxmox_cloud_init.vm.upload_snippets"), \
+         patch("proxmox_cloud_init.vm.ensure_base_image", return_value="/images/debian.qcow2"), \
+         patch("proxmox_cloud_init.vm.ask_yes_no", side_effect=[True, True]), \
+         patch("proxmox_cloud_init.vm.release_vmids"), \
+         patch("proxmox_cloud_init.vm.progress"), \
+         patch("proxmox_cloud_init.vm.ssh_run", side_effect=_ssh_side_effect) as mock_ssh:
+        create_vm("host", "root", "pve", 100, "testvm", "amd64", "debian/13",
+                  "local-lvm", "vmbr0", "/var/lib/vz/snippets", cloud_init_yml, profile=profile)
+    return [c.args[2] for c in mock_ssh.call_args_list]
+
+
+# =============================================================================
+# Profile
+# =============================================================================
+
+
+class TestProfiles:
+    def test_same_names_as_libvirt(self):
+        assert list(PROFILES) == list(LIBVIRT_PROFILES)
+
+    def test_unknown_exits(self):
+        with pytest.raises(SystemExit):
+            get_profile("turbo")
+
+    def test_default_create_options_unchanged(self):
+        assert qm_create_options(PROFILES["default"], "vmbr0") == " --net0 virtio,bridge=vmbr0"
+        assert disk_options(PROFILES["default"]) == ""
+
+    def test_database_numa_hugepages_no_balloon(self):
+        opts = qm_create_options(PROFILES["database"], "vmbr1")
+        assert "--net0 virtio,bridge=vmbr1,queues=4" in opts
+        assert "--numa 1" in opts
+        assert "--hugepages 2" in opts
+        assert "--balloon 0" in opts
+
+    def test_hugepages_always_with_numa(self):
+        for profile in PROFILES.values():
+            if profile["hugepages"]:
+                assert profile["numa"]
+
+    def test_disk_options(self):
+        assert disk_options(PROFILES["balanced"]) == ",iothread=1,discard=on,ssd=1,cache=none,aio=native"
+
+
+# =============================================================================
+# create_vm
+# =============================================================================
+
+
+class TestCreateVmProfile:
+    def test_default_profile_keeps_previous_commands(self, tmp_path):
+        calls = _create(tmp_path, "default")
+        assert any("--net0 virtio,bridge=vmbr0 " in c for c in calls)
+        assert any(c.endswith("--scsihw virtio-scsi-pci --scsi0 local-lvm:vm-100-disk-0") for c in calls)
+
+    def test_database_profile_applied(self, tmp_path):
+        calls = _create(tmp_path, "database")
+        create = next(c for c in calls if c.startswith("qm create"))
+        assert "--cores 4" in create
+        assert "--memory 8192" in create
+        assert "--hugepages 2" in create
+        scsi = next(c for c in calls if "--scsi0" in c)
+        assert "--scsihw virtio-scsi-single" in scsi
+        assert scsi.endswith(",iothread=1,discard=on,ssd=1,cache=none,aio=io_uring")
+
+
+class TestUpdateSession:
+    def test_profile_stored(self, tmp_path):
+        session_file = tmp_path / ".proxmox-session"
+        session_file.write_text(json.dumps({"vm1": {"vmname": "vm1"}}))
+        with patch.object(proxmox_session, "SESSION_FILE", session_file):
+            update_session("vm1", proxmox_profile="database")
+        assert json.loads(session_file.read_text())["vm1"]["proxmox_profile"] == "database"
@@ -0,0 +1,155 @@
+"""Unit-Tests für proxmox_cloud_init/push.py
+
+Die Übertragung läuft mit echtem zstd und perl; statt SSH wird der
+Remote-Befehl lokal mit bash ausgeführt.
+"""
+
+import hashlib
+import os
+import shutil
+from unittest.mock import patch
+
+import pytest
+
+from proxmox_cloud_init import push
+from proxmox_cloud_init.push import changed_blocks, delta_frames, push_image, scan_image
+
+BLOCK = 1024
+
+needs_tools = pytest.mark.skipif(not (shutil.which("zstd") and shutil.which("perl") and shutil.which("bash")),
+                                 reason="zstd, perl und bash werden benötigt")
+
+
+@pytest.fixture
+def env(tmp_path):
+    local_dir = tmp_path / "isos"
+    remote_dir = tmp_path / "remote"
+    local_dir.mkdir()
+    remote_dir.mkdir()
+    remote = remote_dir / "debian-13-generic-amd64.qcow2.img"
+    with patch.object(push, "ISOS_PATH", local_dir), \
+         patch.object(push, "BLOCK_SIZE", BLOCK), \
+         patch("proxmox_cloud_init.push.ensure_local_image"), \
+         patch("proxmox_cloud_init.push._published_checksum", return_value=None), \
+         patch("proxmox_cloud_init.push._resolve_path", return_value=str(remote)), \
+         patch("proxmox_cloud_init.push._ssh_argv", side_effect=lambda host, user, cmd: ["bash", "-c", cmd]), \
+         patch("proxmox_cloud_init.push.progress"):
+        yield local_dir / "debian-13-generic-amd64.qcow2", remote
+
+
+def _sha512(path) -> str:
+    return hashlib.sha512(path.read_bytes()).hexdigest()
+
+
+class TestBlocks:
+    def test_scan(self, tmp_path):
+        path = tmp_path / "img"
+        path.write_bytes(b"a" * 2500)
+        blocks, digest = scan_image(path, "sha256", block_size=1000)
+        assert len(blocks) == 3
+        assert blocks[0] == hashlib.sha256(b"a" * 1000).hexdigest()
+        assert digest == hashlib.sha256(b"a" * 2500).hexdigest()
+
+    def test_changed_blocks(self):
+        assert changed_blocks(["a", "b", "c", "d"], ["a", "x", "c"]) == [1, 3]
+        assert changed_blocks(["a"], ["a", "b"]) == []
+
+    def test_delta_frames(self, tmp_path):
+        path = tmp_path / "img"
+        path.write_bytes(b"0" * 1000 + b"1" * 500)
+        frames = list(delta_frames(path, [1], block_size=1000))
+        assert frames == [push._FRAME_HEADER.pack(1000, 500) + b"1" * 500]
+
+
+@needs_tools
+class TestPush:
+    def test_full_transfer(self, env, capsys):
+        local, remote = env
+        local.write_bytes(os.urandom(BLOCK * 5 + 100))
+        assert push_image("pve", "root", "amd64", "debian/13") == str(remote)
+        assert remote.read_bytes() == local.read_bytes()
+        assert not remote.with_name(remote.name + ".part").exists()
+        out = capsys.readouterr().out
+        assert f"sha512: {_sha512(local)}" in out
+        assert "100.0%" in out
+
+    def test_delta_sends_only_changed_blocks(self, env):
+        local, remote = env
+        old = bytearray(os.urandom(BLOCK * 8))
+        remote.write_bytes(old)
+        new = bytearray(old)
+        new[BLOCK * 3:BLOCK * 3 + 10] = b"x" * 10
+        new += os.urandom(BLOCK // 2)
+        local.write_bytes(new)
+
+        sent = []
+        real_stream = push.stream
+
+        def spy(host, user, cmd, chunks, total):
+            sent.append(total)
+            return real_stream(host, user, cmd, chunks, total)
+
+        with patch("proxmox_cloud_init.push.stream", side_effect=spy):
+            push_image("pve", "root", "amd64", "debian/13")
+        assert remote.read_bytes() == bytes(new)
+        assert sent == [BLOCK + BLOCK // 2]
+
+    def test_delta_shrinks_file(self, env):
+        local, remote = env
+        data = os.urandom(BLOCK * 4)
+        remote.write_bytes(data + os.urandom(BLOCK * 2))
+        local.write_bytes(data[:-10])
+        push_image("pve", "root", "amd64", "debian/13")
+        assert remote.read_bytes() == data[:-10]
+
+    def test_up_to_date_sends_nothing(self, env, capsys):
+        local, remote = env
+        local.write_bytes(os.urandom(BLOCK * 3))
+        shutil.copy(local, remote)
+        with patch("proxmox_cloud_init.push.stream") as mock_stream:
+            push_image("pve", "root", "amd64", "debian/13")
+        mock_stream.assert_not_called()
+        assert "bereits aktuell" in capsys.readouterr().out
+
+    def test_checksum_mismatch_exits(self, env):
+        local, _ = env
+        local.write_bytes(os.urandom(BLOCK))
+        with patch("proxmox_cloud_init.push._remote_checksum", return_value="0000"), \
+             pytest.raises(SystemExit):
+            push_image("pve", "root", "amd64", "debian/13")
+
+    def test_remote_failure_exits(self, env):
+        local, _ = env
+        local.write_bytes(os.urandom(BLOCK * 2))
+        with patch("proxmox_cloud_init.push._resolve_path", return_value="/nonexistent/dir/img"), \
+             pytest.raises(SystemExit):
+            push_image("pve", "root", "amd64", "debian/13")
+
+    def test_remote_exits_early_does_not_hang(self, env):
+        chunks = (os.urandom(BLOCK * 64) for _ in range(256))
+        with pytest.raises(SystemExit):
+            push.stream("pve", "root", "exit 3", chunks, BLOCK * 64 * 256)
+
+    def test_failed_delta_keeps_old_image(self, env):
+        local, remote = env
+        old = os.urandom(BLOCK * 4)
+        remote.write_bytes(old)
+        local.write_bytes(old[:BLOCK] + os.urandom(BLOCK * 3))
+        with patch("proxmox_cloud_init.push._remote_checksum", return_value="0000"), \
+             pytest.raises(SystemExit):
+            push_image("pve", "root", "amd64", "debian/13")
+        assert remote.read_bytes() == old
+        assert not remote.with_name(remote.name + ".part").exists()
+
+
+class TestEnsureImageFallback:
+    def test_host_without_internet_pushes(self):
+        with patch("proxmox_cloud_init.images.ssh_run") as mock_ssh, \
+             patch("proxmox_cloud_init.images.ask_yes_no", return_value=True), \
+             patch("proxmox_cloud_init.push.push_image", return_value="/var/lib/vz/template/iso/x.img") as mock_push:
+            mock_ssh.return_value.returncode = 1
+            mock_ssh.return_value.stdout = ""
+            from proxmox_cloud_init.images import ensure_image
+
+            assert ensure_image("pve", "root", "amd64", "debian/13", "pve1") == "/var/lib/vz/template/iso/x.img"
+        mock_push.assert_called_once_with("pve", "root", "amd64", "debian/13", "local", "pve1")
@@ -0,0 +1,156 @@
+"""Unit-Tests für proxmox_cloud_init/reconcile.py"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import workspace
+from proxmox_cloud_init import reconcile as rc
+from proxmox_cloud_init.reconcile import match_vm, parse_inspect
+
+GIB = 1024 ** 3
+
+RESOURCES = [
+    {"type": "qemu", "vmid": 101, "name": "web1", "node": "pve1", "status": "running", "maxdisk": 30 * GIB},
+    {"type": "qemu", "vmid": 102, "name": "web1", "node": "pve2", "status": "stopped", "maxdisk": 30 * GIB},
+    {"type": "qemu", "vmid": 103, "name": "db1-deleted", "node": "pve1", "tags": "tombstone"},
+    {"type": "lxc", "vmid": 104, "name": "db1", "node": "pve1"},
+]
+
+
+def _output(resources=RESOURCES, snippets=("web1-user-data.yml", "web1-meta-data.yml")):
+    return "@@resources\n" + json.dumps(resources) + "\n@@snippets\n" + "\n".join(snippets) + "\n"
+
+
+def _spec(**overrides):
+    return {**rc.DEFAULTS, "host": "pve1", "node": "pve1", "storage": "local-lvm", "bridge": "vmbr0",
+            **overrides}
+
+
+@pytest.fixture(autouse=True)
+def quiet(tmp_path):
+    with patch("proxmox_cloud_init.reconcile.progress"), patch("proxmox_cloud_init.reconcile.success"), \
+         patch("proxmox_cloud_init.reconcile.record_applied"), \
+         patch.object(workspace, "WORKSPACES_DIR", tmp_path / ".workspaces"):
+        yield
+
+
+@pytest.fixture
+def render():
+    with patch("proxmox_cloud_init.reconcile._render") as mock_render:
+        yield mock_render
+
+
+# =============================================================================
+# Ist-Zustand
+# =============================================================================
+
+
+class TestParse:
+    def test_skips_containers_and_tombstones(self):
+        vms, snippets = parse_inspect(_output())
+        assert [vm["vmid"] for vm in vms] == [101, 102]
+        assert snippets == {"web1-user-data.yml", "web1-meta-data.yml"}
+
+    def test_garbage_resources(self):
+        assert parse_inspect("@@resources\nError\n@@snippets\n") == ([], set())
+
+    def test_recorded_vmid_wins(self):
+        vms, _ = parse_inspect(_output())
+        assert (match_vm("web1", vms, 102) or {}).get("vmid") == 102
+        assert (match_vm("web1", vms, 999) or {}).get("vmid") == 101
+        assert match_vm("db1", vms, None) is None
+
+
+class TestInspect:
+    def test_one_call_per_host(self):
+        result = MagicMock(returncode=0, stdout=_output())
+        specs = {"web1": _spec(), "db1": _spec()}
+        with patch("proxmox_cloud_init.reconcile.ssh_run", return_value=result) as ssh:
+            observed = rc._inspect(specs, {"web1": {"vmid": 102}})
+        ssh.assert_called_once()
+        assert observed == {"web1": {"state": "stopped", "disk": 30 * GIB, "seed": False, "broken": None,
+                                     "record": {"vmid": 102, "node": "pve2"}}}
+
+    def test_removed_vm_looked_up_on_recorded_host(self):
+        result = MagicMock(returncode=0, stdout=_output())
+        state = {"web1": {"host": "old", "ssh_user": "admin", "snippets_path": "/srv/snippets", "vmid": 101}}
+        with patch("proxmox_cloud_init.reconcile.ssh_run", return_value=result) as ssh:
+            assert "web1" in rc._inspect({}, state)
+        assert ssh.call_args.args[:2] == ("old", "admin")
+        assert "ls -1 /srv/snippets" in ssh.call_args.args[2]
+
+
+# =============================================================================
+# Aktionen
+# =============================================================================
+
+
+class TestActions:
+    def test_prepare_once_per_node_and_image(self):
+        specs = {"a": _spec(), "b": _spec(), "c": _spec(node="pve2")}
+        actions = [{"name": name, "action": "create"} for name in specs] + [{"name": "a", "action": "start"}]
+        with patch("proxmox_cloud_init.reconcile.ensure_base_image") as ensure:
+            rc._prepare(actions, specs)
+        assert [c.args[4] for c in ensure.call_args_list] == ["pve1", "pve2"]
+
+    def test_prepare_places_auto_specs_as_one_fleet(self):
+        specs = {"a": _spec(node="auto", storage="auto", profile="database"), "b": _spec(node="auto"),
+                 "c": _spec(storage="auto"), "d": _spec()}
+        actions = [{"name": name, "action": "create"} for name in specs]
+        plan = {"a": {"node": "pve2", "storage": "ceph"}, "b": {"node": "pve1", "storage": "local-lvm"},
+                "c": {"node": "pve1", "storage": "ceph"}}
+        with patch("proxmox_cloud_init.reconcile.fetch_cluster_resources", return_value=[]) as fetch, \
+             patch("proxmox_cloud_init.reconcile.fetch_node_addresses", return_value={"pve2": "10.0.0.2"}), \
+             patch("proxmox_cloud_init.reconcile.plan_fleet", return_value=plan) as fleet, \
+             patch("proxmox_cloud_init.reconcile.ensure_base_image") as ensure:
+            rc._prepare(actions, specs)
+        fetch.assert_called_once()
+        fleet_specs = {s["name"]: s for s in fleet.call_args.args[1]}
+        assert sorted(fleet_specs) == ["a", "b", "c"]
+        assert (fleet_specs["a"]["cores"], fleet_specs["a"]["memory"], fleet_specs["a"]["disk_gb"]) == (4, 8192, 30)
+        assert (fleet_specs["b"]["node"], fleet_specs["b"]["storage"]) == (None, "local-lvm")
+        assert (fleet_specs["c"]["node"], fleet_specs["c"]["storage"]) == ("pve1", None)
+        assert (specs["a"]["node"], specs["a"]["storage"], specs["a"]["address"]) == ("pve2", "ceph", "10.0.0.2")
+        assert "address" not in specs["d"]
+        assert sorted({c.args[4] for c in ensure.call_args_list}) == ["pve1", "pve2"]
+
+    def test_build_runs_on_placed_node(self, render):
+        with patch("proxmox_cloud_init.reconcile.create_vm", return_value=True) as create:
+            rc._build("web1", _spec(node="pve2", address="10.0.0.2"), {}, 120)
+        assert create.call_args.args[:3] == ("10.0.0.2", "root", "pve2")
+        # Erst beim Anlegen landet die user-data im Workspace
+        assert render.call_args.args[1] == create.call_args.args[-1] == (
+            workspace.workspace_dir("web1", "proxmox") / workspace.USER_DATA)
+
+    def test_create_without_questions(self, render):
+        entry = {}
+        with patch("proxmox_cloud_init.reconcile.allocate_vmids", return_value=[120]), \
+             patch("proxmox_cloud_init.reconcile.create_vm", return_value=True) as create:
+            rc._create("web1", _spec(disk="40G"), entry)
+        assert create.call_args.kwargs["disk_gb"] == 40
+        assert entry == {"vmid": 120, "node": "pve1"}
+
+    def test_recreate_same_host_tombstones(self, render):
+        entry = {"host": "pve1", "vmid": 101, "node": "pve1"}
+        with patch("proxmox_cloud_init.reconcile.tombstone_vm", return_value=130) as tombstone, \
+             patch("proxmox_cloud_init.reconcile.create_vm", return_value=True):
+            rc._recreate("web1", _spec(), entry)
+        tombstone.assert_called_once_with("pve1", "root", 101, "web1")
+        assert entry["vmid"] == 130
+
+    def test_recreate_other_host_destroys_there(self, render):
+        entry = {"host": "old", "ssh_user": "root", "vmid": 101, "node": "n1"}
+        with patch("proxmox_cloud_init.reconcile.ssh_run") as ssh, \
+             patch("proxmox_cloud_init.reconcile.allocate_vmids", return_value=[5]), \
+             patch("proxmox_cloud_init.reconcile.create_vm", return_value=True):
+            rc._recreate("web1", _spec(), entry)
+        assert ssh.call_args.args[0] == "old"
+        assert "pvesh delete /nodes/n1/qemu/101" in ssh.call_args.args[2]
+        assert entry["vmid"] == 5
+
+    def test_resize_via_node(self):
+        with patch("proxmox_cloud_init.reconcile.ssh_run") as ssh:
+            rc._resize("web1", _spec(disk="50G"), {"vmid": 101, "node": "pve2"})
+        assert ssh.call_args.args[2] == "pvesh set /nodes/pve2/qemu/101/resize --disk scsi0 --size 50G"
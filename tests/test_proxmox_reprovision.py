@@ -0,0 +1,42 @@
+"""Unit-Tests für proxmox_cloud_init/reprovision.py"""
+
+import asyncio
+import json
+import subprocess
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from debian_cloud_init.engine import CommandError
+from proxmox_cloud_init import reprovision as rp
+
+SESSION = {"proxmox_host": "pve1", "proxmox_ssh_user": "root", "proxmox_vmid": 101}
+
+
+def _completed(stdout: str) -> subprocess.CompletedProcess[str]:
+    return subprocess.CompletedProcess([], 0, stdout, "")
+
+
+class TestExecute:
+    def test_script_via_guest_agent_stdin(self):
+        agent = AsyncMock(return_value=_completed(json.dumps({"exitcode": 0, "exited": 1})))
+        with patch("proxmox_cloud_init.reprovision.ssh_run_async", agent):
+            asyncio.run(rp._execute("web1", SESSION, "set -e\n"))
+        assert agent.call_args.args[2].startswith("qm guest exec 101 ")
+        assert agent.call_args.kwargs["input"] == "set -e\n"
+
+    def test_guest_exit_code_counts(self):
+        output = json.dumps({"exitcode": 100, "exited": 1, "err-data": "E: Paket nicht gefunden\n"})
+        with patch("proxmox_cloud_init.reprovision.ssh_run_async", AsyncMock(return_value=_completed(output))), \
+             pytest.raises(CommandError, match="Paket nicht gefunden"):
+            asyncio.run(rp._execute("web1", SESSION, "true\n"))
+
+
+class TestRunning:
+    def test_one_call_per_host(self):
+        vms = [{"vmid": 101, "status": "running"}, {"vmid": 102, "status": "stopped"}]
+        sessions = {"web1": SESSION, "web2": {**SESSION, "proxmox_vmid": 102}}
+        with patch("proxmox_cloud_init.reprovision.ssh_run",
+                   return_value=MagicMock(returncode=0, stdout=json.dumps(vms))) as ssh:
+            assert rp._running(sessions) == {"web1"}
+        ssh.assert_called_once()
@@ -36,6 +36,12 @@ def _setup_ssh_key(tmp_path):
     return key
 
 
+@pytest.fixture(autouse=True)
+def no_host_facts():
+    with patch("proxmox_cloud_init.session.host_facts", return_value={}) as mock_facts:
+        yield mock_facts
+
+
 def _mkpasswd_mock():
     m = MagicMock()
     m.stdout = "$6$salt$hashedpassword\n"
@@ -166,6 +172,24 @@ class TestGetOrCreateSessionNew:
     # 8. distro_choice, 9. arch_choice, 10. vmname, 11. username
     _DEFAULTS: ClassVar[list[str]] = ["192.168.1.100", "", "", "100", "", "", "", "", "", "", ""]
 
+    def test_host_facts_provide_defaults(self, tmp_path, no_host_facts):
+        no_host_facts.return_value = {
+            "node": "pve2",
+            "nodes": ["pve1", "pve2"],
+            "storages": {"pve2": [{"storage": "ceph", "content": ["images"], "shared": True}]},
+            "bridges": {"pve2": ["vmbr1"]},
+        }
+        session_file = tmp_path / ".proxmox-session"
+        _setup_ssh_key(tmp_path)
+        with patch.object(proxmox_session, "SESSION_FILE", session_file), \
+             patch("builtins.input", side_effect=list(self._DEFAULTS)), \
+             patch("getpass.getpass", return_value="secret"), \
+             patch("subprocess.run", return_value=_mkpasswd_mock()), \
+             patch("pathlib.Path.home", return_value=tmp_path):
+            session, _ = get_or_create_session()
+        assert (session["proxmox_node"], session["proxmox_storage"], session["proxmox_bridge"]) == (
+            "pve2", "ceph", "vmbr1")
+
     def test_defaults_produce_debian13_amd64(self, tmp_path):
         session_file = tmp_path / ".proxmox-session"
         _setup_ssh_key(tmp_path)
@@ -274,6 +298,39 @@ class TestGetOrCreateSessionNew:
              pytest.raises(SystemExit):
             get_or_create_session()
 
+    def test_empty_vmid_allocates_automatically(self, tmp_path):
+        session_file = tmp_path / ".proxmox-session"
+        _setup_ssh_key(tmp_path)
+        inputs = ["192.168.1.100", "", "", "", "", "", "", "", "", "", ""]
+        with patch.object(proxmox_session, "SESSION_FILE", session_file), \
+             patch("builtins.input", side_effect=inputs), \
+             patch("getpass.getpass", return_value="secret"), \
+             patch("subprocess.run", return_value=_mkpasswd_mock()), \
+             patch("pathlib.Path.home", return_value=tmp_path), \
+             patch("proxmox_cloud_init.vmid.allocate_vmids", return_value=[123]) as mock_alloc:
+            session, _ = get_or_create_session()
+        assert session["proxmox_vmid"] == 123
+        assert mock_alloc.call_args.args[:3] == ("192.168.1.100", "root", 1)
+
+    def test_auto_storage_keeps_node_and_uses_profile_size(self, tmp_path):
+        session_file = tmp_path / ".proxmox-session"
+        _setup_ssh_key(tmp_path)
+        # Node angegeben, nur Storage 'auto'; danach Policy und Gruppe
+        inputs = ["192.168.1.100", "", "pve2", "100", "auto", "", "", "", "", "", "", "", ""]
+        placement = {"node": "pve2", "storage": "ceph", "address": "10.0.0.2"}
+        with patch.object(proxmox_session, "SESSION_FILE", session_file), \
+             patch("builtins.input", side_effect=inputs), \
+             patch("getpass.getpass", return_value="secret"), \
+             patch("subprocess.run", return_value=_mkpasswd_mock()), \
+             patch("pathlib.Path.home", return_value=tmp_path), \
+             patch("proxmox_cloud_init.placement.choose_placement", return_value=placement) as mock_place:
+            session, _ = get_or_create_session("database")
+        kwargs = mock_place.call_args.kwargs
+        assert (kwargs["node"], kwargs["storage"]) == ("pve2", None)
+        assert (kwargs["cores"], kwargs["memory_mb"]) == (4, 8192)
+        assert (session["proxmox_node"], session["proxmox_storage"], session["proxmox_host"]) == (
+            "pve2", "ceph", "10.0.0.2")
+
     def test_no_ssh_keys_exits(self, tmp_path):
         session_file = tmp_path / ".proxmox-session"
         (tmp_path / ".ssh").mkdir()
@@ -480,3 +537,21 @@ class TestSyncSessions:
             result = proxmox_session._sync_sessions({})
         mock_ssh.assert_not_called()
         assert result == {}
+
+
+# =============================================================================
+# Vorgaben aus Host-Fakten
+# =============================================================================
+
+
+class TestSuggest:
+    def test_previous_value_kept_when_host_knows_it(self):
+        assert proxmox_session._suggest("local-zfs", ["local-lvm", "local-zfs"], "local-lvm") == "local-zfs"
+
+    def test_previous_value_replaced_when_unknown(self):
+        assert proxmox_session._suggest("gone", ["ceph", "local-lvm"], "local-lvm") == "local-lvm"
+        assert proxmox_session._suggest("gone", ["ceph"], "local-lvm") == "ceph"
+
+    def test_without_facts_previous_or_fallback(self):
+        assert proxmox_session._suggest("vmbr1", [], "vmbr0") == "vmbr1"
+        assert proxmox_session._suggest(None, [], "vmbr0") == "vmbr0"
@@ -0,0 +1,75 @@
+"""Unit-Tests für proxmox_cloud_init/teardown.py"""
+
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+from proxmox_cloud_init import teardown
+from proxmox_cloud_init.teardown import destroy_script, disk_bytes, tombstone_vm
+
+CONFIG = {
+    "name": "vm1",
+    "scsi0": "local-lvm:vm-101-disk-1,iothread=1,size=32G",
+    "efidisk0": "local-lvm:vm-101-disk-0,efitype=4m,size=4M",
+    "ide2": "local-lvm:vm-101-cloudinit,media=cdrom",
+    "net0": "virtio=BC:24:11:00:00:01,bridge=vmbr0",
+}
+
+
+class TestDiskBytes:
+    def test_sums_disks_without_cdrom(self):
+        assert disk_bytes(CONFIG) == 32 * 1024 ** 3 + 4 * 1024 ** 2
+
+    def test_no_disks(self):
+        assert disk_bytes({"name": "x"}) == 0
+
+
+class TestDestroy:
+    def test_single_round_trip_via_pvesh(self):
+        script = destroy_script("pve2", 101)
+        assert "pvesh get /nodes/pve2/qemu/101/config" in script
+        assert "pvesh delete /nodes/pve2/qemu/101 --purge 1 --destroy-unreferenced-disks 1" in script
+
+    def test_freed_from_config(self):
+        async def fake_ssh(host, user, cmd, **kwargs):
+            return MagicMock(stdout=json.dumps(CONFIG) + "\n")
+
+        target = {"name": "vm1", "host": "pve", "user": "root", "node": "pve", "vmid": 101}
+        with patch("proxmox_cloud_init.teardown.ssh_run_async", side_effect=fake_ssh):
+            assert asyncio.run(teardown._destroy(target)) == disk_bytes(CONFIG)
+
+
+class TestSelect:
+    def test_fleet_and_match(self):
+        sessions = {"web": {"proxmox_host": "pve1", "proxmox_ssh_user": "root", "proxmox_node": "pve1",
+                            "proxmox_vmid": 100}}
+        resources = [
+            {"type": "qemu", "vmid": 201, "name": "lab-1", "node": "pve2"},
+            {"type": "qemu", "vmid": 202, "name": "db", "node": "pve2"},
+            {"type": "lxc", "vmid": 203, "name": "lab-ct", "node": "pve2"},
+        ]
+        with patch("proxmox_cloud_init.teardown.all_sessions", return_value=sessions), \
+             patch("proxmox_cloud_init.teardown.ssh_run",
+                   return_value=MagicMock(returncode=0, stdout=json.dumps(resources))):
+            targets = teardown._select("lab-*", True, "pve1", "root")
+        assert [(t["name"], t["node"], t["vmid"]) for t in targets] == [("web", "pve1", 100), ("lab-1", "pve2", 201)]
+
+
+class TestTombstone:
+    def test_renames_and_reallocates(self):
+        with patch("proxmox_cloud_init.teardown.ssh_run", return_value=MagicMock(returncode=0)) as mock_ssh, \
+             patch("proxmox_cloud_init.teardown.allocate_vmids", return_value=[9001]) as mock_alloc, \
+             patch("proxmox_cloud_init.teardown.range_containing", return_value="ci"), \
+             patch("proxmox_cloud_init.teardown.progress"):
+            assert tombstone_vm("pve", "root", 9000, "build") == 9001
+        cmd = mock_ssh.call_args_list[1].args[2]
+        assert "qm set 9000 --name build-deleted --tags tombstone" in cmd
+        assert "setsid nohup" in cmd and cmd.endswith("&")
+        mock_alloc.assert_called_once_with("pve", "root", 1, "ci")
+
+    def test_missing_vm_only_allocates(self):
+        with patch("proxmox_cloud_init.teardown.ssh_run", return_value=MagicMock(returncode=2)) as mock_ssh, \
+             patch("proxmox_cloud_init.teardown.allocate_vmids", return_value=[101]), \
+             patch("proxmox_cloud_init.teardown.range_containing", return_value=None):
+            assert tombstone_vm("pve", "root", 100, "vm") == 101
+        assert mock_ssh.call_count == 1
@@ -1,9 +1,11 @@
 """Unit-Tests für proxmox/vm.py"""
 
+import base64
 from unittest.mock import MagicMock, patch
 
 import pytest
 
+from debian_cloud_init.workspace import SEED_TOKEN
 from proxmox_cloud_init.vm import (
     _extract_ip_from_interfaces,
     create_vm,
@@ -114,42 +116,10 @@ class TestDeleteVm:
 
 
 class TestEnsureBaseImage:
-    def test_image_exists_returns_path_with_filename(self):
-        with patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(returncode=0)):
-            path = ensure_base_image("host", "root", "amd64", "debian/13")
-        assert "debian-13-generic-amd64.qcow2" in path
-
-    def test_image_exists_no_download_attempted(self):
-        with patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(returncode=0)) as mock_ssh:
-            ensure_base_image("host", "root", "amd64", "debian/13")
-        calls = " ".join(str(c) for c in mock_ssh.call_args_list)
-        assert "wget" not in calls
-
-    def test_image_missing_user_confirms_downloads(self):
-        with patch("proxmox_cloud_init.vm.ssh_run", side_effect=[
-            _ssh_result(returncode=1),
-            _ssh_result(),
-        ]) as mock_ssh, \
-             patch("proxmox_cloud_init.vm.ask_yes_no", return_value=True):
-            ensure_base_image("host", "root", "amd64", "debian/13")
-        calls = " ".join(str(c) for c in mock_ssh.call_args_list)
-        assert "wget" in calls
-
-    def test_image_missing_user_declines_exits(self):
-        with patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(returncode=1)), \
-             patch("proxmox_cloud_init.vm.ask_yes_no", return_value=False), \
-             pytest.raises(SystemExit):
-            ensure_base_image("host", "root", "amd64", "debian/13")
-
-    def test_ubuntu_image_name_in_returned_path(self):
-        with patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(returncode=0)):
-            path = ensure_base_image("host", "root", "amd64", "ubuntu/24.04")
-        assert "ubuntu-24.04-server-cloudimg-amd64.img" in path
-
-    def test_arm64_image_name_in_returned_path(self):
-        with patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(returncode=0)):
-            path = ensure_base_image("host", "root", "arm64", "debian/13")
-        assert "arm64" in path
+    def test_delegates_to_storage_staging_with_node(self):
+        with patch("proxmox_cloud_init.images.ensure_image", return_value="/var/lib/vz/template/iso/x.img") as mock:
+            assert ensure_base_image("host", "root", "amd64", "debian/13", "pve2") == "/var/lib/vz/template/iso/x.img"
+        mock.assert_called_once_with("host", "root", "amd64", "debian/13", "pve2")
 
 
 # =============================================================================
@@ -286,3 +256,23 @@ class TestCreateVm:
         )
         calls = " ".join(str(c) for c in mock_ssh.call_args_list)
         assert "50G" in calls
+
+    def test_seed_server_replaces_snippets(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("DEBIAN_CLOUD_INIT_SEED_URL", "http://10.0.0.5:8765/")
+        cloud_init_yml = tmp_path / "cloud-init.yml"
+        cloud_init_yml.write_text("#cloud-config\n{}")
+        with patch("proxmox_cloud_init.vm.upload_snippets") as mock_upload, \
+             patch("proxmox_cloud_init.vm.ensure_base_image", return_value="/images/debian.qcow2"), \
+             patch("proxmox_cloud_init.vm.ask_yes_no", side_effect=[True, True]), \
+             patch("proxmox_cloud_init.vm.ssh_run", side_effect=_ssh_config_side_effect) as mock_ssh:
+            create_vm("host", "root", "pve", 100, "testvm", "amd64", "debian/13",
+                      "local-lvm", "vmbr0", "/var/lib/vz/snippets", cloud_init_yml)
+        mock_upload.assert_not_called()
+        calls = [c.args[2] for c in mock_ssh.call_args_list]
+        smbios = next(c for c in calls if "--smbios1" in c)
+        encoded = smbios.split("serial=", 1)[1].split(",", 1)[0]
+        token = (tmp_path / SEED_TOKEN).read_text().strip()
+        assert base64.b64decode(encoded).decode() == f"ds=nocloud;s=http://10.0.0.5:8765/proxmox/testvm/{token}/"
+        assert not any("--ide2" in c or "--cicustom" in c for c in calls)
+        assert (tmp_path / "meta-data.yml").read_text().startswith("instance-id: testvm-")
+        assert "dhcp4: true" in (tmp_path / "network-config.yml").read_text()
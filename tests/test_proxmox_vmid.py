@@ -0,0 +1,156 @@
+"""Unit-Tests für proxmox/vmid.py"""
+
+import json
+import os
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from proxmox_cloud_init import vmid as proxmox_vmid
+from proxmox_cloud_init.vmid import (
+    allocate_vmids,
+    load_ranges,
+    refresh_vmids,
+    release_vmids,
+    resolve_range,
+)
+
+
+def _ssh_result(returncode=0, stdout="", stderr=""):
+    return MagicMock(returncode=returncode, stdout=stdout, stderr=stderr)
+
+
+# =============================================================================
+# Bereiche
+# =============================================================================
+
+
+class TestRanges:
+    def test_no_file_returns_default_range(self, tmp_path):
+        with patch.object(proxmox_vmid, "RANGES_FILE", tmp_path / "missing"):
+            assert load_ranges() == {"default": proxmox_vmid.DEFAULT_RANGE}
+
+    def test_named_range_loaded(self, tmp_path):
+        ranges_file = tmp_path / ".proxmox-vmid-ranges"
+        ranges_file.write_text(json.dumps({"ci": [9000, 9099]}))
+        with patch.object(proxmox_vmid, "RANGES_FILE", ranges_file):
+            assert resolve_range("ci") == (9000, 9099)
+            assert resolve_range(None) == proxmox_vmid.DEFAULT_RANGE
+
+    def test_unknown_range_exits(self, tmp_path):
+        with patch.object(proxmox_vmid, "RANGES_FILE", tmp_path / "missing"), \
+             pytest.raises(SystemExit):
+            resolve_range("team-x")
+
+    def test_invalid_file_exits(self, tmp_path):
+        ranges_file = tmp_path / ".proxmox-vmid-ranges"
+        ranges_file.write_text("{broken")
+        with patch.object(proxmox_vmid, "RANGES_FILE", ranges_file), \
+             pytest.raises(SystemExit):
+            load_ranges()
+
+
+# =============================================================================
+# allocate_vmids / release_vmids
+# =============================================================================
+
+
+class TestAllocateVmids:
+    def test_returns_ids_from_remote_script(self, tmp_path):
+        with patch.object(proxmox_vmid, "RANGES_FILE", tmp_path / "missing"), \
+             patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(stdout="101\n103\n")):
+            assert allocate_vmids("host", "root", 2) == [101, 103]
+
+    def test_single_round_trip_uses_cluster_lock_and_range(self, tmp_path):
+        ranges_file = tmp_path / ".proxmox-vmid-ranges"
+        ranges_file.write_text(json.dumps({"ci": [9000, 9099]}))
+        with patch.object(proxmox_vmid, "RANGES_FILE", ranges_file), \
+             patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(stdout="9000\n")) as mock_ssh:
+            allocate_vmids("host", "root", 1, "ci")
+        assert mock_ssh.call_count == 1
+        script = mock_ssh.call_args.args[2]
+        assert 'mkdir "$L/.lock"' in script
+        assert proxmox_vmid.LEASE_DIR.startswith("/etc/pve/")
+        assert "lo=9000" in script
+        assert "hi=9099" in script
+
+    def test_range_exhausted_exits(self, tmp_path):
+        with patch.object(proxmox_vmid, "RANGES_FILE", tmp_path / "missing"), \
+             patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(returncode=76)), \
+             pytest.raises(SystemExit):
+            allocate_vmids("host", "root", 5)
+
+    def test_wrong_count_exits(self, tmp_path):
+        with patch.object(proxmox_vmid, "RANGES_FILE", tmp_path / "missing"), \
+             patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(stdout="101\n")), \
+             pytest.raises(SystemExit):
+            allocate_vmids("host", "root", 2)
+
+    def test_release_removes_lease_files(self):
+        with patch("proxmox_cloud_init.vm.ssh_run") as mock_ssh:
+            release_vmids("host", "root", [101, 102])
+        cmd = mock_ssh.call_args.args[2]
+        assert f"{proxmox_vmid.LEASE_DIR}/101" in cmd
+        assert f"{proxmox_vmid.LEASE_DIR}/102" in cmd
+
+    def test_refresh_lost_lease_exits(self):
+        with patch("proxmox_cloud_init.vm.ssh_run", return_value=_ssh_result(returncode=77)), \
+             pytest.raises(SystemExit):
+            refresh_vmids("host", "root", [101])
+
+
+class TestReserveScript:
+    """Führt das Reservierungsskript lokal mit einem gefälschten pvesh aus."""
+
+    def _run(self, tmp_path, count, low=100, high=105):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir(exist_ok=True)
+        pvesh = bin_dir / "pvesh"
+        pvesh.write_text("#!/bin/sh\necho '[{\"vmid\":100},{\"vmid\":102}]'\n")
+        pvesh.chmod(0o755)
+        script = proxmox_vmid._RESERVE_SCRIPT.format(
+            lease_dir=tmp_path / "leases", stale=120, low=low, high=high, count=count, ttl=60,
+        )
+        return self._sh(tmp_path, script)
+
+    def _sh(self, tmp_path, script):
+        env = dict(os.environ, PATH=f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+        return subprocess.run(["sh", "-c", script], capture_output=True, text=True, env=env, check=False)
+
+    def _refresh(self, tmp_path, ids, ttl=60):
+        script = proxmox_vmid._REFRESH_SCRIPT.format(lease_dir=tmp_path / "leases", stale=120, ids=ids, ttl=ttl)
+        return self._sh(tmp_path, script)
+
+    def test_skips_existing_vmids(self, tmp_path):
+        result = self._run(tmp_path, 2)
+        assert result.stdout.split() == ["101", "103"]
+
+    def test_leases_block_second_run(self, tmp_path):
+        first = self._run(tmp_path, 2)
+        second = self._run(tmp_path, 2)
+        assert set(first.stdout.split()).isdisjoint(second.stdout.split())
+
+    def test_exhausted_range_returns_76(self, tmp_path):
+        assert self._run(tmp_path, 5).returncode == 76
+
+    def test_lock_released_after_run(self, tmp_path):
+        self._run(tmp_path, 1)
+        assert not (tmp_path / "leases" / ".lock").exists()
+
+    def test_stale_lock_is_taken_over(self, tmp_path):
+        lock = tmp_path / "leases" / ".lock"
+        lock.mkdir(parents=True)
+        os.utime(lock, (0, 0))
+        assert self._run(tmp_path, 1).returncode == 0
+
+    def test_refresh_extends_and_recreates(self, tmp_path):
+        self._run(tmp_path, 1)
+        lease = tmp_path / "leases" / "101"
+        lease.unlink()
+        assert self._refresh(tmp_path, "101", ttl=7200).returncode == 0
+        assert int(lease.read_text()) > int(subprocess.check_output(["date", "+%s"])) + 3600
+
+    def test_refresh_fails_when_id_taken(self, tmp_path):
+        self._run(tmp_path, 1)
+        assert self._refresh(tmp_path, "102").returncode == 77
@@ -0,0 +1,145 @@
+"""Unit-Tests für rebuild.py"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from debian_cloud_init.rebuild import (
+    capture_golden,
+    config_hash,
+    discard_golden,
+    golden_matches,
+    revert_to_golden,
+)
+from debian_cloud_init.vm import wait_for_cloud_init
+
+
+@pytest.fixture
+def isos(tmp_path):
+    with patch("debian_cloud_init.rebuild.ISOS_PATH", tmp_path):
+        yield tmp_path
+
+
+# =============================================================================
+# Hash / Golden-Dateien
+# =============================================================================
+
+
+class TestConfigHash:
+    def test_changes_with_cloud_init(self, tmp_path):
+        ci = tmp_path / "cloud-init.yml"
+        ci.write_text("#cloud-config\na: 1\n")
+        before = config_hash(ci, {"profile": "default"})
+        ci.write_text("#cloud-config\na: 2\n")
+        assert config_hash(ci, {"profile": "default"}) != before
+
+    def test_changes_with_params(self, tmp_path):
+        ci = tmp_path / "cloud-init.yml"
+        ci.write_text("#cloud-config\n")
+        assert config_hash(ci, {"profile": "default"}) != config_hash(ci, {"profile": "build"})
+
+    def test_param_order_irrelevant(self, tmp_path):
+        ci = tmp_path / "cloud-init.yml"
+        ci.write_text("#cloud-config\n")
+        assert config_hash(ci, {"a": 1, "b": 2}) == config_hash(ci, {"b": 2, "a": 1})
+
+
+class TestGoldenMatches:
+    def test_no_golden(self, isos):
+        assert not golden_matches("vm", "abc")
+
+    def test_match_and_mismatch(self, isos):
+        (isos / "vm-golden.qcow2").touch()
+        (isos / "vm-golden.json").write_text(json.dumps({"hash": "abc"}))
+        assert golden_matches("vm", "abc")
+        assert not golden_matches("vm", "def")
+
+    def test_discard(self, isos):
+        (isos / "vm-golden.qcow2").touch()
+        (isos / "vm-golden.json").touch()
+        discard_golden("vm")
+        assert list(isos.iterdir()) == []
+
+
+# =============================================================================
+# Sichern / Zurücksetzen
+# =============================================================================
+
+
+class TestCaptureGolden:
+    def test_skipped_when_cloud_init_failed(self, isos):
+        with patch("debian_cloud_init.rebuild.wait_for_cloud_init", return_value=False), \
+             patch("debian_cloud_init.rebuild.run_cmd") as mock_run:
+            assert not capture_golden("vm", "abc")
+        mock_run.assert_not_called()
+        assert not (isos / "vm-golden.json").exists()
+
+    def test_skipped_when_deferred_failed(self, isos):
+        with patch("debian_cloud_init.rebuild.wait_for_cloud_init", return_value=True), \
+             patch("debian_cloud_init.rebuild.wait_for_provisioning", return_value={"state": "failed"}), \
+             patch("debian_cloud_init.rebuild.run_cmd") as mock_run:
+            assert not capture_golden("vm", "abc", deferred=True)
+        mock_run.assert_not_called()
+
+    def test_shutdown_copy_start(self, isos):
+        def fake_run(cmd):
+            if cmd.startswith("cp "):
+                (isos / "vm-golden.tmp").touch()
+
+        with patch("debian_cloud_init.rebuild.wait_for_cloud_init", return_value=True), \
+             patch("debian_cloud_init.rebuild.subprocess.run") as mock_sub, \
+             patch("debian_cloud_init.virt.domain_state", return_value="shut off"), \
+             patch("debian_cloud_init.rebuild.progress"), \
+             patch("debian_cloud_init.rebuild.success"), \
+             patch("debian_cloud_init.rebuild.run_cmd", side_effect=fake_run) as mock_run:
+            assert capture_golden("vm", "abc")
+
+        assert mock_sub.call_args_list[0].args[0] == ["virsh", "shutdown", "vm"]
+        cmds = [c.args[0] for c in mock_run.call_args_list]
+        assert cmds[0].startswith(f"cp --reflink=auto --sparse=always {isos}/vm.qcow2 ")
+        assert cmds[-1] == "virsh start vm"
+        assert golden_matches("vm", "abc")
+
+
+class TestRevertToGolden:
+    def test_missing_golden_exits(self, isos):
+        with pytest.raises(SystemExit):
+            revert_to_golden("vm")
+
+    def test_destroy_copy_start(self, isos):
+        (isos / "vm-golden.qcow2").touch()
+
+        def fake_run(cmd):
+            if cmd.startswith("cp "):
+                (isos / "vm.tmp").write_text("golden")
+
+        with patch("debian_cloud_init.virt.destroy") as mock_destroy, \
+             patch("debian_cloud_init.rebuild.progress"), \
+             patch("debian_cloud_init.rebuild.success"), \
+             patch("debian_cloud_init.rebuild.run_cmd", side_effect=fake_run) as mock_run:
+            revert_to_golden("vm")
+
+        mock_destroy.assert_called_once_with("vm")
+        assert mock_run.call_args.args[0] == "virsh start vm"
+        assert (isos / "vm.qcow2").read_text() == "golden"
+
+
+# =============================================================================
+# wait_for_cloud_init
+# =============================================================================
+
+
+class TestWaitForCloudInit:
+    @pytest.fixture(autouse=True)
+    def _quiet(self):
+        with patch("debian_cloud_init.vm.progress"):
+            yield
+
+    def test_done(self):
+        with patch("debian_cloud_init.vm.guest_exec", return_value=(0, "status: done\n")):
+            assert wait_for_cloud_init("vm", timeout=1, interval=0)
+
+    def test_error(self):
+        with patch("debian_cloud_init.vm.guest_exec", return_value=(1, "status: error\n")):
+            assert not wait_for_cloud_init("vm", timeout=1, interval=0)
@@ -0,0 +1,281 @@
+"""Unit-Tests für debian_cloud_init/reconcile.py"""
+
+import asyncio
+import json
+import pathlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import build, workspace
+from debian_cloud_init import reconcile as rc
+from debian_cloud_init.engine import CommandError
+from debian_cloud_init.reconcile import (
+    apply_plan,
+    format_plan,
+    load_spec,
+    plan,
+    reconcile,
+    update_state,
+)
+
+GIB = 1024 ** 3
+REPO_TEMPLATES = pathlib.Path(__file__).resolve().parent.parent / "templates"
+
+
+def _want(hash_="h1", disk=20 * GIB):
+    return {"hash": hash_, "disk": disk}
+
+
+def _have(state="running", disk=20 * GIB, seed: bool | None = True, broken=None):
+    return {"state": state, "disk": disk, "seed": seed, "broken": broken}
+
+
+def _actions(actions):
+    return [(a["name"], a["action"]) for a in actions]
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with patch("debian_cloud_init.reconcile.progress"), patch("debian_cloud_init.reconcile.success"), \
+         patch("debian_cloud_init.ui.NON_INTERACTIVE", False):
+        yield
+
+
+# =============================================================================
+# Plan
+# =============================================================================
+
+
+class TestPlan:
+    def test_converged_is_empty(self):
+        assert plan({"a": _want()}, {"a": _have()}, {"a": _want()}) == []
+
+    def test_create_and_start(self):
+        actions = plan({"a": _want(), "b": _want()}, {"b": _have(state="stopped")}, {"b": _want()})
+        assert _actions(actions) == [("a", "create"), ("b", "start")]
+
+    def test_changed_hash_recreates(self):
+        assert _actions(plan({"a": _want("h2")}, {"a": _have()}, {"a": _want("h1")})) == [("a", "recreate")]
+
+    def test_unrecorded_vm_adopted_not_recreated(self):
+        actions = plan({"a": _want()}, {"a": _have(state="stopped")}, {})
+        assert _actions(actions) == [("a", "adopt"), ("a", "start")]
+
+    def test_reseed_and_resize(self):
+        actions = plan({"a": _want(disk=40 * GIB)}, {"a": _have(seed=False)}, {"a": _want()})
+        assert _actions(actions) == [("a", "reseed"), ("a", "resize")]
+        assert actions[1]["reason"] == "20G → 40G"
+
+    def test_seed_not_expected(self):
+        assert plan({"a": _want()}, {"a": _have(seed=None)}, {"a": _want()}) == []
+
+    def test_shrink_recreates(self):
+        assert _actions(plan({"a": _want(disk=10 * GIB)}, {"a": _have()}, {"a": _want()})) == [("a", "recreate")]
+
+    def test_broken_recreates(self):
+        actions = plan({"a": _want()}, {"a": _have(broken="Overlay fehlt")}, {"a": _want()})
+        assert actions == [{"name": "a", "action": "recreate", "reason": "Overlay fehlt"}]
+
+    def test_delete_only_managed_and_existing(self):
+        actions = plan({}, {"old": _have(), "foreign": _have()}, {"old": _want(), "gone": _want()})
+        assert _actions(actions) == [("old", "delete")]
+
+    def test_format(self):
+        out = format_plan(plan({"a": _want()}, {}, {}))
+        assert "+ create    a  (VM fehlt)" in out
+        assert out.endswith("Plan: 1 create")
+        assert format_plan([]).startswith("Nichts zu tun")
+
+
+# =============================================================================
+# Spec
+# =============================================================================
+
+
+class TestLoadSpec:
+    def test_defaults_and_relative_paths(self, tmp_path):
+        spec = tmp_path / "lab.yml"
+        spec.write_text("defaults:\n  username: ci\n  templates: templates\nvms:\n  web1: {}\n"
+                        "  db1: {profile: database}\n")
+        specs = load_spec(spec, ("username",), {"profile": "default", "arch": "amd64"})
+        assert specs["web1"] == {"profile": "default", "arch": "amd64", "username": "ci",
+                                 "templates": str(tmp_path / "templates")}
+        assert specs["db1"]["profile"] == "database"
+
+    def test_missing_setting_fails(self, tmp_path, capsys):
+        spec = tmp_path / "lab.yml"
+        spec.write_text("vms:\n  web1: {}\n")
+        with pytest.raises(SystemExit):
+            load_spec(spec, ("username",), {})
+        assert "fehlt username" in capsys.readouterr().out
+
+    def test_invalid_name_fails(self, tmp_path):
+        spec = tmp_path / "lab.yml"
+        spec.write_text("vms:\n  'a b': {}\n")
+        with pytest.raises(SystemExit):
+            load_spec(spec, (), {})
+
+
+# =============================================================================
+# Anwenden
+# =============================================================================
+
+
+def _backend(tmp_path, observed=None, **actions):
+    return {
+        "state_file": tmp_path / ".reconcile-state.json",
+        "required": (),
+        "defaults": {},
+        "desire": lambda name, spec: _want(spec.get("hash", "h1")),
+        "inspect": MagicMock(return_value=observed or {}),
+        "prepare": MagicMock(),
+        "actions": {action: actions.get(action, MagicMock()) for action in rc.ACTIONS},
+    }
+
+
+class TestApply:
+    def test_steps_per_vm_in_order_and_errors_isolated(self, tmp_path):
+        calls = []
+
+        def create(name, spec, entry):
+            if name == "b":
+                raise CommandError(["qemu-img"], 1, "", "kaputt")
+            calls.append((name, "create"))
+            entry["vmid"] = 7
+
+        backend = _backend(tmp_path, create=create, start=lambda name, spec, entry: calls.append((name, "start")))
+        actions = [{"name": "a", "action": "create"}, {"name": "b", "action": "create"},
+                   {"name": "a", "action": "start"}]
+        results = asyncio.run(apply_plan(actions, {"a": {}, "b": {}}, {}, backend, limit=2))
+        assert calls == [("a", "create"), ("a", "start")]
+        assert results[0]["entry"] == {"vmid": 7} and results[0]["error"] is None
+        assert "kaputt" in results[1]["error"]
+
+    def test_fail_inside_action_is_captured(self, tmp_path):
+        def create(name, spec, entry):
+            rc.fail("geht nicht")
+
+        results = asyncio.run(apply_plan([{"name": "a", "action": "create"}], {"a": {}}, {},
+                                         _backend(tmp_path, create=create)))
+        assert results[0]["error"] == "abgebrochen"
+
+    def test_update_state(self):
+        state = {"a": {"hash": "old"}, "gone": {"hash": "x"}, "bad": {"hash": "keep"}}
+        results = [
+            {"name": "a", "actions": ["recreate"], "entry": {"hash": "old", "vmid": 5}, "error": None},
+            {"name": "gone", "actions": ["delete"], "entry": {}, "error": None},
+            {"name": "bad", "actions": ["recreate"], "entry": {}, "error": "x"},
+        ]
+        state = update_state(state, results, {"a": _want("new"), "bad": _want("new")})
+        assert state == {"a": {"hash": "new", "disk": 20 * GIB, "vmid": 5}, "bad": {"hash": "keep"}}
+
+
+class TestReconcile:
+    @pytest.fixture
+    def spec_file(self, tmp_path):
+        path = tmp_path / "lab.yml"
+        path.write_text("vms:\n  a: {}\n  b: {}\n")
+        return path
+
+    def test_plan_only_touches_nothing(self, tmp_path, spec_file, capsys):
+        backend = _backend(tmp_path)
+        assert len(reconcile(spec_file, backend)) == 2
+        backend["actions"]["create"].assert_not_called()
+        assert not backend["state_file"].exists()
+        assert "Plan: 2 create" in capsys.readouterr().out
+
+    def test_apply_then_converged(self, tmp_path, spec_file):
+        backend = _backend(tmp_path)
+        reconcile(spec_file, backend, apply=True)
+        assert backend["actions"]["create"].call_count == 2
+        backend["prepare"].assert_called_once()
+        state = json.loads(backend["state_file"].read_text())
+        assert set(state) == {"a", "b"}
+
+        backend["inspect"].return_value = {name: _have() for name in ("a", "b")}
+        assert reconcile(spec_file, backend, apply=True) == []
+
+    def test_observed_record_passed_to_actions(self, tmp_path, spec_file):
+        backend = _backend(tmp_path, {"a": {**_have(state="stopped"), "record": {"vmid": 101}},
+                                      "b": _have()})
+        backend["state_file"].write_text(json.dumps({"a": _want(), "b": _want()}))
+        reconcile(spec_file, backend, apply=True)
+        assert backend["actions"]["start"].call_args.args[2]["vmid"] == 101
+        assert json.loads(backend["state_file"].read_text())["a"]["vmid"] == 101
+
+    def test_destructive_needs_confirmation(self, tmp_path, spec_file):
+        backend = _backend(tmp_path, {"a": _have(), "b": _have(), "old": _have()})
+        backend["state_file"].write_text(json.dumps({"a": _want(), "b": _want(), "old": _want()}))
+        with patch("debian_cloud_init.ui.input", return_value="n", create=True):
+            reconcile(spec_file, backend, apply=True)
+        backend["actions"]["delete"].assert_not_called()
+        reconcile(spec_file, backend, apply=True, assume_yes=True)
+        backend["actions"]["delete"].assert_called_once()
+        assert "old" not in json.loads(backend["state_file"].read_text())
+
+    def test_failed_action_exits_but_keeps_progress(self, tmp_path, spec_file):
+        def create(name, spec, entry):
+            if name == "b":
+                raise OSError("voll")
+
+        backend = _backend(tmp_path, create=create)
+        with pytest.raises(SystemExit):
+            reconcile(spec_file, backend, apply=True)
+        assert set(json.loads(backend["state_file"].read_text())) == {"a"}
+
+
+# =============================================================================
+# libvirt
+# =============================================================================
+
+
+class TestLibvirtInspect:
+    def test_overlay_and_seed(self, tmp_path):
+        (tmp_path / "a.qcow2").touch()
+        (tmp_path / "a-seed.iso").touch()
+        (tmp_path / "b.qcow2").touch()
+        specs = {"a": {"distro": "debian/13"}, "b": {"distro": "debian/13"}, "c": {"distro": "debian/13"}}
+        with patch("debian_cloud_init.vm.ISOS_PATH", tmp_path), \
+             patch("debian_cloud_init.virt.domain_state_map", return_value={"a": "running", "b": "shut off",
+                                                                           "x": "running"}), \
+             patch("debian_cloud_init.reconcile._disk_sizes", return_value={"a": 20 * GIB}) as sizes:
+            observed = rc._inspect(specs, {})
+        assert sizes.call_args.args[0] == ["a", "b"]
+        assert observed["a"] == _have()
+        assert observed["b"] == {"state": "stopped", "disk": None, "seed": False, "broken": None}
+        assert "c" not in observed and "x" not in observed
+
+    def test_missing_overlay_is_broken(self, tmp_path):
+        with patch("debian_cloud_init.vm.ISOS_PATH", tmp_path), \
+             patch("debian_cloud_init.virt.domain_state_map", return_value={"a": "running"}), \
+             patch("debian_cloud_init.reconcile._disk_sizes", return_value={}):
+            assert rc._inspect({"a": {"distro": "debian/13"}}, {})["a"]["broken"] == "Overlay fehlt"
+
+
+class TestLibvirtDesire:
+    @pytest.fixture
+    def spec(self, tmp_path):
+        key = tmp_path / "id.pub"
+        key.write_text("ssh-ed25519 AAAA ci@host")
+        with patch.object(workspace, "WORKSPACES_DIR", tmp_path / ".workspaces"), \
+             patch.object(build, "BUILD_CACHE_FILE", tmp_path / ".build-cache.json"), \
+             patch("debian_cloud_init.build.progress"), patch("debian_cloud_init.build.success"):
+            yield {**rc.DEFAULTS, "username": "ci", "hashed_password": "$6$x", "ssh_key": str(key),
+                   "templates": str(REPO_TEMPLATES)}
+
+    def test_plan_leaves_workspace_untouched(self, tmp_path, spec):
+        user_data = workspace.workspace_dir("a") / workspace.USER_DATA
+        user_data.parent.mkdir(parents=True)
+        user_data.write_text("#cloud-config\n")
+        first = rc._desire("a", spec)
+        assert user_data.read_text() == "#cloud-config\n"
+        assert rc._desire("a", spec) == first
+        assert rc._desire("a", {**spec, "username": "other"})["hash"] != first["hash"]
+
+    def test_reseed_renders_missing_user_data(self, tmp_path, spec):
+        with patch("debian_cloud_init.vm.create_seed_iso") as seed, \
+             patch("debian_cloud_init.cloud_init.create_network_config"):
+            rc._reseed("a", spec, {})
+        assert (workspace.workspace_dir("a") / workspace.USER_DATA).read_text().startswith("#cloud-config")
+        seed.assert_called_once()
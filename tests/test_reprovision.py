@@ -0,0 +1,250 @@
+"""Unit-Tests für debian_cloud_init/reprovision.py"""
+
+import os
+import pathlib
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import build
+from debian_cloud_init.build import (
+    build_cloud_config,
+    render_cloud_config,
+    template_files,
+)
+from debian_cloud_init.engine import CommandError
+from debian_cloud_init.reprovision import (
+    config_parts,
+    diff_configs,
+    has_changes,
+    reprovision,
+    update_script,
+    watch,
+)
+from debian_cloud_init.stages import CRITICAL_RUNCMD
+from debian_cloud_init.workspace import APPLIED_DATA, USER_DATA, record_applied
+
+REPO_TEMPLATES = pathlib.Path(__file__).resolve().parent.parent / "templates"
+
+_PARAMS = {
+    "username": "ci",
+    "hashed_password": "$6$salt$hash",
+    "ssh_key_content": "ssh-ed25519 AAAA ci@host",
+}
+
+
+@pytest.fixture
+def templates(tmp_path):
+    templates_dir = tmp_path / "templates"
+    templates_dir.mkdir()
+    for name in ("cloud-init-template.yml", "package-config.txt", "system-config.txt", "tools.yml"):
+        (templates_dir / name).write_text((REPO_TEMPLATES / name).read_text())
+    with patch.object(build, "BUILD_CACHE_FILE", tmp_path / ".build-cache.json"), \
+         patch("debian_cloud_init.build.progress"), patch("debian_cloud_init.build.success"):
+        yield templates_dir
+
+
+def _render(templates, **kwargs) -> dict:
+    return render_cloud_config(template_files(templates), **_PARAMS, **kwargs)
+
+
+def _append(path: pathlib.Path, line: str):
+    path.write_text(path.read_text() + line + "\n")
+
+
+# =============================================================================
+# Vergleich
+# =============================================================================
+
+
+class TestConfigParts:
+    def test_deferred_and_immediate_agree(self, templates):
+        immediate = config_parts(_render(templates))
+        deferred = config_parts(_render(templates, deferred=True))
+        assert deferred["scripts"] == immediate["scripts"]
+        assert set(immediate["scripts"]) == {"tools"}
+        assert [c for c in deferred["commands"] if c not in CRITICAL_RUNCMD] == immediate["commands"]
+
+    def test_continuation_lines_stay_together(self):
+        parts = config_parts({"runcmd": ["a \\\n  --flag\nb\n# Kommentar\n"], "packages": [["jq", "1.7"]]})
+        assert parts["commands"] == ["a \\\n  --flag", "b"]
+        assert parts["packages"] == ["jq=1.7"]
+
+
+class TestDiff:
+    def test_unchanged(self, templates):
+        diff = diff_configs(_render(templates), _render(templates))
+        assert not has_changes(diff) and not diff["removed"] and not diff["other"]
+
+    def test_new_system_line_with_variables(self, templates):
+        old = _render(templates)
+        _append(templates / "system-config.txt", "apt-get install -y jq")
+        diff = diff_configs(old, _render(templates))
+        assert diff["commands"] == ['DISTRO_ID=$(. /etc/os-release && echo "$ID")', "apt-get install -y jq"]
+        assert diff["scripts"] == {}
+
+    def test_new_repo_keeps_repeated_apt_update(self, templates):
+        old = _render(templates)
+        repo = "echo 'deb http://repo.example/debian stable main' > /etc/apt/sources.list.d/x.list"
+        for line in (repo, "apt-get update", "apt-get install -y xpkg"):
+            _append(templates / "package-config.txt", line)
+        lines = update_script(diff_configs(old, _render(templates))).splitlines()
+        assert lines.index(repo) < lines.index("apt-get update", lines.index(repo)) < lines.index("apt-get install -y xpkg")
+
+    def test_only_removed_lines_run_nothing(self):
+        old = {"runcmd": ["a", "b", "c"]}
+        diff = diff_configs(old, {"runcmd": ["a", "c"]})
+        assert diff["commands"] == [] and diff["removed"] == ["b"]
+
+    def test_changed_tool_reruns_script_only(self, templates):
+        old = _render(templates)
+        tools = templates / "tools.yml"
+        tools.write_text(tools.read_text().replace("kubectl", "kubectl2", 1))
+        diff = diff_configs(old, _render(templates))
+        assert list(diff["scripts"]) == ["tools"] and diff["commands"] == []
+
+    def test_removed_and_other_reported(self):
+        old = {"packages": ["htop"], "runcmd": ["swapoff -a"], "users": [{"name": "a"}]}
+        new = {"packages": ["jq"], "runcmd": [], "users": [{"name": "b"}]}
+        diff = diff_configs(old, new)
+        assert diff["packages"] == ["jq"]
+        assert diff["removed"] == ["htop", "swapoff -a"]
+        assert diff["other"] == ["users"]
+
+    def test_update_script(self):
+        script = update_script({"packages": ["jq", "a b"], "commands": ["swapoff -a"], "scripts": {"tools": "( x )"}})
+        assert script.splitlines() == ["set -e", "export DEBIAN_FRONTEND=noninteractive", "apt-get update",
+                                       "apt-get install -y jq 'a b'", "swapoff -a", "( x )"]
+
+
+# =============================================================================
+# Abgleich
+# =============================================================================
+
+
+@pytest.fixture
+def fleet(tmp_path, templates):
+    """Zwei Sessions mit angewendetem Stand und ein Fake-Backend."""
+    key = tmp_path / "id.pub"
+    key.write_text(_PARAMS["ssh_key_content"])
+    sessions = {}
+    for name in ("vm1", "vm2"):
+        workspace = tmp_path / ".workspaces" / name
+        workspace.mkdir(parents=True)
+        build_cloud_config(templates, workspace / USER_DATA, username="ci", hashed_password="$6$salt$hash",
+                           ssh_key_content=_PARAMS["ssh_key_content"])
+        record_applied(workspace)
+        sessions[name] = {"vmname": name, "username": "ci", "hashed_password": "$6$salt$hash",
+                          "ssh_key": str(key), "arch": "amd64", "workspace": str(workspace)}
+    backend = {
+        "workspace": "kvm",
+        "build": "libvirt",
+        "sessions": lambda: sessions,
+        "update_session": MagicMock(),
+        "running": MagicMock(return_value={"vm1", "vm2"}),
+        "execute": AsyncMock(),
+    }
+    with patch("debian_cloud_init.reprovision.progress"), patch("debian_cloud_init.reprovision.success"):
+        yield backend, sessions
+
+
+class TestReprovision:
+    def test_converged_does_nothing(self, fleet, templates):
+        backend, _ = fleet
+        assert reprovision(backend, templates) == []
+        backend["execute"].assert_not_called()
+
+    def test_applies_diff_and_records(self, fleet, templates):
+        backend, sessions = fleet
+        _append(templates / "system-config.txt", "timedatectl set-timezone UTC")
+        results = reprovision(backend, templates, limit=2)
+        assert [r["error"] for r in results] == [None, None]
+        script = backend["execute"].call_args_list[0].args[2]
+        assert script.endswith("timedatectl set-timezone UTC\n")
+        assert "swapoff" not in script
+        workspace = pathlib.Path(sessions["vm1"]["workspace"])
+        assert (workspace / APPLIED_DATA).read_text() == (workspace / USER_DATA).read_text()
+        assert backend["update_session"].call_count == 2
+        assert "applied_hash" in backend["update_session"].call_args.kwargs
+
+        # Zweiter Lauf: Stand ist aufgezeichnet
+        backend["execute"].reset_mock()
+        assert reprovision(backend, templates) == []
+        backend["execute"].assert_not_called()
+
+    def test_dry_run_and_match(self, fleet, templates, capsys):
+        backend, _ = fleet
+        _append(templates / "package-config.txt", "apt-get install -y jq")
+        reprovision(backend, templates, match="vm2", dry_run=True)
+        out = capsys.readouterr().out
+        assert "vm2:" in out and "vm1:" not in out
+        backend["execute"].assert_not_called()
+
+    def test_dry_run_leaves_workspace_untouched(self, fleet, templates, capsys):
+        backend, sessions = fleet
+        workspace = pathlib.Path(sessions["vm1"]["workspace"])
+        (workspace / APPLIED_DATA).unlink()  # VM aus der Zeit vor der Aufzeichnung
+        before = (workspace / USER_DATA).read_text()
+        _append(templates / "system-config.txt", "true")
+        for _ in range(2):
+            reprovision(backend, templates, dry_run=True)
+            assert "vm1: 2 Befehl(e)" in capsys.readouterr().out
+        assert (workspace / USER_DATA).read_text() == before
+
+    def test_unrecorded_baseline_survives_stopped_run(self, fleet, templates):
+        backend, sessions = fleet
+        workspace = pathlib.Path(sessions["vm1"]["workspace"])
+        (workspace / APPLIED_DATA).unlink()
+        backend["running"].return_value = {"vm2"}
+        _append(templates / "system-config.txt", "true")
+        reprovision(backend, templates)
+        backend["running"].return_value = {"vm1", "vm2"}
+        backend["execute"].reset_mock()
+        reprovision(backend, templates)
+        assert [c.args[0] for c in backend["execute"].call_args_list] == ["vm1"]
+
+    def test_stopped_vm_keeps_old_state(self, fleet, templates):
+        backend, sessions = fleet
+        backend["running"].return_value = {"vm2"}
+        _append(templates / "system-config.txt", "true")
+        reprovision(backend, templates)
+        assert [c.args[0] for c in backend["execute"].call_args_list] == ["vm2"]
+        workspace = pathlib.Path(sessions["vm1"]["workspace"])
+        assert (workspace / APPLIED_DATA).read_text() != (workspace / USER_DATA).read_text()
+
+    def test_failure_exits_and_is_retried(self, fleet, templates):
+        backend, _ = fleet
+
+        async def execute(name, session, script):
+            if name == "vm1":
+                raise CommandError(["ssh"], 100, "", "E: Paket nicht gefunden")
+
+        backend["execute"] = execute
+        _append(templates / "system-config.txt", "true")
+        with pytest.raises(SystemExit):
+            reprovision(backend, templates)
+        backend["update_session"].assert_called_once()
+        assert backend["update_session"].call_args.args[0] == "vm2"
+
+
+class TestWatch:
+    def test_reruns_after_change(self, templates):
+        run = MagicMock()
+        target = templates / "system-config.txt"
+
+        def touch():
+            stat = target.stat()
+            os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        sleeps = iter([touch, lambda: None, KeyboardInterrupt])
+
+        def sleep(_):
+            step = next(sleeps)
+            if step is KeyboardInterrupt:
+                raise KeyboardInterrupt
+            step()
+
+        with patch("debian_cloud_init.reprovision.time.sleep", side_effect=sleep), \
+             patch("debian_cloud_init.reprovision.progress"):
+            watch(run, templates, interval=0)
+        assert run.call_count == 2
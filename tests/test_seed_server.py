@@ -0,0 +1,138 @@
+"""Unit-Tests für debian_cloud_init/seed_server.py"""
+
+import threading
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init.seed_server import (
+    SeedServer,
+    listen_address,
+    parse_arp,
+    parse_listen,
+    seed_file,
+    seed_token,
+    smbios_serial,
+)
+from debian_cloud_init.workspace import META_DATA, SEED_TOKEN, USER_DATA
+
+TOKEN = "t0ken-for-tests-1234"
+ARP = (
+    "IP address       HW type     Flags       HW address            Mask     Device\n"
+    "192.168.122.10   0x1         0x2         52:54:00:AB:CD:EF     *        virbr0\n"
+    "192.168.122.11   0x1         0x0         00:00:00:00:00:00     *        virbr0\n"
+)
+
+
+@pytest.fixture
+def workspaces(tmp_path):
+    workspace = tmp_path / "kvm" / "vm1"
+    workspace.mkdir(parents=True)
+    (workspace / USER_DATA).write_text("#cloud-config\nhostname: vm1\n")
+    (workspace / META_DATA).write_text("instance-id: vm1-1\n")
+    (workspace / SEED_TOKEN).write_text(TOKEN + "\n")
+    proxmox = tmp_path / "proxmox" / "web1"
+    proxmox.mkdir(parents=True)
+    (proxmox / USER_DATA).write_text("#cloud-config\n")
+    (proxmox / SEED_TOKEN).write_text(TOKEN + "\n")
+    return tmp_path
+
+
+@pytest.fixture
+def server(workspaces):
+    server = SeedServer(("127.0.0.1", 0), workspaces)
+    yield server
+    server.server_close()
+
+
+# =============================================================================
+# Seed-URL
+# =============================================================================
+
+
+class TestSeedUrl:
+    def test_serial_from_env(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("DEBIAN_CLOUD_INIT_SEED_URL", "http://192.168.122.1:8765/")
+        serial = smbios_serial("vm1", workspace=tmp_path / "kvm" / "vm1")
+        assert smbios_serial("vm1", workspace=tmp_path / "kvm" / "vm1") == serial
+        web1 = smbios_serial("web1", "proxmox", tmp_path / "proxmox" / "web1")
+        token = (tmp_path / "kvm" / "vm1" / SEED_TOKEN).read_text().strip()
+        assert serial == f"ds=nocloud;s=http://192.168.122.1:8765/kvm/vm1/{token}/"
+        assert web1 is not None and web1.startswith("ds=nocloud;s=http://192.168.122.1:8765/proxmox/web1/")
+        assert token not in web1
+
+    def test_token_reused(self, tmp_path):
+        assert seed_token(tmp_path / "vm") == seed_token(tmp_path / "vm")
+        assert len(seed_token(tmp_path / "vm")) >= 16
+
+    def test_without_env_no_serial(self, monkeypatch):
+        monkeypatch.delenv("DEBIAN_CLOUD_INIT_SEED_URL", raising=False)
+        assert smbios_serial("vm1") is None
+
+    def test_listen_address(self):
+        assert listen_address("http://192.168.122.1:8765") == ("192.168.122.1", 8765)
+        assert parse_listen("0.0.0.0") == ("0.0.0.0", 8765)
+        assert parse_listen("[::1]:9000") == ("::1", 9000)
+
+
+# =============================================================================
+# Auflösung
+# =============================================================================
+
+
+class TestResolve:
+    def test_parse_arp_skips_incomplete(self):
+        assert parse_arp(ARP) == {"192.168.122.10": "52:54:00:ab:cd:ef"}
+
+    def test_files_from_workspace(self, workspaces):
+        workspace = workspaces / "kvm" / "vm1"
+        assert seed_file(workspace, "vm1", "user-data") == "#cloud-config\nhostname: vm1\n"
+        assert seed_file(workspace, "vm1", "meta-data") == "instance-id: vm1-1\n"
+        assert seed_file(workspace, "vm1", "network-config") is None
+        assert seed_file(workspace, "vm1", "vendor-data") == ""
+
+    def test_meta_data_generated_with_stable_instance_id(self, workspaces):
+        meta = seed_file(workspaces / "proxmox" / "web1", "web1", "meta-data")
+        assert meta == "instance-id: web1\nlocal-hostname: web1\n"
+        assert seed_file(workspaces / "proxmox" / "missing", "missing", "meta-data") is None
+
+    def test_path_and_mac(self, server):
+        server.mac_index = MagicMock(lookup=lambda mac: {"52:54:00:ab:cd:ef": "vm1"}.get(mac))
+        assert server.resolve(["proxmox", "web1", TOKEN, "user-data"], "10.0.0.9") == ("user-data", "#cloud-config\n")
+        assert server.resolve(["..", "vm1", TOKEN, "user-data"], "10.0.0.9") == ("other", None)
+        assert server.resolve(["kvm", "vm1", TOKEN, "passwd"], "10.0.0.9") == ("other", None)
+
+        with patch("debian_cloud_init.seed_server.ARP_TABLE") as arp, \
+             patch("debian_cloud_init.seed_server.virt.dhcp_leases", return_value=[]):
+            arp.read_text.return_value = ARP
+            assert server.resolve(["meta-data"], "192.168.122.10") == ("meta-data", "instance-id: vm1-1\n")
+            assert server.resolve(["meta-data"], "192.168.122.99") == ("meta-data", None)
+
+    def test_token_required(self, server, workspaces):
+        assert server.resolve(["kvm", "vm1", "user-data"], "10.0.0.9") == ("other", None)
+        assert server.resolve(["kvm", "vm1", "wrong-token-000000", "user-data"], "10.0.0.9") == ("user-data", None)
+        (workspaces / "proxmox" / "web1" / SEED_TOKEN).unlink()
+        assert server.resolve(["proxmox", "web1", TOKEN, "user-data"], "10.0.0.9") == ("user-data", None)
+
+
+# =============================================================================
+# HTTP
+# =============================================================================
+
+
+class TestHttp:
+    def test_serves_user_data_and_404(self, server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(f"{base}/kvm/vm1/{TOKEN}/user-data") as response:
+                assert response.read() == b"#cloud-config\nhostname: vm1\n"
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(f"{base}/kvm/vm1/{TOKEN}/network-config")
+            assert error.value.code == 404
+            with urllib.request.urlopen(f"{base}/metrics") as response:
+                assert b'seed_requests_total{file="network-config",result="miss"}' in response.read()
+        finally:
+            server.shutdown()
@@ -0,0 +1,212 @@
+"""Unit-Tests für stages.py"""
+
+import base64
+import json
+import pathlib
+import shutil
+import subprocess
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+
+from debian_cloud_init import stages
+from debian_cloud_init.build import (
+    dump_cloud_config,
+    render_cloud_config,
+    template_files,
+)
+from debian_cloud_init.stages import (
+    CRITICAL_RUNCMD,
+    STATUS_FILE,
+    UNIT_NAME,
+    apply_deferred_stage,
+    format_status,
+    parse_status,
+    wait_for_provisioning,
+)
+from debian_cloud_init.vm import read_provision_status
+from proxmox_cloud_init.vm import read_provision_status as pve_read_provision_status
+
+REPO_TEMPLATES = pathlib.Path(__file__).resolve().parent.parent / "templates"
+
+_PARAMS: dict[str, Any] = {
+    "username": "wlanboy",
+    "hashed_password": "$6$salt$hash",
+    "ssh_key_content": "ssh-rsa AAAAB3NzaC1 user@host",
+}
+
+
+# =============================================================================
+# apply_deferred_stage / render_cloud_config(deferred=True)
+# =============================================================================
+
+
+class TestApplyDeferredStage:
+    def test_runcmd_only_critical(self):
+        cfg = {"runcmd": ["apt-get update"]}
+        apply_deferred_stage(cfg, [("tools", "echo tools\n")])
+        assert cfg["runcmd"] == CRITICAL_RUNCMD
+        assert cfg["runcmd"][-1] == f"systemctl start --no-block {UNIT_NAME}"
+
+    def test_guest_agent_installed_natively(self):
+        cfg = {"packages": ["curl"]}
+        apply_deferred_stage(cfg, [])
+        assert cfg["packages"] == ["curl", "qemu-guest-agent"]
+        assert cfg["package_update"] is True
+
+    def test_steps_written_in_order(self):
+        cfg = {}
+        apply_deferred_stage(cfg, [("packages", "a"), ("tools", "b\n")])
+        paths = [f["path"] for f in cfg["write_files"]]
+        assert paths[0] == f"/etc/systemd/system/{UNIT_NAME}"
+        assert paths[2].endswith("/steps/01-packages.sh")
+        assert paths[3].endswith("/steps/02-tools.sh")
+        assert cfg["write_files"][2]["content"] == "a\n"
+
+    def test_unit_installed_into_cloud_init_target(self):
+        # WantedBy=multi-user.target + After=cloud-final.service wäre ein Ordering-Zyklus
+        assert "WantedBy=cloud-init.target" in stages._UNIT
+        assert "multi-user.target" not in stages._UNIT.split("[Install]")[1]
+
+    def test_render_moves_heavy_work_out_of_runcmd(self):
+        cfg = render_cloud_config(template_files(REPO_TEMPLATES), **_PARAMS, deferred=True)
+        runcmd = "\n".join(cfg["runcmd"])
+        assert "docker" not in runcmd
+        assert "kubectl" not in runcmd
+        steps = [f["path"].rsplit("/", 1)[-1] for f in cfg["write_files"][2:]]
+        assert steps == ["01-packages.sh", "02-tools.sh", "03-system.sh"]
+
+    def test_render_output_stays_literal_and_valid(self):
+        cfg = render_cloud_config(template_files(REPO_TEMPLATES), **_PARAMS, deferred=True)
+        content = dump_cloud_config(cfg)
+        assert "content: |" in content
+        loaded = yaml.safe_load(content)
+        assert loaded["write_files"][1]["content"].startswith("#!/bin/sh\n")
+
+
+# =============================================================================
+# Status
+# =============================================================================
+
+
+class TestParseStatus:
+    def test_full_status(self):
+        status = parse_status("state=done\nstep=3/3 system\nready=41.5\nstarted=42.0\nfinished=300.2\nfailed=\n")
+        assert status["state"] == "done"
+        assert status["ready"] == 41.5
+        assert status["finished"] == 300.2
+        assert status["failed"] == []
+
+    def test_pending_status_from_critical_stage(self):
+        status = parse_status("state=pending\nready=12.3\n")
+        assert status["ready"] == 12.3
+        assert status["finished"] is None
+
+    def test_failed_steps_split(self):
+        assert parse_status("state=failed\nfailed= tools system\n")["failed"] == ["tools", "system"]
+
+
+class TestFormatStatus:
+    def test_done_reports_both_times(self):
+        text = format_status(parse_status("state=done\nready=40\nfinished=310\n"))
+        assert "bereit nach 40 s" in text
+        assert "vollständig provisioniert nach 310 s" in text
+
+    def test_running_reports_step(self):
+        assert "Schritt 2/3 tools" in format_status(parse_status("state=running\nstep=2/3 tools\nready=40\n"))
+
+    def test_failed_lists_steps(self):
+        assert "tools" in format_status(parse_status("state=failed\nfailed= tools\n"))
+
+
+class TestWaitForProvisioning:
+    def test_returns_when_done(self):
+        reads = iter([None, parse_status("state=running\nready=10\n"), parse_status("state=done\nready=10\nfinished=90\n")])
+        with patch("debian_cloud_init.stages.time.sleep"):
+            status = wait_for_provisioning(lambda: next(reads), interval=0)
+        assert status is not None
+        assert status["state"] == "done"
+
+    def test_timeout_returns_last_status(self):
+        with patch("debian_cloud_init.stages.time.sleep"):
+            assert wait_for_provisioning(lambda: None, timeout=0) is None
+
+
+# =============================================================================
+# Status lesen (libvirt / Proxmox)
+# =============================================================================
+
+
+class TestReadProvisionStatus:
+    def test_libvirt_guest_exec(self):
+        out = base64.b64encode(b"state=done\nready=5\nfinished=50\n").decode()
+        responses = [
+            MagicMock(returncode=0, stdout=json.dumps({"return": {"pid": 7}})),
+            MagicMock(returncode=0, stdout=json.dumps({"return": {"exited": True, "exitcode": 0, "out-data": out}})),
+        ]
+        with patch("debian_cloud_init.virt.subprocess.run", side_effect=responses) as mock_run:
+            status = read_provision_status("testvm")
+        assert status is not None
+        assert status["finished"] == 50
+        assert STATUS_FILE in mock_run.call_args_list[0].args[0][3]
+
+    def test_libvirt_agent_unavailable(self):
+        with patch("debian_cloud_init.virt.subprocess.run", return_value=MagicMock(returncode=1, stdout="")):
+            assert read_provision_status("testvm") is None
+
+    def test_proxmox_qm_guest_exec(self):
+        result = MagicMock(returncode=0, stdout=json.dumps({"exitcode": 0, "exited": 1, "out-data": "state=running\n"}))
+        with patch("proxmox_cloud_init.vm.ssh_run", return_value=result) as mock_ssh:
+            status = pve_read_provision_status("host", "root", 100)
+        assert status is not None
+        assert status["state"] == "running"
+        assert f"qm guest exec 100 -- cat {STATUS_FILE}" in mock_ssh.call_args.args[2]
+
+    def test_proxmox_missing_file(self):
+        result = MagicMock(returncode=0, stdout=json.dumps({"exitcode": 1, "exited": 1}))
+        with patch("proxmox_cloud_init.vm.ssh_run", return_value=result):
+            assert pve_read_provision_status("host", "root", 100) is None
+
+
+# =============================================================================
+# Runner-Skript (echte Ausführung)
+# =============================================================================
+
+
+@pytest.mark.skipif(not shutil.which("dash"), reason="dash nicht verfügbar")
+class TestRunnerScript:
+    """Führt den Runner mit umgebogenen Pfaden unter dash aus."""
+
+    def _run(self, tmp_path, steps):
+        lib, state = tmp_path / "lib", tmp_path / "state"
+        (lib / "steps").mkdir(parents=True)
+        state.mkdir()
+        (state / "provision.status").write_text("state=pending\nready=12.5\n")
+        for name, body in steps.items():
+            (lib / "steps" / f"{name}.sh").write_text(body)
+        script = stages._RUNNER.replace(stages.LIB_DIR, str(lib)).replace(stages.STATE_DIR, str(state))
+        result = subprocess.run(["dash", "-c", script], capture_output=True, text=True, check=False)
+        return result, parse_status((state / "provision.status").read_text()), state
+
+    def test_success_marks_done(self, tmp_path):
+        result, status, state = self._run(tmp_path, {"01-a": "true\n", "02-b": "true\n"})
+        assert result.returncode == 0
+        assert status["state"] == "done"
+        assert status["ready"] == 12.5
+        assert status["finished"] is not None
+        assert (state / "deferred.done").exists()
+
+    def test_failed_step_continues_and_reports(self, tmp_path):
+        result, status, state = self._run(tmp_path, {"01-a": "exit 3\n", "02-b": "true\n"})
+        assert result.returncode == 1
+        assert status["state"] == "failed"
+        assert status["failed"] == ["a"]
+        assert "Schritt 2/2: b" in result.stdout
+        assert not (state / "deferred.done").exists()
+
+    def test_failing_line_inside_step_fails_it(self, tmp_path):
+        result, status, _ = self._run(tmp_path, {"01-a": "false\ntrue\n"})
+        assert result.returncode == 1
+        assert status["failed"] == ["a"]
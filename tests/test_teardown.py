@@ -0,0 +1,168 @@
+"""Unit-Tests für teardown.py"""
+
+import asyncio
+import pathlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import teardown
+from debian_cloud_init.engine import CommandError
+from debian_cloud_init.teardown import (
+    format_bytes,
+    format_report,
+    reap_trash,
+    run_teardown,
+    teardown_all,
+    tombstone_vm,
+)
+
+
+@pytest.fixture
+def isos(tmp_path):
+    with patch("debian_cloud_init.teardown.ISOS_PATH", tmp_path), \
+         patch("debian_cloud_init.rebuild.ISOS_PATH", tmp_path):
+        yield tmp_path
+
+
+def _write(path: pathlib.Path, size: int = 8192) -> pathlib.Path:
+    path.write_bytes(b"x" * size)
+    return path
+
+
+# =============================================================================
+# Engine
+# =============================================================================
+
+
+class TestTeardownAll:
+    def test_limit_per_host(self):
+        running: dict[str, int] = {}
+        peak: dict[str, int] = {}
+
+        async def destroy(target):
+            host = target["host"]
+            running[host] = running.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), running[host])
+            await asyncio.sleep(0.05)
+            running[host] -= 1
+            return 100
+
+        targets = [{"name": f"vm{i}", "host": "a" if i % 2 else "b"} for i in range(8)]
+        results = asyncio.run(teardown_all(targets, destroy, limit=2))
+        assert peak == {"a": 2, "b": 2}
+        assert [r["name"] for r in results] == [t["name"] for t in targets]
+        assert all(r["freed"] == 100 and r["error"] is None for r in results)
+
+    def test_errors_do_not_stop_others(self):
+        async def destroy(target):
+            if target["name"] == "bad":
+                raise CommandError(["virsh", "undefine", "bad"], 1, "", "error: domain not found")
+            return 1
+
+        results = asyncio.run(teardown_all([{"name": "bad", "host": "h"}, {"name": "ok", "host": "h"}], destroy))
+        assert "domain not found" in results[0]["error"]
+        assert results[1]["error"] is None
+
+
+class TestReport:
+    def test_format_bytes(self):
+        assert format_bytes(512) == "512 B"
+        assert format_bytes(3 * 1024 ** 3) == "3.0 GiB"
+
+    def test_summary(self):
+        results = [
+            {"name": "vm1", "host": "local", "freed": 1024 ** 3, "seconds": 2.0, "error": None},
+            {"name": "vm2", "host": "local", "freed": 0, "seconds": 0.1, "error": "kaputt"},
+        ]
+        report = format_report(results, 2.5)
+        assert "vm2   FEHLER: kaputt" in report
+        assert report.splitlines()[-1] == "1 VM(s) in 2.5 s gelöscht, 1.0 GiB freigegeben, 1 Fehler"
+
+    def test_forget_only_deleted(self):
+        async def destroy(target):
+            if target["name"] == "bad":
+                raise OSError("nope")
+            return 0
+
+        forgotten = []
+        targets = [{"name": "bad", "host": "h"}, {"name": "ok", "host": "h"}]
+        with patch("debian_cloud_init.teardown.progress"):
+            run_teardown(targets, destroy, lambda t: forgotten.append(t["name"]), assume_yes=True)
+        assert forgotten == ["ok"]
+
+    def test_declined(self):
+        with patch("debian_cloud_init.teardown.ask_yes_no", return_value=False):
+            destroy, forget = MagicMock(), MagicMock()
+            assert run_teardown([{"name": "vm", "host": "h"}], destroy, forget) == []
+        destroy.assert_not_called()
+        forget.assert_not_called()
+
+
+# =============================================================================
+# libvirt
+# =============================================================================
+
+
+class TestLibvirt:
+    def test_select_match_and_fleet(self):
+        with patch("debian_cloud_init.teardown.virt.list_domains", return_value={"lab-1", "lab-2", "db", "web"}), \
+             patch("debian_cloud_init.teardown.all_sessions", return_value={"web": {}, "gone": {}}):
+            targets = teardown._select("lab-*", fleet=True)
+        assert [t["name"] for t in targets] == ["lab-1", "lab-2", "web"]
+
+    def test_destroy_removes_files_and_reports_space(self, isos):
+        _write(isos / "vm1.qcow2")
+        _write(isos / "vm1-seed.iso")
+        calls = []
+
+        async def fake_run(argv, **kwargs):
+            calls.append(argv)
+
+        with patch("debian_cloud_init.teardown.virt.domain_disks", return_value=[str(isos / "vm1.qcow2")]), \
+             patch("debian_cloud_init.teardown.run_async", side_effect=fake_run), \
+             patch("debian_cloud_init.teardown.release_pinning") as mock_release:
+            freed = asyncio.run(teardown.destroy_domain({"name": "vm1", "host": "local"}))
+        assert freed >= 2 * 8192
+        assert not (isos / "vm1.qcow2").exists()
+        assert not (isos / "vm1-seed.iso").exists()
+        assert calls == [["virsh", "destroy", "vm1"], ["virsh", "undefine", "vm1", "--nvram"]]
+        mock_release.assert_called_once_with("vm1")
+
+
+class TestTombstone:
+    def test_moves_storage_and_spawns_reaper(self, isos):
+        _write(isos / "vm1.qcow2")
+        _write(isos / "vm1-golden.qcow2")
+        with patch("debian_cloud_init.teardown.virt") as mock_virt, \
+             patch("debian_cloud_init.teardown.release_pinning"), \
+             patch("debian_cloud_init.teardown.progress"), \
+             patch("debian_cloud_init.teardown.ui.spawn_module") as mock_spawn:
+            mock_virt.domain_exists.return_value = True
+            mock_virt.domain_disks.return_value = [str(isos / "vm1.qcow2")]
+            mock_virt.undefine.return_value = True
+            tombstone_vm("vm1")
+        assert not (isos / "vm1.qcow2").exists()
+        assert sorted(p.name.split("-", 2)[2] for p in (isos / ".trash").iterdir()) == ["vm1-golden.qcow2",
+                                                                                          "vm1.qcow2"]
+        mock_virt.destroy.assert_called_once_with("vm1")
+        mock_virt.undefine.assert_called_once_with("vm1", remove_storage=False)
+        assert mock_spawn.call_args.args[:2] == ("debian_cloud_init.teardown", ["--reap"])
+
+    def test_virsh_fallback_keeps_storage(self, isos):
+        with patch("debian_cloud_init.teardown.virt") as mock_virt, \
+             patch("debian_cloud_init.teardown.release_pinning"), \
+             patch("debian_cloud_init.teardown.progress"), \
+             patch("debian_cloud_init.teardown.ui.spawn_module"), \
+             patch("debian_cloud_init.teardown.run_cmd") as mock_run:
+            mock_virt.domain_exists.return_value = True
+            mock_virt.domain_disks.return_value = []
+            mock_virt.undefine.return_value = False
+            tombstone_vm("vm1")
+        mock_run.assert_called_once_with("virsh undefine vm1 --nvram")
+
+    def test_reap(self, isos):
+        (isos / ".trash").mkdir()
+        _write(isos / ".trash" / "20260101-000000-vm1.qcow2")
+        assert reap_trash() >= 8192
+        assert list((isos / ".trash").iterdir()) == []
@@ -0,0 +1,144 @@
+"""Unit-Tests für tools.py"""
+
+import hashlib
+import io
+import pathlib
+import shutil
+import subprocess
+import tarfile
+from unittest.mock import patch
+
+import pytest
+
+from debian_cloud_init import tools
+from debian_cloud_init.tools import load_manifest, render_tools_script
+
+REPO_TEMPLATES = pathlib.Path(__file__).resolve().parent.parent / "templates"
+
+
+def _write_manifest(tmp_path, text):
+    path = tmp_path / "tools.yml"
+    path.write_text(text)
+    return path
+
+
+# =============================================================================
+# load_manifest
+# =============================================================================
+
+
+class TestLoadManifest:
+    def test_repo_manifest_loads(self):
+        names = [t["name"] for t in load_manifest(REPO_TEMPLATES / "tools.yml")]
+        assert names == ["kubectl", "helm", "kind", "istioctl", "k9s"]
+
+    def test_missing_checksum_exits(self, tmp_path):
+        path = _write_manifest(tmp_path, "tools:\n  - name: x\n    version: '1'\n    url: https://e/x\n")
+        with pytest.raises(SystemExit):
+            load_manifest(path)
+
+    def test_missing_version_exits(self, tmp_path):
+        path = _write_manifest(tmp_path, "tools:\n  - name: x\n    url: https://e/x\n    checksum_url: https://e/x.sha\n")
+        with pytest.raises(SystemExit):
+            load_manifest(path)
+
+    def test_invalid_name_exits(self, tmp_path):
+        path = _write_manifest(tmp_path, "tools:\n  - name: 'a b'\n    version: '1'\n    url: u\n    sha256: {}\n")
+        with pytest.raises(SystemExit):
+            load_manifest(path)
+
+
+# =============================================================================
+# render_tools_script
+# =============================================================================
+
+
+class TestRenderToolsScript:
+    def test_arm64_has_no_amd64_urls(self):
+        script = render_tools_script(load_manifest(REPO_TEMPLATES / "tools.yml"), "arm64")
+        assert "arm64" in script
+        assert "amd64" not in script
+
+    def test_downloads_run_in_background(self):
+        script = render_tools_script(load_manifest(REPO_TEMPLATES / "tools.yml"), "amd64")
+        assert script.count(") &\n") == 5
+        assert "\nwait\n" in script
+
+    def test_arch_override(self, tmp_path):
+        path = _write_manifest(
+            tmp_path,
+            "tools:\n  - name: x\n    version: '1'\n    url: https://e/x-{arch}\n"
+            "    checksum_url: https://e/x.sha\n    arch: {amd64: x86_64}\n",
+        )
+        assert "https://e/x-x86_64" in render_tools_script(load_manifest(path), "amd64")
+
+    def test_static_checksum_missing_for_arch_exits(self, tmp_path):
+        path = _write_manifest(
+            tmp_path, "tools:\n  - name: x\n    version: '1'\n    url: https://e/x\n    sha256: {amd64: abc}\n",
+        )
+        with pytest.raises(SystemExit):
+            render_tools_script(load_manifest(path), "arm64")
+
+    def test_shell_metacharacters_rejected(self, tmp_path):
+        path = _write_manifest(
+            tmp_path, 'tools:\n  - name: x\n    version: "1"\n    url: https://e/`id`\n    checksum_url: https://e/s\n',
+        )
+        with pytest.raises(SystemExit):
+            render_tools_script(load_manifest(path), "amd64")
+
+
+@pytest.mark.skipif(
+    not all(shutil.which(b) for b in ("dash", "curl", "sha256sum", "tar")),
+    reason="dash/curl/sha256sum/tar nicht verfügbar",
+)
+class TestScriptExecution:
+    """Führt das gerenderte Skript mit file://-URLs unter /bin/sh-Semantik (dash) aus."""
+
+    def _fixtures(self, tmp_path):
+        src = tmp_path / "src"
+        src.mkdir()
+        plain = src / "plain-amd64"
+        plain.write_bytes(b"#!/bin/sh\necho plain\n")
+        (src / "plain-amd64.sha256").write_text(hashlib.sha256(plain.read_bytes()).hexdigest() + "\n")
+
+        archive = src / "packed-amd64.tar.gz"
+        data = b"#!/bin/sh\necho packed\n"
+        with tarfile.open(archive, "w:gz") as tar:
+            info = tarfile.TarInfo("dir/packed")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        digest = hashlib.sha256(archive.read_bytes()).hexdigest()
+        (src / "checksums.txt").write_text(f"{'0' * 64}  other.tar.gz\n{digest}  packed-amd64.tar.gz\n")
+        return src
+
+    def _run(self, tmp_path, manifest_text):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        path = _write_manifest(tmp_path, manifest_text)
+        with patch.object(tools, "INSTALL_DIR", str(bin_dir)):
+            script = render_tools_script(load_manifest(path), "amd64")
+        result = subprocess.run(["dash", "-c", script], capture_output=True, text=True, check=False)
+        return result, bin_dir
+
+    def test_plain_and_archived_tools_installed(self, tmp_path):
+        src = self._fixtures(tmp_path)
+        result, bin_dir = self._run(tmp_path, (
+            "tools:\n"
+            f"  - name: plain\n    version: '1'\n    url: file://{src}/plain-{{arch}}\n"
+            f"    checksum_url: file://{src}/plain-{{arch}}.sha256\n"
+            f"  - name: packed\n    version: '1'\n    url: file://{src}/packed-{{arch}}.tar.gz\n"
+            f"    checksum_url: file://{src}/checksums.txt\n    extract: dir/packed\n"
+        ))
+        assert result.returncode == 0, result.stderr
+        assert (bin_dir / "plain").read_bytes().startswith(b"#!/bin/sh")
+        assert (bin_dir / "packed").exists()
+
+    def test_bad_checksum_not_installed_and_fails(self, tmp_path):
+        src = self._fixtures(tmp_path)
+        result, bin_dir = self._run(tmp_path, (
+            "tools:\n"
+            f"  - name: plain\n    version: '1'\n    url: file://{src}/plain-{{arch}}\n"
+            f"    sha256: {{amd64: '{'f' * 64}'}}\n"
+        ))
+        assert result.returncode != 0
+        assert not (bin_dir / "plain").exists()
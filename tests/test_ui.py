@@ -81,6 +81,13 @@ class TestAskYesNo:
         with patch("builtins.input", side_effect=["xyz", "ungültig", "j"]):
             assert ask_yes_no("Test?") is True
 
+    def test_non_interactive_returns_default_without_prompt(self):
+        with patch("debian_cloud_init.ui.NON_INTERACTIVE", True), \
+             patch("builtins.input") as mock_input:
+            assert ask_yes_no("Test?") is True
+            assert ask_yes_no("Test?", default=False) is False
+        mock_input.assert_not_called()
+
     def test_uppercase_accepted(self):
         with patch("builtins.input", return_value="J"):
             assert ask_yes_no("Test?") is True
@@ -120,16 +127,20 @@ class TestAskYesNo:
 
 
 class TestRunCmd:
-    def test_success_does_not_exit(self):
-        with patch("subprocess.run", return_value=MagicMock(returncode=0)):
-            run_cmd("echo test")
+    def test_success_does_not_exit(self, capsys):
+        run_cmd("echo test")
+        assert "test" in capsys.readouterr().out
 
     def test_failure_exits(self):
-        with patch("subprocess.run", return_value=MagicMock(returncode=1)), \
-             pytest.raises(SystemExit):
+        with pytest.raises(SystemExit):
             run_cmd("false")
 
     def test_nonzero_returncode_exits(self):
-        with patch("subprocess.run", return_value=MagicMock(returncode=127)), \
-             pytest.raises(SystemExit):
-            run_cmd("command_not_found")
+        with pytest.raises(SystemExit):
+            run_cmd("exit 127")
+
+    def test_runs_through_engine(self):
+        with patch("debian_cloud_init.engine.run_sync", return_value=MagicMock(returncode=0)) as mock_run:
+            run_cmd("echo test")
+        assert mock_run.call_args.args[0] == ["sh", "-c", "echo test"]
+        assert mock_run.call_args.kwargs["timeout"] is None
\ No newline at end of file
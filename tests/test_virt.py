@@ -0,0 +1,161 @@
+"""Unit-Tests für virt.py"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debian_cloud_init import virt
+
+DOMIFADDR = """\
+ Name       MAC address          Protocol     Address
+-------------------------------------------------------------------------------
+ lo         00:00:00:00:00:00    ipv4         127.0.0.1/8
+ enp1s0     52:54:00:aa:bb:cc    ipv4         192.168.122.10/24
+ -          -                    ipv6         fe80::5054:ff:feaa:bbcc/64
+"""
+
+LEASES = """\
+ Expiry Time           MAC address         Protocol   IP address           Hostname   Client ID or DUID
+------------------------------------------------------------------------------------------------------------
+ 2026-01-01 12:00:00   52:54:00:aa:bb:cc   ipv4       192.168.122.10/24    vm1        01:52:54:00:aa:bb:cc
+ 2026-01-01 12:00:00   52:54:00:11:22:33   ipv4       192.168.122.11/24    -          01:52:54:00:11:22:33
+"""
+
+DOMAIN_LIST = """\
+ Id   Name    State
+------------------------
+ 3    web1    running
+ -    db1     shut off
+"""
+
+
+def _virsh(stdout="", returncode=0):
+    return MagicMock(returncode=returncode, stdout=stdout)
+
+
+@pytest.fixture
+def no_bindings():
+    with patch.object(virt, "libvirt", None):
+        yield
+
+
+@pytest.fixture
+def fake_libvirt():
+    """Minimales libvirt-Modul mit einer Verbindung und einer Domain 'vm1'."""
+    module = MagicMock()
+    module.libvirtError = type("libvirtError", (Exception,), {})
+    module.VIR_IP_ADDR_TYPE_IPV4 = 0
+    module.VIR_IP_ADDR_TYPE_IPV6 = 1
+    conn = module.open.return_value
+    conn.isAlive.return_value = True
+    dom = MagicMock()
+    dom.name.return_value = "vm1"
+    dom.state.return_value = [1, 1]
+
+    def lookup(name):
+        if name == "vm1":
+            return dom
+        raise module.libvirtError("not found")
+
+    conn.lookupByName.side_effect = lookup
+    conn.listAllDomains.return_value = [dom]
+    with patch.object(virt, "libvirt", module), patch.object(virt, "_conn", None), \
+         patch("debian_cloud_init.virt.subprocess.run") as mock_run:
+        yield module, conn, dom
+    mock_run.assert_not_called()
+
+
+# =============================================================================
+# Fallback virsh
+# =============================================================================
+
+
+class TestVirshFallback:
+    def test_list_domains(self, no_bindings):
+        with patch("debian_cloud_init.virt.subprocess.run", return_value=_virsh("a\nb\n\n")) as mock_run:
+            assert virt.list_domains() == {"a", "b"}
+        assert mock_run.call_args.args[0] == ["virsh", "list", "--all", "--name"]
+
+    def test_list_domains_unreachable(self, no_bindings):
+        with patch("debian_cloud_init.virt.subprocess.run", return_value=_virsh(returncode=1)):
+            assert virt.list_domains() is None
+
+    def test_state_missing_domain_empty(self, no_bindings):
+        with patch("debian_cloud_init.virt.subprocess.run", return_value=_virsh("", returncode=1)):
+            assert virt.domain_state("x") == ""
+            assert not virt.domain_exists("x")
+
+    def test_agent_addresses_skip_loopback_and_ipv6(self, no_bindings):
+        with patch("debian_cloud_init.virt.subprocess.run", return_value=_virsh(DOMIFADDR)):
+            assert virt.agent_ipv4_addresses("vm1") == ["192.168.122.10"]
+
+    def test_dhcp_leases(self, no_bindings):
+        with patch("debian_cloud_init.virt.subprocess.run", return_value=_virsh(LEASES)):
+            assert virt.dhcp_leases() == [
+                {"mac": "52:54:00:aa:bb:cc", "ip": "192.168.122.10", "hostname": "vm1"},
+                {"mac": "52:54:00:11:22:33", "ip": "192.168.122.11", "hostname": ""},
+            ]
+
+    def test_domain_state_map(self, no_bindings):
+        with patch("debian_cloud_init.virt.subprocess.run", return_value=_virsh(DOMAIN_LIST)):
+            assert virt.domain_state_map() == {"web1": "running", "db1": "shut off"}
+
+    def test_undefine_without_connection_returns_false(self, no_bindings):
+        assert virt.undefine("vm1") is False
+
+    def test_env_forces_virsh(self, fake_libvirt):
+        with patch.dict("os.environ", {"DEBIAN_CLOUD_INIT_VIRSH": "1"}):
+            assert virt.connection() is None
+
+
+# =============================================================================
+# Native Verbindung
+# =============================================================================
+
+
+class TestNative:
+    def test_connection_reused(self, fake_libvirt):
+        module, _, _ = fake_libvirt
+        virt.domain_state("vm1")
+        virt.list_domains()
+        assert module.open.call_count == 1
+
+    def test_state_and_listing(self, fake_libvirt):
+        assert virt.domain_state("vm1") == "running"
+        assert virt.domain_state("missing") == ""
+        assert virt.domain_exists("vm1")
+        assert virt.list_domains() == {"vm1"}
+        assert virt.domain_state_map() == {"vm1": "running"}
+
+    def test_agent_addresses(self, fake_libvirt):
+        _, _, dom = fake_libvirt
+        dom.interfaceAddresses.return_value = {
+            "lo": {"addrs": [{"type": 0, "addr": "127.0.0.1"}]},
+            "enp1s0": {"addrs": [{"type": 0, "addr": "10.0.0.5"}, {"type": 1, "addr": "fe80::1"}]},
+        }
+        assert virt.agent_ipv4_addresses("vm1") == ["10.0.0.5"]
+
+    def test_destroy_only_when_active(self, fake_libvirt):
+        _, _, dom = fake_libvirt
+        dom.isActive.return_value = False
+        virt.destroy("vm1")
+        dom.destroy.assert_not_called()
+
+    def test_undefine_removes_managed_volumes(self, fake_libvirt):
+        _, conn, dom = fake_libvirt
+        dom.XMLDesc.return_value = (
+            "<domain><devices>"
+            "<disk device='disk'><source file='/isos/vm1.qcow2'/></disk>"
+            "<disk device='cdrom'><source file='/isos/vm1-seed.iso'/></disk>"
+            "</devices></domain>"
+        )
+        assert virt.undefine("vm1")
+        dom.undefineFlags.assert_called_once()
+        conn.storageVolLookupByPath.assert_called_once_with("/isos/vm1.qcow2")
+
+    def test_undefine_rejected_falls_back(self, fake_libvirt):
+        module, conn, dom = fake_libvirt
+        dom.XMLDesc.return_value = "<domain><devices><disk device='disk'><source file='/isos/vm1.qcow2'/></disk></devices></domain>"
+        dom.undefineFlags.side_effect = module.libvirtError("Flags nicht unterstützt")
+        assert virt.undefine("vm1") is False
+        conn.storageVolLookupByPath.assert_not_called()
@@ -99,52 +99,60 @@ class TestImageInfo:
 
 
 class TestEnsureIsosFolder:
-    def _mock_path(self, exists, st_uid=1000, st_gid=2000):
+    def _mock_path(self, exists):
         mock = MagicMock()
         mock.exists.return_value = exists
-        mock.stat.return_value = MagicMock(st_uid=st_uid, st_gid=st_gid)
         return mock
 
+    def _facts(self, exists=True, st_uid=1000, st_gid=2000):
+        return {"uid": 1000, "kvm_gid": 2000, "isos": {"exists": exists, "uid": st_uid, "gid": st_gid}}
+
     def test_exists_correct_permissions_returns_silently(self):
-        mock_path = self._mock_path(exists=True, st_uid=1000, st_gid=2000)
-        with patch("debian_cloud_init.vm.ISOS_PATH", mock_path), \
-             patch("debian_cloud_init.vm.os.getuid", return_value=1000), \
-             patch("debian_cloud_init.vm.grp.getgrnam", return_value=MagicMock(gr_gid=2000)):
+        with patch("debian_cloud_init.vm.ISOS_PATH", self._mock_path(exists=True)), \
+             patch("debian_cloud_init.vm.local_facts", return_value=self._facts()) as mock_facts:
             ensure_isos_folder()  # kein SystemExit
+        assert mock_facts.call_args.kwargs["refresh"] is False
 
     def test_exists_wrong_uid_user_confirms_chown(self):
-        mock_path = self._mock_path(exists=True, st_uid=999, st_gid=2000)
-        with patch("debian_cloud_init.vm.ISOS_PATH", mock_path), \
-             patch("debian_cloud_init.vm.os.getuid", return_value=1000), \
-             patch("debian_cloud_init.vm.grp.getgrnam", return_value=MagicMock(gr_gid=2000)), \
+        with patch("debian_cloud_init.vm.ISOS_PATH", self._mock_path(exists=True)), \
+             patch("debian_cloud_init.vm.local_facts", return_value=self._facts(st_uid=999)), \
              patch("debian_cloud_init.vm.ask_yes_no", return_value=True), \
              patch("debian_cloud_init.vm.run_cmd") as mock_run_cmd, \
+             patch("debian_cloud_init.vm.invalidate") as mock_invalidate, \
              patch("debian_cloud_init.vm.os.getlogin", return_value="testuser"):
             ensure_isos_folder()
         calls = " ".join(str(c) for c in mock_run_cmd.call_args_list)
         assert "chown" in calls
+        mock_invalidate.assert_called_once_with("local", keys=["isos"])
 
     def test_exists_wrong_permissions_user_declines_exits(self):
-        mock_path = self._mock_path(exists=True, st_uid=999, st_gid=2000)
-        with patch("debian_cloud_init.vm.ISOS_PATH", mock_path), \
-             patch("debian_cloud_init.vm.os.getuid", return_value=1000), \
-             patch("debian_cloud_init.vm.grp.getgrnam", return_value=MagicMock(gr_gid=2000)), \
+        with patch("debian_cloud_init.vm.ISOS_PATH", self._mock_path(exists=True)), \
+             patch("debian_cloud_init.vm.local_facts", return_value=self._facts(st_uid=999)), \
              patch("debian_cloud_init.vm.ask_yes_no", return_value=False), \
              pytest.raises(SystemExit):
             ensure_isos_folder()
 
+    def test_missing_kvm_group_exits(self):
+        facts = {**self._facts(), "kvm_gid": None}
+        with patch("debian_cloud_init.vm.ISOS_PATH", self._mock_path(exists=True)), \
+             patch("debian_cloud_init.vm.local_facts", return_value=facts), \
+             pytest.raises(SystemExit):
+            ensure_isos_folder()
+
     def test_not_exists_user_confirms_creates_folder(self):
-        mock_path = self._mock_path(exists=False)
-        with patch("debian_cloud_init.vm.ISOS_PATH", mock_path), \
+        with patch("debian_cloud_init.vm.ISOS_PATH", self._mock_path(exists=False)), \
+             patch("debian_cloud_init.vm.local_facts", return_value=self._facts(exists=False)) as mock_facts, \
              patch("debian_cloud_init.vm.ask_yes_no", return_value=True), \
+             patch("debian_cloud_init.vm.invalidate"), \
              patch("debian_cloud_init.vm.run_cmd") as mock_run_cmd:
             ensure_isos_folder()
         calls = " ".join(str(c) for c in mock_run_cmd.call_args_list)
         assert "mkdir" in calls
+        assert mock_facts.call_args.kwargs["refresh"] is True
 
     def test_not_exists_user_declines_exits(self):
-        mock_path = self._mock_path(exists=False)
-        with patch("debian_cloud_init.vm.ISOS_PATH", mock_path), \
+        with patch("debian_cloud_init.vm.ISOS_PATH", self._mock_path(exists=False)), \
+             patch("debian_cloud_init.vm.local_facts", return_value=self._facts(exists=False)), \
              patch("debian_cloud_init.vm.ask_yes_no", return_value=False), \
              pytest.raises(SystemExit):
             ensure_isos_folder()
@@ -253,14 +261,14 @@ class TestCreateSeedIso:
     def test_returns_correct_path(self, tmp_path):
         self._setup_isos(tmp_path)
         with patch("debian_cloud_init.vm.ISOS_PATH", tmp_path), patch("debian_cloud_init.vm.run_cmd"):
-            result = create_seed_iso("myvm")
+            result = create_seed_iso("myvm", tmp_path)
         assert result == tmp_path / "myvm-seed.iso"
 
     def test_genisoimage_called(self, tmp_path):
         self._setup_isos(tmp_path)
         with patch("debian_cloud_init.vm.ISOS_PATH", tmp_path), \
              patch("debian_cloud_init.vm.run_cmd") as mock_run_cmd:
-            create_seed_iso("myvm")
+            create_seed_iso("myvm", tmp_path)
         calls = " ".join(str(c) for c in mock_run_cmd.call_args_list)
         assert "genisoimage" in calls
 
@@ -268,17 +276,16 @@ class TestCreateSeedIso:
         self._setup_isos(tmp_path)
         with patch("debian_cloud_init.vm.ISOS_PATH", tmp_path), \
              patch("debian_cloud_init.vm.run_cmd") as mock_run_cmd:
-            create_seed_iso("myvm")
+            create_seed_iso("myvm", tmp_path)
         calls = " ".join(str(c) for c in mock_run_cmd.call_args_list)
         assert "network-config" not in calls
 
     def test_with_network_config_included_in_iso(self, tmp_path):
         self._setup_isos(tmp_path)
-        net_cfg = tmp_path / "network-config.yml"
-        net_cfg.write_text("version: 2\n")
+        (tmp_path / "network-config.yml").write_text("version: 2\n")
         with patch("debian_cloud_init.vm.ISOS_PATH", tmp_path), \
              patch("debian_cloud_init.vm.run_cmd") as mock_run_cmd:
-            create_seed_iso("myvm", network_config_file=net_cfg)
+            create_seed_iso("myvm", tmp_path)
         calls = " ".join(str(c) for c in mock_run_cmd.call_args_list)
         assert "network-config" in calls
 
@@ -286,7 +293,7 @@ class TestCreateSeedIso:
         self._setup_isos(tmp_path)
         with patch("debian_cloud_init.vm.ISOS_PATH", tmp_path), \
              patch("debian_cloud_init.vm.run_cmd") as mock_run_cmd:
-            create_seed_iso("myvm")
+            create_seed_iso("myvm", tmp_path)
         calls = " ".join(str(c) for c in mock_run_cmd.call_args_list)
         assert "cidata" in calls
 
@@ -0,0 +1,87 @@
+"""Unit-Tests für debian_cloud_init/workspace.py"""
+
+from unittest.mock import patch
+
+import pytest
+
+from debian_cloud_init import workspace
+from debian_cloud_init.cloud_init import create_meta_data, create_network_config
+from debian_cloud_init.workspace import (
+    remove_workspace,
+    session_workspace,
+    workspace_dir,
+    write_atomic,
+)
+
+
+@pytest.fixture(autouse=True)
+def workspaces(tmp_path):
+    with patch.object(workspace, "WORKSPACES_DIR", tmp_path / ".workspaces"):
+        yield tmp_path / ".workspaces"
+
+
+# =============================================================================
+# Pfade
+# =============================================================================
+
+
+class TestWorkspaceDir:
+    def test_per_backend_and_vm(self, workspaces):
+        assert workspace_dir("vm1") == workspaces / "kvm" / "vm1"
+        assert workspace_dir("vm1", "proxmox") == workspaces / "proxmox" / "vm1"
+
+    def test_session_path_wins(self, tmp_path):
+        assert session_workspace({"vmname": "vm1", "workspace": str(tmp_path / "x")}) == tmp_path / "x"
+
+    def test_old_session_gets_default(self, workspaces):
+        assert session_workspace({"vmname": "vm1"}) == workspaces / "kvm" / "vm1"
+
+    def test_remove(self):
+        directory = workspace.ensure_workspace(workspace_dir("vm1"))
+        (directory / "cloud-init.yml").write_text("#cloud-config\n")
+        remove_workspace("vm1")
+        assert not directory.exists()
+
+
+# =============================================================================
+# Atomares Schreiben
+# =============================================================================
+
+
+class TestWriteAtomic:
+    def test_replaces_content_without_leftovers(self, tmp_path):
+        target = tmp_path / "cloud-init.yml"
+        target.write_text("alt")
+        write_atomic(target, "neu")
+        assert target.read_text() == "neu"
+        assert [p.name for p in tmp_path.iterdir()] == ["cloud-init.yml"]
+
+    def test_failed_write_keeps_old_file(self, tmp_path):
+        target = tmp_path / "cloud-init.yml"
+        target.write_text("alt")
+        with patch("pathlib.Path.replace", side_effect=OSError("voll")), pytest.raises(OSError):
+            write_atomic(target, "neu")
+        assert target.read_text() == "alt"
+        assert [p.name for p in tmp_path.iterdir()] == ["cloud-init.yml"]
+
+
+# =============================================================================
+# cloud-init-Dateien
+# =============================================================================
+
+
+class TestArtifacts:
+    def test_two_vms_do_not_share_files(self):
+        first = workspace.ensure_workspace(workspace_dir("vm1"))
+        second = workspace.ensure_workspace(workspace_dir("vm2"))
+        with patch("debian_cloud_init.cloud_init.success"):
+            create_meta_data("vm1", first)
+            create_meta_data("vm2", second)
+        assert "local-hostname: vm1" in (first / "meta-data.yml").read_text()
+        assert "local-hostname: vm2" in (second / "meta-data.yml").read_text()
+
+    def test_network_config_only_for_ubuntu(self, tmp_path):
+        with patch("debian_cloud_init.cloud_init.success"):
+            assert create_network_config("ubuntu/24.04", tmp_path) == tmp_path / "network-config.yml"
+            assert create_network_config("debian/13", tmp_path) is None
+        assert not (tmp_path / "network-config.yml").exists()